@@ -1,21 +1,34 @@
 ## `api/__init__.py`
 
-from fastapi import FastAPI
-from api.routes_agents import router as agents_router
-from api.routes_results import router as results_router
-from api.routes_projects import router as projects_router
+# The standalone app below (routers without the /api prefix) is built on first
+# access of `api.app`, not when any `api.*` module is imported: the worker and
+# main.py import this package without needing it.
 
 
-app = FastAPI(title="AutoTeamAI API", version="1.0.0")
+def _build_app():
+    from fastapi import FastAPI
+    from api.routes_agents import router as agents_router
+    from api.routes_results import router as results_router
+    from api.routes_projects import router as projects_router
 
+    app = FastAPI(title="AutoTeamAI API", version="1.0.0")
 
-# Mount routers
-app.include_router(projects_router, prefix="/projects", tags=["projects"])
-app.include_router(agents_router, prefix="/agents", tags=["agents"])
-app.include_router(results_router, prefix="/results", tags=["results"])
+    # Mount routers
+    app.include_router(projects_router, prefix="/projects", tags=["projects"])
+    app.include_router(agents_router, prefix="/agents", tags=["agents"])
+    app.include_router(results_router, prefix="/results", tags=["results"])
 
+    # Health check
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
 
-# Health check
-@app.get("/health")
-async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return app
+
+
+def __getattr__(name: str):
+    if name == "app":
+        global app
+        app = _build_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,7 +4,11 @@ from typing import Optional
 import abc
 import logging
 from api.ai.core.utils import get_logger
-from api.ai.agents.llm_client import LLMClient
+from api.ai.core import stage_context
+from api.ai.core.deadlines import TimeBudgetExceeded
+from api.ai.core.metrics import STAGE_FALLBACKS
+from api.ai.core.usage import note_fallback
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
 
 logger = get_logger("base_agent")
 
@@ -31,13 +35,28 @@ class BaseAgent(abc.ABC):
     async def _generate(self, prompt: str, system: Optional[str] = None) -> str:
         """
         Use injected LLM if present, else fallback to deterministic response.
+        Streams through the current stage's delta sink when one is set.
+        Provider failures and expired time budgets are raised, never replaced by
+        the fallback text (the orchestrator reports and degrades them).
         """
         if self.llm:
             try:
+                sink = stage_context.delta_sink.get()
+                if sink is not None:
+                    self._logger.debug("Streaming LLM generation")
+                    chunks = []
+                    async for chunk in self.llm.stream(prompt=prompt, system=system):
+                        chunks.append(chunk)
+                        await sink(chunk)
+                    return "".join(chunks)
                 self._logger.debug("Calling LLM for generation")
                 return await self.llm.generate(prompt=prompt, system=system)
+            except (LLMProviderError, TimeBudgetExceeded):
+                raise
             except Exception as e:
                 self._logger.exception("LLM generation failed, falling back to deterministic logic: %s", e)
+                STAGE_FALLBACKS.labels(stage_context.current_stage.get() or self.name, "agent_fallback").inc()
+                note_fallback()
                 # continue to fallback below
         # fallback deterministic behavior
         return self.fallback(prompt)
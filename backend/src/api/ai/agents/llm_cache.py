@@ -0,0 +1,334 @@
+"""
+Content-addressed cache for LLM responses.
+
+- cache_key(...) -> sha256 over (provider, model, system, prompt, generation params)
+- ResponseCache: bounded in-memory LRU in front of an optional SQLite file store,
+  both with TTLs and size-based eviction, plus hit/miss counters
+- CachedLLMClient: LLMClient wrapper that serves repeated prompts from the cache
+
+Bypass per call with `generate(..., cache_bypass=True)` or for a whole pipeline
+run by setting `stage_context.cache_bypass` (the orchestrator does this).
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from api.ai.core import stage_context, tracing
+from api.ai.core.metrics import counter
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+
+logger = get_logger("llm_cache")
+
+# Responses carrying this marker are provider failures and must never be cached
+ERROR_MARKER = "[ERROR]"
+
+
+def cache_key(provider: str, model: str, system: Optional[str], prompt: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        {"provider": provider, "model": model, "system": system or "", "prompt": prompt, "params": params},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --------------------- Memory tier ---------------------
+class LRUCache:
+    """In-memory LRU bounded by entry count and total bytes; entries expire after their TTL."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value, time.time() + ttl)
+        self._bytes += size
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value.encode("utf-8"))
+
+
+# --------------------- Persistent tier ---------------------
+class SQLiteCacheStore:
+    """
+    SQLite-file store. Calls are blocking, so ResponseCache runs them in the
+    default executor. Evicts least-recently-used rows beyond `max_entries`.
+    """
+
+    EVICT_EVERY = 64  # writes between eviction sweeps
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        cur = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        self.evictions += cur.rowcount
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cur = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += cur.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --------------------- Two-tier cache ---------------------
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    stores: int = 0
+
+
+class ResponseCache:
+    def __init__(self, memory: Optional[LRUCache] = None, store: Optional[SQLiteCacheStore] = None, ttl: float = 86400.0):
+        self.memory = memory or LRUCache()
+        self.store = store
+        self.ttl = ttl
+        self.counters = CacheStats()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters.memory_hits += 1
+            return value
+        if self.store is not None:
+            loop = asyncio.get_event_loop()
+            row = await loop.run_in_executor(None, self.store.get, key)
+            if row is not None:
+                value, expires_at = row
+                # Promote to the memory tier for the remaining lifetime
+                self.memory.set(key, value, max(expires_at - time.time(), 0.0))
+                self.counters.persistent_hits += 1
+                return value
+        self.counters.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value, self.ttl)
+        if self.store is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.store.set, key, value, self.ttl)
+        self.counters.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.counters
+        lookups = c.memory_hits + c.persistent_hits + c.misses
+        return {
+            "memory_hits": c.memory_hits,
+            "persistent_hits": c.persistent_hits,
+            "misses": c.misses,
+            "bypassed": c.bypassed,
+            "stores": c.stores,
+            "hit_ratio": round((c.memory_hits + c.persistent_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "persistent_evictions": self.store.evictions if self.store else 0,
+        }
+
+
+# --------------------- LLMClient wrapper ---------------------
+class CachedLLMClient(LLMClient):
+    def __init__(self, inner: LLMClient, cache: ResponseCache):
+        self.inner = inner
+        self.cache = cache
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+
+    def _key(self, prompt: str, system: Optional[str], kwargs: Dict[str, Any]) -> str:
+        return cache_key(self.provider, self.model_name, system, prompt, kwargs)
+
+    @staticmethod
+    def _bypass(kwargs: Dict[str, Any]) -> bool:
+        return bool(kwargs.pop("cache_bypass", False)) or stage_context.cache_bypass.get()
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        if self._bypass(kwargs):
+            self.cache.counters.bypassed += 1
+            return await self.inner.generate(prompt, system=system, **kwargs)
+
+        key = self._key(prompt, system, kwargs)
+        with tracing.span("llm.cache_lookup", provider=self.provider, model=self.model_name) as span:
+            cached = await self.cache.get(key)
+            span.set("hit", cached is not None)
+        if cached is not None:
+            return cached
+        text = await self.inner.generate(prompt, system=system, **kwargs)
+        if text and ERROR_MARKER not in text:
+            await self.cache.set(key, text)
+        return text
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        if self._bypass(kwargs):
+            self.cache.counters.bypassed += 1
+            async for chunk in self.inner.stream(prompt, system=system, **kwargs):
+                yield chunk
+            return
+
+        key = self._key(prompt, system, kwargs)
+        with tracing.span("llm.cache_lookup", provider=self.provider, model=self.model_name) as span:
+            cached = await self.cache.get(key)
+            span.set("hit", cached is not None)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in self.inner.stream(prompt, system=system, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        text = "".join(chunks)
+        if text and ERROR_MARKER not in text:
+            await self.cache.set(key, text)
+
+    def batches_natively(self, count: int) -> bool:
+        return self.inner.batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        """Cached prompts are answered here; the distinct misses go to the inner client as one batch."""
+        if self._bypass(kwargs):
+            self.cache.counters.bypassed += len(prompts)
+            return await self.inner.generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+
+        results: List[Any] = [None] * len(prompts)
+        misses: Dict[str, List[int]] = {}  # key -> positions of its prompt
+        with tracing.span("llm.cache_lookup", provider=self.provider, model=self.model_name, prompts=len(prompts)) as span:
+            for i, prompt in enumerate(prompts):
+                key = self._key(prompt, system, kwargs)
+                if key in misses:
+                    misses[key].append(i)
+                    continue
+                cached = await self.cache.get(key)
+                if cached is None:
+                    misses[key] = [i]
+                else:
+                    results[i] = cached
+            span.set("misses", len(misses))
+        if misses:
+            answers = await self.inner.generate_many([prompts[pos[0]] for pos in misses.values()], system=system, concurrency=concurrency, **kwargs)
+            for (key, positions), text in zip(misses.items(), answers):
+                if isinstance(text, str) and text and ERROR_MARKER not in text:
+                    await self.cache.set(key, text)
+                for i in positions:
+                    results[i] = text
+        return results
+
+
+# --------------------- Process-wide cache ---------------------
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Shared cache built from settings; every per-run client wraps the same instance."""
+    global _response_cache
+    if _response_cache is None:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        store = None
+        if settings.LLM_CACHE_PATH:
+            store = SQLiteCacheStore(settings.LLM_CACHE_PATH, max_entries=settings.LLM_CACHE_MAX_DISK_ENTRIES)
+        _response_cache = ResponseCache(
+            memory=LRUCache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_MAX_MEMORY_BYTES),
+            store=store,
+            ttl=settings.LLM_CACHE_TTL_SECONDS,
+        )
+        logger.info("LLM response cache initialised (persistent=%s)", settings.LLM_CACHE_PATH or "off")
+    return _response_cache
+
+
+def _lookup_counts() -> Dict[Tuple[str, ...], int]:
+    if _response_cache is None:
+        return {}
+    c = _response_cache.counters
+    return {("memory_hit",): c.memory_hits, ("persistent_hit",): c.persistent_hits, ("miss",): c.misses, ("bypassed",): c.bypassed}
+
+
+# Read from the cache's own counters at scrape time
+counter("autoteam_llm_cache_lookups_total", "LLM response cache lookups by result.", ("result",), function=_lookup_counts)
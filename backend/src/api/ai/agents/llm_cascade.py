@@ -0,0 +1,190 @@
+"""
+Tiered model cascade: answer with a cheap model, escalate when its output looks weak.
+
+CascadeLLMClient sends a call to the first (fast, cheap) tier and runs a local
+AcceptanceCheck on the answer. Only when the check fails, or the tier errors,
+does the call go to the next (stronger) tier; the last tier's answer is
+returned as is.
+
+The check is deliberately cheap and local:
+- no [ERROR] / [Empty ...] marker from a client
+- a minimum length
+- some structure (a heading, list or code block)
+- the sections the agent asked for: the trailing "- item" list of the prompt
+  (e.g. Boss' "- key success criteria"), items marked "(if any)" excepted
+
+Streams from a cheap tier are buffered until accepted, so a rejected answer
+never reaches the delta sink; the strongest tier streams live. Stages outside
+`stages` (LLM_CASCADE_STAGES) go straight to the strongest tier.
+
+Outcomes are counted per stage (autoteam_llm_cascade_total and
+cascade_stats()), so the escalation rate shows where the flagship model is
+actually needed.
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Union
+import asyncio
+import re
+
+from api.ai.core import stage_context, tracing
+from api.ai.core.deadlines import TimeBudgetExceeded
+from api.ai.core.metrics import counter
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_cache import ERROR_MARKER
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+
+logger = get_logger("llm_cascade")
+
+CASCADE_CALLS = counter(
+    "autoteam_llm_cascade_total",
+    "Cascaded LLM calls by stage and outcome (accepted by the cheap tier, escalated).",
+    ("stage", "outcome"),
+)
+CASCADE_REJECTIONS = counter(
+    "autoteam_llm_cascade_rejections_total",
+    "Cheap-tier answers rejected, by stage and failed check.",
+    ("stage", "reason"),
+)
+
+_STRUCTURE_RE = re.compile(r"^\s*(#{1,6}\s|[-*+]\s|\d+[.)]\s|```|\|)", re.MULTILINE)
+_WORD_RE = re.compile(r"[a-z]{4,}")
+# Words of a requested item that say nothing about its subject
+_FILLER = {"only", "include", "including", "short", "small", "brief", "concise", "rough", "with", "list", "bullet", "bullets", "sentence", "sentences", "primary", "minimal", "containing"}
+
+
+def required_sections(prompt: str) -> List[List[str]]:
+    """
+    Keywords of each item of the prompt's trailing "- item" list (the output format
+    the agent asked for). Optional items ("(if any)", "optional") are left out.
+    """
+    lines = prompt.rstrip().splitlines()
+    items: List[str] = []
+    while lines and lines[-1].lstrip().startswith("- "):
+        items.insert(0, lines.pop().strip()[2:])
+    if not items or not lines or not lines[-1].rstrip().endswith(":"):
+        return []
+    sections = []
+    for item in items:
+        if re.search(r"\bif any\b|\boptional\b", item, re.IGNORECASE):
+            continue
+        words = [w for w in _WORD_RE.findall(re.sub(r"\(.*?\)", "", item.lower())) if w not in _FILLER]
+        if words:
+            sections.append(words)
+    return sections
+
+
+class AcceptanceCheck:
+    def __init__(self, min_chars: int = 200, require_structure: bool = True, require_sections: bool = True):
+        self.min_chars = min_chars
+        self.require_structure = require_structure
+        self.require_sections = require_sections
+
+    def __call__(self, prompt: str, text: str) -> List[str]:
+        """Reasons to reject `text` as the answer to `prompt`; empty when it is acceptable."""
+        stripped = (text or "").strip()
+        if ERROR_MARKER in stripped or stripped.startswith("[Empty"):
+            return ["error_marker"]
+        reasons = []
+        if len(stripped) < self.min_chars:
+            reasons.append("too_short")
+        if self.require_structure and not _STRUCTURE_RE.search(stripped):
+            reasons.append("no_structure")
+        if self.require_sections:
+            lowered = stripped.lower()
+            if any(not any(word in lowered for word in words) for words in required_sections(prompt)):
+                reasons.append("missing_sections")
+        return reasons
+
+
+# --------------------- Per-stage escalation stats ---------------------
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _record(stage: str, escalated: bool, reasons: Sequence[str]) -> None:
+    entry = _stats.setdefault(stage, {"calls": 0, "escalated": 0, "reasons": {}})
+    entry["calls"] += 1
+    CASCADE_CALLS.labels(stage, "escalated" if escalated else "accepted").inc()
+    if escalated:
+        entry["escalated"] += 1
+        for reason in reasons:
+            entry["reasons"][reason] = entry["reasons"].get(reason, 0) + 1
+            CASCADE_REJECTIONS.labels(stage, reason).inc()
+
+
+def cascade_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        stage: {**entry, "escalation_rate": round(entry["escalated"] / entry["calls"], 4) if entry["calls"] else 0.0}
+        for stage, entry in _stats.items()
+    }
+
+
+# --------------------- LLMClient wrapper ---------------------
+class CascadeLLMClient(LLMClient):
+    def __init__(self, tiers: Sequence[LLMClient], check: Optional[AcceptanceCheck] = None, stages: Optional[Sequence[str]] = None):
+        if len(tiers) < 2:
+            raise ValueError("CascadeLLMClient needs at least two tiers")
+        self.tiers = list(tiers)
+        self.check = check or AcceptanceCheck()
+        self.stages = set(stages) if stages else None
+        # Identity of the strongest tier: its answers are what callers must be able to rely on
+        self.provider = self.tiers[-1].provider
+        self.model_name = self.tiers[-1].model_name
+
+    def _tiers(self, stage: Optional[str]) -> List[LLMClient]:
+        if self.stages is None or (stage and (stage in self.stages or stage.split(" (")[0] in self.stages)):
+            return self.tiers
+        return self.tiers[-1:]
+
+    async def _try(self, tier: LLMClient, stage: str, prompt: str, text_of) -> Optional[str]:
+        """Run a cheap tier; its text if accepted, else None (the caller escalates)."""
+        with tracing.span("llm.cascade_tier", stage=stage, model=tier.model_name) as span:
+            try:
+                text = await text_of()
+            except (asyncio.CancelledError, TimeBudgetExceeded):
+                raise  # no time left to escalate either
+            except Exception as e:
+                reasons = ["error"]
+                logger.warning("Cascade tier %s failed for %s: %s; escalating", tier.model_name, stage, e)
+            else:
+                reasons = self.check(prompt, text)
+            span.set("accepted", not reasons)
+            if reasons:
+                span.set("reasons", ",".join(reasons))
+        _record(stage, escalated=bool(reasons), reasons=reasons)
+        if reasons:
+            logger.info("Escalating %s past %s: %s", stage, tier.model_name, ", ".join(reasons))
+            return None
+        return text
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        stage = stage_context.current_stage.get() or "unknown"
+        tiers = self._tiers(stage)
+        for tier in tiers[:-1]:
+            text = await self._try(tier, stage, prompt, lambda: tier.generate(prompt, system=system, **kwargs))
+            if text is not None:
+                return text
+        return await tiers[-1].generate(prompt, system=system, **kwargs)
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        stage = stage_context.current_stage.get() or "unknown"
+        tiers = self._tiers(stage)
+        for tier in tiers[:-1]:
+            async def buffered(tier: LLMClient = tier) -> str:
+                return "".join([chunk async for chunk in tier.stream(prompt, system=system, **kwargs)])
+
+            text = await self._try(tier, stage, prompt, buffered)
+            if text is not None:
+                yield text
+                return
+        async for chunk in tiers[-1].stream(prompt, system=system, **kwargs):
+            yield chunk
+
+    def batches_natively(self, count: int) -> bool:
+        return len(self._tiers(stage_context.current_stage.get() or "unknown")) == 1 and self.tiers[-1].batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        if len(self._tiers(stage_context.current_stage.get() or "unknown")) == 1:
+            return await self.tiers[-1].generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)  # cascaded per prompt
@@ -1,6 +1,9 @@
 """
 Simple abstracted LLM client interface with a minimal implementation for Gemini API.
-Export LLMClient class with method: async generate(prompt: str, system: str | None = None) -> str
+Export LLMClient class with methods:
+- async generate(prompt: str, system: str | None = None) -> str
+- async stream(prompt: str, system: str | None = None) -> AsyncIterator[str]  (incremental chunks)
+- async generate_many(prompts: Sequence[str], system: str | None = None) -> List[str | LLMProviderError]
 
 Supports:
 - Gemini (production default)
@@ -8,30 +11,264 @@ Supports:
 - OpenAI (commented out example)
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Iterator, List, Mapping, Sequence, TypeVar, Union
 import abc
 import asyncio
 import os
+import random
+import re
+import threading
 from api.ai.core.utils import get_logger
+from api.ai.core.deadlines import TimeBudgetExceeded, time_left
 
 logger = get_logger("llm_client")
 
+T = TypeVar("T")
+
 
 class LLMClient(abc.ABC):
     """Abstract base class for LLM providers."""
 
+    # Identity used for cache keys, rate limits and metrics
+    provider: str = "unknown"
+    model_name: str = "default"
+
     @abc.abstractmethod
     async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
         raise NotImplementedError
 
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Yield the completion incrementally. Joining every chunk must give the same
+        text `generate` would return. Default: a single chunk from `generate`.
+        """
+        yield await self.generate(prompt, system=system, **kwargs)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, "LLMProviderError"]]:
+        """
+        One completion per prompt, in prompt order. A failed item holds its
+        LLMProviderError instead of raising, so one bad prompt does not sink the
+        rest. Default: `generate` per prompt, `concurrency` (LLM_BATCH_CONCURRENCY)
+        at a time; providers with a batch API override it.
+        """
+        return await generate_each(self, prompts, system, concurrency, kwargs)
+
+    def batches_natively(self, count: int) -> bool:
+        """Whether `generate_many` of `count` prompts is sent as one provider batch job."""
+        return False
+
+
+# --------------------- Provider errors ---------------------
+class LLMProviderError(Exception):
+    """
+    A failed provider call. `retryable` separates transient failures (rate limits,
+    5xx, timeouts, connection resets) from fatal ones (bad request, auth, unknown model).
+    `headers` are the response headers when there was a response (rate-limit state).
+    """
+
+    def __init__(
+        self,
+        message: str,
+        provider: str = "unknown",
+        retryable: bool = True,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        super().__init__(message)
+        self.provider = provider
+        self.retryable = retryable
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+_FATAL_STATUS = {400, 401, 403, 404, 422}
+_FATAL_NAMES_RE = re.compile(r"InvalidArgument|PermissionDenied|Unauthenticated|NotFound|InvalidRequest|Authentication|BlockedPrompt|StopCandidate", re.IGNORECASE)
+# A status in a message only counts when spelled as one ("HTTP 503", "429 Too Many Requests"), not any number ("404 ms", "host:443")
+_STATUS_RE = re.compile(
+    r"\bHTTP[/\d.]*\s+([45]\d\d)\b"
+    r"|\b([45]\d\d) (?:Bad Request|Unauthorized|Forbidden|Not Found|Unprocessable|Too Many Requests"
+    r"|Internal Server Error|Bad Gateway|Service Unavailable|Gateway Timeout)"
+)
+# Transport failures of the SDKs and HTTP clients (httpx, openai, aiohttp), matched by name to avoid importing them
+_TRANSPORT_NAMES_RE = re.compile(r"^(TransportError|TimeoutException|APIConnectionError|APITimeoutError|ClientConnectionError)$")
+
+
+def _is_transport_error(exc: BaseException) -> bool:
+    return isinstance(exc, (TimeoutError, ConnectionError)) or any(_TRANSPORT_NAMES_RE.match(c.__name__) for c in type(exc).__mro__)
+
+
+def classify_error(exc: BaseException, provider: str = "unknown") -> LLMProviderError:
+    """
+    Map an SDK/transport exception to an LLMProviderError (idempotent). Timeouts and
+    connection failures are retryable whatever their message says; otherwise the status
+    comes from the exception's attributes, or from an explicit "HTTP nnn" in its message.
+    """
+    if isinstance(exc, LLMProviderError):
+        return exc
+    transport = _is_transport_error(exc)
+    status = getattr(exc, "status_code", None) or getattr(exc, "http_status", None) or getattr(exc, "code", None)
+    if not isinstance(status, int) or isinstance(status, bool):
+        match = None if transport else _STATUS_RE.search(str(exc))
+        status = int(match.group(1) or match.group(2)) if match else None
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except ValueError:
+        retry_after = None
+    if transport:
+        retryable = True
+    elif status in _FATAL_STATUS or (status is None and _FATAL_NAMES_RE.search(type(exc).__name__)):
+        retryable = False
+    else:
+        retryable = True
+    return LLMProviderError(
+        f"{provider} API failed: {exc}",
+        provider=provider,
+        retryable=retryable,
+        status_code=status,
+        retry_after=retry_after,
+        headers=dict(headers) if hasattr(headers, "items") and headers else None,
+    )
+
+
+async def generate_each(
+    client: LLMClient, prompts: Sequence[str], system: Optional[str], concurrency: Optional[int], kwargs: Dict[str, Any]
+) -> List[Union[str, LLMProviderError]]:
+    """`client.generate` for every prompt with at most `concurrency` in flight; errors are returned in place."""
+    if concurrency is None:
+        from api.config.settings import get_settings
+
+        concurrency = get_settings().LLM_BATCH_CONCURRENCY
+    slots = asyncio.Semaphore(max(concurrency, 1))
+
+    async def one(prompt: str) -> Union[str, LLMProviderError]:
+        async with slots:
+            try:
+                return await client.generate(prompt, system=system, **kwargs)
+            except TimeBudgetExceeded:
+                raise  # the whole call is out of time, not this item
+            except Exception as e:
+                return classify_error(e, client.provider)
+
+    tasks = [asyncio.ensure_future(one(p)) for p in prompts]
+    try:
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()  # no-op unless the call was cancelled or ran out of time
+
+
+def _request_timeout() -> Optional[float]:
+    """
+    SDK-level timeout from the stage's time budget. Executor threads cannot be
+    cancelled, so only the SDK giving up frees a thread stuck on a hung request.
+    """
+    left = time_left()
+    return max(left, 1.0) if left is not None else None
+
+
+async def _iterate_in_executor(make_iter: Callable[[], Iterator[T]]) -> AsyncIterator[T]:
+    """
+    Drive a blocking SDK iterator from the default executor, one item per hop.
+
+    When the consumer stops early (cancelled run, losing hedge) the iterator is
+    closed so the SDK stops reading the response. A `next` already blocked in a
+    thread cannot be interrupted; the close waits for it and its item is dropped.
+    """
+    loop = asyncio.get_event_loop()
+    iterator = await loop.run_in_executor(None, lambda: iter(make_iter()))
+    lock = threading.Lock()
+    done = object()
+
+    def _step():
+        with lock:
+            return next(iterator, done)
+
+    def _close() -> None:
+        with lock:
+            try:
+                iterator.close()
+            except Exception as e:
+                logger.debug("Closing SDK stream failed: %s", e)
+
+    finished = False
+    try:
+        while True:
+            item = await loop.run_in_executor(None, _step)
+            if item is done:
+                finished = True
+                return
+            yield item
+    finally:
+        if not finished and hasattr(iterator, "close"):
+            loop.run_in_executor(None, _close)
+
 
 # ============================
 # ✅ MOCK CLIENT (for testing)
 # ============================
 class MockLLMClient(LLMClient):
+    """
+    Deterministic offline client. `latency` is a fixed delay in seconds or a
+    callable returning one per call (e.g. a sampled long-tail distribution).
+    For load modelling, `output_chars` (int or callable) pads responses to a
+    realistic size and `error_rate` fails that share of calls with a retryable
+    LLMProviderError, drawn from `rng`.
+    """
+
+    provider = "mock"
+    model_name = "mock"
+    STREAM_CHUNK_SIZE = 16
+    _FILLER = " lorem ipsum dolor sit amet consectetur adipiscing elit"
+
+    def __init__(
+        self,
+        latency: Union[float, Callable[[], float]] = 0.05,
+        output_chars: Optional[Union[int, Callable[[], int]]] = None,
+        error_rate: float = 0.0,
+        rng: Optional[random.Random] = None,
+    ):
+        self.latency = latency
+        self.output_chars = output_chars
+        self.error_rate = error_rate
+        self.rng = rng or random.Random(0)
+
+    def _latency(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise LLMProviderError("mock API failed: injected 503", provider=self.provider, status_code=503)
+
     async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
-        await asyncio.sleep(0.05)
-        return f"[MOCK LLM RESPONSE] system={system or 'none'} prompt_summary={prompt[:200]}"
+        await asyncio.sleep(self._latency())
+        self._maybe_fail()
+        return self._response(prompt, system)
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        text = self._response(prompt, system)
+        chunks = [text[i:i + self.STREAM_CHUNK_SIZE] for i in range(0, len(text), self.STREAM_CHUNK_SIZE)]
+        # Same total latency as generate(), spread across the chunks
+        delay = self._latency() / max(len(chunks), 1)
+        self._maybe_fail()
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+    def _response(self, prompt: str, system: Optional[str]) -> str:
+        text = f"[MOCK LLM RESPONSE] system={system or 'none'} prompt_summary={prompt[:200]}"
+        if self.output_chars is None:
+            return text
+        size = self.output_chars() if callable(self.output_chars) else self.output_chars
+        if len(text) >= size:
+            return text[:size]
+        filler = self._FILLER * (1 + (size - len(text)) // len(self._FILLER))
+        return (text + filler)[:size]
 
 
 # =======================================
@@ -46,6 +283,8 @@ class GeminiClient(LLMClient):
         export GEMINI_API_KEY="your_api_key"
     """
 
+    provider = "gemini"
+
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         import google.generativeai as genai
 
@@ -56,6 +295,7 @@ class GeminiClient(LLMClient):
         # Prioritize model from constructor, then ENV, then default
         model_name = model or os.getenv("GEMINI_MODEL_NAME") or "gemini-1.5-flash"
         genai.configure(api_key=self.api_key)
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
         logger.info(f"GeminiClient initialized with model: {model_name}")
 
@@ -65,18 +305,46 @@ class GeminiClient(LLMClient):
         Wraps blocking SDK calls in executor for non-blocking behavior.
         """
         loop = asyncio.get_event_loop()
+        options = self._request_options()
 
         def _call() -> str:
             sys_prefix = f"System: {system}\n\n" if system else ""
             full_prompt = f"{sys_prefix}{prompt}"
-            try:
-                response = self.model.generate_content(full_prompt)
-                return response.text or "[Empty Gemini response]"
-            except Exception as e:
-                logger.error(f"Gemini API error: {e}")
-                return f"[ERROR] Gemini API failed: {str(e)}"
+            response = self.model.generate_content(full_prompt, **options)
+            return response.text or "[Empty Gemini response]"
+
+        try:
+            # Cancelling this await abandons the call; the SDK request finishes in its thread
+            return await loop.run_in_executor(None, _call)
+        except Exception as e:
+            logger.error(f"Gemini API error: {e}")
+            raise classify_error(e, self.provider) from e
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Stream content from Gemini (generate_content(stream=True)).
+        Errors are raised as LLMProviderError, like in `generate`.
+        """
+        sys_prefix = f"System: {system}\n\n" if system else ""
+        full_prompt = f"{sys_prefix}{prompt}"
+        options = self._request_options()
+        produced = False
+        try:
+            async for chunk in _iterate_in_executor(lambda: self.model.generate_content(full_prompt, stream=True, **options)):
+                text = chunk.text
+                if text:
+                    produced = True
+                    yield text
+        except Exception as e:
+            logger.error(f"Gemini API error: {e}")
+            raise classify_error(e, self.provider) from e
+        if not produced:
+            yield "[Empty Gemini response]"
 
-        return await loop.run_in_executor(None, _call)
+    @staticmethod
+    def _request_options() -> Dict[str, Any]:
+        timeout = _request_timeout()
+        return {"request_options": {"timeout": timeout}} if timeout is not None else {}
 
 
 # =======================================================
@@ -84,14 +352,18 @@ class GeminiClient(LLMClient):
 # =======================================================
 
 class OpenAIClient(LLMClient):
+    provider = "openai"
+
     def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o"):
         import openai
         self._openai = openai
         self._openai.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model
+        self.model_name = model
 
     async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
         loop = asyncio.get_event_loop()
+        kwargs = self._with_timeout(kwargs)
 
         def _call():
             msgs = []
@@ -101,22 +373,60 @@ class OpenAIClient(LLMClient):
             resp = self._openai.ChatCompletion.create(model=self.model, messages=msgs, **kwargs)
             return resp["choices"][0]["message"]["content"]
 
-        return await loop.run_in_executor(None, _call)
+        try:
+            return await loop.run_in_executor(None, _call)
+        except Exception as e:
+            raise classify_error(e, self.provider) from e
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        msgs = []
+        if system:
+            msgs.append({"role": "system", "content": system})
+        msgs.append({"role": "user", "content": prompt})
+        kwargs = self._with_timeout(kwargs)
+
+        def _start():
+            return self._openai.ChatCompletion.create(model=self.model, messages=msgs, stream=True, **kwargs)
+
+        try:
+            async for chunk in _iterate_in_executor(_start):
+                text = chunk["choices"][0].get("delta", {}).get("content")
+                if text:
+                    yield text
+        except Exception as e:
+            raise classify_error(e, self.provider) from e
+
+    @staticmethod
+    def _with_timeout(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        timeout = _request_timeout()
+        if timeout is None or "request_timeout" in kwargs:
+            return kwargs
+        return {**kwargs, "request_timeout": timeout}
 
 
 # ============================
 # Factory helper
 # ============================
-def get_llm_client(provider: str = "gemini") -> LLMClient:
+def get_llm_client(provider: str = "gemini", api_key: Optional[str] = None, model: Optional[str] = None) -> LLMClient:
     """
     Helper to select the correct LLM provider.
     provider: "gemini" | "mock" | "openai"
+    Real providers use the async HTTP clients (llm_http) unless LLM_HTTP_CLIENT=sdk.
     """
+    from api.config.settings import get_settings
+
+    native = get_settings().LLM_HTTP_CLIENT != "sdk"
     if provider == "mock":
         return MockLLMClient()
     elif provider == "gemini":
-        return GeminiClient()
+        if native:
+            from api.ai.agents.llm_http import GeminiHTTPClient
+            return GeminiHTTPClient(api_key=api_key, model=model)
+        return GeminiClient(api_key=api_key, model=model)
     elif provider == "openai":
-        return OpenAIClient()
+        if native:
+            from api.ai.agents.llm_http import OpenAIHTTPClient
+            return OpenAIHTTPClient(api_key=api_key, model=model or "gpt-4o")
+        return OpenAIClient(api_key=api_key, model=model or "gpt-4o")
     else:
         raise ValueError(f"Unknown LLM provider: {provider}")
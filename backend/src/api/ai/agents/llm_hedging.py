@@ -0,0 +1,230 @@
+"""
+Hedged (speculative) LLM requests to cut tail latency.
+
+HedgedLLMClient sends the request to `primary`; if it has not answered by the
+hedge deadline (a latency percentile of recent calls), a duplicate goes to
+`secondary` (or the primary again). The first success wins and the loser is
+cancelled. A rolling hedge-rate cap bounds the extra cost.
+
+For streams the race is on the first chunk (time to first token); the winner
+then streams to completion. Generate latencies and stream first-chunk times are
+kept in separate windows (their percentiles differ by the whole generation), and
+only successful calls are recorded.
+
+Latency history lives in a HedgePolicy shared per provider/model, so the
+short-lived per-run clients built by the routes all learn from the same window.
+"""
+
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import math
+import time
+
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+
+logger = get_logger("llm_hedging")
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        initial_delay: float = 2.0,
+        min_delay: float = 0.05,
+        max_delay: float = 30.0,
+        max_hedge_rate: float = 0.1,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        if not 0.0 < quantile < 1.0:
+            raise ValueError("quantile must be in (0, 1)")
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        # Successful call latencies per kind: full answers ("generate"), first chunks ("stream")
+        self._latencies: Dict[str, Deque[float]] = {kind: deque(maxlen=window) for kind in ("generate", "stream")}
+        self._hedged: Deque[bool] = deque(maxlen=window)
+        self.counters: Dict[str, int] = {"requests": 0, "hedges": 0, "hedge_wins": 0, "hedges_suppressed": 0}
+
+    def hedge_delay(self, kind: str = "generate") -> float:
+        """Seconds to wait for the primary before hedging: the configured latency percentile of `kind` calls."""
+        latencies = self._latencies[kind]
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(latencies)
+        idx = min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)
+        return min(max(ordered[idx], self.min_delay), self.max_delay)
+
+    def may_hedge(self) -> bool:
+        if not self._hedged:
+            return self.max_hedge_rate > 0
+        return sum(self._hedged) / len(self._hedged) < self.max_hedge_rate
+
+    def record(self, latency: Optional[float], hedged: bool, kind: str = "generate") -> None:
+        """`latency` is None for a failed call: it counts toward the hedge rate, not the latency window."""
+        if latency is not None:
+            self._latencies[kind].append(latency)
+        self._hedged.append(hedged)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "hedge_delay": {kind: round(self.hedge_delay(kind), 4) for kind in self._latencies}}
+
+
+async def _first_success(tasks: set) -> asyncio.Future:
+    """Return the first task to succeed; re-raise the first error if all fail. Losers are left to the caller."""
+    pending = set(tasks)
+    first_error: Optional[BaseException] = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                return task
+            first_error = first_error or task.exception()
+    raise first_error
+
+
+async def _cancel(tasks) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class HedgedLLMClient(LLMClient):
+    def __init__(self, primary: LLMClient, secondary: Optional[LLMClient] = None, policy: Optional[HedgePolicy] = None):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.policy = policy or HedgePolicy()
+        self.provider = primary.provider
+        self.model_name = primary.model_name
+
+    # --------------------- Generate ---------------------
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        policy = self.policy
+        policy.counters["requests"] += 1
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self.primary.generate(prompt, system=system, **kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=policy.hedge_delay())
+            if done or not policy.may_hedge():
+                if not done:
+                    policy.counters["hedges_suppressed"] += 1
+                try:
+                    result = await primary
+                except BaseException:
+                    policy.record(None, hedged=False)
+                    raise
+                policy.record(time.monotonic() - start, hedged=False)
+                return result
+
+            policy.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self.secondary.generate(prompt, system=system, **kwargs))
+            contenders = {primary, hedge}
+            try:
+                winner = await _first_success(contenders)
+            except BaseException:
+                policy.record(None, hedged=True)
+                raise
+            finally:
+                await _cancel([t for t in contenders if not t.done()])
+            policy.record(time.monotonic() - start, hedged=True)
+            if winner is hedge:
+                policy.counters["hedge_wins"] += 1
+                logger.debug("Hedge won after %.2fs", time.monotonic() - start)
+            return winner.result()
+        except BaseException:
+            # Also on cancellation (stage deadline, /cancel): the provider call must not outlive its caller
+            await _cancel([primary])
+            raise
+
+    # --------------------- Stream ---------------------
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        policy = self.policy
+        policy.counters["requests"] += 1
+        start = time.monotonic()
+        contenders: Dict[asyncio.Future, Tuple[AsyncIterator[str], bool]] = {}
+
+        def _launch(client: LLMClient, is_hedge: bool) -> None:
+            iterator = client.stream(prompt, system=system, **kwargs).__aiter__()
+            contenders[asyncio.ensure_future(iterator.__anext__())] = (iterator, is_hedge)
+
+        _launch(self.primary, False)
+        try:
+            done, _ = await asyncio.wait(set(contenders), timeout=policy.hedge_delay("stream"))
+        except BaseException:
+            await _cancel(list(contenders))
+            for iterator, _ in contenders.values():
+                await iterator.aclose()
+            raise
+        hedged = False
+        if not done:
+            if policy.may_hedge():
+                hedged = True
+                policy.counters["hedges"] += 1
+                _launch(self.secondary, True)
+            else:
+                policy.counters["hedges_suppressed"] += 1
+
+        winner: Optional[asyncio.Future] = None
+        first_chunk: Optional[float] = None
+        try:
+            winner = await _first_success(set(contenders))
+            first_chunk = time.monotonic() - start
+        except StopAsyncIteration:
+            first_chunk = time.monotonic() - start
+            return  # empty stream
+        finally:
+            losers = [t for t in contenders if t is not winner]
+            await _cancel([t for t in losers if not t.done()])
+            for task in losers:
+                await contenders[task][0].aclose()
+            policy.record(first_chunk, hedged, kind="stream")
+
+        iterator, is_hedge = contenders[winner]
+        if is_hedge:
+            policy.counters["hedge_wins"] += 1
+        try:
+            yield winner.result()
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            # The consumer may stop early: release the winning provider stream too
+            await iterator.aclose()
+
+    # --------------------- Generate many ---------------------
+    def batches_natively(self, count: int) -> bool:
+        return self.primary.batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        if self.batches_natively(len(prompts)):
+            # A batch job runs for minutes: there is no tail latency worth a duplicate job
+            return await self.primary.generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+
+
+# --------------------- Process-wide policies ---------------------
+_policies: Dict[Tuple[str, str], HedgePolicy] = {}
+
+
+def get_hedge_policy(provider: str, model_name: str) -> HedgePolicy:
+    key = (provider, model_name)
+    if key not in _policies:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _policies[key] = HedgePolicy(
+            quantile=settings.LLM_HEDGE_QUANTILE,
+            initial_delay=settings.LLM_HEDGE_INITIAL_DELAY,
+            max_hedge_rate=settings.LLM_HEDGE_MAX_RATE,
+        )
+    return _policies[key]
+
+
+def hedge_stats_by_model() -> Dict[str, Dict[str, Any]]:
+    return {f"{provider}/{model}": policy.stats() for (provider, model), policy in _policies.items()}
@@ -0,0 +1,396 @@
+"""
+Async-native LLM provider clients over plain HTTP (no vendor SDK, no executor threads).
+
+- get_http_client(): one process-wide httpx.AsyncClient; its connection pool
+  keeps connections alive between calls and uses HTTP/2 when `h2` is installed
+- GeminiHTTPClient: Gemini REST API (generateContent / streamGenerateContent?alt=sse)
+- OpenAIHTTPClient: OpenAI-compatible /chat/completions (stream=true -> SSE)
+
+From LLM_NATIVE_BATCH_MIN_PROMPTS prompts, `generate_many` submits one provider
+batch job (Gemini batchGenerateContent with inline requests, OpenAI /batches over
+an uploaded JSONL file) and polls it, instead of one request per prompt.
+
+Unlike the SDK clients in llm_client, cancelling a call (hedge loser, cancelled
+run, stage deadline) aborts the request and returns its connection to the pool.
+Errors are raised as LLMProviderError, like every other client.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional, Sequence, Union
+import asyncio
+import json
+import os
+
+import httpx
+
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_client import LLMClient, LLMProviderError, _FATAL_STATUS, _request_timeout
+
+logger = get_logger("llm_http")
+
+# --------------------- Shared connection pool ---------------------
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The pooled client shared by every native provider client of this process."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(settings.LLM_HTTP_READ_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT),
+        )
+        logger.info("LLM HTTP pool initialised (http2=%s, max_connections=%d)", http2, settings.LLM_HTTP_MAX_CONNECTIONS)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# --------------------- Helpers ---------------------
+def _timeout(http: httpx.AsyncClient) -> httpx.Timeout:
+    """The client's timeouts, with reads cut to what is left of the stage budget."""
+    left = _request_timeout()
+    if left is None:
+        return http.timeout
+    return httpx.Timeout(
+        connect=min(http.timeout.connect or left, left),
+        read=min(http.timeout.read or left, left),
+        write=min(http.timeout.write or left, left),
+        pool=min(http.timeout.pool or left, left),
+    )
+
+
+def _status_error(response: httpx.Response, provider: str) -> LLMProviderError:
+    status = response.status_code
+    try:
+        retry_after = float(response.headers["retry-after"]) if "retry-after" in response.headers else None
+    except ValueError:
+        retry_after = None
+    # The body has been read (streamed responses are read before calling this)
+    detail = response.text[:300]
+    return LLMProviderError(
+        f"{provider} API failed: HTTP {status}: {detail}",
+        provider=provider,
+        retryable=status not in _FATAL_STATUS,
+        status_code=status,
+        retry_after=retry_after,
+        headers=dict(response.headers),
+    )
+
+
+def _transport_error(exc: httpx.HTTPError, provider: str) -> LLMProviderError:
+    # Timeouts, refused/reset connections and protocol errors are all worth a retry
+    return LLMProviderError(f"{provider} API failed: {type(exc).__name__}: {exc}", provider=provider, retryable=True)
+
+
+async def _sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Payloads of the `data:` lines of a server-sent event stream."""
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+
+class _HTTPClient(LLMClient):
+    def __init__(self, http: Optional[httpx.AsyncClient] = None):
+        self._http = http
+        # Called with the headers of every successful response (set by RateLimitedLLMClient, which
+        # follows x-ratelimit-remaining-*); failed ones carry theirs on the LLMProviderError
+        self.header_observer: Optional[Callable[[Mapping[str, str]], None]] = None
+
+    def _observe(self, response: httpx.Response) -> None:
+        if self.header_observer is not None:
+            self.header_observer(response.headers)
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or get_http_client()
+
+    def _url(self, path: str) -> str:
+        raise NotImplementedError
+
+    def _headers(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        http = self.http
+        try:
+            response = await http.request(method, url, headers=self._headers(), timeout=_timeout(http), **kwargs)
+        except httpx.HTTPError as e:
+            raise _transport_error(e, self.provider) from e
+        if response.status_code >= 400:
+            raise _status_error(response, self.provider)
+        self._observe(response)
+        return response
+
+    async def _post(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self._send("POST", self._url(path), json=body)).json()
+
+    async def _post_sse(self, path: str, body: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        http = self.http
+        try:
+            async with http.stream("POST", self._url(path), json=body, headers=self._headers(), timeout=_timeout(http)) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise _status_error(response, self.provider)
+                self._observe(response)
+                async for data in _sse_data(response):
+                    if data == "[DONE]":
+                        return
+                    if data:
+                        yield json.loads(data)
+        except httpx.HTTPError as e:
+            raise _transport_error(e, self.provider) from e
+
+    # --------------------- Native batch jobs ---------------------
+    def batches_natively(self, count: int) -> bool:
+        from api.config.settings import get_settings
+
+        threshold = get_settings().LLM_NATIVE_BATCH_MIN_PROMPTS
+        return threshold > 0 and count >= threshold
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        if not self.batches_natively(len(prompts)):
+            return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        from api.config.settings import get_settings
+
+        try:
+            job = await self._submit_batch(prompts, system, kwargs)
+        except LLMProviderError as e:
+            return [e] * len(prompts)
+        logger.info("%s batch job %s submitted (%d prompts)", self.provider, job, len(prompts))
+        try:
+            while True:
+                try:
+                    finished = await self._poll_batch(job)
+                except LLMProviderError as e:
+                    if not e.retryable:
+                        return [e] * len(prompts)
+                    logger.warning("Polling %s batch job %s failed: %s", self.provider, job, e)
+                    finished = None
+                if finished is not None:
+                    return await self._batch_results(finished, len(prompts))
+                await asyncio.sleep(get_settings().LLM_BATCH_POLL_SECONDS)
+        except asyncio.CancelledError:
+            # Nobody is waiting for the answers any more: stop the provider working (and billing) on them
+            await asyncio.shield(self._cancel_quietly(job))
+            raise
+
+    async def _cancel_quietly(self, job: str) -> None:
+        try:
+            await self._cancel_batch(job)
+        except LLMProviderError as e:
+            logger.warning("Cancelling %s batch job %s failed: %s", self.provider, job, e)
+
+    async def _submit_batch(self, prompts: Sequence[str], system: Optional[str], kwargs: Dict[str, Any]) -> str:
+        """Create the batch job; returns its id."""
+        raise NotImplementedError
+
+    async def _poll_batch(self, job: str) -> Optional[Dict[str, Any]]:
+        """The job's final status, or None while it is still running."""
+        raise NotImplementedError
+
+    async def _batch_results(self, status: Dict[str, Any], count: int) -> List[Union[str, LLMProviderError]]:
+        raise NotImplementedError
+
+    async def _cancel_batch(self, job: str) -> None:
+        raise NotImplementedError
+
+
+# =======================================
+# Gemini (REST)
+# =======================================
+class GeminiHTTPClient(_HTTPClient):
+    provider = "gemini"
+    # google.rpc.Code values of batch item errors that no retry fixes
+    _FATAL_CODES = {3, 5, 7, 16}  # INVALID_ARGUMENT, NOT_FOUND, PERMISSION_DENIED, UNAUTHENTICATED
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, base_url: Optional[str] = None, http: Optional[httpx.AsyncClient] = None):
+        from api.config.settings import get_settings
+
+        super().__init__(http)
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("Missing GEMINI_API_KEY environment variable or provided api_key")
+        self.model_name = model or os.getenv("GEMINI_MODEL_NAME") or "gemini-1.5-flash"
+        self.base_url = (base_url or get_settings().GEMINI_BASE_URL).rstrip("/")
+        logger.info(f"GeminiHTTPClient initialized with model: {self.model_name}")
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/models/{self.model_name}:{path}"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key}
+
+    @staticmethod
+    def _body(prompt: str, system: Optional[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        if kwargs:
+            body["generationConfig"] = kwargs
+        return body
+
+    @staticmethod
+    def _text(payload: Dict[str, Any]) -> str:
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(p.get("text", "") for p in parts)
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        payload = await self._post("generateContent", self._body(prompt, system, kwargs))
+        return self._text(payload) or "[Empty Gemini response]"
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        produced = False
+        async for payload in self._post_sse("streamGenerateContent?alt=sse", self._body(prompt, system, kwargs)):
+            text = self._text(payload)
+            if text:
+                produced = True
+                yield text
+        if not produced:
+            yield "[Empty Gemini response]"
+
+    async def _submit_batch(self, prompts: Sequence[str], system: Optional[str], kwargs: Dict[str, Any]) -> str:
+        requests = [{"request": self._body(p, system, kwargs), "metadata": {"key": str(i)}} for i, p in enumerate(prompts)]
+        body = {"batch": {"displayName": "autoteam", "inputConfig": {"requests": {"requests": requests}}}}
+        return (await self._post("batchGenerateContent", body))["name"]
+
+    async def _poll_batch(self, job: str) -> Optional[Dict[str, Any]]:
+        operation = (await self._send("GET", f"{self.base_url}/{job}")).json()
+        return operation if operation.get("done") else None
+
+    async def _batch_results(self, operation: Dict[str, Any], count: int) -> List[Union[str, LLMProviderError]]:
+        state = (operation.get("metadata") or {}).get("state", "without results")
+        results: List[Union[str, LLMProviderError]] = [self._batch_error(operation.get("error") or {"message": f"batch job ended {state}"})] * count
+        inlined = ((operation.get("response") or {}).get("inlinedResponses") or {}).get("inlinedResponses") or []
+        for pos, item in enumerate(inlined):
+            key = (item.get("metadata") or {}).get("key")
+            idx = int(key) if key is not None else pos
+            if item.get("error"):
+                results[idx] = self._batch_error(item["error"])
+            else:
+                results[idx] = self._text(item.get("response") or {}) or "[Empty Gemini response]"
+        return results
+
+    def _batch_error(self, error: Dict[str, Any]) -> LLMProviderError:
+        code = error.get("code")
+        return LLMProviderError(
+            f"{self.provider} API failed: batch item: {error.get('message', error)}",
+            provider=self.provider,
+            retryable=code not in self._FATAL_CODES,
+        )
+
+    async def _cancel_batch(self, job: str) -> None:
+        await self._send("POST", f"{self.base_url}/{job}:cancel")
+
+
+# =======================================
+# OpenAI (chat completions)
+# =======================================
+class OpenAIHTTPClient(_HTTPClient):
+    provider = "openai"
+    _BATCH_ENDPOINT = "/v1/chat/completions"
+    _BATCH_FINAL = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o", base_url: Optional[str] = None, http: Optional[httpx.AsyncClient] = None):
+        from api.config.settings import get_settings
+
+        super().__init__(http)
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model
+        self.model_name = model
+        self.base_url = (base_url or get_settings().OPENAI_BASE_URL).rstrip("/")
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path}"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _body(self, prompt: str, system: Optional[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        msgs = []
+        if system:
+            msgs.append({"role": "system", "content": system})
+        msgs.append({"role": "user", "content": prompt})
+        return {"model": self.model, "messages": msgs, **kwargs}
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        payload = await self._post("chat/completions", self._body(prompt, system, kwargs))
+        return payload["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        body = {**self._body(prompt, system, kwargs), "stream": True}
+        async for payload in self._post_sse("chat/completions", body):
+            choices = payload.get("choices") or []
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                yield text
+
+    async def _submit_batch(self, prompts: Sequence[str], system: Optional[str], kwargs: Dict[str, Any]) -> str:
+        lines = [
+            json.dumps({"custom_id": str(i), "method": "POST", "url": self._BATCH_ENDPOINT, "body": self._body(p, system, kwargs)})
+            for i, p in enumerate(prompts)
+        ]
+        upload = await self._send(
+            "POST", self._url("files"), data={"purpose": "batch"}, files={"file": ("batch.jsonl", "\n".join(lines).encode(), "application/jsonl")}
+        )
+        job = await self._post("batches", {"input_file_id": upload.json()["id"], "endpoint": self._BATCH_ENDPOINT, "completion_window": "24h"})
+        return job["id"]
+
+    async def _poll_batch(self, job: str) -> Optional[Dict[str, Any]]:
+        status = (await self._send("GET", self._url(f"batches/{job}"))).json()
+        return status if status.get("status") in self._BATCH_FINAL else None
+
+    async def _batch_results(self, status: Dict[str, Any], count: int) -> List[Union[str, LLMProviderError]]:
+        ended = LLMProviderError(f"{self.provider} API failed: batch job ended {status.get('status')}", provider=self.provider)
+        results: List[Union[str, LLMProviderError]] = [ended] * count
+        # Expired and cancelled jobs still deliver the items they finished
+        for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+            if not file_id:
+                continue
+            content = (await self._send("GET", self._url(f"files/{file_id}/content"))).text
+            for line in content.splitlines():
+                if line.strip():
+                    item = json.loads(line)
+                    results[int(item["custom_id"])] = self._batch_item(item)
+        return results
+
+    def _batch_item(self, item: Dict[str, Any]) -> Union[str, LLMProviderError]:
+        response = item.get("response") or {}
+        status = response.get("status_code")
+        if item.get("error") or not status or status >= 400:
+            error = item.get("error") or (response.get("body") or {}).get("error") or {}
+            return LLMProviderError(
+                f"{self.provider} API failed: batch item: HTTP {status}: {error.get('message', error)}",
+                provider=self.provider,
+                retryable=status not in _FATAL_STATUS,
+                status_code=status,
+            )
+        return response["body"]["choices"][0]["message"]["content"] or ""
+
+    async def _cancel_batch(self, job: str) -> None:
+        await self._send("POST", self._url(f"batches/{job}/cancel"))
@@ -0,0 +1,311 @@
+"""
+Process-wide request/token rate limiting for LLM providers.
+
+- RateLimiter: two token buckets (requests per minute, tokens per minute);
+  callers wait in FIFO order instead of failing
+- RateLimitedLLMClient: LLMClient wrapper that reserves an estimate before the
+  call and settles it against the real response size afterwards
+- get_rate_limiter(provider, model, api_key): one limiter per key, shared by the
+  short-lived per-run clients
+
+The native HTTP clients report the headers of every response, so the buckets
+follow the provider's `x-ratelimit-remaining-*` counts. When the provider still
+answers 429 (other processes share the quota, or the configured limits are too
+optimistic) the limiter pauses for the advertised Retry-After (else for as long
+as its rates take to refill the failed call) and halves its effective rate,
+then recovers it gradually with every successful call.
+A caller whose wait would outlast its stage's time budget fails at once.
+"""
+
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+import asyncio
+import hashlib
+import re
+import time
+
+from api.ai.core.utils import get_logger
+from api.ai.core.token_budget import count_tokens
+from api.ai.core.deadlines import TimeBudgetExceeded, time_left
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+
+logger = get_logger("llm_ratelimit")
+
+_RATE_LIMIT_RE = re.compile(r"\b429\b|rate.?limit|quota|resource.?exhausted|too many requests", re.IGNORECASE)
+_RETRY_AFTER_RE = re.compile(r"retry(?:[ _-]?after| in|_delay\s*\{\s*seconds:)\s*:?\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for provider 429s."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "http_status", None) == 429:
+        return True
+    return bool(_RATE_LIMIT_RE.search(f"{type(error).__name__} {error}"))
+
+
+def retry_after_seconds(error: Any) -> Optional[float]:
+    if getattr(error, "retry_after", None) is not None:
+        return float(error.retry_after)
+    headers = _headers_of(error)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    match = _RETRY_AFTER_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def _headers_of(error: Any) -> Optional[Mapping[str, str]]:
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers
+
+
+@dataclass
+class _Bucket:
+    capacity: float
+    level: float
+    updated: float
+
+    def refill(self, now: float, rate: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    `rpm` / `tpm` of 0 disable that dimension. Buckets start full, so a burst of up
+    to one minute's quota goes through immediately.
+    """
+
+    MIN_SCALE = 0.1
+    RECOVERY_STEP = 0.05  # share of the configured rate regained per successful call
+    DEFAULT_PAUSE = 1.0  # after a 429 without Retry-After, when no rate says how long to wait
+    MAX_PAUSE = 60.0  # per-minute quotas: a minute always restores the full quota
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, name: str = "llm"):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        now = time.monotonic()
+        self._requests = _Bucket(rpm, rpm, now)
+        self._tokens = _Bucket(tpm, tpm, now)
+        self._lock = asyncio.Lock()  # FIFO: waiters are served in arrival order
+        self._scale = 1.0
+        self._paused_until = 0.0
+        self.waiting = 0
+        self.counters: Dict[str, float] = {"acquired": 0, "throttled": 0, "wait_seconds": 0.0, "rate_limited": 0, "deadline_rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _refill(self, now: float) -> None:
+        self._requests.refill(now, self.rpm / 60.0 * self._scale)
+        self._tokens.refill(now, self.tpm / 60.0 * self._scale)
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = max(self._paused_until - now, 0.0)
+        if self.rpm and self._requests.level < 1:
+            wait = max(wait, (1 - self._requests.level) / (self.rpm / 60.0 * self._scale))
+        if self.tpm and self._tokens.level < tokens:
+            wait = max(wait, (tokens - self._tokens.level) / (self.tpm / 60.0 * self._scale))
+        return wait
+
+    # --------------------- Acquire / settle ---------------------
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request and `tokens` tokens fit, then debit them."""
+        if not self.enabled:
+            return
+        if self.tpm:
+            tokens = min(tokens, self.tpm)  # a single oversized call must not wait forever
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(tokens, now)
+                    if wait <= 0:
+                        break
+                    left = time_left()
+                    if left is not None and wait > left:
+                        self.counters["deadline_rejected"] += 1
+                        raise TimeBudgetExceeded(f"Waiting for {self.name} rate limit", max(left, 0.0))
+                    await asyncio.sleep(wait)
+                if self.rpm:
+                    self._requests.level -= 1
+                if self.tpm:
+                    self._tokens.level -= tokens
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.counters["acquired"] += 1
+        if waited > 0.001:
+            self.counters["throttled"] += 1
+            self.counters["wait_seconds"] += waited
+
+    def settle(self, reserved: int, actual: int, succeeded: bool = True) -> None:
+        """
+        Correct the token bucket once the real usage is known (may go negative, delaying
+        later callers); only a successful call wins back some of the rate halved by 429s.
+        """
+        if self.tpm:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level - (actual - reserved))
+        if succeeded:
+            self._scale = min(1.0, self._scale + self.RECOVERY_STEP)
+
+    # --------------------- Feedback from the provider ---------------------
+    def on_rate_limited(self, retry_after: Optional[float] = None, tokens: int = 0) -> None:
+        """Pause after a 429: for its Retry-After, else until the halved rates refill one request and `tokens`."""
+        self.counters["rate_limited"] += 1
+        self._scale = max(self.MIN_SCALE, self._scale / 2)
+        if retry_after is not None:
+            pause = retry_after
+        else:
+            refills = []
+            if self.rpm:
+                refills.append(60.0 / (self.rpm * self._scale))
+            if self.tpm and tokens:
+                refills.append(min(tokens, self.tpm) / (self.tpm / 60.0 * self._scale))
+            pause = min(max(refills, default=self.DEFAULT_PAUSE), self.MAX_PAUSE)
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning("%s rate limited by provider; pausing %.1fs, rate scaled to %.0f%%", self.name, pause, self._scale * 100)
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Align the buckets with `x-ratelimit-remaining-*` headers (OpenAI-style) when present."""
+        now = time.monotonic()
+        self._refill(now)
+        for key, bucket in (("x-ratelimit-remaining-requests", self._requests), ("x-ratelimit-remaining-tokens", self._tokens)):
+            value = headers.get(key)
+            if value is not None and bucket.capacity:
+                try:
+                    bucket.level = min(bucket.level, float(value))
+                except ValueError:
+                    continue
+
+    def headroom(self) -> float:
+        """Share of the quota available right now (0 while paused by a 429, 1 when disabled)."""
+        now = time.monotonic()
+        if self._paused_until > now:
+            return 0.0
+        self._refill(now)
+        shares = [max(b.level, 0.0) / b.capacity for b in (self._requests, self._tokens) if b.capacity]
+        return min(shares, default=1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill(time.monotonic())
+
+        def used(bucket: _Bucket) -> float:
+            return round(1 - max(bucket.level, 0.0) / bucket.capacity, 4) if bucket.capacity else 0.0
+
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "rpm_utilization": used(self._requests),
+            "tpm_utilization": used(self._tokens),
+            "rate_scale": round(self._scale, 3),
+            "waiting": self.waiting,
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+            **{k: round(v, 3) for k, v in self.counters.items()},
+        }
+
+
+# --------------------- LLMClient wrapper ---------------------
+class RateLimitedLLMClient(LLMClient):
+    def __init__(self, inner: LLMClient, limiter: RateLimiter, expected_output_tokens: int = 1024):
+        self.inner = inner
+        self.limiter = limiter
+        self.expected_output_tokens = expected_output_tokens
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+        if hasattr(inner, "header_observer"):
+            inner.header_observer = limiter.observe_headers
+
+    def _estimate(self, prompt: str, system: Optional[str]) -> Tuple[int, int]:
+        prompt_tokens = count_tokens(prompt) + count_tokens(system or "")
+        return prompt_tokens, prompt_tokens + self.expected_output_tokens
+
+    def _on_error(self, error: Exception, reserved: int) -> None:
+        if is_rate_limit_error(error):
+            self.limiter.on_rate_limited(retry_after_seconds(error), reserved)
+            return
+        headers = _headers_of(error)
+        if headers:
+            self.limiter.observe_headers(headers)
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        prompt_tokens, reserved = self._estimate(prompt, system)
+        await self.limiter.acquire(reserved)
+        text = None
+        try:
+            text = await self.inner.generate(prompt, system=system, **kwargs)
+        except Exception as e:
+            self._on_error(e, reserved)
+            raise
+        finally:
+            # Also on errors and cancellation: the prompt went out, no answer came back
+            output_tokens = count_tokens(text) if text is not None else 0
+            self.limiter.settle(reserved, prompt_tokens + output_tokens, succeeded=text is not None)
+        return text
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        prompt_tokens, reserved = self._estimate(prompt, system)
+        await self.limiter.acquire(reserved)
+        produced = 0
+        succeeded = True
+        try:
+            async for chunk in self.inner.stream(prompt, system=system, **kwargs):
+                produced += count_tokens(chunk)
+                yield chunk
+        except Exception as e:
+            succeeded = False
+            self._on_error(e, reserved)
+            raise
+        except asyncio.CancelledError:
+            succeeded = False
+            raise
+        finally:
+            # On every path, early stops, errors and cancellation included: the prompt and the
+            # tokens produced so far are what was used
+            self.limiter.settle(reserved, prompt_tokens + produced, succeeded=succeeded)
+
+    def batches_natively(self, count: int) -> bool:
+        return self.inner.batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        if self.batches_natively(len(prompts)):
+            # Batch jobs are queued and metered by the provider apart from the interactive quota limited here
+            return await self.inner.generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+
+
+# --------------------- Process-wide limiters ---------------------
+_limiters: Dict[Tuple[str, str, str], RateLimiter] = {}
+
+
+def _key_id(api_key: Optional[str]) -> str:
+    # Never keep raw API keys around just to index limiters
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+
+
+def get_rate_limiter(provider: str, model_name: str, api_key: Optional[str] = None) -> RateLimiter:
+    key = (provider, model_name, _key_id(api_key))
+    if key not in _limiters:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _limiters[key] = RateLimiter(
+            rpm=settings.LLM_RATE_LIMIT_RPM, tpm=settings.LLM_RATE_LIMIT_TPM, name=f"{provider}/{model_name}"
+        )
+    return _limiters[key]
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {f"{provider}/{model}#{key_id}": limiter.stats() for (provider, model, key_id), limiter in _limiters.items()}
@@ -0,0 +1,377 @@
+"""
+Resilience layer for LLM calls.
+
+- CircuitBreaker: per provider/model; opens after consecutive transient failures,
+  fails fast while open and lets a probe through after `recovery_timeout`
+- RetryPolicy: full-jitter exponential backoff that honours Retry-After
+- RetryBudget: caps retries to a share of recent traffic so an outage does not
+  multiply load on the provider
+- ResilientLLMClient: tries the providers of a chain in order, skipping open
+  circuits, retrying transient errors and failing over to the next provider
+
+Only retryable errors (see llm_client.classify_error) count against a circuit;
+a rejected prompt says nothing about provider health and is raised immediately.
+No retry is attempted when its backoff would outlast the stage's time budget.
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+import asyncio
+import random
+import time
+
+from api.ai.core.utils import get_logger
+from api.ai.core.deadlines import TimeBudgetExceeded, time_left
+from api.ai.core.metrics import LLM_ERRORS, LLM_RETRIES
+from api.ai.core import tracing, usage
+from api.ai.agents.llm_client import LLMClient, LLMProviderError, classify_error
+
+logger = get_logger("llm_resilience")
+
+
+class CircuitOpenError(LLMProviderError):
+    def __init__(self, names: Sequence[str], retry_after: float):
+        super().__init__(
+            f"Circuit open for {', '.join(names)}; retry in {retry_after:.0f}s",
+            provider=names[0] if names else "unknown",
+            retryable=False,
+            retry_after=retry_after,
+        )
+
+
+# --------------------- Circuit breaker ---------------------
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.counters: Dict[str, int] = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        self.counters["successes"] += 1
+        if self._state != self.CLOSED:
+            logger.info("Circuit %s closed", self.name)
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probes = 0
+
+    def record_failure(self) -> None:
+        self.counters["failures"] += 1
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def release(self) -> None:
+        """The call ended without an outcome (cancelled); free its half-open probe slot."""
+        if self._state == self.HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def _open(self) -> None:
+        if self._state != self.OPEN:
+            self.counters["opened"] += 1
+            logger.warning("Circuit %s opened after %d failures", self.name, self._failures)
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self._failures, "retry_after": round(self.retry_after(), 1), **self.counters}
+
+
+# --------------------- Retry policy ---------------------
+class RetryBudget:
+    """
+    Every request deposits `ratio` retry tokens, every retry spends one; a small
+    time-based reserve keeps low-traffic processes able to retry at all.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_balance: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._updated = time.monotonic()
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(self.max_balance, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def on_request(self) -> None:
+        self._refill()
+        self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+        if self._balance >= 1.0:
+            self._balance -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {"balance": round(self._balance, 2), "exhausted": self.exhausted}
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be >= 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full jitter: uniform in [0, base * 2**attempt], never earlier than Retry-After."""
+        wait = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.max_delay))
+        return wait
+
+
+# --------------------- LLMClient wrapper ---------------------
+class ResilientLLMClient(LLMClient):
+    def __init__(
+        self,
+        clients: Sequence[LLMClient],
+        breakers: Optional[Sequence[CircuitBreaker]] = None,
+        policy: Optional[RetryPolicy] = None,
+        budget: Optional[RetryBudget] = None,
+    ):
+        if not clients:
+            raise ValueError("ResilientLLMClient needs at least one client")
+        self.clients = list(clients)
+        self.breakers = list(breakers) if breakers else [CircuitBreaker(f"{c.provider}/{c.model_name}") for c in clients]
+        self.policy = policy or RetryPolicy()
+        self.budget = budget or RetryBudget()
+        self.provider = clients[0].provider
+        self.model_name = clients[0].model_name
+        # Metric children bound once per client, indexed like `clients`
+        self._retried = [LLM_RETRIES.labels(c.provider, "retry") for c in clients]
+        self._failed_over = [LLM_RETRIES.labels(c.provider, "failover") for c in clients]
+        self._errors = [(LLM_ERRORS.labels(c.provider, "false"), LLM_ERRORS.labels(c.provider, "true")) for c in clients]
+
+    def _pick(self, start: int) -> Tuple[int, LLMClient, CircuitBreaker]:
+        n = len(self.clients)
+        for offset in range(n):
+            idx = (start + offset) % n
+            if self.breakers[idx].allow():
+                return idx, self.clients[idx], self.breakers[idx]
+        raise CircuitOpenError([b.name for b in self.breakers], min(b.retry_after() for b in self.breakers))
+
+    async def _after_failure(self, error: LLMProviderError, attempt: int, idx: int) -> int:
+        """Decide whether to retry; returns the client index to start from next."""
+        if attempt >= self.policy.max_attempts or not self.budget.try_spend():
+            raise error
+        nxt = (idx + 1) % len(self.clients)
+        # Failing over to another provider needs no backoff; retrying the same one does
+        if nxt == idx or self.breakers[nxt].state == CircuitBreaker.OPEN:
+            wait = self.policy.delay(attempt - 1, error.retry_after)
+            left = time_left()
+            if left is not None and wait >= left:
+                raise error  # the retry could not finish in time anyway
+            logger.warning("%s failed (attempt %d): %s; retrying in %.2fs", self.breakers[idx].name, attempt, error, wait)
+            self._retried[idx].inc()
+            with tracing.span("llm.backoff", provider=self.breakers[idx].name, attempt=attempt, wait_s=round(wait, 3)):
+                await asyncio.sleep(wait)
+        else:
+            logger.warning("%s failed (attempt %d): %s; failing over to %s", self.breakers[idx].name, attempt, error, self.breakers[nxt].name)
+            self._failed_over[idx].inc()
+        return nxt
+
+    @staticmethod
+    def _span_attributes(client: LLMClient, attempt: int, prompt: str, system: Optional[str]) -> Dict[str, Any]:
+        return {
+            "provider": client.provider,
+            "model": client.model_name,
+            "attempt": attempt + 1,
+            "prompt_chars": len(prompt) + len(system or ""),
+        }
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        self.budget.on_request()
+        start, attempt = 0, 0
+        while True:
+            idx, client, breaker = self._pick(start)
+            usage.note_attempt(client.provider, client.model_name)
+            try:
+                with tracing.span("llm.generate", **self._span_attributes(client, attempt, prompt, system)) as span:
+                    text = await client.generate(prompt, system=system, **kwargs)
+                    span.set("output_chars", len(text))
+            except (asyncio.CancelledError, TimeBudgetExceeded):
+                breaker.release()  # our budget ran out; says nothing about the provider
+                raise
+            except Exception as e:
+                error = classify_error(e, client.provider)
+                self._errors[idx][error.retryable].inc()
+                if not error.retryable:
+                    breaker.record_success()  # the provider answered; the request itself is bad
+                    raise error from e
+                breaker.record_failure()
+                attempt += 1
+                start = await self._after_failure(error, attempt, idx)
+                continue
+            breaker.record_success()
+            return text
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """Retries and failover only happen before the first chunk; a broken stream is raised."""
+        self.budget.on_request()
+        start, attempt = 0, 0
+        while True:
+            idx, client, breaker = self._pick(start)
+            usage.note_attempt(client.provider, client.model_name)
+            produced = False
+            settled = False
+            try:
+                # Not activated: this generator is suspended in the consumer's context between chunks
+                with tracing.span("llm.stream", activate=False, **self._span_attributes(client, attempt, prompt, system)) as span:
+                    output_chars = 0
+                    async for chunk in client.stream(prompt, system=system, **kwargs):
+                        produced = True
+                        output_chars += len(chunk)
+                        span.set("output_chars", output_chars)
+                        yield chunk
+            except TimeBudgetExceeded:
+                raise  # released in `finally`
+            except Exception as e:
+                settled = True
+                error = classify_error(e, client.provider)
+                self._errors[idx][error.retryable].inc()
+                if not error.retryable:
+                    breaker.record_success()
+                    raise error from e
+                breaker.record_failure()
+                if produced:
+                    raise error from e
+                attempt += 1
+                start = await self._after_failure(error, attempt, idx)
+                continue
+            finally:
+                if not settled:
+                    breaker.release()  # no-op unless this call held a half-open probe
+            breaker.record_success()
+            return
+
+    def batches_natively(self, count: int) -> bool:
+        return self.clients[0].batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        """
+        A natively batching primary gets the whole batch as one job; the items it
+        failed transiently are then retried one by one under the usual policy.
+        Otherwise (or while its circuit is open) `generate` per prompt.
+        """
+        breaker = self.breakers[0]
+        if not self.batches_natively(len(prompts)) or not breaker.allow():
+            return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        client = self.clients[0]
+        self.budget.on_request()
+        usage.note_attempt(client.provider, client.model_name)
+        try:
+            with tracing.span("llm.generate_many", provider=client.provider, model=client.model_name, prompts=len(prompts)):
+                results = await client.generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        except BaseException:
+            breaker.release()
+            raise
+        transient = [i for i, r in enumerate(results) if isinstance(r, LLMProviderError) and r.retryable]
+        if transient and len(transient) == len(results):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if transient:
+            logger.warning("%s batch: %d/%d items failed transiently; retrying them one by one", breaker.name, len(transient), len(results))
+            retried = await super().generate_many([prompts[i] for i in transient], system=system, concurrency=concurrency, **kwargs)
+            for i, result in zip(transient, retried):
+                results[i] = result
+        return results
+
+
+# --------------------- Process-wide state ---------------------
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_retry_budget: Optional[RetryBudget] = None
+
+
+def get_circuit_breaker(provider: str, model_name: str) -> CircuitBreaker:
+    key = (provider, model_name)
+    if key not in _breakers:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _breakers[key] = CircuitBreaker(
+            f"{provider}/{model_name}",
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            recovery_timeout=settings.CIRCUIT_RECOVERY_SECONDS,
+        )
+    return _breakers[key]
+
+
+def get_retry_budget() -> RetryBudget:
+    global _retry_budget
+    if _retry_budget is None:
+        from api.config.settings import get_settings
+
+        _retry_budget = RetryBudget(ratio=get_settings().LLM_RETRY_BUDGET_RATIO)
+    return _retry_budget
+
+
+def resilient_from_settings(clients: Sequence[LLMClient]) -> ResilientLLMClient:
+    from api.config.settings import get_settings
+
+    settings = get_settings()
+    return ResilientLLMClient(
+        clients,
+        breakers=[get_circuit_breaker(c.provider, c.model_name) for c in clients],
+        policy=RetryPolicy(settings.LLM_RETRY_MAX_ATTEMPTS, settings.LLM_RETRY_BASE_DELAY, settings.LLM_RETRY_MAX_DELAY),
+        budget=get_retry_budget(),
+    )
+
+
+def open_circuit_retry_after(specs: Sequence[Tuple[str, str]]) -> Optional[float]:
+    """Seconds until a (provider, model) of the chain accepts calls again, or None if one already does."""
+    # A link without a breaker yet has never failed: its circuit is closed
+    breakers = [_breakers.get((provider, model)) for provider, model in specs]
+    if any(b is None or b.state != CircuitBreaker.OPEN for b in breakers):
+        return None
+    return min(b.retry_after() for b in breakers)
+
+
+def circuit_stats() -> Dict[str, Any]:
+    return {
+        "circuits": {b.name: b.stats() for b in _breakers.values()},
+        "retry_budget": get_retry_budget().stats(),
+    }
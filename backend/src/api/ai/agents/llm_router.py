@@ -0,0 +1,335 @@
+"""
+Latency-aware routing of LLM calls over a pool of provider backends.
+
+A backend is one (provider, model, API key) client behind its own rate limiter.
+RoutedLLMClient picks one per call, at random with probability proportional to
+
+    weight * headroom * (1 - error_rate)^2 / (latency * (1 + in_flight))
+
+- latency: EWMA of successful calls (time to first chunk for streams); a backend
+  without samples yet is assumed to be as fast as the pool's average
+- error_rate: EWMA of transient failures
+- headroom: share of the key's rate-limit quota still available, so traffic
+  spreads over keys and throughput grows with the number of keys
+- weight: configured preference (LLM_ROUTER_WEIGHTS)
+
+Stages can be pinned to models (LLM_STAGE_MODELS), e.g. a cheap model for Boss
+and a strong one for Engineer. A backend failing EJECT_FAILURES times in a row
+is ejected for a cool-down that doubles with every repeat. A transient failure
+before any output fails over to the next backend within the same call; retries
+with backoff are left to the resilience layer above.
+
+Health is tracked per backend for the whole process, like the rate limiters.
+"""
+
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import random
+import time
+
+from api.ai.core import stage_context, usage
+from api.ai.core.deadlines import TimeBudgetExceeded
+from api.ai.core.metrics import counter
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_client import LLMClient, LLMProviderError, classify_error, get_llm_client
+from api.ai.agents.llm_ratelimit import RateLimitedLLMClient, RateLimiter, _key_id, get_rate_limiter
+
+logger = get_logger("llm_router")
+
+ROUTED = counter(
+    "autoteam_llm_router_calls_total",
+    "LLM calls routed to each backend, by outcome (ok, failed, rejected).",
+    ("backend", "outcome"),
+)
+EJECTIONS = counter("autoteam_llm_router_ejections_total", "Backends ejected from routing for failing.", ("backend",))
+
+
+# --------------------- Backend health ---------------------
+class BackendHealth:
+    ALPHA = 0.2  # weight of the newest sample in the moving averages
+
+    def __init__(self, name: str, eject_failures: int = 3, eject_seconds: float = 30.0, max_eject_seconds: float = 300.0):
+        self.name = name
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.latency: Dict[str, Optional[float]] = {"generate": None, "stream": None}
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.counters: Dict[str, int] = {"calls": 0, "failures": 0, "ejected": 0}
+        self._ok = ROUTED.labels(name, "ok")
+        self._failed = ROUTED.labels(name, "failed")
+        self._rejected = ROUTED.labels(name, "rejected")
+        self._ejected = EJECTIONS.labels(name)
+
+    def ejected(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.monotonic()) < self.ejected_until
+
+    def on_success(self, kind: str, latency: float) -> None:
+        previous = self.latency[kind]
+        self.latency[kind] = latency if previous is None else previous + self.ALPHA * (latency - previous)
+        self.error_rate -= self.ALPHA * self.error_rate
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.counters["calls"] += 1
+        self._ok.inc()
+
+    def on_rejected(self) -> None:
+        """The provider answered but refused the request: nothing learnt about its health."""
+        self.counters["calls"] += 1
+        self._rejected.inc()
+
+    def on_failure(self) -> None:
+        self.error_rate += self.ALPHA * (1.0 - self.error_rate)
+        self.consecutive_failures += 1
+        self.counters["calls"] += 1
+        self.counters["failures"] += 1
+        self._failed.inc()
+        if self.consecutive_failures >= self.eject_failures:
+            self._eject()
+
+    def _eject(self) -> None:
+        cool_down = min(self.eject_seconds * (2 ** self.ejections), self.max_eject_seconds)
+        self.ejected_until = time.monotonic() + cool_down
+        self.ejections += 1
+        # Back on probation afterwards: one more failure ejects it again
+        self.consecutive_failures = self.eject_failures - 1
+        self.counters["ejected"] += 1
+        self._ejected.inc()
+        logger.warning("Backend %s ejected for %.0fs after %d failures", self.name, cool_down, self.eject_failures)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "latency_s": {k: round(v, 4) if v is not None else None for k, v in self.latency.items()},
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "ejected_for": round(max(self.ejected_until - time.monotonic(), 0.0), 1),
+            **self.counters,
+        }
+
+
+@dataclass
+class Backend:
+    client: LLMClient
+    health: BackendHealth
+    limiter: Optional[RateLimiter] = None
+    weight: float = 1.0
+
+    @property
+    def model_name(self) -> str:
+        return self.client.model_name
+
+    @property
+    def provider(self) -> str:
+        return self.client.provider
+
+    def headroom(self) -> float:
+        return self.limiter.headroom() if self.limiter is not None else 1.0
+
+
+# --------------------- LLMClient wrapper ---------------------
+class RoutedLLMClient(LLMClient):
+    MIN_HEADROOM = 0.01  # an exhausted key keeps a small chance, its limiter makes the caller wait
+
+    def __init__(self, backends: Sequence[Backend], stage_models: Optional[Dict[str, Sequence[str]]] = None):
+        if not backends:
+            raise ValueError("RoutedLLMClient needs at least one backend")
+        self.backends = list(backends)
+        self.stage_models = {stage: list(models) for stage, models in (stage_models or {}).items()}
+        # Identity of the default backend (metrics labels, circuit breaker, context limit)
+        self.provider = self.backends[0].provider
+        self.model_name = self.backends[0].model_name
+
+    def _pinned(self, stage: Optional[str]) -> Optional[List[str]]:
+        if not stage:
+            return None
+        # "Engineer" also pins "Engineer (Final)"
+        return self.stage_models.get(stage) or self.stage_models.get(stage.split(" (")[0])
+
+    def candidates(self) -> List[Backend]:
+        pool = self.backends
+        models = self._pinned(stage_context.current_stage.get())
+        if models:
+            pinned = [b for b in pool if b.model_name in models]
+            if pinned:
+                pool = pinned
+            else:
+                logger.warning("No backend serves %s (pinned for %s); routing over all", models, stage_context.current_stage.get())
+        now = time.monotonic()
+        healthy = [b for b in pool if not b.health.ejected(now)]
+        # Never fail just because everything is ejected: try the one coming back soonest
+        return healthy or [min(pool, key=lambda b: b.health.ejected_until)]
+
+    def _score(self, backend: Backend, kind: str, default_latency: float) -> float:
+        health = backend.health
+        latency = health.latency[kind] or default_latency
+        headroom = max(backend.headroom(), self.MIN_HEADROOM)
+        return backend.weight * headroom * (1.0 - health.error_rate) ** 2 / (max(latency, 1e-3) * (1 + health.in_flight))
+
+    def order(self, kind: str) -> List[Backend]:
+        """Candidates in the order to try them: weighted random by score, without replacement."""
+        pool = self.candidates()
+        known = [b.health.latency[kind] for b in pool if b.health.latency[kind] is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        scored = [(self._score(b, kind, default_latency), b) for b in pool]
+        ordered: List[Backend] = []
+        while scored:
+            pick = random.uniform(0, sum(score for score, _ in scored))
+            for i, (score, backend) in enumerate(scored):
+                pick -= score
+                if pick <= 0 or i == len(scored) - 1:
+                    ordered.append(backend)
+                    del scored[i]
+                    break
+        return ordered
+
+    def _failed(self, backend: Backend, exc: Exception) -> LLMProviderError:
+        error = classify_error(exc, backend.provider)
+        if error.retryable:
+            backend.health.on_failure()
+        else:
+            backend.health.on_rejected()
+        return error
+
+    @staticmethod
+    def _note(backend: Backend, n: int) -> None:
+        # The first try is the attempt the layer above already counted
+        if n == 1:
+            usage.note_model(backend.provider, backend.model_name)
+        else:
+            usage.note_attempt(backend.provider, backend.model_name)
+
+    @staticmethod
+    def _fail_over(backend: Backend, error: LLMProviderError, remaining: int) -> None:
+        if not error.retryable or not remaining:
+            raise error
+        logger.warning("%s failed: %s; routing to another backend", backend.health.name, error)
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        ordered = self.order("generate")
+        for n, backend in enumerate(ordered, start=1):
+            self._note(backend, n)
+            health = backend.health
+            start = time.monotonic()
+            health.in_flight += 1
+            try:
+                text = await backend.client.generate(prompt, system=system, **kwargs)
+            except (asyncio.CancelledError, TimeBudgetExceeded):
+                raise  # our budget ran out; says nothing about the backend
+            except Exception as e:
+                error = self._failed(backend, e)
+                self._fail_over(backend, error, len(ordered) - n)
+                continue
+            finally:
+                health.in_flight -= 1
+            health.on_success("generate", time.monotonic() - start)
+            return text
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """Fails over only before the first chunk; a broken stream is raised."""
+        ordered = self.order("stream")
+        for n, backend in enumerate(ordered, start=1):
+            self._note(backend, n)
+            health = backend.health
+            start = time.monotonic()
+            first_chunk: Optional[float] = None
+            health.in_flight += 1
+            try:
+                async for chunk in backend.client.stream(prompt, system=system, **kwargs):
+                    if first_chunk is None:
+                        first_chunk = time.monotonic() - start
+                    yield chunk
+            except (asyncio.CancelledError, TimeBudgetExceeded):
+                raise
+            except Exception as e:
+                error = self._failed(backend, e)
+                if first_chunk is not None:
+                    raise error from e
+                self._fail_over(backend, error, len(ordered) - n)
+                continue
+            finally:
+                health.in_flight -= 1
+            health.on_success("stream", first_chunk if first_chunk is not None else time.monotonic() - start)
+            return
+
+
+# --------------------- Process-wide health and settings ---------------------
+_health: Dict[Tuple[str, str, str], BackendHealth] = {}
+
+
+def get_backend_health(provider: str, model_name: str, api_key: Optional[str] = None) -> BackendHealth:
+    key = (provider, model_name, _key_id(api_key))
+    if key not in _health:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _health[key] = BackendHealth(
+            f"{provider}/{model_name}#{key[2]}",
+            eject_failures=settings.LLM_ROUTER_EJECT_FAILURES,
+            eject_seconds=settings.LLM_ROUTER_EJECT_SECONDS,
+        )
+    return _health[key]
+
+
+def router_stats() -> Dict[str, Dict[str, Any]]:
+    return {health.name: health.stats() for health in _health.values()}
+
+
+def _split(value: str) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def _pairs(value: str) -> Dict[str, str]:
+    """ "a=1,b=2" -> {"a": "1", "b": "2"} (entries without "=" are ignored)."""
+    return {k.strip(): v.strip() for k, _, v in (item.partition("=") for item in _split(value)) if v.strip()}
+
+
+def backend_specs() -> List[Tuple[str, str, str]]:
+    """(provider, model, api_key) of every routable backend: each key of a provider times each of its models."""
+    from api.config.settings import get_settings
+
+    settings = get_settings()
+    providers = _split(settings.LLM_ROUTER_PROVIDERS)
+    configured = {
+        "gemini": ([settings.GEMINI_API_KEY] + _split(settings.GEMINI_API_KEYS), _split(settings.GEMINI_MODELS) or [settings.GEMINI_MODEL]),
+        "openai": ([settings.OPENAI_API_KEY] + _split(settings.OPENAI_API_KEYS), _split(settings.OPENAI_MODELS) or [settings.OPENAI_MODEL]),
+    }
+    specs = []
+    for provider in providers:
+        if provider not in configured:
+            logger.warning("Unknown provider %r in LLM_ROUTER_PROVIDERS", provider)
+            continue
+        keys, models = configured[provider]
+        keys = list(dict.fromkeys(k for k in keys if k))
+        specs += [(provider, model, key) for key in keys for model in models]
+    return specs
+
+
+def router_from_settings() -> Optional[RoutedLLMClient]:
+    """The router over all configured backends, or None when there is at most one (nothing to route)."""
+    from api.config.settings import get_settings
+
+    settings = get_settings()
+    specs = backend_specs()
+    if len(specs) < 2:
+        return None
+    weights = {name: float(w) for name, w in _pairs(settings.LLM_ROUTER_WEIGHTS).items()}
+    backends = []
+    for provider, model, api_key in specs:
+        client = get_llm_client(provider, api_key=api_key, model=model)
+        limiter = None
+        if settings.LLM_RATE_LIMIT_ENABLED:
+            limiter = get_rate_limiter(provider, model, api_key)
+            client = RateLimitedLLMClient(client, limiter, expected_output_tokens=settings.LLM_RATE_LIMIT_OUTPUT_TOKENS)
+        backends.append(Backend(
+            client=client,
+            health=get_backend_health(provider, model, api_key),
+            limiter=limiter,
+            weight=weights.get(model, weights.get(provider, 1.0)),
+        ))
+    stage_models = {stage: [m.strip() for m in models.split("|") if m.strip()] for stage, models in _pairs(settings.LLM_STAGE_MODELS).items()}
+    return RoutedLLMClient(backends, stage_models=stage_models)
@@ -0,0 +1,199 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+Concurrent calls with the same (provider, model, system, prompt, params) key,
+whitespace-normalised, share one underlying request: the first caller starts
+it in its own task, later callers attach to it and all receive its result or
+its error. Nothing is kept once the request finishes (that is the response
+cache's job).
+
+- A waiter that is cancelled only detaches; the shared request keeps running
+  for the others and is cancelled when its last waiter is gone.
+- Streams are shared too: followers first replay the chunks already received,
+  then follow the live stream.
+- The shared request runs in the context of the caller that started it (its
+  stage deadline, trace span and cache-bypass flag).
+
+The SingleFlight group is process-wide, so calls from different pipeline runs
+coalesce even though every run builds its own client.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Union
+import asyncio
+
+from api.ai.core.metrics import counter
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_cache import cache_key
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+
+logger = get_logger("llm_singleflight")
+
+COALESCED = counter(
+    "autoteam_llm_coalesced_total",
+    "LLM calls served by an identical request already in flight.",
+    ("provider", "kind"),
+)
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task
+    waiters: int = 0
+    # Streams only: chunks received so far, and an event replaced on every change
+    chunks: List[str] = field(default_factory=list)
+    done: bool = False
+    error: Optional[BaseException] = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def detach(self) -> None:
+        self.waiters -= 1
+        if self.waiters == 0 and not self.task.done():
+            self.task.cancel()  # nobody is waiting any more
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+    def _join(self, key: str, start) -> "tuple[_Flight, bool]":
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(task=asyncio.get_running_loop().create_task(start(key)))
+            self._flights[key] = flight
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return flight, leader
+
+    def joins(self, key: str) -> bool:
+        """Whether a call for `key` made now would attach to one already in flight."""
+        return key in self._flights
+
+    def _finished(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: str, call) -> Any:
+        """Await `call()` once for all concurrent callers of `key`."""
+        async def start(key: str) -> Any:
+            try:
+                return await call()
+            finally:
+                self._finished(key, flight)
+
+        flight, leader = self._join(key, start)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.detach()
+
+    async def stream(self, key: str, open_stream) -> AsyncIterator[str]:
+        """Iterate `open_stream()` once for all concurrent callers of `key`."""
+        async def start(key: str) -> None:
+            try:
+                async for chunk in open_stream():
+                    flight.chunks.append(chunk)
+                    flight.notify()
+            except BaseException as e:
+                flight.error = e
+                if not isinstance(e, asyncio.CancelledError):
+                    return  # handed to the waiters, not raised from the task
+                raise
+            finally:
+                flight.done = True
+                self._finished(key, flight)
+                flight.notify()
+
+        flight, leader = self._join(key, start)
+        try:
+            i = 0
+            while True:
+                changed = flight.changed
+                while i < len(flight.chunks):
+                    yield flight.chunks[i]
+                    i += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            flight.detach()
+
+
+_group: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    global _group
+    if _group is None:
+        _group = SingleFlight()
+    return _group
+
+
+# --------------------- LLMClient wrapper ---------------------
+class CoalescingLLMClient(LLMClient):
+    def __init__(self, inner: LLMClient, group: Optional[SingleFlight] = None):
+        self.inner = inner
+        self.group = group or get_single_flight()
+        self.provider = inner.provider
+        self.model_name = inner.model_name
+
+    def _key(self, kind: str, prompt: str, system: Optional[str], kwargs: Dict[str, Any]) -> str:
+        return kind + ":" + cache_key(self.provider, self.model_name, _normalize(system), _normalize(prompt), kwargs)
+
+    def _joined(self, key: str, kind: str) -> None:
+        if self.group.joins(key):
+            COALESCED.labels(self.provider, kind).inc()
+            logger.debug(f"Coalesced {kind} onto an identical in-flight request ({self.provider})")
+
+    async def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> str:
+        key = self._key("generate", prompt, system, kwargs)
+        self._joined(key, "generate")
+        return await self.group.do(key, lambda: self.inner.generate(prompt, system=system, **kwargs))
+
+    async def stream(self, prompt: str, system: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        key = self._key("stream", prompt, system, kwargs)
+        self._joined(key, "stream")
+        chunks = self.group.stream(key, lambda: self.inner.stream(prompt, system=system, **kwargs))
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()  # detach now, not when the generator is collected
+
+    def batches_natively(self, count: int) -> bool:
+        return self.inner.batches_natively(count)
+
+    async def generate_many(
+        self, prompts: Sequence[str], system: Optional[str] = None, concurrency: Optional[int] = None, **kwargs
+    ) -> List[Union[str, LLMProviderError]]:
+        if self.batches_natively(len(prompts)):
+            return await self.inner.generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+        return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
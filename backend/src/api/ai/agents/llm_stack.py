@@ -0,0 +1,109 @@
+"""
+Builds the LLM client used by pipeline runs from settings.
+
+provider chain (a router over all keys/models when several are configured, else
+  Gemini if a key is set, else Mock; plus LLM_FALLBACK_PROVIDER; native async
+  HTTP clients unless LLM_HTTP_CLIENT=sdk)
+  -> per-provider rate limiting -> resilience (retries, circuit breakers, failover)
+  -> hedging -> model cascade (cheap model first, when LLM_CASCADE_MODEL is set) -> single-flight coalescing -> response cache
+
+Shared by the API process and out-of-process workers (api.worker).
+"""
+
+from typing import List, Optional, Tuple
+
+from api.ai.agents.llm_client import LLMClient, MockLLMClient, get_llm_client
+from api.ai.agents.llm_cache import CachedLLMClient, get_response_cache
+from api.ai.agents.llm_ratelimit import RateLimitedLLMClient, get_rate_limiter
+from api.ai.agents.llm_resilience import (
+    ResilientLLMClient,
+    RetryPolicy,
+    get_circuit_breaker,
+    get_retry_budget,
+    resilient_from_settings,
+)
+from api.ai.agents.llm_cascade import AcceptanceCheck, CascadeLLMClient
+from api.ai.agents.llm_router import RoutedLLMClient, backend_specs, router_from_settings
+from api.ai.agents.llm_hedging import HedgedLLMClient, get_hedge_policy
+from api.ai.agents.llm_singleflight import CoalescingLLMClient, get_single_flight
+from api.config.settings import get_settings
+
+
+def provider_chain() -> List[LLMClient]:
+    settings = get_settings()
+    router = router_from_settings()
+    # Choose real provider if key present; fall back to Mock
+    if router is not None:
+        chain: List[LLMClient] = [router]
+    elif settings.GEMINI_API_KEY:
+        chain = [get_llm_client("gemini", api_key=settings.GEMINI_API_KEY, model=settings.GEMINI_MODEL)]
+    else:
+        chain = [MockLLMClient()]
+    routed = {b.provider for b in router.backends} if router is not None else set()
+    if settings.LLM_FALLBACK_PROVIDER == "openai" and settings.OPENAI_API_KEY and "openai" not in routed:
+        chain.append(get_llm_client("openai", api_key=settings.OPENAI_API_KEY, model=settings.OPENAI_MODEL))
+    elif settings.LLM_FALLBACK_PROVIDER == "mock" and not isinstance(chain[0], MockLLMClient):
+        chain.append(MockLLMClient())
+    return chain
+
+
+def provider_specs() -> List[Tuple[str, str]]:
+    """(provider, model) of each link of provider_chain(), the key of its circuit breaker; builds no client."""
+    settings = get_settings()
+    routed = backend_specs()
+    if len(routed) >= 2:
+        # A router takes the provider and model of its first backend
+        specs = [routed[0][:2]]
+    elif settings.GEMINI_API_KEY:
+        specs = [("gemini", settings.GEMINI_MODEL)]
+    else:
+        specs = [(MockLLMClient.provider, MockLLMClient.model_name)]
+    routes_openai = len(routed) >= 2 and any(provider == "openai" for provider, _, _ in routed)
+    if settings.LLM_FALLBACK_PROVIDER == "openai" and settings.OPENAI_API_KEY and not routes_openai:
+        specs.append(("openai", settings.OPENAI_MODEL))
+    elif settings.LLM_FALLBACK_PROVIDER == "mock" and specs[0][0] != MockLLMClient.provider:
+        specs.append((MockLLMClient.provider, MockLLMClient.model_name))
+    return specs
+
+
+def _rate_limited(llm: LLMClient) -> LLMClient:
+    settings = get_settings()
+    # The mock has no quota; real providers share one limiter per model and key (a router's backends have theirs)
+    if not settings.LLM_RATE_LIMIT_ENABLED or isinstance(llm, (MockLLMClient, RoutedLLMClient)):
+        return llm
+    limiter = get_rate_limiter(llm.provider, llm.model_name, getattr(llm, "api_key", None))
+    return RateLimitedLLMClient(llm, limiter, expected_output_tokens=settings.LLM_RATE_LIMIT_OUTPUT_TOKENS)
+
+
+def cascade_tier() -> Optional[LLMClient]:
+    """The cheap first tier of the model cascade, or None when no cascade is configured."""
+    settings = get_settings()
+    if not settings.LLM_CASCADE_MODEL:
+        return None
+    provider, _, model = settings.LLM_CASCADE_MODEL.rpartition(":")
+    provider = provider or "gemini"
+    api_key = {"gemini": settings.GEMINI_API_KEY, "openai": settings.OPENAI_API_KEY}.get(provider)
+    if not api_key:
+        return None  # e.g. dev runs on the mock: nothing cheaper to try
+    client = _rate_limited(get_llm_client(provider, api_key=api_key, model=model))
+    # No retries: a failing cheap tier escalates instead of backing off
+    return ResilientLLMClient(
+        [client], breakers=[get_circuit_breaker(provider, model)], policy=RetryPolicy(max_attempts=1), budget=get_retry_budget()
+    )
+
+
+def build_llm_client() -> LLMClient:
+    settings = get_settings()
+    llm: LLMClient = resilient_from_settings([_rate_limited(c) for c in provider_chain()])
+    if settings.LLM_HEDGE_ENABLED:
+        llm = HedgedLLMClient(llm, policy=get_hedge_policy(llm.provider, llm.model_name))
+    cheap = cascade_tier()
+    if cheap is not None:
+        stages = [s.strip() for s in settings.LLM_CASCADE_STAGES.split(",") if s.strip()]
+        llm = CascadeLLMClient([cheap, llm], check=AcceptanceCheck(min_chars=settings.LLM_CASCADE_MIN_CHARS), stages=stages or None)
+    if settings.LLM_COALESCE_ENABLED:
+        # Below the cache: identical misses made at the same time share one provider call
+        llm = CoalescingLLMClient(llm, get_single_flight())
+    if settings.LLM_CACHE_ENABLED:
+        llm = CachedLLMClient(llm, get_response_cache())
+    return llm
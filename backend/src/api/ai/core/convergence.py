@@ -0,0 +1,88 @@
+"""
+Convergence checks for the pipeline's refinement loops.
+
+A refinement stage can be skipped when the round before it already produced
+(nearly) the same output. Checks return a similarity in [0, 1]:
+
+- DiffRatioCheck: difflib ratio over normalized word sequences
+- HashingVectorizerCheck: cosine similarity of hashed word uni/bi-gram counts
+  (a dependency-free local stand-in for embeddings)
+"""
+
+from collections import Counter
+from typing import List, Optional
+import abc
+import difflib
+import hashlib
+import math
+import re
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class ConvergenceCheck(abc.ABC):
+    name: str = "base"
+
+    def __init__(self, threshold: float = 0.95):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+
+    @abc.abstractmethod
+    def similarity(self, a: str, b: str) -> float:
+        raise NotImplementedError
+
+    def converged(self, a: str, b: str) -> bool:
+        return self.similarity(a, b) >= self.threshold
+
+
+class DiffRatioCheck(ConvergenceCheck):
+    name = "diff"
+
+    def similarity(self, a: str, b: str) -> float:
+        wa, wb = _words(a), _words(b)
+        if not wa and not wb:
+            return 1.0
+        matcher = difflib.SequenceMatcher(None, wa, wb, autojunk=False)
+        # quick_ratio is a cheap upper bound; below threshold the exact (quadratic) ratio is not needed
+        upper = matcher.quick_ratio()
+        if upper < self.threshold:
+            return upper
+        return matcher.ratio()
+
+
+class HashingVectorizerCheck(ConvergenceCheck):
+    name = "embedding"
+
+    def __init__(self, threshold: float = 0.95, n_features: int = 2 ** 18):
+        super().__init__(threshold)
+        self.n_features = n_features
+
+    def _vector(self, text: str) -> Counter:
+        words = _words(text)
+        grams = words + [f"{x} {y}" for x, y in zip(words, words[1:])]
+        # Stable across processes, unlike hash()
+        return Counter(int.from_bytes(hashlib.blake2b(g.encode(), digest_size=8).digest(), "little") % self.n_features for g in grams)
+
+    def similarity(self, a: str, b: str) -> float:
+        va, vb = self._vector(a), self._vector(b)
+        if not va and not vb:
+            return 1.0
+        dot = sum(count * vb.get(idx, 0) for idx, count in va.items())
+        norm = math.sqrt(sum(c * c for c in va.values())) * math.sqrt(sum(c * c for c in vb.values()))
+        return dot / norm if norm else 0.0
+
+
+def get_convergence_check(method: str, threshold: float) -> Optional[ConvergenceCheck]:
+    """method: "diff" | "embedding" | "off" (None disables early exit)."""
+    if method == "off":
+        return None
+    if method == "diff":
+        return DiffRatioCheck(threshold)
+    if method == "embedding":
+        return HashingVectorizerCheck(threshold)
+    raise ValueError(f"Unknown convergence method: {method}")
@@ -0,0 +1,69 @@
+"""
+Time budgets for pipeline runs.
+
+- run deadline: Orchestrator.run gives every project PIPELINE_DEADLINE_SECONDS
+- stage budget: each stage gets a share of what is left (stage_budget), set as
+  stage_context.deadline for everything the stage awaits
+- time_left(): read by LLM clients (SDK request timeouts), the retry and rate
+  limit layers (never wait past the deadline) and DB helpers
+- with_deadline(aw, what): await within the budget or raise TimeBudgetExceeded
+
+The orchestrator turns TimeBudgetExceeded into a degraded stage result instead
+of a failed or hung pipeline.
+"""
+
+from typing import Awaitable, Optional, TypeVar
+import asyncio
+import inspect
+
+from api.ai.core import stage_context
+
+T = TypeVar("T")
+
+
+class TimeBudgetExceeded(Exception):
+    def __init__(self, what: str, budget: float):
+        super().__init__(f"{what} exceeded its {budget:.1f}s time budget")
+        self.what = what
+        self.budget = budget
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current stage's deadline (may be negative), None without one."""
+    deadline = stage_context.deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def stage_budget(run_deadline: Optional[float], levels_left: int, cap: float = 0.0, borrow: float = 2.0) -> Optional[float]:
+    """
+    Budget of a stage with `levels_left` stages (itself included) still ahead on its
+    longest path: a fair share of the remaining run time, which a slow stage may
+    exceed `borrow` times (later stages get less), capped at `cap` (0 = no cap).
+    """
+    if run_deadline is None:
+        return cap or None
+    remaining = max(run_deadline - asyncio.get_running_loop().time(), 0.0)
+    budget = min(remaining, remaining * borrow / max(levels_left, 1))
+    return min(budget, cap) if cap else budget
+
+
+async def with_deadline(aw: Awaitable[T], what: str, timeout: Optional[float] = None) -> T:
+    """Await `aw` within `timeout` seconds (default: the current deadline); no budget means no limit."""
+    if timeout is None:
+        timeout = time_left()
+        if timeout is None:
+            return await aw
+    if timeout <= 0:
+        if inspect.iscoroutine(aw):
+            aw.close()  # never started; avoid the "never awaited" warning
+        raise TimeBudgetExceeded(what, 0.0)
+    scope = asyncio.timeout(timeout)
+    try:
+        async with scope:
+            return await aw
+    except TimeoutError as e:
+        if not scope.expired():
+            raise  # raised by `aw` itself, not our budget
+        raise TimeBudgetExceeded(what, timeout) from e
@@ -0,0 +1,249 @@
+"""
+Durable pipeline job queue on top of the application database.
+
+- enqueue(db, project_id, payload) -> job id (API side)
+- claim(worker_id) -> ClaimedJob holding a lease, or None (worker side)
+- heartbeat / complete / release -> keep, finish or hand back a lease
+- cancel(db, project_id) -> drop a queued job, or flag a leased one for its worker
+
+Claiming uses `SELECT ... FOR UPDATE SKIP LOCKED` on Postgres, so concurrent
+workers never block on each other's rows. SQLite has no row locks; there a claim
+is a compare-and-swap UPDATE guarded by the row's attempt counter, which is
+safe because SQLite serialises writers.
+
+A lease expires unless heartbeated; an expired job becomes visible again and is
+claimed by another worker (the orchestrator then resumes from persisted
+outputs). Jobs claimed more than `max_attempts` times are failed as poison.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+import json
+import logging
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.ai.core.utils import get_logger
+from api.db.models import JobStatus, PipelineJobRecord, Project, ProjectStatus
+
+logger: logging.Logger = get_logger("job_queue")
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    project_id: int
+    batch_id: Optional[int]
+    payload: Dict[str, Any]
+    attempts: int
+    worker_id: str
+    # Seconds from submission to this claim (earlier attempts included)
+    queue_wait: float = 0.0
+
+
+class DBJobQueue:
+    def __init__(self, session_factory: Callable[[], AsyncSession], lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    # --------------------- API side ---------------------
+    @staticmethod
+    async def enqueue(db: AsyncSession, project_id: int, payload: Dict[str, Any], batch_id: Optional[int] = None) -> int:
+        job = PipelineJobRecord(project_id=project_id, batch_id=batch_id, payload=json.dumps(payload))
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        return job.id
+
+    @staticmethod
+    async def cancel(db: AsyncSession, project_id: int) -> Optional[str]:
+        """Cancel the project's active job: "queued" if it was dropped, "running" if its worker was asked to stop."""
+        job = await DBJobQueue.active_job(db, project_id)
+        if job is None:
+            return None
+        if job.status == JobStatus.QUEUED:
+            res = await db.execute(
+                update(PipelineJobRecord)
+                .where(PipelineJobRecord.id == job.id, PipelineJobRecord.status == JobStatus.QUEUED)
+                .values(status=JobStatus.CANCELLED, finished_at=datetime.utcnow())
+            )
+            await db.commit()
+            if res.rowcount == 1:
+                return "queued"
+            # Claimed in the meantime; fall through to the leased case
+        await db.execute(update(PipelineJobRecord).where(PipelineJobRecord.id == job.id).values(cancel_requested=True))
+        await db.commit()
+        return "running"
+
+    @staticmethod
+    async def active_job(db: AsyncSession, project_id: int) -> Optional[PipelineJobRecord]:
+        res = await db.execute(
+            select(PipelineJobRecord)
+            .where(PipelineJobRecord.project_id == project_id, PipelineJobRecord.status.in_((JobStatus.QUEUED, JobStatus.LEASED)))
+            .order_by(PipelineJobRecord.id.desc())
+            .limit(1)
+        )
+        return res.scalar_one_or_none()
+
+    @staticmethod
+    async def latest_job(db: AsyncSession, project_id: int) -> Optional[PipelineJobRecord]:
+        res = await db.execute(
+            select(PipelineJobRecord).where(PipelineJobRecord.project_id == project_id).order_by(PipelineJobRecord.id.desc()).limit(1)
+        )
+        return res.scalar_one_or_none()
+
+    @staticmethod
+    async def queued_count(db: AsyncSession, before_id: Optional[int] = None) -> int:
+        query = select(func.count(PipelineJobRecord.id)).where(PipelineJobRecord.status == JobStatus.QUEUED)
+        if before_id is not None:
+            query = query.where(PipelineJobRecord.id < before_id)
+        return (await db.execute(query)).scalar_one()
+
+    @staticmethod
+    async def stats(db: AsyncSession) -> Dict[str, int]:
+        res = await db.execute(select(PipelineJobRecord.status, func.count(PipelineJobRecord.id)).group_by(PipelineJobRecord.status))
+        return {status: count for status, count in res.all()}
+
+    # --------------------- Worker side ---------------------
+    def _claimable(self, now: datetime):
+        return or_(
+            PipelineJobRecord.status == JobStatus.QUEUED,
+            and_(PipelineJobRecord.status == JobStatus.LEASED, PipelineJobRecord.lease_expires_at < now),
+        )
+
+    async def claim(self, worker_id: str) -> Optional[ClaimedJob]:
+        """Lease the oldest visible job, or return None when there is none."""
+        async with self.session_factory() as db:
+            while True:
+                now = datetime.utcnow()
+                if db.bind.dialect.name == "postgresql":
+                    row = (
+                        await db.execute(
+                            select(PipelineJobRecord)
+                            .where(self._claimable(now))
+                            .order_by(PipelineJobRecord.id)
+                            .limit(1)
+                            .with_for_update(skip_locked=True)
+                        )
+                    ).scalar_one_or_none()
+                    if row is None:
+                        return None
+                    job_id, attempts = row.id, row.attempts + 1
+                    row.status, row.attempts = JobStatus.LEASED, attempts
+                    row.lease_owner = worker_id
+                    row.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+                    row.heartbeat_at = now
+                    await db.commit()
+                else:
+                    candidate = (
+                        await db.execute(
+                            select(PipelineJobRecord.id, PipelineJobRecord.attempts)
+                            .where(self._claimable(now))
+                            .order_by(PipelineJobRecord.id)
+                            .limit(1)
+                        )
+                    ).first()
+                    if candidate is None:
+                        return None
+                    job_id, attempts = candidate.id, candidate.attempts + 1
+                    res = await db.execute(
+                        update(PipelineJobRecord)
+                        .where(PipelineJobRecord.id == job_id, PipelineJobRecord.attempts == candidate.attempts, self._claimable(now))
+                        .values(
+                            status=JobStatus.LEASED,
+                            attempts=attempts,
+                            lease_owner=worker_id,
+                            lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                            heartbeat_at=now,
+                        )
+                    )
+                    await db.commit()
+                    if res.rowcount != 1:
+                        continue  # another worker won the race; look again
+
+                row = (await db.execute(select(PipelineJobRecord).where(PipelineJobRecord.id == job_id))).scalar_one()
+                if attempts > self.max_attempts:
+                    await self._poison(db, row)
+                    continue
+                if attempts > 1:
+                    logger.warning("Job %s (project %s) reclaimed by %s, attempt %d", job_id, row.project_id, worker_id, attempts)
+                return ClaimedJob(
+                    id=row.id,
+                    project_id=row.project_id,
+                    batch_id=row.batch_id,
+                    payload=json.loads(row.payload),
+                    attempts=attempts,
+                    worker_id=worker_id,
+                    queue_wait=max((now - row.created_at).total_seconds(), 0.0),
+                )
+
+    async def _poison(self, db: AsyncSession, row: PipelineJobRecord) -> None:
+        logger.error("Job %s (project %s) failed after %d attempts", row.id, row.project_id, row.attempts - 1)
+        row.status = JobStatus.FAILED
+        row.last_error = f"Lease expired {row.attempts - 1} times"
+        row.finished_at = datetime.utcnow()
+        await db.execute(update(Project).where(Project.id == row.project_id).values(status=ProjectStatus.FAILED))
+        await db.commit()
+
+    def _owned(self, job: ClaimedJob):
+        return and_(
+            PipelineJobRecord.id == job.id,
+            PipelineJobRecord.lease_owner == job.worker_id,
+            PipelineJobRecord.attempts == job.attempts,
+            PipelineJobRecord.status == JobStatus.LEASED,
+        )
+
+    async def heartbeat(self, job: ClaimedJob) -> bool:
+        """Extend the lease; False means it was lost (expired and claimed elsewhere)."""
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            res = await db.execute(
+                update(PipelineJobRecord)
+                .where(self._owned(job))
+                .values(lease_expires_at=now + timedelta(seconds=self.lease_seconds), heartbeat_at=now)
+            )
+            await db.commit()
+            return res.rowcount == 1
+
+    async def cancel_requested(self, job: ClaimedJob) -> bool:
+        async with self.session_factory() as db:
+            res = await db.execute(select(PipelineJobRecord.cancel_requested).where(PipelineJobRecord.id == job.id))
+            return bool(res.scalar_one_or_none())
+
+    async def complete(self, job: ClaimedJob, status: str = JobStatus.DONE, error: Optional[str] = None) -> bool:
+        async with self.session_factory() as db:
+            res = await db.execute(
+                update(PipelineJobRecord)
+                .where(self._owned(job))
+                .values(
+                    status=status,
+                    last_error=error,
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    finished_at=datetime.utcnow(),
+                )
+            )
+            await db.commit()
+            return res.rowcount == 1
+
+    async def release(self, job: ClaimedJob) -> bool:
+        """Hand the job back immediately (graceful shutdown); the attempt is not counted."""
+        async with self.session_factory() as db:
+            res = await db.execute(
+                update(PipelineJobRecord)
+                .where(self._owned(job))
+                .values(status=JobStatus.QUEUED, attempts=job.attempts - 1, lease_owner=None, lease_expires_at=None)
+            )
+            await db.commit()
+            return res.rowcount == 1
+
+
+def get_job_queue() -> DBJobQueue:
+    from api.config.settings import get_settings
+    from api.db.database import AsyncSessionLocal
+
+    settings = get_settings()
+    return DBJobQueue(AsyncSessionLocal, lease_seconds=settings.JOB_LEASE_SECONDS, max_attempts=settings.JOB_MAX_ATTEMPTS)
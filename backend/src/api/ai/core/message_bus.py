@@ -43,6 +43,10 @@ class MessageBus:
         await q.put(content)
         logger.debug("Published message for project=%s agent=%s", project_id, agent_name)
 
+    def queued(self) -> int:
+        """Messages published but not yet consumed, over every project."""
+        return sum(q.qsize() for q in self._queues.values())
+
     async def subscribe(self, project_id: int) -> AsyncGenerator[str, None]:
         """
         Async generator that yields JSON string messages for a given project_id.
@@ -51,4 +55,13 @@ class MessageBus:
         while True:
             # The message is now correctly expected to be a string.
             msg = await q.get()
-            yield msg
\ No newline at end of file
+            yield msg
+
+class NullMessageBus(MessageBus):
+    """
+    Drops every message. Used by out-of-process workers, whose progress reaches
+    clients through the database instead (see routes_agents worker mode).
+    """
+
+    async def publish(self, project_id: int, agent_name: str, content: str) -> None:
+        logger.debug("Dropped message for project=%s agent=%s", project_id, agent_name)
@@ -0,0 +1,264 @@
+"""
+In-process metrics in the Prometheus text exposition format (served at /metrics).
+
+- Counter / Histogram: updated on the hot path. `labels(...)` returns a child
+  that callers bind once (per stage, per provider) and then only increment:
+  no allocation and no lock per observation. Every update happens on the event
+  loop thread, so plain `+=` is safe.
+- Gauge: a value read at scrape time from a callback, so queue depths,
+  subscriber counts or pool checkouts cost nothing until someone scrapes.
+  Counters can take a callback too, for state that already counts itself.
+
+Metrics are per process: out-of-process workers (`python -m api.worker`) keep
+their own, unscraped, registry.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+import logging
+import math
+
+from api.ai.core.utils import get_logger
+
+logger: logging.Logger = get_logger("metrics")
+
+LabelValues = Tuple[str, ...]
+# A callback returns one value, or one value per label-value tuple
+Sampler = Callable[[], Union[float, Mapping[LabelValues, float]]]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; covers DB writes (ms) up to slow LLM stages (minutes)
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# --------------------- Metric types ---------------------
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), function: Optional[Sampler] = None):
+        self.name = name
+        self.doc = doc
+        self.labelnames: LabelValues = tuple(labelnames)
+        self.function = function
+        self._children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _sampled(self) -> List[Tuple[LabelValues, float]]:
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.warning("Metric %s callback failed: %s", self.name, e)
+            return []
+        if isinstance(value, Mapping):
+            return [(tuple(k), v) for k, v in value.items()]
+        return [((), value)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        if self.function is not None:
+            samples = self._sampled()
+        else:
+            samples = [(values, child.value) for values, child in self._children.items()]
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(v)}" for values, v in samples]
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Sampler) -> None:
+        self.function = function
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.bounds: Tuple[float, ...] = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, n in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += n
+                le = 'le="%s"' % (_format_value(bound) if bound == math.inf else repr(float(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+# --------------------- Registry ---------------------
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, doc: str, labelnames: Sequence[str] = (), function: Optional[Sampler] = None) -> Counter:
+    return REGISTRY.register(Counter(name, doc, labelnames, function))
+
+
+def gauge(name: str, doc: str, labelnames: Sequence[str] = (), function: Optional[Sampler] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, doc, labelnames, function))
+
+
+def histogram(name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, doc, labelnames, buckets))
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+# --------------------- Pipeline metrics ---------------------
+STAGE_SECONDS = histogram(
+    "autoteam_stage_phase_seconds",
+    "Time spent per pipeline stage and phase (llm = agent run incl. retries, persist = DB write, publish = MessageBus).",
+    ("stage", "phase"),
+)
+STAGE_ERRORS = counter("autoteam_stage_errors_total", "Pipeline stages that failed.", ("stage",))
+STAGE_FALLBACKS = counter(
+    "autoteam_stage_fallbacks_total",
+    "Stage outputs not produced by the LLM (timeout_reuse, timeout_fallback, agent_fallback).",
+    ("stage", "reason"),
+)
+STAGE_RETRIES = counter("autoteam_stage_retries_total", "Agent-level retries of a pipeline stage.", ("stage",))
+LLM_RETRIES = counter(
+    "autoteam_llm_retries_total",
+    "Provider calls retried by the resilience layer (action: retry or failover).",
+    ("provider", "action"),
+)
+LLM_ERRORS = counter("autoteam_llm_errors_total", "Failed provider calls.", ("provider", "retryable"))
+
+
+class StageMetrics:
+    """The per-stage children of the pipeline metrics, bound once per stage name."""
+
+    __slots__ = ("llm", "persist", "publish", "errors", "retries")
+
+    def __init__(self, stage: str):
+        self.llm = STAGE_SECONDS.labels(stage, "llm")
+        self.persist = STAGE_SECONDS.labels(stage, "persist")
+        self.publish = STAGE_SECONDS.labels(stage, "publish")
+        self.errors = STAGE_ERRORS.labels(stage)
+        self.retries = STAGE_RETRIES.labels(stage)
+
+
+_stage_metrics: Dict[str, StageMetrics] = {}
+
+
+def stage_metrics(stage: str) -> StageMetrics:
+    metrics = _stage_metrics.get(stage)
+    if metrics is None:
+        metrics = _stage_metrics[stage] = StageMetrics(stage)
+    return metrics
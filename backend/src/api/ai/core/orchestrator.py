@@ -31,7 +31,6 @@
 
 # logger: logging.Logger = get_logger("orchestrator")
 
-
 # class Orchestrator:
 #     def __init__(self, message_bus: MessageBus, llm: Optional[LLMClient] = None):
 #         self.message_bus = message_bus
@@ -189,21 +188,36 @@
 Async orchestrator for AutoTeamAI.
 
 Responsibilities:
-- Execute agents in dependency flow (Boss -> PM <-> Architect <-> ProjectMgr -> Engineer <-> QA)
-- Persist outputs via CRUD layer
-- Publish real-time updates via MessageBus
+- Execute agents in dependency flow (Boss -> PM <-> Architect <-> ProjectMgr -> Engineer <-> QA),
+  declared as a stage graph (PIPELINE_STAGES) and run by the StageScheduler
+- Persist outputs via CRUD layer, and resume a project from its persisted outputs
+- Publish real-time updates via MessageBus (incl. token-level agent_delta chunks)
 - Retry and error handling at agent level
+- Time budgets: a deadline per run, split into per-stage budgets; a stage out of
+  time degrades (agent fallback, or the optional refinement is skipped)
+- Semantic stage cache: stages in SEMANTIC_CACHE_STAGES reuse the output of an
+  earlier run with a near-duplicate input instead of calling the LLM
 """
 
-from typing import List, Optional, Callable
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Callable
 import asyncio
 import logging
 import json
+import time
 
 from api.ai.core.message_bus import MessageBus
 from api.ai.core.utils import get_logger
+from api.ai.core import stage_context, tracing
+from api.ai.core.metrics import STAGE_FALLBACKS, StageMetrics, stage_metrics
+from api.ai.core.deadlines import TimeBudgetExceeded, stage_budget, with_deadline
+from api.ai.core.scheduler import PROMPT, Stage, StageScheduler
+from api.ai.core.token_budget import ContextBudgeter, Section, count_tokens
+from api.ai.core.usage import StageOutcome, StageUsage
+from api.ai.core.convergence import get_convergence_check
 from api.ai.agents.base_agent import BaseAgent, AgentResult
+from api.config.settings import get_settings
 from api.db import crud
+from api.db.models import ProjectStatus
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # agent imports
@@ -213,14 +227,90 @@ from api.ai.agents.architect_agent import ArchitectAgent
 from api.ai.agents.project_manager_agent import ProjectManagerAgent
 from api.ai.agents.engineer_agent import EngineerAgent
 from api.ai.agents.qa_agent import QAAgent
-from api.ai.agents.llm_client import LLMClient
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+from api.ai.agents.llm_resilience import RetryPolicy, get_retry_budget
+
+if TYPE_CHECKING:
+    from api.ai.core.semantic_cache import SemanticCache, SemanticHit
 
 logger: logging.Logger = get_logger("orchestrator")
 
+# Persisted in place of a stage output when the stage fails; such rows are re-run on resume
+STAGE_ERROR_PREFIX = "An error occurred in agent "
+
+
+# --------------------- Pipeline definition ---------------------
+# Each stage's input is its `inputs` joined with a blank line. Stages whose
+# dependencies are satisfied run concurrently, so independent branches
+# (e.g. a QA test-plan draft alongside the Engineer) only need a new entry here.
+# Refinement stages with `skip_if_converged` are skipped once the loop stabilizes.
+PIPELINE_STAGES: List[Stage] = [
+    Stage("Boss", "boss", inputs=(PROMPT,)),
+    Stage("Product Manager", "pm", inputs=("Boss",)),
+    Stage("Architect", "arch", inputs=("Boss", "Product Manager")),
+    # 🔁 PM <-> Architect feedback loop
+    Stage("Product Manager (Refined)", "pm", inputs=("Architect", "Product Manager")),
+    # PRD unchanged by the architecture review -> the architecture stands as is
+    Stage(
+        "Architect (Refined)", "arch", inputs=("Product Manager (Refined)", "Architect"),
+        skip_if_converged=("Product Manager (Refined)", "Product Manager"), reuse="Architect",
+    ),
+    Stage("Project Manager", "projmgr", inputs=("Product Manager (Refined)", "Architect (Refined)")),
+    # 🔁 Architect <-> Project Manager feedback
+    # Architecture already stable across the first loop -> no final pass
+    Stage(
+        "Architect (Final)", "arch", inputs=("Project Manager", "Architect (Refined)"),
+        skip_if_converged=("Architect (Refined)", "Architect"), reuse="Architect (Refined)",
+    ),
+    # Final architecture did not move -> the task breakdown stands as is
+    Stage(
+        "Project Manager (Refined)", "projmgr", inputs=("Architect (Final)", "Project Manager"),
+        skip_if_converged=("Architect (Final)", "Architect (Refined)"), reuse="Project Manager",
+    ),
+    Stage("Engineer", "engineer", inputs=("Project Manager (Refined)", "Architect (Final)")),
+    Stage("QA", "qa", inputs=("Engineer", "Project Manager (Refined)")),
+    # 🔁 Engineer <-> QA feedback
+    Stage("Engineer (Final)", "engineer", inputs=("QA", "Engineer")),
+]
+
 
 class Orchestrator:
-    def __init__(self, message_bus: MessageBus, llm: Optional[LLMClient] = None):
+    def __init__(
+        self,
+        message_bus: MessageBus,
+        llm: Optional[LLMClient] = None,
+        max_parallelism: Optional[int] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+    ):
         self.message_bus = message_bus
+        settings = get_settings()
+        self.max_parallelism = max_parallelism or settings.PIPELINE_MAX_PARALLELISM
+        self.stage_input_tokens = settings.PIPELINE_STAGE_INPUT_TOKENS
+        self.model_name = llm.model_name if llm else "default"
+        self.budgeter = ContextBudgeter(
+            model_name=self.model_name,
+            strategies=[s.strip() for s in settings.PROMPT_COMPACTION_STRATEGIES.split(",") if s.strip()],
+        )
+        # Input token count per stage of the last run
+        self.prompt_tokens: Dict[str, int] = {}
+        self.convergence = get_convergence_check(settings.CONVERGENCE_METHOD, settings.CONVERGENCE_THRESHOLD)
+        # Similarity measured for each refinement stage of the last run
+        self.convergence_scores: Dict[str, float] = {}
+        self.deadline_seconds = settings.PIPELINE_DEADLINE_SECONDS
+        self.stage_timeout = settings.PIPELINE_STAGE_TIMEOUT_SECONDS
+        self.db_timeout = settings.PIPELINE_DB_TIMEOUT_SECONDS
+        # Budget of every stage of the last run that ran out of time
+        self.timed_out_stages: Dict[str, float] = {}
+        # Near-duplicate inputs of these stages reuse an earlier output; only real LLM output is
+        # cached, and numpy is only imported when the cache is on
+        self.semantic_stages = {s.strip() for s in settings.SEMANTIC_CACHE_STAGES.split(",") if s.strip()}
+        if semantic_cache is None and settings.SEMANTIC_CACHE_ENABLED and llm is not None:
+            from api.ai.core.semantic_cache import get_semantic_cache
+
+            semantic_cache = get_semantic_cache()
+        self.semantic_cache = semantic_cache
+        # Stage-level retries for non-provider failures; provider errors are retried below the agents
+        self.retry_policy = RetryPolicy(settings.LLM_RETRY_MAX_ATTEMPTS, settings.LLM_RETRY_BASE_DELAY, settings.LLM_RETRY_MAX_DELAY)
         self.boss = BossAgent(llm=llm)
         self.pm = ProductManagerAgent(llm=llm)
         self.arch = ArchitectAgent(llm=llm)
@@ -239,133 +329,410 @@ class Orchestrator:
         return json.dumps(message)
 
     # --------------------- Core Flow ---------------------
-    async def run(self, prompt: str, db_session_factory: Callable[[], AsyncSession], project_id: int, project_title: str) -> List[AgentResult]:
-        logger.info(f"Starting AutoTeamAI pipeline for project_id: {project_id}")
+    async def run(
+        self,
+        prompt: str,
+        db_session_factory: Callable[[], AsyncSession],
+        project_id: int,
+        project_title: str,
+        max_parallelism: Optional[int] = None,
+        cache_bypass: bool = False,
+        resume: bool = False,
+        deadline_seconds: Optional[float] = None,
+        queue_wait: float = 0.0,
+    ) -> List[AgentResult]:
+        """
+        Run the pipeline for `project_id`. With `resume=True`, stages that already
+        have a persisted successful AgentOutput are reloaded instead of re-run.
+        `deadline_seconds` (default PIPELINE_DEADLINE_SECONDS, 0 = none) bounds the
+        run's wall-clock time from this call on. `queue_wait` is the time the run
+        waited for a worker, recorded in the usage of its first stages.
+        """
+        with tracing.span("run_pipeline", project_id=project_id, prompt_chars=len(prompt), resume=resume) as run_span:
+            logger.info(f"Starting AutoTeamAI pipeline for project_id: {project_id}")
+            # Inherited by every stage task created below
+            stage_context.cache_bypass.set(cache_bypass)
         
-        # Create a new session specifically for this background task.
-        db: AsyncSession = db_session_factory()
+            # Create a new session specifically for this background task.
+            db: AsyncSession = db_session_factory()
         
-        results: List[AgentResult] = []
-        try:
-            # Publish workflow start event
-            start_message = self._create_message(
-                "workflow_start",
-                project_id,
-                "Orchestrator",
-                f"Workflow started for project: '{project_title}'"
-            )
-            await self.message_bus.publish(project_id, "Orchestrator", start_message)
-
-            # --------------------- Boss ---------------------
-            boss_res = await self._run_and_record("Boss", self.boss, prompt, db, project_id)
-            results.append(boss_res)
-
-            # --------------------- Product Manager ---------------------
-            pm_res = await self._run_and_record("Product Manager", self.pm, boss_res.content, db, project_id)
-            results.append(pm_res)
-
-            # --------------------- Architect ---------------------
-            arch_input = boss_res.content + "\n\n" + pm_res.content
-            arch_res = await self._run_and_record("Architect", self.arch, arch_input, db, project_id)
-            results.append(arch_res)
-
-            # 🔁 PM <-> Architect feedback loop
-            logger.info("Feedback loop: Product Manager ↔ Architect")
-            pm_refined_input = arch_res.content + "\n\n" + pm_res.content
-            pm_refined = await self._run_and_record("Product Manager (Refined)", self.pm, pm_refined_input, db, project_id)
-            results.append(pm_refined)
-
-            arch_refined_input = pm_refined.content + "\n\n" + arch_res.content
-            arch_refined = await self._run_and_record("Architect (Refined)", self.arch, arch_refined_input, db, project_id)
-            results.append(arch_refined)
-
-            # --------------------- Project Manager ---------------------
-            pmgr_input = pm_refined.content + "\n\n" + arch_refined.content
-            pmgr_res = await self._run_and_record("Project Manager", self.projmgr, pmgr_input, db, project_id)
-            results.append(pmgr_res)
-
-            # 🔁 Architect <-> Project Manager feedback
-            logger.info("Feedback loop: Architect ↔ Project Manager")
-            arch_pm_input = pmgr_res.content + "\n\n" + arch_refined.content
-            arch_pm = await self._run_and_record("Architect (Final)", self.arch, arch_pm_input, db, project_id)
-            results.append(arch_pm)
-
-            pmgr_refined_input = arch_pm.content + "\n\n" + pmgr_res.content
-            pmgr_refined = await self._run_and_record("Project Manager (Refined)", self.projmgr, pmgr_refined_input, db, project_id)
-            results.append(pmgr_refined)
-
-            # --------------------- Engineer ---------------------
-            eng_input = pmgr_refined.content + "\n\n" + arch_pm.content
-            eng_res = await self._run_and_record("Engineer", self.engineer, eng_input, db, project_id)
-            results.append(eng_res)
-
-            # --------------------- QA ---------------------
-            qa_input = eng_res.content + "\n\n" + pmgr_refined.content
-            qa_res = await self._run_and_record("QA", self.qa, qa_input, db, project_id)
-            results.append(qa_res)
-
-            # 🔁 Engineer <-> QA feedback
-            logger.info("Feedback loop: Engineer ↔ QA")
-            eng_final_input = qa_res.content + "\n\n" + eng_res.content
-            eng_final = await self._run_and_record("Engineer (Final)", self.engineer, eng_final_input, db, project_id)
-            results.append(eng_final)
+            results: List[AgentResult] = []
+            status: Optional[str] = ProjectStatus.FAILED
+            cancelled = False
+            try:
+                outputs: Dict[str, AgentResult] = {}
+                if resume:
+                    outputs = await self._load_completed_stages(db, project_id)
+                if not await crud.set_project_status(db, project_id, ProjectStatus.RUNNING, unless=ProjectStatus.CANCELLED):
+                    # Cancelled between being queued and starting
+                    status, cancelled = None, True
+                    return results
+
+                # Publish workflow start event
+                start_text = f"Workflow started for project: '{project_title}'"
+                if resume:
+                    start_text = f"Workflow resumed for project: '{project_title}' ({len(outputs)} stages restored)"
+                start_message = self._create_message("workflow_start", project_id, "Orchestrator", start_text)
+                await self.message_bus.publish(project_id, "Orchestrator", start_message)
+
+                # Replay restored outputs so stream consumers see the full picture
+                for stage in PIPELINE_STAGES:
+                    if stage.name in outputs:
+                        restored_message = self._create_message("agent_result", project_id, stage.name, outputs[stage.name].content)
+                        await self.message_bus.publish(project_id, stage.name, restored_message)
+
+                scheduler = StageScheduler(PIPELINE_STAGES, max_parallelism or self.max_parallelism)
+                db_lock = asyncio.Lock()
+                levels_left = scheduler.levels_to_end()
+                seconds = self.deadline_seconds if deadline_seconds is None else deadline_seconds
+                run_deadline = asyncio.get_running_loop().time() + seconds if seconds else None
+
+                async def _run_stage(stage: Stage, outputs: Mapping[str, AgentResult]) -> AgentResult:
+                    with tracing.span(f"stage:{stage.name}", stage=stage.name) as stage_span:
+                        # Each stage runs in its own task, so this usage is the stage's alone
+                        waited = scheduler.queue_waits.get(stage.name, 0.0) + (queue_wait if PROMPT in stage.inputs else 0.0)
+                        stage_context.llm_usage.set(StageUsage(model=self.model_name, queue_wait_seconds=waited))
+                        agent: BaseAgent = getattr(self, stage.agent)
+                        if self._has_converged(stage, outputs):
+                            stage_span.set("skipped", True)
+                            return await self._record_skipped(stage, agent, outputs, db, project_id, db_lock)
+                        input_text = self._compose_input(stage, prompt, outputs)
+                        stage_context.llm_usage.get().prompt_tokens = self.prompt_tokens.get(stage.name, 0)
+                        stage_span.set("prompt_chars", len(input_text)).set("prompt_tokens", self.prompt_tokens.get(stage.name))
+                        cached = self._semantic_lookup(stage.name, input_text)
+                        if cached is not None:
+                            stage_span.set("semantic_similarity", round(cached.similarity, 3))
+                            return await self._record_cached(stage, agent, cached, db, project_id, db_lock)
+                        budget = stage_budget(run_deadline, levels_left[stage.name], cap=self.stage_timeout)
+                        stage_span.set("budget_s", round(budget, 2) if budget is not None else None)
+                        try:
+                            result = await self._run_and_record(stage.name, agent, input_text, db, project_id, db_lock=db_lock, timeout=budget)
+                        except TimeBudgetExceeded as exc:
+                            stage_span.set("timed_out", True)
+                            return await self._record_degraded(stage, agent, input_text, outputs, exc, db, project_id, db_lock)
+                        self._semantic_store(stage.name, input_text, result)
+                        return result
+
+                try:
+                    await scheduler.run(_run_stage, outputs)
+                    status = ProjectStatus.COMPLETED
+                finally:
+                    # Keep results in pipeline order, including partial results on failure
+                    results.extend(outputs[s.name] for s in PIPELINE_STAGES if s.name in outputs)
+
+            except asyncio.CancelledError:
+                # POST /cancel persists 'cancelled' before cancelling the task; anything else is a
+                # shutdown, which leaves the project 'running' so startup recovery resumes it
+                status = None
+                cancelled = await self._is_cancelled(db_session_factory, project_id)
+                raise
+            except Exception as e:
+                logger.error(f"Workflow for project_id {project_id} terminated due to an error: {e}", exc_info=True)
+        
+            finally:
+                if status is not None:
+                    try:
+                        # A cancel that raced the last stage wins
+                        await crud.set_project_status(db, project_id, status, unless=ProjectStatus.CANCELLED)
+                    except Exception as e:
+                        logger.error(f"Could not record status '{status}' for project_id {project_id}: {e}")
+
+                # IMPORTANT: Close the session created within this task.
+                await db.close()
+
+                if cancelled:
+                    cancel_message = self._create_message("workflow_cancelled", project_id, "Orchestrator", "Workflow was cancelled.")
+                    await self.message_bus.publish(project_id, "Orchestrator", cancel_message)
+                    logger.info(f"AutoTeamAI pipeline cancelled for project_id: {project_id}")
+
+                run_span.set("outcome", "cancelled" if cancelled else status or "interrupted")
+                # Publish workflow end event
+                end_message = self._create_message(
+                    "workflow_end",
+                    project_id,
+                    "Orchestrator",
+                    "Workflow was cancelled." if cancelled else "Workflow has completed."
+                )
+                await self.message_bus.publish(project_id, "Orchestrator", end_message)
+                logger.info(f"✅ AutoTeamAI pipeline complete for project_id: {project_id}")
+        
+            return results
 
+    # --------------------- Helper: cancellation ---------------------
+    async def _is_cancelled(self, db_session_factory: Callable[[], AsyncSession], project_id: int) -> bool:
+        # Fresh session: the run's own one may have been interrupted mid-query
+        try:
+            async with db_session_factory() as session:
+                project = await crud.get_project(session, project_id)
         except Exception as e:
-            logger.error(f"Workflow for project_id {project_id} terminated due to an error: {e}", exc_info=True)
-        
-        finally:
-            # IMPORTANT: Close the session created within this task.
-            await db.close()
-
-            # Publish workflow end event
-            end_message = self._create_message(
-                "workflow_end",
-                project_id,
-                "Orchestrator",
-                "Workflow has completed."
+            logger.error(f"Could not read status of project_id {project_id}: {e}")
+            return False
+        return project is not None and project.status == ProjectStatus.CANCELLED
+
+    # --------------------- Helper: convergence early exit ---------------------
+    def _has_converged(self, stage: Stage, outputs: Mapping[str, AgentResult]) -> bool:
+        if self.convergence is None or stage.skip_if_converged is None:
+            return False
+        a, b = stage.skip_if_converged
+        score = self.convergence.similarity(outputs[a].content, outputs[b].content)
+        self.convergence_scores[stage.name] = score
+        logger.info(
+            "Convergence %s vs %s for %s: %.3f (threshold %.2f)",
+            a, b, stage.name, score, self.convergence.threshold,
+        )
+        return score >= self.convergence.threshold
+
+    async def _record_skipped(
+        self,
+        stage: Stage,
+        agent: BaseAgent,
+        outputs: Mapping[str, AgentResult],
+        db: AsyncSession,
+        project_id: int,
+        db_lock: Optional[asyncio.Lock],
+    ) -> AgentResult:
+        """Persist the reused output under the skipped stage's name so resume and results stay complete."""
+        a, b = stage.skip_if_converged
+        reason = (
+            f"Skipped '{stage.name}': '{a}' converged with '{b}' "
+            f"(similarity {self.convergence_scores[stage.name]:.3f} >= {self.convergence.threshold:.2f}, "
+            f"{self.convergence.name}); reusing '{stage.reuse}'"
+        )
+        skipped_message = self._create_message("stage_skipped", project_id, stage.name, reason)
+        await self.message_bus.publish(project_id, stage.name, skipped_message)
+
+        result = AgentResult(agent_name=agent.name, content=outputs[stage.reuse].content)
+        self._set_outcome(StageOutcome.SKIPPED)
+        await self._persist(db, project_id, stage.name, result.content, db_lock)
+        result_message = self._create_message("agent_result", project_id, stage.name, result.content)
+        await self.message_bus.publish(project_id, stage.name, result_message)
+        return result
+
+    # --------------------- Helper: semantic stage cache ---------------------
+    def _semantic_key(self, stage_name: str) -> Optional[str]:
+        if self.semantic_cache is None or stage_name not in self.semantic_stages:
+            return None
+        return f"{self.model_name}/{stage_name}"
+
+    def _semantic_lookup(self, stage_name: str, input_text: str) -> Optional["SemanticHit"]:
+        namespace = self._semantic_key(stage_name)
+        if namespace is None or stage_context.cache_bypass.get():
+            return None
+        return self.semantic_cache.lookup(namespace, input_text)
+
+    def _semantic_store(self, stage_name: str, input_text: str, result: AgentResult) -> None:
+        namespace = self._semantic_key(stage_name)
+        usage = stage_context.llm_usage.get()
+        # Never reuse the deterministic fallback an agent gave after an unexpected LLM failure
+        if namespace is not None and (usage is None or usage.outcome != StageOutcome.FALLBACK):
+            self.semantic_cache.add(namespace, input_text, result.content)
+
+    async def _record_cached(
+        self,
+        stage: Stage,
+        agent: BaseAgent,
+        hit: "SemanticHit",
+        db: AsyncSession,
+        project_id: int,
+        db_lock: Optional[asyncio.Lock],
+    ) -> AgentResult:
+        """Persist and publish the output of an earlier run whose input was a near duplicate."""
+        logger.info("Stage %s served from the semantic cache (similarity %.3f)", stage.name, hit.similarity)
+        cached_message = self._create_message(
+            "stage_cached", project_id, stage.name,
+            f"'{stage.name}' reuses the output for a similar earlier input (similarity {hit.similarity:.3f} >= {self.semantic_cache.threshold:.2f})",
+        )
+        await self.message_bus.publish(project_id, stage.name, cached_message)
+
+        result = AgentResult(agent_name=agent.name, content=hit.output)
+        self._set_outcome(StageOutcome.CACHED)
+        usage = stage_context.llm_usage.get()
+        if usage is not None:
+            usage.completion_tokens = count_tokens(hit.output)
+        await self._persist(db, project_id, stage.name, result.content, db_lock)
+        result_message = self._create_message("agent_result", project_id, stage.name, result.content)
+        await self.message_bus.publish(project_id, stage.name, result_message)
+        return result
+
+    # --------------------- Helper: time budgets ---------------------
+    async def _record_degraded(
+        self,
+        stage: Stage,
+        agent: BaseAgent,
+        input_text: str,
+        outputs: Mapping[str, AgentResult],
+        exc: TimeBudgetExceeded,
+        db: AsyncSession,
+        project_id: int,
+        db_lock: Optional[asyncio.Lock],
+    ) -> AgentResult:
+        """A stage out of time: skip it if it is an optional refinement, else use the agent's fallback."""
+        self.timed_out_stages[stage.name] = exc.budget
+        if stage.reuse is not None:
+            content = outputs[stage.reuse].content
+            action = f"skipping the optional refinement and reusing '{stage.reuse}'"
+            STAGE_FALLBACKS.labels(stage.name, "timeout_reuse").inc()
+        else:
+            content = agent.fallback(input_text)
+            action = "using the agent's fallback output"
+            STAGE_FALLBACKS.labels(stage.name, "timeout_fallback").inc()
+        logger.warning("Stage %s out of time (%.1fs budget); %s", stage.name, exc.budget, action)
+        timeout_message = self._create_message(
+            "stage_timeout", project_id, stage.name, f"'{stage.name}' ran out of its {exc.budget:.1f}s time budget; {action}"
+        )
+        await self.message_bus.publish(project_id, stage.name, timeout_message)
+
+        result = AgentResult(agent_name=agent.name, content=content)
+        self._set_outcome(StageOutcome.TIMEOUT)
+        await self._persist(db, project_id, stage.name, content, db_lock)
+        result_message = self._create_message("agent_result", project_id, stage.name, content)
+        await self.message_bus.publish(project_id, stage.name, result_message)
+        return result
+
+    # --------------------- Helper: input composition ---------------------
+    def _compose_input(self, stage: Stage, prompt: str, outputs: Mapping[str, AgentResult]) -> str:
+        """
+        Join the stage's upstream outputs, compacting the oldest ones when the
+        result exceeds the stage's token budget. The user prompt is kept longest.
+        """
+        order = {s.name: i for i, s in enumerate(PIPELINE_STAGES)}
+        sections = [
+            Section(PROMPT, prompt, priority=len(PIPELINE_STAGES))
+            if name == PROMPT
+            else Section(name, outputs[name].content, priority=order[name])
+            for name in stage.inputs
+        ]
+        text, report = self.budgeter.fit(sections, stage.max_input_tokens or self.stage_input_tokens)
+        self.prompt_tokens[stage.name] = report.tokens_after
+        if report.compacted:
+            logger.info(
+                "Stage %s input compacted %d -> %d tokens (budget %d, %s)",
+                stage.name, report.tokens_before, report.tokens_after, report.budget, "+".join(report.applied),
             )
-            await self.message_bus.publish(project_id, "Orchestrator", end_message)
-            logger.info(f"✅ AutoTeamAI pipeline complete for project_id: {project_id}")
-        
-        return results
+        else:
+            logger.info("Stage %s input: %d tokens", stage.name, report.tokens_after)
+        return text
+
+    # --------------------- Helper: resume ---------------------
+    async def _load_completed_stages(self, db: AsyncSession, project_id: int) -> Dict[str, AgentResult]:
+        """Latest successful persisted output per pipeline stage; error rows are ignored."""
+        stages = {s.name: s for s in PIPELINE_STAGES}
+        completed: Dict[str, AgentResult] = {}
+        for row in await crud.list_agent_outputs(db, project_id):
+            stage = stages.get(row.agent_name)
+            if stage is None or row.content.startswith(STAGE_ERROR_PREFIX):
+                continue
+            agent: BaseAgent = getattr(self, stage.agent)
+            completed[stage.name] = AgentResult(agent_name=agent.name, content=row.content)
+        logger.info(f"Restored {len(completed)} completed stages for project_id: {project_id}")
+        return completed
 
     # --------------------- Helper: run, persist, publish ---------------------
-    async def _run_and_record(self, name: str, agent: BaseAgent, input_text: str, db: AsyncSession, project_id: int) -> AgentResult:
+    async def _run_and_record(
+        self,
+        name: str,
+        agent: BaseAgent,
+        input_text: str,
+        db: AsyncSession,
+        project_id: int,
+        db_lock: Optional[asyncio.Lock] = None,
+        timeout: Optional[float] = None,
+    ) -> AgentResult:
+        metrics = stage_metrics(name)
         # Publish agent start event
         start_message = self._create_message("agent_start", project_id, name, f"Agent '{name}' is starting its task...")
-        await self.message_bus.publish(project_id, name, start_message)
-
+        await self._publish(project_id, name, start_message, metrics)
+
+        # Forward incremental LLM output as agent_delta events while the stage runs
+        async def _publish_delta(chunk: str) -> None:
+            delta_message = self._create_message("agent_delta", project_id, name, chunk)
+            await self.message_bus.publish(project_id, name, delta_message)
+
+        stage_token = stage_context.current_stage.set(name)
+        sink_token = stage_context.delta_sink.set(_publish_delta)
+        # LLM clients and the retry/rate-limit layers below read the stage deadline
+        deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+        deadline_token = stage_context.deadline.set(deadline)
+        started = time.perf_counter()
         try:
-            result = await self._run_agent_with_retries(agent, input_text, name)
+            result = await with_deadline(self._run_agent_with_retries(agent, input_text, name), f"Stage '{name}'", timeout)
+        except TimeBudgetExceeded:
+            raise  # degraded by the caller, not an error
         except Exception as exc:
-            err_text = f"An error occurred in agent '{name}': {exc}"
+            metrics.errors.inc()
+            err_text = f"{STAGE_ERROR_PREFIX}'{name}': {exc}"
             logger.error(err_text, exc_info=True)
+            self._set_outcome(StageOutcome.ERROR)
             
             # Persist and publish error
-            await crud.add_agent_output(db, project_id, name, err_text)
+            await self._persist(db, project_id, name, err_text, db_lock)
             error_message = self._create_message("error", project_id, name, err_text)
-            await self.message_bus.publish(project_id, name, error_message)
+            await self._publish(project_id, name, error_message, metrics)
             raise # Re-raise the exception to stop the workflow
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.llm.observe(elapsed)
+            usage = stage_context.llm_usage.get()
+            if usage is not None:
+                usage.llm_seconds = elapsed
+            stage_context.deadline.reset(deadline_token)
+            stage_context.delta_sink.reset(sink_token)
+            stage_context.current_stage.reset(stage_token)
 
         # Persist and publish successful result
-        await crud.add_agent_output(db, project_id, name, result.content)
+        if usage is not None:
+            usage.completion_tokens = count_tokens(result.content)
+        await self._persist(db, project_id, name, result.content, db_lock)
         result_message = self._create_message("agent_result", project_id, name, result.content)
-        await self.message_bus.publish(project_id, name, result_message)
+        await self._publish(project_id, name, result_message, metrics)
         
         return result
 
+    async def _publish(self, project_id: int, name: str, message: str, metrics: StageMetrics) -> None:
+        started = time.perf_counter()
+        await self.message_bus.publish(project_id, name, message)
+        metrics.publish.observe(time.perf_counter() - started)
+
+    # --------------------- Helper: persistence ---------------------
+    @staticmethod
+    def _set_outcome(outcome: str) -> None:
+        usage = stage_context.llm_usage.get()
+        if usage is not None:
+            usage.outcome = outcome
+
+    async def _persist(self, db: AsyncSession, project_id: int, name: str, content: str, db_lock: Optional[asyncio.Lock]) -> None:
+        # A single AsyncSession must not be used by concurrent stages at once. The write gets its
+        # own limit instead of the stage deadline, so an output is still saved after a timeout.
+        # The stage's usage (if any) is saved with it.
+        timeout = self.db_timeout or None
+        usage = stage_context.llm_usage.get()
+        started = time.perf_counter()
+        if db_lock is None:
+            await with_deadline(crud.add_agent_output(db, project_id, name, content, usage=usage), "Saving stage output", timeout)
+        else:
+            async with db_lock:
+                await with_deadline(crud.add_agent_output(db, project_id, name, content, usage=usage), "Saving stage output", timeout)
+        stage_metrics(name).persist.observe(time.perf_counter() - started)
+
     # --------------------- Helper: retry logic ---------------------
-    async def _run_agent_with_retries(
-        self, agent, input_text: str, agent_name: str, retries: int = 2, backoff: float = 1.0
-    ) -> AgentResult:
+    async def _run_agent_with_retries(self, agent, input_text: str, agent_name: str) -> AgentResult:
+        """
+        Retry unexpected agent failures with jittered backoff inside the shared retry budget.
+        LLMProviderError is raised at once: the resilience layer under the agent has already
+        retried or failed over, and an open circuit must fail the stage fast.
+        """
         attempt = 0
-        last_exc = None
-        while attempt <= retries:
+        while True:
             try:
                 return await agent.run(input_text)
+            except (LLMProviderError, TimeBudgetExceeded):
+                raise
             except Exception as e:
-                last_exc = e
-                wait = backoff * (2 ** attempt)
+                attempt += 1
+                if attempt >= self.retry_policy.max_attempts or not get_retry_budget().try_spend():
+                    raise
+                wait = self.retry_policy.delay(attempt - 1)
+                stage_metrics(agent_name).retries.inc()
                 logger.warning(
                     "Agent %s failed on attempt %d: %s — retrying in %.1fs",
                     agent_name,
@@ -374,5 +741,3 @@ class Orchestrator:
                     wait,
                 )
                 await asyncio.sleep(wait)
-                attempt += 1
-        raise last_exc
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""
+Bounded pipeline execution service.
+
+- submit(project_id, run) -> enqueue a pipeline run (raises QueueFullError / ServiceUnavailableError)
+- submit_batch(batch_id, jobs, concurrency) -> enqueue a batch into its own lane
+- a fixed pool of async workers drains the queues: interactive runs FIFO, batches
+  round-robin between each other, alternating with interactive runs
+- position/ETA/queue-wait are tracked per project for admission responses and status
+- cancel(project_id) drops a queued run or cancels the task of a running one
+
+With more than one worker, batches never take every worker: `batch_workers` (at
+most workers - 1) bounds how many batch runs execute at once, the rest staying
+free for interactive traffic, and each batch is further capped by its own
+`concurrency`. A single worker serves both: it alternates between interactive
+runs and batch lanes, so an interactive run waits for at most one batch run.
+
+Started and stopped from `main.lifespan`. Jobs still queued at shutdown are not
+lost: their projects stay `pending` and are resumed by the next process that starts,
+or by another running one (`routes_agents.resume_unfinished_pipelines`).
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+
+from api.ai.core.utils import get_logger
+
+logger: logging.Logger = get_logger("pipeline_service")
+
+RunFactory = Callable[[], Awaitable[Any]]
+
+
+class QueueFullError(Exception):
+    def __init__(self, depth: int, eta_seconds: float):
+        super().__init__(f"Pipeline queue is full ({depth} waiting)")
+        self.depth = depth
+        self.eta_seconds = eta_seconds
+
+
+class ServiceUnavailableError(Exception):
+    pass
+
+
+@dataclass
+class PipelineJob:
+    project_id: int
+    run: RunFactory
+    enqueued_at: float
+    batch_id: Optional[int] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    cancelled: bool = False
+
+    @property
+    def state(self) -> str:
+        if self.finished_at is not None:
+            return "cancelled" if self.cancelled else "finished"
+        return "running" if self.started_at is not None else "queued"
+
+    @property
+    def queue_wait(self) -> float:
+        """Seconds spent waiting for a worker (still growing while queued)."""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+@dataclass
+class BatchLane:
+    batch_id: int
+    concurrency: int
+    pending: Deque[PipelineJob]
+    running: int = 0
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.pending) and self.running < self.concurrency
+
+
+class PipelineService:
+    HISTORY_SIZE = 1000  # finished jobs kept for status lookups
+    EWMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue_depth: int = 100,
+        default_run_seconds: float = 60.0,
+        batch_workers: Optional[int] = None,
+        max_batch_queue_depth: int = 5000,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        # One worker is always left to interactive runs, unless it is the only one
+        limit = max(workers - 1, 1)
+        self.batch_workers = max(1, min(batch_workers if batch_workers is not None else limit, limit))
+        self.max_batch_queue_depth = max_batch_queue_depth
+        self._avg_run_seconds = default_run_seconds
+        self._pending: Deque[PipelineJob] = deque()
+        self._batches: "OrderedDict[int, BatchLane]" = OrderedDict()
+        self._batch_running = 0
+        self._interactive_turn = True
+        self._running: Dict[int, PipelineJob] = {}
+        self._finished: "OrderedDict[int, PipelineJob]" = OrderedDict()
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+    # --------------------- Lifecycle ---------------------
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"pipeline-worker-{i}") for i in range(self.workers)]
+        logger.info("Pipeline service started (workers=%d, max_queue_depth=%d)", self.workers, self.max_queue_depth)
+
+    async def stop(self) -> None:
+        self._accepting = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        queued = len(self._pending) + self._batch_queued()
+        if queued:
+            logger.info("Pipeline service stopped with %d queued jobs left for startup recovery", queued)
+        self._pending.clear()
+        self._batches.clear()
+        self._batch_running = 0
+
+    @property
+    def running(self) -> bool:
+        return self._accepting and bool(self._tasks)
+
+    # --------------------- Admission ---------------------
+    def check_admission(self) -> None:
+        """Raise if a new job would be rejected right now (used before creating DB rows)."""
+        if not self.running:
+            raise ServiceUnavailableError("Pipeline service is not accepting work")
+        if len(self._pending) >= self.max_queue_depth:
+            raise QueueFullError(len(self._pending), self.eta(len(self._pending)))
+
+    async def submit(self, project_id: int, run: RunFactory) -> PipelineJob:
+        if self.is_active(project_id):
+            raise ValueError(f"Project {project_id} is already queued or running")
+        self.check_admission()
+        job = PipelineJob(project_id=project_id, run=run, enqueued_at=time.monotonic())
+        self._pending.append(job)
+        async with self._cond:
+            self._cond.notify()
+        return job
+
+    def check_batch_admission(self, size: int) -> None:
+        if not self.running:
+            raise ServiceUnavailableError("Pipeline service is not accepting work")
+        queued = self._batch_queued()
+        if queued + size > self.max_batch_queue_depth:
+            raise QueueFullError(queued, self.eta(queued // max(self.batch_workers, 1)))
+
+    async def submit_batch(self, batch_id: int, jobs: Sequence[Tuple[int, RunFactory]], concurrency: int) -> List[PipelineJob]:
+        """Queue a batch in its own lane; at most `concurrency` of its runs execute at once."""
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+        active = [pid for pid, _ in jobs if self.is_active(pid)]
+        if active:
+            raise ValueError(f"Projects {active} are already queued or running")
+        self.check_batch_admission(len(jobs))
+        lane = self._batches.get(batch_id)
+        if lane is None:
+            lane = self._batches[batch_id] = BatchLane(batch_id=batch_id, concurrency=concurrency, pending=deque())
+        now = time.monotonic()
+        queued = [PipelineJob(project_id=pid, run=run, enqueued_at=now, batch_id=batch_id) for pid, run in jobs]
+        lane.pending.extend(queued)
+        async with self._cond:
+            self._cond.notify(min(len(queued), lane.concurrency))
+        return queued
+
+    # --------------------- Cancellation ---------------------
+    def cancel(self, project_id: int) -> Optional[str]:
+        """
+        Stop a project's run: a queued job is dropped, a running one has its task
+        cancelled. Returns the state it was in ("queued" / "running"), None if unknown.
+        """
+        running = self._running.get(project_id)
+        if running is not None:
+            running.cancelled = True
+            if running.task is not None:
+                running.task.cancel()
+            return "running"
+        for lane in [None, *self._batches.values()]:
+            queue = self._pending if lane is None else lane.pending
+            job = next((j for j in queue if j.project_id == project_id), None)
+            if job is None:
+                continue
+            queue.remove(job)
+            job.cancelled = True
+            job.finished_at = time.monotonic()
+            self._finished[project_id] = job
+            if lane is not None and not lane.pending and not lane.running:
+                del self._batches[lane.batch_id]
+            return "queued"
+        return None
+
+    # --------------------- Introspection ---------------------
+    def _queued_jobs(self) -> Iterator[PipelineJob]:
+        yield from self._pending
+        for lane in self._batches.values():
+            yield from lane.pending
+
+    def _batch_queued(self) -> int:
+        return sum(len(lane.pending) for lane in self._batches.values())
+
+    def is_active(self, project_id: int) -> bool:
+        return project_id in self._running or any(j.project_id == project_id for j in self._queued_jobs())
+
+    def active_projects(self) -> List[int]:
+        """Projects queued or running here."""
+        return [*self._running, *(j.project_id for j in self._queued_jobs())]
+
+    def position(self, project_id: int) -> Optional[int]:
+        """0-based position in the project's queue (interactive, or its batch lane), None if not queued."""
+        for queue in [self._pending, *(lane.pending for lane in self._batches.values())]:
+            for i, job in enumerate(queue):
+                if job.project_id == project_id:
+                    return i
+        return None
+
+    def eta(self, position: int) -> float:
+        """Rough seconds until a job at `position` starts, from the EWMA run duration."""
+        busy = len(self._running) >= self.workers
+        rounds = position // self.workers + (1 if busy else 0)
+        return round(rounds * self._avg_run_seconds, 1)
+
+    def job(self, project_id: int) -> Optional[PipelineJob]:
+        if project_id in self._running:
+            return self._running[project_id]
+        for job in self._queued_jobs():
+            if job.project_id == project_id:
+                return job
+        return self._finished.get(project_id)
+
+    def batch_stats(self, batch_id: int) -> Optional[Dict[str, int]]:
+        lane = self._batches.get(batch_id)
+        if lane is None:
+            return None
+        return {"queued": len(lane.pending), "running": lane.running, "concurrency": lane.concurrency}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accepting": self.running,
+            "workers": self.workers,
+            "running": len(self._running),
+            "queued": len(self._pending),
+            "max_queue_depth": self.max_queue_depth,
+            "avg_run_seconds": round(self._avg_run_seconds, 2),
+            "batch_workers": self.batch_workers,
+            "batch_running": self._batch_running,
+            "batch_queued": self._batch_queued(),
+            "batches": len(self._batches),
+        }
+
+    # --------------------- Workers ---------------------
+    def _pick(self) -> Optional[PipelineJob]:
+        """Alternate between interactive runs and batch lanes; batch lanes take turns among themselves."""
+        lane = None
+        if self._batch_running < self.batch_workers:
+            lane = next((lane for lane in self._batches.values() if lane.ready), None)
+        if self._pending and (self._interactive_turn or lane is None):
+            self._interactive_turn = False
+            return self._pending.popleft()
+        if lane is None:
+            return None
+        self._interactive_turn = True
+        self._batches.move_to_end(lane.batch_id)  # round-robin: this lane goes last next time
+        lane.running += 1
+        self._batch_running += 1
+        return lane.pending.popleft()
+
+    async def _next_job(self) -> PipelineJob:
+        async with self._cond:
+            while True:
+                job = self._pick()
+                if job is not None:
+                    return job
+                await self._cond.wait()
+
+    async def _release(self, job: PipelineJob) -> None:
+        """Free the batch slot of a finished job and wake a worker that may now take another."""
+        if job.batch_id is None:
+            return
+        lane = self._batches.get(job.batch_id)
+        self._batch_running -= 1
+        if lane is not None:
+            lane.running -= 1
+            if not lane.pending and not lane.running:
+                del self._batches[job.batch_id]
+        async with self._cond:
+            self._cond.notify()
+
+    async def _worker(self, idx: int) -> None:
+        while True:
+            job = await self._next_job()
+            job.started_at = time.monotonic()
+            self._running[job.project_id] = job
+            logger.info(
+                "Worker %d picked project_id %s after %.2fs in queue", idx, job.project_id, job.queue_wait
+            )
+            job.task = asyncio.create_task(job.run())
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                # Only swallow a cancel aimed at the job, never one aimed at this worker
+                if not job.cancelled or asyncio.current_task().cancelling():
+                    raise
+                logger.info("Pipeline for project_id %s cancelled", job.project_id)
+            except Exception as e:
+                logger.error(f"Pipeline for project_id {job.project_id} crashed: {e}", exc_info=True)
+            finally:
+                job.finished_at = time.monotonic()
+                self._running.pop(job.project_id, None)
+                self._remember(job)
+                await self._release(job)
+
+    def _remember(self, job: PipelineJob) -> None:
+        if not job.cancelled:  # a cut-short run says nothing about run time
+            duration = job.finished_at - job.started_at
+            self._avg_run_seconds += self.EWMA_ALPHA * (duration - self._avg_run_seconds)
+        self._finished[job.project_id] = job
+        self._finished.move_to_end(job.project_id)
+        while len(self._finished) > self.HISTORY_SIZE:
+            self._finished.popitem(last=False)
+
+
+# --------------------- Process-wide service ---------------------
+_service: Optional[PipelineService] = None
+
+
+def get_pipeline_service() -> PipelineService:
+    global _service
+    if _service is None:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _service = PipelineService(
+            workers=settings.PIPELINE_WORKERS,
+            max_queue_depth=settings.PIPELINE_QUEUE_DEPTH,
+            batch_workers=settings.PIPELINE_BATCH_WORKERS or None,
+            max_batch_queue_depth=settings.PIPELINE_BATCH_QUEUE_DEPTH,
+        )
+    return _service
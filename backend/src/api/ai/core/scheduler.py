@@ -0,0 +1,156 @@
+"""
+DAG-based stage scheduler for the AutoTeamAI pipeline.
+
+- Stage: declarative pipeline node (which agent runs, which upstream outputs
+  make up its input, which upstream stages it depends on); the orchestrator
+  composes and budgets the input text
+- StageScheduler: launches every stage whose dependencies are satisfied,
+  concurrently, bounded by a per-run max_parallelism
+
+The scheduler knows nothing about agents, persistence or the MessageBus; the
+orchestrator hands it a `runner` coroutine that executes a single stage.
+"""
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, FrozenSet, Mapping, Optional, Sequence, Tuple
+import asyncio
+import time
+import logging
+
+from api.ai.core.utils import get_logger
+from api.ai.agents.base_agent import AgentResult
+
+logger: logging.Logger = get_logger("scheduler")
+
+# Placeholder used in Stage.inputs for the raw user prompt
+PROMPT = "__prompt__"
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    A single node of the pipeline graph.
+
+    - name: unique stage name (also the `agent_name` persisted in AgentOutput)
+    - agent: attribute name of the agent on the Orchestrator (e.g. "boss")
+    - inputs: upstream stage names (or PROMPT) concatenated, in order, to build the input
+    - after: extra ordering-only dependencies that do not feed the input
+    - max_input_tokens: input budget for this stage (None = pipeline default)
+    - skip_if_converged: pair of stages whose outputs, once similar, make this
+      refinement stage redundant; its output is then taken from `reuse`
+    """
+    name: str
+    agent: str
+    inputs: Tuple[str, ...] = (PROMPT,)
+    after: Tuple[str, ...] = ()
+    max_input_tokens: Optional[int] = None
+    skip_if_converged: Optional[Tuple[str, str]] = None
+    reuse: Optional[str] = None
+
+    def __post_init__(self):
+        if (self.skip_if_converged is None) != (self.reuse is None):
+            raise ValueError(f"Stage '{self.name}': skip_if_converged and reuse must be set together")
+
+    @property
+    def deps(self) -> FrozenSet[str]:
+        extra = set(self.after)
+        if self.skip_if_converged:
+            extra.update(self.skip_if_converged)
+            extra.add(self.reuse)
+        return frozenset(n for n in self.inputs if n != PROMPT) | frozenset(extra)
+
+
+StageRunner = Callable[[Stage, Mapping[str, AgentResult]], Awaitable[AgentResult]]
+
+
+class StageScheduler:
+    def __init__(self, stages: Sequence[Stage], max_parallelism: int = 4):
+        if max_parallelism < 1:
+            raise ValueError("max_parallelism must be >= 1")
+        self.stages: Tuple[Stage, ...] = tuple(stages)
+        self.max_parallelism = max_parallelism
+        # Seconds each launched stage waited for a free slot once its dependencies were done
+        self.queue_waits: Dict[str, float] = {}
+        self._validate()
+
+    # --------------------- Graph validation ---------------------
+    def _validate(self) -> None:
+        names = [s.name for s in self.stages]
+        if len(names) != len(set(names)):
+            raise ValueError("Duplicate stage names in pipeline definition")
+        known = set(names)
+        for stage in self.stages:
+            missing = stage.deps - known
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {sorted(missing)}")
+
+        # Kahn's algorithm: every stage must become ready at some point
+        resolved: set = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [s for s in remaining if s.deps <= resolved]
+            if not ready:
+                raise ValueError(f"Cycle detected between stages: {sorted(s.name for s in remaining)}")
+            resolved.update(s.name for s in ready)
+            remaining = [s for s in remaining if s.name not in resolved]
+
+    def levels_to_end(self) -> Dict[str, int]:
+        """Per stage, the number of stages on the longest path from it to the end (itself included)."""
+        levels: Dict[str, int] = {}
+        for stage in reversed(self._topological()):
+            dependents = [levels[s.name] for s in self.stages if stage.name in s.deps]
+            levels[stage.name] = 1 + max(dependents, default=0)
+        return levels
+
+    def _topological(self) -> Tuple[Stage, ...]:
+        order, resolved = [], set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [s for s in remaining if s.deps <= resolved]
+            order.extend(ready)
+            resolved.update(s.name for s in ready)
+            remaining = [s for s in remaining if s.name not in resolved]
+        return tuple(order)
+
+    # --------------------- Execution ---------------------
+    async def run(self, runner: StageRunner, results: Optional[Dict[str, AgentResult]] = None) -> Dict[str, AgentResult]:
+        """
+        Execute the graph. Every stage whose dependencies are in `results` is
+        launched as soon as a parallelism slot is free.
+
+        `results` is filled in place (so callers keep partial results when a
+        stage fails); stages already present in it are treated as done.
+        The first stage failure cancels the stages still running and is re-raised.
+        """
+        if results is None:
+            results = {}
+        pending: Dict[str, Stage] = {s.name: s for s in self.stages if s.name not in results}
+        running: Dict[asyncio.Task, Stage] = {}
+        ready_since: Dict[str, float] = {}
+
+        try:
+            while pending or running:
+                # Launch ready stages in declaration order
+                now = time.monotonic()
+                for stage in list(pending.values()):
+                    if not stage.deps <= results.keys():
+                        continue
+                    ready_since.setdefault(stage.name, now)
+                    if len(running) >= self.max_parallelism:
+                        continue
+                    del pending[stage.name]
+                    self.queue_waits[stage.name] = now - ready_since[stage.name]
+                    logger.debug("Launching stage %s", stage.name)
+                    running[asyncio.create_task(runner(stage, results))] = stage
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    results[stage.name] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return results
@@ -0,0 +1,482 @@
+"""
+Semantic stage cache: reuse a stage's output for a near-duplicate input.
+
+Ideas are often resubmitted reworded ("AI note taking app that summarizes
+meetings" vs "App that takes meeting notes and summarizes them with AI") and the
+exact-match LLM response cache misses them.
+The orchestrator asks this cache before running a stage listed in
+SEMANTIC_CACHE_STAGES and reuses the stored output when an earlier input of
+the same stage (and model) is similar enough.
+
+- HashedTfidfEmbedder: content words (function words and request verbs such as
+  "build" dropped, lightly stemmed) plus their character trigrams, and
+  negations as features of their own ("not using cloud" is not "using cloud"),
+  tf-idf weighted and hashed (with a sign bit) into a small dense vector; no
+  model download
+- VectorIndex: NumPy inner-product search over unit vectors; brute force while
+  small, an inverted file (spherical k-means lists, `nprobe` probed per query)
+  once it grows, retrained each time it doubles (a k-means of about a second at
+  64k entries, run in a worker thread while searches keep using the old lists)
+- SemanticCache: one index per namespace, least-recently-used eviction past
+  `max_entries`, TTL, atomic persistence to an .npz file
+
+Lookups stay well under a millisecond at 100k entries (`python -m
+bench.semantic_cache`). The similarity is lexical: synonyms ("rental" vs
+"renting", "used" vs "second-hand") and rephrasings that add or drop words
+("notes app with AI" vs "AI-powered note taking app", about 0.67) miss, and
+swapping one content word of a longer idea ("virtual garden" vs "virtual farm")
+still scores about 0.8, which is what the default threshold of 0.85 sits above
+(`python -m bench.semantic_threshold` scores labelled pairs; the tests check it
+against pairs held out from that set). Document frequencies keep
+growing, so vectors embedded early were weighted with an older idf; the drift
+is small next to the threshold.
+"""
+
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+from api.ai.core.metrics import counter
+from api.ai.core.utils import get_logger
+
+logger = get_logger("semantic_cache")
+
+LOOKUPS = counter("autoteam_semantic_cache_lookups_total", "Semantic stage cache lookups by stage and result.", ("stage", "result"))
+
+# Words, and the punctuation that ends a negation
+_TOKEN_RE = re.compile(r"\w+|[.,;:!?]")
+_SIGN_BIT = 1 << 31
+_STOPWORDS = frozenset("""
+a an the and or but of for to in on at by with from into onto that which who whom where when whose this these those
+it its is are was be been being can could will would should i we you my our your their them they each other between
+some any as than then so very also just like about via using
+""".split())
+# The request verbs of idea prompts ("Build an app that..." is "An app that...")
+_FILLER = frozenset("build create make develop want need".split())
+_NEGATIONS = frozenset(("no", "not", "without", "non", "never", "nor"))
+_NEGATION = "<not>"
+# A negation flips the idea, so it weighs more than one more content word would
+_NEGATION_WEIGHT = 2.0
+# Character trigrams only bridge spelling variants, so they weigh less than whole words
+_TRIGRAM_WEIGHT = 0.35
+
+
+# --------------------- Embedding ---------------------
+def _stem(word: str) -> str:
+    """Crude suffix stripping: "summarises"/"summarized" -> "summariz", "meetings" -> "meet"."""
+    word = re.sub(r"is(e|es|ed|ing)$", r"iz\1", word)
+    if word.endswith("s") and not word.endswith("ss") and len(word) >= 4:
+        word = word[:-1]
+    for suffix in ("ing", "ed", "e"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+class HashedTfidfEmbedder:
+    # Bumped whenever `features` changes: persisted vectors of another version are not comparable
+    VERSION = 3
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        # Documents seen, and how many contained each hashed feature
+        self.docs = 0
+        self.df: Dict[int, int] = {}
+
+    @staticmethod
+    def features(text: str) -> Dict[int, float]:
+        """Hashed content words and their character trigrams of `text`, weighted by sublinear tf.
+
+        Word order is ignored ("notes app with AI" and "AI notes app" are the same idea). A
+        negation is a feature of its own, and reaches over function words to the next content
+        word ("not using cloud", "without video calls"), which becomes a negated feature sharing
+        nothing with the plain word; punctuation ends it.
+        """
+        grams: Counter = Counter()
+        negated = False
+        for token in _TOKEN_RE.findall(text.lower()):
+            if token in _NEGATIONS:
+                grams[_NEGATION] += 1
+                negated = True
+            elif not token[0].isalnum():
+                negated = False
+            elif token in _STOPWORDS or token in _FILLER:
+                continue
+            elif negated:
+                grams["!" + _stem(token)] += 1
+                negated = False
+            else:
+                word = _stem(token)
+                grams[word] += 1
+                padded = f"<{word}>"
+                grams.update("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+        # crc32 is stable across processes (persisted vectors must stay comparable), unlike hash()
+        features: Dict[int, float] = {}
+        for gram, count in grams.items():
+            h = zlib.crc32(gram.encode())
+            kind = _TRIGRAM_WEIGHT if gram[0] == "#" else _NEGATION_WEIGHT if gram[0] in "!<" else 1.0
+            weight = (1.0 + math.log(count)) * kind
+            features[h] = features.get(h, 0.0) + weight
+        return features
+
+    def learn(self, features: Dict[int, float]) -> None:
+        self.docs += 1
+        for feature in features:
+            self.df[feature] = self.df.get(feature, 0) + 1
+
+    def embed(self, features: Dict[int, float]) -> np.ndarray:
+        """Feature weights times smoothed idf, signed-hashed into `dim` buckets, L2 normalized."""
+        n = len(features)
+        keys = np.fromiter(features, dtype=np.int64, count=n)
+        tf = np.fromiter(features.values(), dtype=np.float64, count=n)
+        df = np.fromiter((self.df.get(k, 0) for k in features), dtype=np.float64, count=n)
+        weights = tf * (np.log((1 + self.docs) / (1 + df)) + 1.0)
+        weights[(keys & _SIGN_BIT) == 0] *= -1.0
+        vector = np.bincount(keys % self.dim, weights=weights, minlength=self.dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+# --------------------- Vector index ---------------------
+class _List:
+    """A growable block of vectors and their entry ids (removal swaps in the last row)."""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, entry_id: int, vector: np.ndarray) -> int:
+        if self.size == len(self.ids):
+            self.vectors = np.resize(self.vectors, (2 * len(self.ids), self.vectors.shape[1]))
+            self.ids = np.resize(self.ids, 2 * len(self.ids))
+        self.vectors[self.size] = vector
+        self.ids[self.size] = entry_id
+        self.size += 1
+        return self.size - 1
+
+    def swap_remove(self, pos: int) -> Optional[int]:
+        """Remove row `pos`; returns the id of the row moved into its place, if any."""
+        self.size -= 1
+        if pos == self.size:
+            return None
+        self.vectors[pos] = self.vectors[self.size]
+        self.ids[pos] = self.ids[self.size]
+        return int(self.ids[pos])
+
+
+class VectorIndex:
+    def __init__(self, dim: int, nprobe: int = 4, ivf_min: int = 4096, seed: int = 0):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.ivf_min = ivf_min
+        self.rng = np.random.default_rng(seed)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[_List] = [_List(dim)]
+        self._where: Dict[int, Tuple[int, int]] = {}  # entry id -> (list, row)
+        self._trained_at = 0
+        self._training: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._where
+
+    def vector(self, entry_id: int) -> np.ndarray:
+        li, pos = self._where[entry_id]
+        return self.lists[li].vectors[pos]
+
+    def add(self, entry_id: int, vector: np.ndarray) -> None:
+        li = 0 if self.centroids is None else int(np.argmax(self.centroids @ vector))
+        self._where[entry_id] = (li, self.lists[li].append(entry_id, vector))
+        if len(self) >= max(self.ivf_min, 2 * self._trained_at) and self._training is None:
+            self._retrain()
+
+    def remove(self, entry_id: int) -> None:
+        li, pos = self._where.pop(entry_id)
+        moved = self.lists[li].swap_remove(pos)
+        if moved is not None:
+            self._where[moved] = (li, pos)
+
+    def search(self, query: np.ndarray) -> Optional[Tuple[int, float]]:
+        """(entry id, cosine similarity) of the best match among the probed lists."""
+        if self.centroids is None or len(self.lists) <= self.nprobe:
+            probe = range(len(self.lists))
+        else:
+            probe = np.argpartition(self.centroids @ query, -self.nprobe)[-self.nprobe:]
+        best: Optional[Tuple[int, float]] = None
+        for li in probe:
+            block = self.lists[li]
+            if not block.size:
+                continue
+            scores = block.vectors[:block.size] @ query
+            row = int(np.argmax(scores))
+            if best is None or scores[row] > best[1]:
+                best = (int(block.ids[row]), float(scores[row]))
+        return best
+
+    def _retrain(self) -> None:
+        """Train on a snapshot: in a worker thread when on the event loop (the loop keeps serving), else inline."""
+        ids = np.concatenate([b.ids[:b.size] for b in self.lists])
+        vectors = np.concatenate([b.vectors[:b.size] for b in self.lists])
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._swap(*self._train(ids, vectors))
+            return
+        self._training = loop.create_task(self._train_in_thread(ids, vectors))
+
+    async def _train_in_thread(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        try:
+            self._swap(*await asyncio.to_thread(self._train, ids, vectors))
+        except Exception as e:
+            logger.warning("Retraining the semantic index failed: %s", e)
+        finally:
+            self._training = None
+
+    def _swap(self, centroids: np.ndarray, lists: List[_List], where: Dict[int, Tuple[int, int]]) -> None:
+        """Install trained lists, replaying what changed since the snapshot (entry ids are never reused)."""
+        removed = [entry_id for entry_id in where if entry_id not in self._where]
+        added = [(entry_id, self.vector(entry_id).copy()) for entry_id in self._where if entry_id not in where]
+        trained_at = len(where)
+        self.centroids, self.lists, self._where = centroids, lists, where
+        for entry_id in removed:
+            self.remove(entry_id)
+        for entry_id, vector in added:
+            li = int(np.argmax(centroids @ vector))
+            self._where[entry_id] = (li, self.lists[li].append(entry_id, vector))
+        self._trained_at = trained_at
+
+    def _train(self, ids: np.ndarray, vectors: np.ndarray) -> Tuple[np.ndarray, List[_List], Dict[int, Tuple[int, int]]]:
+        """Spherical k-means over a sample, then every vector is assigned to its nearest list."""
+        started = time.perf_counter()
+        # ~2 sqrt(n) short lists: a probe is memory-bound, so short lists keep lookups fast
+        nlist = max(1, int(2 * math.sqrt(len(ids))))
+        sample = vectors[self.rng.choice(len(vectors), size=min(len(vectors), 32 * nlist), replace=False)]
+        centroids = sample[self.rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(6):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            used = np.bincount(assign, minlength=nlist) > 0
+            centroids[used] = sums[used]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms > 0, norms, 1.0)
+
+        assign = np.concatenate([  # in chunks, to bound the (rows x nlist) score matrix
+            np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1) for start in range(0, len(ids), 8192)
+        ])
+        order = np.argsort(assign, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist))))
+        lists: List[_List] = []
+        where: Dict[int, Tuple[int, int]] = {}
+        for li in range(nlist):
+            rows = order[bounds[li]:bounds[li + 1]]
+            block = _List(self.dim, capacity=max(16, 2 * len(rows)))
+            block.vectors[:len(rows)] = vectors[rows]
+            block.ids[:len(rows)] = ids[rows]
+            block.size = len(rows)
+            lists.append(block)
+            where.update((int(entry_id), (li, pos)) for pos, entry_id in enumerate(ids[rows]))
+        logger.info("Semantic index retrained: %d vectors in %d lists (%.0f ms)", len(ids), nlist, (time.perf_counter() - started) * 1000)
+        return centroids, lists, where
+
+
+# --------------------- Cache ---------------------
+@dataclass
+class SemanticHit:
+    output: str
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    namespace: str
+    output: str
+    created_at: float
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        max_entries: int = 100_000,
+        ttl: float = 7 * 24 * 3600,
+        dim: int = 256,
+        path: Optional[str] = None,
+        save_every: int = 100,
+    ):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_every = save_every
+        self.embedder = HashedTfidfEmbedder(dim)
+        self.indexes: Dict[str, VectorIndex] = {}
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()  # least recently used first
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._next_id = 0
+        self._unsaved = 0
+        self._saving: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, namespace: str, text: str) -> Optional[SemanticHit]:
+        index = self.indexes.get(namespace)
+        query = self.embedder.embed(self.embedder.features(text)) if index is not None else None
+        stage = namespace.rpartition("/")[2]
+        while index is not None:
+            best = index.search(query)
+            if best is None:
+                break
+            entry_id, similarity = best
+            entry = self.entries[entry_id]
+            if time.time() - entry.created_at > self.ttl:
+                # Expired: drop it and look at the next best entry
+                self._drop(entry_id)
+                continue
+            if similarity >= self.threshold:
+                self.entries.move_to_end(entry_id)
+                self.counters["hits"] += 1
+                LOOKUPS.labels(stage, "hit").inc()
+                return SemanticHit(entry.output, similarity)
+            break
+        self.counters["misses"] += 1
+        LOOKUPS.labels(stage, "miss").inc()
+        return None
+
+    def add(self, namespace: str, text: str, output: str) -> None:
+        features = self.embedder.features(text)
+        self.embedder.learn(features)
+        self._insert(namespace, self.embedder.embed(features), output, time.time())
+        self.counters["stores"] += 1
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+        self._unsaved += 1
+        if self.path and self._unsaved >= self.save_every and self._saving is None:
+            self._saving = asyncio.ensure_future(self.save())
+            self._saving.add_done_callback(self._saved)
+
+    def _insert(self, namespace: str, vector: np.ndarray, output: str, created_at: float) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = _Entry(namespace, output, created_at)
+        index = self.indexes.get(namespace)
+        if index is None:
+            index = self.indexes[namespace] = VectorIndex(self.embedder.dim)
+        index.add(entry_id, vector)
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self.entries.pop(entry_id)
+        self.indexes[entry.namespace].remove(entry_id)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "namespaces": {ns: len(index) for ns, index in self.indexes.items()},
+            "threshold": self.threshold,
+        }
+
+    # --------------------- Persistence ---------------------
+    async def save(self) -> None:
+        """Snapshot on the loop, serialize and write in a thread; the file is replaced atomically."""
+        if not self.path:
+            return
+        ids = list(self.entries)
+        vectors = np.stack([self.indexes[self.entries[i].namespace].vector(i) for i in ids]) if ids else np.empty((0, self.embedder.dim), np.float32)
+        meta = {
+            "dim": self.embedder.dim,
+            "embedder": HashedTfidfEmbedder.VERSION,
+            "docs": self.embedder.docs,
+            "df": list(self.embedder.df.items()),
+            "entries": [[e.namespace, e.output, e.created_at] for e in (self.entries[i] for i in ids)],
+        }
+        self._unsaved = 0
+        await asyncio.to_thread(self._write, self.path, vectors, meta)
+        logger.info("Semantic cache saved: %d entries -> %s", len(ids), self.path)
+
+    @staticmethod
+    def _write(path: str, vectors: np.ndarray, meta: Dict[str, object]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, vectors=vectors, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8))
+        os.replace(tmp, path)
+
+    def _saved(self, task: asyncio.Task) -> None:
+        self._saving = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Saving the semantic cache failed: %s", task.exception())
+
+    def load(self) -> int:
+        """Restore entries saved by `save`, dropping expired ones; returns how many were loaded."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with np.load(self.path) as data:
+            vectors = data["vectors"]
+            meta = json.loads(data["meta"].tobytes())
+        if meta["dim"] != self.embedder.dim:
+            logger.warning("Ignoring semantic cache %s: dimension %d, configured %d", self.path, meta["dim"], self.embedder.dim)
+            return 0
+        if meta.get("embedder", 1) != HashedTfidfEmbedder.VERSION:
+            logger.warning("Ignoring semantic cache %s: saved by an older embedder", self.path)
+            return 0
+        self.embedder.docs = meta["docs"]
+        self.embedder.df = {int(feature): count for feature, count in meta["df"]}
+        now = time.time()
+        for vector, (namespace, output, created_at) in zip(vectors, meta["entries"]):
+            if now - created_at <= self.ttl:
+                self._insert(namespace, vector, output, created_at)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+        logger.info("Semantic cache loaded: %d entries from %s", len(self.entries), self.path)
+        return len(self.entries)
+
+
+# --------------------- Process-wide cache ---------------------
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Shared cache built from settings and loaded from SEMANTIC_CACHE_PATH on first use."""
+    global _semantic_cache
+    if _semantic_cache is None:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        _semantic_cache = SemanticCache(
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl=settings.SEMANTIC_CACHE_TTL_SECONDS,
+            dim=settings.SEMANTIC_CACHE_DIM,
+            path=settings.SEMANTIC_CACHE_PATH or None,
+        )
+        try:
+            _semantic_cache.load()
+        except (OSError, ValueError, KeyError) as e:
+            # A cache is disposable: start empty rather than fail every run
+            logger.warning("Could not load the semantic cache from %s: %s", settings.SEMANTIC_CACHE_PATH, e)
+    return _semantic_cache
+
+
+async def save_semantic_cache() -> None:
+    """Shutdown hook: persist the cache if this process used it."""
+    if _semantic_cache is not None and _semantic_cache._unsaved:
+        await _semantic_cache.save()
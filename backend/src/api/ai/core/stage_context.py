@@ -0,0 +1,25 @@
+"""
+Per-stage execution context.
+
+The orchestrator runs each stage in its own asyncio task, so values stored in
+these ContextVars are visible to everything awaited by that stage (agent ->
+LLMClient) without threading extra arguments through `BaseAgent.run`.
+"""
+
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from api.ai.core.usage import StageUsage
+
+# Called with every incremental chunk of LLM output while a stage streams
+DeltaSink = Callable[[str], Awaitable[None]]
+
+current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+delta_sink: ContextVar[Optional[DeltaSink]] = ContextVar("delta_sink", default=None)
+# Skip the LLM response cache for everything awaited by the current run
+cache_bypass: ContextVar[bool] = ContextVar("cache_bypass", default=False)
+# Absolute loop.time() by which the current stage must finish (None = no budget), see deadlines
+deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+# LLM usage of the current stage, filled in by the LLM layers (see usage.note_attempt)
+llm_usage: ContextVar[Optional["StageUsage"]] = ContextVar("llm_usage", default=None)
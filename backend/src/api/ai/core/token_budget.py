@@ -0,0 +1,172 @@
+"""
+Token counting and context-window budgeting for chained agent inputs.
+
+- count_tokens(text) -> approximate token count (no tokenizer dependency)
+- context_limit(model_name) -> context window of a known model
+- ContextBudgeter.fit(sections, budget) -> input text compacted to fit the budget
+
+Compaction is progressive and only kicks in when the input is over budget.
+Strategies run in this order, lowest-priority (oldest) sections first:
+  dedupe     - drop paragraphs already present in another section
+  structured - keep only headings, bullets and numbered items
+  summarize  - keep the first sentence of every paragraph
+  truncate   - hard cut with a marker
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+
+# Words, numbers and single punctuation marks; long words count once per 4 chars,
+# which tracks BPE tokenizers closely enough for budgeting.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s|[-*+•]\s|\d+[.)]\s|[A-Z][^.!?]{0,60}:\s*$|\*\*.+\*\*\s*:?\s*$)")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+TRUNCATION_MARKER = "\n[... truncated to fit context budget ...]"
+
+# Context windows (tokens). Lookups match on prefix, so dated variants resolve too.
+MODEL_CONTEXT_LIMITS: Dict[str, int] = {
+    "gemini-2.5-pro": 1_048_576,
+    "gemini-2.5-flash": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4-turbo": 128_000,
+    "gpt-3.5-turbo": 16_385,
+    "mock": 32_000,
+}
+DEFAULT_CONTEXT_LIMIT = 32_000
+
+STRATEGIES = ("dedupe", "structured", "summarize", "truncate")
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 + (len(tok) - 1) // 4 for tok in _TOKEN_RE.findall(text))
+
+
+def context_limit(model_name: str) -> int:
+    name = (model_name or "").lower().removeprefix("models/")
+    for prefix in sorted(MODEL_CONTEXT_LIMITS, key=len, reverse=True):
+        if name.startswith(prefix):
+            return MODEL_CONTEXT_LIMITS[prefix]
+    return DEFAULT_CONTEXT_LIMIT
+
+
+@dataclass
+class Section:
+    """One upstream piece of a stage input. Lower priority is compacted first."""
+    name: str
+    text: str
+    priority: int = 0
+
+
+@dataclass
+class BudgetReport:
+    budget: int
+    tokens_before: int
+    tokens_after: int
+    applied: List[str] = field(default_factory=list)
+
+    @property
+    def compacted(self) -> bool:
+        return bool(self.applied)
+
+
+class ContextBudgeter:
+    def __init__(
+        self,
+        model_name: str = "default",
+        reserved_output_tokens: int = 4096,
+        strategies: Sequence[str] = STRATEGIES,
+    ):
+        unknown = set(strategies) - set(STRATEGIES)
+        if unknown:
+            raise ValueError(f"Unknown compaction strategies: {sorted(unknown)}")
+        self.model_name = model_name
+        self.strategies = tuple(s for s in STRATEGIES if s in strategies)
+        # The input may never exceed what the model can take next to its answer
+        self.max_input_tokens = max(context_limit(model_name) - reserved_output_tokens, 1)
+
+    def fit(self, sections: Sequence[Section], budget: Optional[int] = None) -> Tuple[str, BudgetReport]:
+        budget = min(budget or self.max_input_tokens, self.max_input_tokens)
+        texts = [s.text for s in sections]
+        before = self._total(texts)
+        report = BudgetReport(budget=budget, tokens_before=before, tokens_after=before)
+        if before <= budget:
+            return "\n\n".join(texts), report
+
+        # Oldest / least important sections are compacted first
+        order = sorted(range(len(sections)), key=lambda i: sections[i].priority)
+        for strategy in self.strategies:
+            if strategy == "dedupe":
+                texts = self._dedupe(texts, order)
+                report.applied.append(strategy)
+                if self._total(texts) <= budget:
+                    break
+                continue
+            for i in order:
+                if strategy == "truncate":
+                    overflow = self._total(texts) - budget
+                    texts[i] = self._truncate(texts[i], count_tokens(texts[i]) - overflow)
+                else:
+                    texts[i] = self._structured(texts[i]) if strategy == "structured" else self._summarize(texts[i])
+                if strategy not in report.applied:
+                    report.applied.append(strategy)
+                if self._total(texts) <= budget:
+                    break
+            if self._total(texts) <= budget:
+                break
+
+        report.tokens_after = self._total(texts)
+        return "\n\n".join(t for t in texts if t), report
+
+    # --------------------- Strategies ---------------------
+    @staticmethod
+    def _total(texts: Sequence[str]) -> int:
+        return sum(count_tokens(t) for t in texts)
+
+    @staticmethod
+    def _paragraphs(text: str) -> List[str]:
+        return [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+    def _dedupe(self, texts: List[str], order: Sequence[int]) -> List[str]:
+        """Drop paragraphs from low-priority sections that a higher-priority section already has."""
+        seen: set = set()
+        result = list(texts)
+        for i in reversed(order):  # highest priority keeps its paragraphs
+            kept = []
+            for para in self._paragraphs(texts[i]):
+                key = " ".join(para.lower().split())
+                if key in seen:
+                    continue
+                seen.add(key)
+                kept.append(para)
+            result[i] = "\n\n".join(kept)
+        return result
+
+    @staticmethod
+    def _structured(text: str) -> str:
+        lines = [line for line in text.splitlines() if _HEADING_RE.match(line)]
+        return "\n".join(lines) if lines else text
+
+    def _summarize(self, text: str) -> str:
+        firsts = [_SENTENCE_END_RE.split(p.strip(), maxsplit=1)[0] for p in self._paragraphs(text)]
+        return "\n".join(firsts)
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        if count_tokens(text) <= max_tokens:
+            return text
+        limit = max_tokens - count_tokens(TRUNCATION_MARKER)
+        if limit <= 0:
+            return ""
+        # Walk tokens to find the char offset of the cut
+        used = 0
+        for match in _TOKEN_RE.finditer(text):
+            used += 1 + (len(match.group()) - 1) // 4
+            if used > limit:
+                return text[:match.start()].rstrip() + TRUNCATION_MARKER
+        return text
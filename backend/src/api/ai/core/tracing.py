@@ -0,0 +1,316 @@
+"""
+Lightweight tracing: one trace per project, spans across API -> Orchestrator ->
+Agent -> LLMClient -> CRUD.
+
+- span(name, project_id=None, **attributes): context manager timing a block. It
+  nests under the active span; without one it starts a root in the trace of
+  `project_id` (and is a no-op when neither is known, e.g. a CRUD call outside
+  a pipeline). The trace id is derived from the project, so the API request,
+  the run picked up later by a worker and any resume land in the same trace.
+- Exporters: an in-memory store of the last N projects (served as a waterfall
+  at GET /api/agents/trace/{id}) and an optional JSONL file, which also
+  collects spans from out-of-process workers. A background thread appends to
+  the file, so finishing a span never waits for the disk.
+
+Spans inside async generators must pass `activate=False`: the generator is
+suspended with the consumer's context, so it must not leave itself as the
+active span between chunks.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from api.ai.core.utils import get_logger
+
+logger: logging.Logger = get_logger("tracing")
+
+
+def trace_id_for(project_id: int) -> str:
+    return f"project-{project_id}"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    project_id: Optional[int]
+    start: float  # wall clock (epoch seconds), comparable across processes
+    duration: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, key: str, value: Any) -> "Span":
+        self.attributes[key] = value
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _NoopSpan:
+    """Returned when tracing is off or there is no trace to attach to."""
+
+    def set(self, key: str, value: Any) -> "_NoopSpan":
+        return self
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+# --------------------- Exporters ---------------------
+class InMemoryExporter:
+    """Finished spans of the most recent `max_projects` projects (LRU), at most `max_spans` each."""
+
+    def __init__(self, max_projects: int = 200, max_spans: int = 5000):
+        self.max_projects = max_projects
+        self.max_spans = max_spans
+        self._spans: "OrderedDict[int, List[Span]]" = OrderedDict()
+
+    def export(self, span: Span) -> None:
+        if span.project_id is None:
+            return
+        spans = self._spans.get(span.project_id)
+        if spans is None:
+            spans = self._spans[span.project_id] = []
+            while len(self._spans) > self.max_projects:
+                self._spans.popitem(last=False)
+        else:
+            self._spans.move_to_end(span.project_id)
+        if len(spans) < self.max_spans:
+            spans.append(span)
+
+    def spans(self, project_id: int) -> List[Dict[str, Any]]:
+        return [s.to_dict() for s in self._spans.get(project_id, [])]
+
+
+class JSONLExporter:
+    """
+    Appends every finished span as one JSON line (shared by API and worker processes).
+    `export` only queues the line; a writer thread appends what is queued in batches.
+    Spans beyond `max_queued` unwritten ones are dropped (counted in `dropped`).
+    """
+
+    def __init__(self, path: str, max_queued: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(max_queued)
+        self._closed = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_queued, name="tracing-jsonl", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def export(self, span: Span) -> None:
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(json.dumps(span.to_dict(), default=str) + "\n")
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_queued(self) -> None:
+        while True:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = "".join(line for line in lines if line is not None)
+            try:
+                if batch:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(batch)
+            except OSError as e:
+                logger.warning("Could not write %d spans to %s: %s", len(lines), self.path, e)
+            finally:
+                for _ in lines:
+                    self._queue.task_done()
+            if None in lines:
+                return
+
+    def flush(self) -> None:
+        """Block until the spans exported so far are written."""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+    def spans(self, project_id: int) -> List[Dict[str, Any]]:
+        """Blocking file read: call it off the event loop."""
+        self.flush()
+        found = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line another process is still writing, or one cut short by a crash
+                    if record.get("project_id") == project_id:
+                        found.append(record)
+        except FileNotFoundError:
+            pass
+        return found
+
+
+# --------------------- Tracer ---------------------
+class Tracer:
+    def __init__(self, enabled: bool = True, exporters: Sequence[Any] = ()):
+        self.enabled = enabled
+        self.exporters = list(exporters)
+
+    def _start(self, name: str, project_id: Optional[int], attributes: Dict[str, Any]) -> Optional[Span]:
+        if not self.enabled:
+            return None
+        parent = _current.get()
+        if parent is not None:
+            trace_id, parent_id, project_id = parent.trace_id, parent.span_id, parent.project_id
+        elif project_id is not None:
+            trace_id, parent_id = trace_id_for(project_id), None
+        else:
+            return None
+        return Span(name, trace_id, os.urandom(8).hex(), parent_id, project_id, time.time(), attributes=attributes)
+
+    def _finish(self, span: Span, duration: float) -> None:
+        span.duration = duration
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, project_id: Optional[int] = None, activate: bool = True, **attributes: Any) -> Iterator[Any]:
+        span = self._start(name, project_id, attributes)
+        if span is None:
+            yield _NOOP
+            return
+        started = time.perf_counter()
+        token = _current.set(span) if activate else None
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            raise
+        except GeneratorExit:
+            span.status = "closed"  # consumer stopped reading a stream early
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if token is not None:
+                _current.reset(token)
+            self._finish(span, time.perf_counter() - started)
+
+    def record(self, name: str, project_id: int, duration: float, **attributes: Any) -> None:
+        """Add an already finished span ending now (e.g. time a job spent queued)."""
+        span = self._start(name, project_id, attributes)
+        if span is None:
+            return
+        span.start -= duration
+        self._finish(span, duration)
+
+    def spans(self, project_id: int) -> List[Dict[str, Any]]:
+        """Spans of a project from the first exporter that has any (may read a file: call it off the loop)."""
+        for exporter in self.exporters:
+            found = exporter.spans(project_id)
+            if found:
+                return found
+        return []
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        from api.config.settings import get_settings
+
+        settings = get_settings()
+        exporters: List[Any] = [InMemoryExporter(settings.TRACING_MAX_PROJECTS)]
+        if settings.TRACING_JSONL_PATH:
+            exporters.append(JSONLExporter(settings.TRACING_JSONL_PATH))
+        _tracer = Tracer(settings.TRACING_ENABLED, exporters)
+    return _tracer
+
+
+def span(name: str, project_id: Optional[int] = None, activate: bool = True, **attributes: Any):
+    return get_tracer().span(name, project_id, activate, **attributes)
+
+
+def record(name: str, project_id: int, duration: float, **attributes: Any) -> None:
+    get_tracer().record(name, project_id, duration, **attributes)
+
+
+# --------------------- Waterfall ---------------------
+def waterfall(spans: Sequence[Dict[str, Any]], width: int = 60) -> Dict[str, Any]:
+    """
+    Order spans as a tree (children under their parent, by start time) with
+    offsets from the first span, plus a text rendering with one bar per span.
+    """
+    if not spans:
+        return {"spans": [], "total_ms": 0.0, "text": ""}
+    t0 = min(s["start"] for s in spans)
+    end = max(s["start"] + (s["duration"] or 0.0) for s in spans)
+    total = max(end - t0, 1e-9)
+    ids = {s["span_id"] for s in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    rows: List[Dict[str, Any]] = []
+
+    def walk(parent: Optional[str], depth: int) -> None:
+        for s in sorted(children.get(parent, []), key=lambda s: s["start"]):
+            rows.append({
+                "name": s["name"],
+                "depth": depth,
+                "offset_ms": round((s["start"] - t0) * 1000, 2),
+                "duration_ms": round((s["duration"] or 0.0) * 1000, 2),
+                "status": s["status"],
+                "error": s["error"],
+                "attributes": s["attributes"],
+                "span_id": s["span_id"],
+                "parent_id": s["parent_id"],
+            })
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+
+    label_width = max(len(r["name"]) + 2 * r["depth"] for r in rows)
+    lines = []
+    for r in rows:
+        begin = int(r["offset_ms"] / 1000 / total * width)
+        length = max(1, int(r["duration_ms"] / 1000 / total * width))
+        bar = " " * begin + "#" * min(length, width - begin or 1)
+        label = ("  " * r["depth"] + r["name"]).ljust(label_width)
+        lines.append(f"{label} |{bar.ljust(width)}| {r['duration_ms']:>10.1f} ms")
+    return {"spans": rows, "total_ms": round(total * 1000, 2), "text": "\n".join(lines)}
@@ -0,0 +1,120 @@
+"""
+Per-stage LLM usage accounting.
+
+- StageUsage: what one stage spent; the orchestrator sets one per stage as
+  stage_context.llm_usage and persists it next to the stage's AgentOutput
+- note_attempt(provider, model): called by the LLM layers for every provider
+  request (resilience retries, router failovers, cascade tiers, hedges); the
+  last model noted is the one that answered
+- note_fallback(): called by an agent that answered with its deterministic
+  fallback after an unexpected LLM failure
+- estimate_cost(model, prompt_tokens, completion_tokens): USD from per-model
+  prices (MODEL_PRICES, overridden/extended by LLM_PRICES)
+
+Token counts are estimated with token_budget.count_tokens: the provider
+clients do not report usage. A stage answered from the response cache (or by
+a coalesced in-flight call) records no attempts and no cost.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from api.ai.core import stage_context
+from api.ai.core.utils import get_logger
+
+logger = get_logger("usage")
+
+# USD per million (input, output) tokens. Lookups match on prefix, so dated variants resolve too.
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1": (2.00, 8.00),
+    "mock": (0.0, 0.0),
+}
+
+
+class StageOutcome:
+    OK = "ok"
+    ERROR = "error"
+    TIMEOUT = "timeout"
+    SKIPPED = "skipped"
+    CACHED = "cached"
+    # The agent's deterministic fallback answered (the LLM failed unexpectedly)
+    FALLBACK = "fallback"
+
+
+@dataclass
+class StageUsage:
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    # Provider requests made for the stage (0 when served from the cache)
+    attempts: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    outcome: str = StageOutcome.OK
+
+    @property
+    def cost_usd(self) -> Optional[float]:
+        if not self.attempts:
+            return 0.0
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+
+def note_attempt(provider: str, model: str) -> None:
+    usage = stage_context.llm_usage.get()
+    if usage is not None:
+        usage.attempts += 1
+        usage.provider, usage.model = provider, model
+
+
+def note_model(provider: str, model: str) -> None:
+    """The model serving the attempt already noted (e.g. the backend a router picked)."""
+    usage = stage_context.llm_usage.get()
+    if usage is not None:
+        usage.provider, usage.model = provider, model
+
+
+def note_fallback() -> None:
+    usage = stage_context.llm_usage.get()
+    if usage is not None:
+        usage.outcome = StageOutcome.FALLBACK
+
+
+_prices: Optional[Dict[str, Tuple[float, float]]] = None
+
+
+def _price_table() -> Dict[str, Tuple[float, float]]:
+    global _prices
+    if _prices is None:
+        from api.config.settings import get_settings
+
+        _prices = dict(MODEL_PRICES)
+        for item in get_settings().LLM_PRICES.split(","):
+            model, _, price = item.partition("=")
+            try:
+                prompt_price, completion_price = (float(p) for p in price.split("/"))
+            except ValueError:
+                if item.strip():
+                    logger.warning("Ignoring malformed LLM_PRICES entry %r (expected model=input/output)", item)
+                continue
+            _prices[model.strip()] = (prompt_price, completion_price)
+    return _prices
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD, or None for a model without a known price."""
+    name = (model or "").lower().removeprefix("models/")
+    prices = _price_table()
+    for prefix in sorted(prices, key=len, reverse=True):
+        if name.startswith(prefix):
+            prompt_price, completion_price = prices[prefix]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    return None
@@ -8,7 +8,7 @@ class AgentMessage(BaseModel):
     # This uses the new Pydantic V2 model_config dictionary
     model_config = ConfigDict(from_attributes=True)
     
-    event_type: Literal["agent_result", "agent_start", "workflow_start", "workflow_end", "error"]
+    event_type: Literal["agent_result", "agent_delta", "agent_start", "workflow_start", "workflow_end", "workflow_cancelled", "stage_skipped", "stage_cached", "stage_timeout", "error"]
     agent_name: Optional[str] = None
     content: Optional[str] = None
     project_id: int
\ No newline at end of file
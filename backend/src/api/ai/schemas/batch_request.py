@@ -0,0 +1,22 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class BatchCreate(BaseModel):
+    title: Optional[str] = Field(default=None, description="Optional batch title; projects are named '<title> #n'")
+    prompts: List[str] = Field(..., min_length=1, description="One pipeline run per prompt")
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64, description="Max runs of this batch executing at once")
+    max_parallelism: Optional[int] = Field(default=None, ge=1, le=32, description="Max concurrently running pipeline stages per run")
+    cache_bypass: bool = Field(default=False, description="Skip the LLM response cache for every run of the batch")
+    deadline_seconds: Optional[float] = Field(default=None, ge=0, description="Wall-clock budget of each run (default PIPELINE_DEADLINE_SECONDS, 0 = none)")
+
+
+class BatchProgress(BaseModel):
+    batch_id: int
+    total: int
+    pending: int
+    running: int
+    completed: int
+    failed: int
+    cancelled: int = 0
+    done: bool
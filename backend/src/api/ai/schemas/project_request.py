@@ -5,9 +5,13 @@ from pydantic import BaseModel, Field
 class ProjectCreate(BaseModel):
     title: Optional[str] = Field(default=None, description="Optional project title")
     prompt: str = Field(..., min_length=3, description="User idea / request")
+    max_parallelism: Optional[int] = Field(default=None, ge=1, le=32, description="Max concurrently running pipeline stages for this run")
+    cache_bypass: bool = Field(default=False, description="Skip the LLM response cache for this run")
+    deadline_seconds: Optional[float] = Field(default=None, ge=0, description="Wall-clock budget of the run (default PIPELINE_DEADLINE_SECONDS, 0 = none)")
 
 
 class ProjectResponse(BaseModel):
     id: int
     title: str
-    prompt: str
\ No newline at end of file
+    prompt: str
+    status: str
\ No newline at end of file
@@ -1,10 +1,16 @@
 import asyncio
+import os
 import pytest
+import pytest_asyncio
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import StaticPool
 
 
+# api.db.database builds its engine at import time
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
 from api.db.database import Base
+import api.db.models  # noqa: F401  (register tables on Base.metadata)
 
 
 @pytest.fixture(scope="session")
@@ -32,4 +38,23 @@ async def engine():
 async def session(engine):
     SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
     async with SessionLocal() as s:
-        yield s
\ No newline at end of file
+        yield s
+
+
+@pytest_asyncio.fixture()
+async def session_factory():
+    """Fresh in-memory database per test; yields a session factory like AsyncSessionLocal."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def _reset_sse_exit_event():
+    # sse-starlette binds its shutdown Event to the first loop that streams; each test runs on its own loop
+    from sse_starlette.sse import AppStatus
+
+    AppStatus.should_exit_event = None
+    yield
@@ -44,4 +44,11 @@ async def test_engineer_and_qa_agents():
     eng_res = await eng.run("Task list: build CLI & API")
     assert eng_res.agent_name == "Engineer"
     qa_res = await qa.run(eng_res.content)
-    assert qa_res.agent_name == "QA"
\ No newline at end of file
+    assert qa_res.agent_name == "QA"
+
+@pytest.mark.asyncio
+async def test_mock_stream_matches_generate():
+    llm = MockLLMClient()
+    chunks = [c async for c in llm.stream("Build a notes app", system="sys")]
+    assert len(chunks) > 1
+    assert "".join(chunks) == await llm.generate("Build a notes app", system="sys")
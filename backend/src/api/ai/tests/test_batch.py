@@ -0,0 +1,106 @@
+import asyncio
+import json
+import pytest
+
+from api.ai.core.pipeline_service import PipelineService
+from api.db import crud
+from api.db.models import ProjectStatus
+
+
+def recorder(log, name, gate=None, delay=0.01):
+    async def run():
+        log.append(name)
+        if gate is not None:
+            await gate.wait()
+        await asyncio.sleep(delay)
+    return run
+
+
+@pytest.mark.asyncio
+async def test_batches_take_turns_and_respect_their_concurrency():
+    service = PipelineService(workers=1, batch_workers=1)
+    await service.start()
+    log = []
+    await service.submit_batch(1, [(10 + i, recorder(log, f"a{i}")) for i in range(3)], concurrency=1)
+    await service.submit_batch(2, [(20 + i, recorder(log, f"b{i}")) for i in range(3)], concurrency=1)
+    while service.stats()["batch_queued"] or service.stats()["running"]:
+        await asyncio.sleep(0.01)
+    await service.stop()
+    assert log == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+
+@pytest.mark.asyncio
+async def test_batch_does_not_starve_interactive_runs():
+    service = PipelineService(workers=2)  # one worker stays free for interactive runs
+    await service.start()
+    log = []
+    gate = asyncio.Event()
+    await service.submit_batch(1, [(i, recorder(log, f"batch{i}", gate)) for i in range(10)], concurrency=5)
+    await asyncio.sleep(0.01)
+    assert service.stats()["batch_running"] == 1
+
+    await service.submit(100, recorder(log, "interactive"))
+    await asyncio.sleep(0.05)
+    assert "interactive" in log and service.job(100).state == "finished"
+    gate.set()
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_batches_leave_a_worker_to_interactive_runs_unless_there_is_one():
+    assert PipelineService(workers=3, batch_workers=3).batch_workers == 2
+    service = PipelineService(workers=1)
+    assert service.batch_workers == 1
+    await service.start()
+    log = []
+    gate = asyncio.Event()
+    await service.submit_batch(1, [(i, recorder(log, f"batch{i}", gate)) for i in range(3)], concurrency=3)
+    await asyncio.sleep(0.01)
+    await service.submit(100, recorder(log, "interactive"))
+    gate.set()
+    while service.stats()["batch_queued"] or service.stats()["running"]:
+        await asyncio.sleep(0.01)
+    await service.stop()
+    # The single worker takes the interactive run as soon as its batch run ends
+    assert log == ["batch0", "interactive", "batch1", "batch2"]
+
+
+@pytest.mark.asyncio
+async def test_batch_rows_are_created_together_and_aggregated(session_factory):
+    async with session_factory() as s:
+        batch_id, ids = await crud.create_batch(s, "Eval", ["idea one", "idea two", "idea three"], concurrency=2)
+        await crud.set_project_status(s, ids[0], ProjectStatus.COMPLETED)
+        await crud.set_project_status(s, ids[1], ProjectStatus.FAILED)
+        counts = await crud.batch_status_counts(s, batch_id)
+        projects = await crud.list_batch_projects(s, batch_id)
+    assert counts == {ProjectStatus.COMPLETED: 1, ProjectStatus.FAILED: 1, ProjectStatus.PENDING: 1}
+    assert [p.title for p in projects] == ["Eval #1", "Eval #2", "Eval #3"]
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_runs_every_prompt_and_streams_completion(monkeypatch, session_factory):
+    import httpx
+    from main import app
+    from api import routes_agents
+
+    service = PipelineService(workers=2)
+    await service.start()
+    monkeypatch.setattr(routes_agents, "_pipeline_service", service)
+    monkeypatch.setattr(routes_agents, "AsyncSessionLocal", session_factory)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/api/agents/batch", json={"title": "Eval", "prompts": ["notes app", "todo app"]})
+        assert resp.status_code == 200
+        body = resp.json()
+        assert len(body["project_ids"]) == 2 and body["progress"]["pending"] == 2
+
+        events = []
+        async with client.stream("GET", f"/api/agents/batch/{body['batch_id']}/stream") as stream:
+            async for line in stream.aiter_lines():
+                if line.startswith("data:"):
+                    events.append(json.loads(line[len("data:"):]))
+        status = (await client.get(f"/api/agents/batch/{body['batch_id']}")).json()
+    await service.stop()
+
+    assert events[-1]["event_type"] == "batch_end"
+    assert status["progress"]["completed"] == 2 and status["progress"]["done"]
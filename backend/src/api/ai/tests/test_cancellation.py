@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+import pytest
+import pytest_asyncio
+
+from api.ai.agents.llm_client import MockLLMClient, _iterate_in_executor
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import PIPELINE_STAGES
+from api.ai.core.pipeline_service import PipelineService
+from api.ai.schemas.agent_message import AgentMessage
+from api.db import crud
+from api.db.models import ProjectStatus
+
+
+@pytest.mark.asyncio
+async def test_service_cancel_drops_queued_and_stops_running_jobs():
+    service = PipelineService(workers=1)
+    await service.start()
+    started = asyncio.Event()
+    ran = []
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def quick():
+        ran.append("quick")
+
+    await service.submit(1, slow)
+    await service.submit(2, quick)
+    await asyncio.wait_for(started.wait(), timeout=1)
+
+    assert service.cancel(2) == "queued"
+    assert service.cancel(1) == "running"
+    assert service.cancel(99) is None
+    await asyncio.sleep(0.01)
+    assert service.job(1).state == "cancelled" and service.job(2).state == "cancelled"
+
+    # The worker survives a cancelled job and keeps serving
+    await service.submit(3, quick)
+    await asyncio.sleep(0.01)
+    await service.stop()
+    assert ran == ["quick"] and service.job(3).state == "finished"
+
+
+@pytest.mark.asyncio
+async def test_abandoned_executor_stream_is_closed():
+    closed = threading.Event()
+
+    def sdk_stream():
+        try:
+            for i in range(1000):
+                yield f"chunk{i}"
+        finally:
+            closed.set()
+
+    chunks = _iterate_in_executor(sdk_stream)
+    assert await chunks.__anext__() == "chunk0"
+    await chunks.aclose()
+    assert await asyncio.get_running_loop().run_in_executor(None, closed.wait, 2)
+
+
+@pytest_asyncio.fixture()
+async def inline_api(monkeypatch, session_factory):
+    import httpx
+    from main import app
+    from api import routes_agents
+
+    service = PipelineService(workers=2)
+    await service.start()
+    monkeypatch.setattr(routes_agents, "_pipeline_service", service)
+    monkeypatch.setattr(routes_agents, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(routes_agents, "_message_bus", MessageBus())
+    # Slow stages, so the run is still in flight when it is cancelled
+    monkeypatch.setattr(routes_agents, "_get_llm_client", lambda: MockLLMClient(latency=0.2))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client, routes_agents
+    await service.stop()
+
+
+async def _read_until_end(stream, events):
+    async for line in stream.aiter_lines():
+        if line.startswith("data:"):
+            events.append(json.loads(line[len("data:"):]))
+            if events[-1]["event_type"] == "workflow_end":
+                return
+
+
+@pytest.mark.asyncio
+async def test_cancel_endpoint_stops_a_running_pipeline(inline_api, session_factory):
+    client, routes_agents = inline_api
+    project_id = (await client.post("/api/agents/run", json={"prompt": "Build a notes app"})).json()["project_id"]
+    while routes_agents._pipeline_service.job(project_id).state != "running":
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.3)  # a stage or two in
+
+    resp = await client.post(f"/api/agents/cancel/{project_id}")
+    events = []
+    async with client.stream("GET", f"/api/agents/stream/{project_id}") as stream:
+        await asyncio.wait_for(_read_until_end(stream, events), timeout=2)
+
+    assert resp.status_code == 200 and resp.json()["was"] == "running"
+    assert [e["event_type"] for e in events[-2:]] == ["workflow_cancelled", "workflow_end"]
+    assert all(AgentMessage.model_validate(e) for e in events)
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.CANCELLED
+        assert len(await crud.list_agent_outputs(s, project_id)) < len(PIPELINE_STAGES)
+    assert (await client.post(f"/api/agents/cancel/{project_id}")).status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_last_subscriber_leaving_cancels_after_the_grace_period(inline_api, monkeypatch, session_factory):
+    client, routes_agents = inline_api
+    monkeypatch.setattr(routes_agents._settings, "PIPELINE_DISCONNECT_GRACE_SECONDS", 0.1)
+    project_id = (await client.post("/api/agents/run", json={"prompt": "Build a notes app"})).json()["project_id"]
+
+    # A reconnect within the grace period keeps the run alive
+    routes_agents._subscribe(project_id)
+    routes_agents._unsubscribe(project_id, cancel_on_disconnect=True)
+    routes_agents._subscribe(project_id)
+    await asyncio.sleep(0.2)
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.RUNNING
+
+    routes_agents._unsubscribe(project_id, cancel_on_disconnect=True)
+    await asyncio.sleep(0.3)
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.CANCELLED
+    assert project_id not in routes_agents._disconnect_timers
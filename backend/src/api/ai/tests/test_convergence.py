@@ -0,0 +1,53 @@
+import json
+import pytest
+
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.core.convergence import DiffRatioCheck, HashingVectorizerCheck, get_convergence_check
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator, PIPELINE_STAGES
+from api.db import crud
+
+PRD = "## Objective\nA notes app with AI summaries.\n- Sync across devices\n- Offline mode"
+
+
+@pytest.mark.parametrize("check", [DiffRatioCheck(0.9), HashingVectorizerCheck(0.9)])
+def test_checks_separate_near_duplicates_from_rewrites(check):
+    assert check.converged(PRD, PRD.replace("Offline mode", "Offline  mode."))
+    assert not check.converged(PRD, "## Objective\nA chat app for teams.\n- Video calls\n- Threads")
+
+
+def test_factory_can_disable_early_exit():
+    assert get_convergence_check("off", 0.9) is None
+    with pytest.raises(ValueError):
+        get_convergence_check("cosine", 0.9)
+
+
+class StableLLM(MockLLMClient):
+    """Same answer per role regardless of input, i.e. every loop converges immediately."""
+
+    async def stream(self, prompt, system=None, **kwargs):
+        yield f"{system}: stable output"
+
+
+@pytest.mark.asyncio
+async def test_converged_refinement_stages_are_skipped(session_factory):
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Converge", "Build an AI notes app")
+
+    llm = StableLLM()
+    bus = MessageBus()
+    orch = Orchestrator(message_bus=bus, llm=llm)
+    await orch.run(prompt="Build an AI notes app", db_session_factory=session_factory, project_id=project_id, project_title="Converge")
+
+    events = []
+    async for raw in bus.subscribe(project_id):
+        events.append(json.loads(raw))
+        if events[-1]["event_type"] == "workflow_end":
+            break
+    skipped = [e["agent_name"] for e in events if e["event_type"] == "stage_skipped"]
+    assert skipped == ["Architect (Refined)", "Architect (Final)", "Project Manager (Refined)"]
+
+    # Skipped stages are still persisted, so results and resume stay complete
+    async with session_factory() as s:
+        rows = await crud.list_agent_outputs(s, project_id)
+    assert len(rows) == len(PIPELINE_STAGES)
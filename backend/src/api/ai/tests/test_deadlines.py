@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.agents.llm_ratelimit import RateLimiter
+from api.ai.core import stage_context
+from api.ai.core.deadlines import TimeBudgetExceeded, stage_budget, with_deadline
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator, PIPELINE_STAGES
+from api.ai.core.scheduler import StageScheduler
+from api.ai.schemas.agent_message import AgentMessage
+from api.db import crud
+from api.db.models import ProjectStatus
+
+
+def test_stage_budgets_share_the_remaining_run_time():
+    levels = StageScheduler(PIPELINE_STAGES).levels_to_end()
+    assert levels["Boss"] == len(PIPELINE_STAGES) and levels["Engineer (Final)"] == 1
+
+    loop = asyncio.new_event_loop()
+    try:
+        async def budgets():
+            deadline = asyncio.get_running_loop().time() + 100
+            return (
+                stage_budget(deadline, levels_left=10),
+                stage_budget(deadline, levels_left=1),
+                stage_budget(deadline, levels_left=10, cap=5),
+                stage_budget(None, levels_left=10, cap=5),
+            )
+        first, last, capped, no_deadline = loop.run_until_complete(budgets())
+    finally:
+        loop.close()
+    assert 19 < first <= 20  # twice the fair share
+    assert 99 < last <= 100  # the last stage may use everything left
+    assert capped == 5 and no_deadline == 5
+
+
+@pytest.mark.asyncio
+async def test_with_deadline_only_converts_its_own_timeout():
+    with pytest.raises(TimeBudgetExceeded):
+        await with_deadline(asyncio.sleep(1), "sleep", timeout=0.01)
+    with pytest.raises(TimeBudgetExceeded):
+        await with_deadline(asyncio.sleep(1), "sleep", timeout=0)
+
+    async def inner_timeout():
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(asyncio.TimeoutError) as info:
+        await with_deadline(inner_timeout(), "inner", timeout=1)
+    assert not isinstance(info.value, TimeBudgetExceeded)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_wait_longer_than_the_budget_fails_fast():
+    limiter = RateLimiter(rpm=1)
+    await limiter.acquire(1)
+    token = stage_context.deadline.set(asyncio.get_running_loop().time() + 0.1)
+    try:
+        with pytest.raises(TimeBudgetExceeded):
+            await asyncio.wait_for(limiter.acquire(1), timeout=1)
+    finally:
+        stage_context.deadline.reset(token)
+    assert limiter.stats()["deadline_rejected"] == 1
+
+
+class HangingLLM(MockLLMClient):
+    """Never answers for the given stages."""
+
+    def __init__(self, hang_stages):
+        super().__init__(latency=0)
+        self.hang_stages = set(hang_stages)
+
+    async def stream(self, prompt, system=None, **kwargs):
+        if stage_context.current_stage.get() in self.hang_stages:
+            await asyncio.Event().wait()
+        async for chunk in super().stream(prompt, system, **kwargs):
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_stages_out_of_time_degrade_instead_of_hanging(session_factory):
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Deadline", "Build an AI notes app")
+
+    bus = MessageBus()
+    orch = Orchestrator(message_bus=bus, llm=HangingLLM({"Architect (Refined)", "Engineer"}))
+    orch.stage_timeout = 0.1
+    results = await asyncio.wait_for(
+        orch.run(prompt="Build an AI notes app", db_session_factory=session_factory, project_id=project_id, project_title="Deadline"),
+        timeout=5,
+    )
+
+    events = []
+    async for raw in bus.subscribe(project_id):
+        events.append(json.loads(raw))
+        if events[-1]["event_type"] == "workflow_end":
+            break
+    timeouts = [e["agent_name"] for e in events if e["event_type"] == "stage_timeout"]
+    assert timeouts == ["Architect (Refined)", "Engineer"]
+    assert all(AgentMessage.model_validate(e) for e in events)
+    assert set(orch.timed_out_stages) == {"Architect (Refined)", "Engineer"}
+
+    by_name = {s.name: r.content for s, r in zip(PIPELINE_STAGES, results)}
+    # Optional refinement skipped, required stage replaced by the agent's fallback
+    assert by_name["Architect (Refined)"] == by_name["Architect"]
+    assert by_name["Engineer"].startswith("Engineer processed input")
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.COMPLETED
+        assert len(await crud.list_agent_outputs(s, project_id)) == len(PIPELINE_STAGES)
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from api.ai.core.job_queue import DBJobQueue
+from api.db import crud
+from api.db.database import Base
+from api.db.models import AgentOutput, JobStatus, PipelineJobRecord, ProjectStatus
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+@pytest_asyncio.fixture()
+async def file_session_factory(tmp_path):
+    """File database: claims race across real connections (StaticPool would share one)."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'queue.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _enqueue(session_factory, n):
+    ids = []
+    async with session_factory() as s:
+        for i in range(n):
+            pid = await crud.create_project(s, f"P{i}", f"idea {i}")
+            await DBJobQueue.enqueue(s, pid, {"prompt": f"idea {i}", "project_title": f"P{i}"})
+            ids.append(pid)
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_each_job_is_claimed_by_one_worker(file_session_factory):
+    session_factory = file_session_factory
+    await _enqueue(session_factory, 3)
+    queue = DBJobQueue(session_factory, lease_seconds=60)
+    claims = await asyncio.gather(*(queue.claim(f"w{i}") for i in range(5)))
+    claimed = [c for c in claims if c is not None]
+    assert len(claimed) == 3 and len({c.id for c in claimed}) == 3
+    assert await queue.complete(claimed[0])
+    async with session_factory() as s:
+        assert (await DBJobQueue.stats(s)) == {JobStatus.DONE: 1, JobStatus.LEASED: 2}
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_reclaimed_and_fences_the_old_owner(session_factory):
+    await _enqueue(session_factory, 1)
+    queue = DBJobQueue(session_factory, lease_seconds=0.05)
+    first = await queue.claim("w1")
+    assert await queue.claim("w2") is None  # still leased
+    await asyncio.sleep(0.1)
+    second = await queue.claim("w2")
+    assert second.id == first.id and second.attempts == 2
+    assert not await queue.heartbeat(first)
+    assert not await queue.complete(first)
+    assert await queue.heartbeat(second)
+
+
+@pytest.mark.asyncio
+async def test_released_job_goes_back_without_counting_an_attempt(session_factory):
+    await _enqueue(session_factory, 1)
+    queue = DBJobQueue(session_factory)
+    job = await queue.claim("w1")
+    assert await queue.release(job)
+    again = await queue.claim("w2")
+    assert again.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_poison_job_is_failed_after_max_attempts(session_factory):
+    (pid,) = await _enqueue(session_factory, 1)
+    queue = DBJobQueue(session_factory, lease_seconds=0.01, max_attempts=2)
+    for _ in range(2):
+        assert await queue.claim("w") is not None
+        await asyncio.sleep(0.02)
+    assert await queue.claim("w") is None
+    async with session_factory() as s:
+        assert (await crud.get_project(s, pid)).status == ProjectStatus.FAILED
+
+
+@pytest.mark.asyncio
+async def test_worker_processes_drain_the_queue_once_each(tmp_path):
+    from api.ai.core.orchestrator import PIPELINE_STAGES
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}"
+    engine = create_async_engine(url, connect_args={"timeout": 30})
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    ids = await _enqueue(session_factory, 6)
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": url,
+        "PIPELINE_EXECUTION_MODE": "worker",
+        "WORKER_POLL_INTERVAL": "0.1",
+        "LLM_CACHE_ENABLED": "false",
+        "GEMINI_API_KEY": "",
+    }
+    workers = [
+        subprocess.Popen([sys.executable, "-m", "api.worker", "--concurrency", "2", "--worker-id", f"w{i}"], cwd=SRC_DIR, env=env)
+        for i in range(3)
+    ]
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            async with session_factory() as s:
+                if (await DBJobQueue.stats(s)).get(JobStatus.DONE) == len(ids):
+                    break
+            await asyncio.sleep(0.2)
+    finally:
+        for proc in workers:
+            proc.send_signal(signal.SIGTERM)
+        for proc in workers:
+            proc.wait(timeout=30)
+
+    async with session_factory() as s:
+        jobs = (await s.execute(select(PipelineJobRecord))).scalars().all()
+        outputs = (await s.execute(select(AgentOutput))).scalars().all()
+        statuses = [(await crud.get_project(s, pid)).status for pid in ids]
+    await engine.dispose()
+
+    assert all(j.status == JobStatus.DONE and j.attempts == 1 for j in jobs)
+    assert statuses == [ProjectStatus.COMPLETED] * len(ids)
+    # No stage ran twice
+    assert len(outputs) == len(ids) * len(PIPELINE_STAGES)
+    assert all(proc.returncode == 0 for proc in workers)
+
+
+@pytest.mark.asyncio
+async def test_cancel_drops_queued_jobs_and_stops_the_worker_of_leased_ones(monkeypatch, file_session_factory):
+    from api.ai.agents.llm_client import MockLLMClient
+    from api.ai.core.orchestrator import PIPELINE_STAGES
+    from api import worker as worker_module
+
+    monkeypatch.setattr(worker_module, "AsyncSessionLocal", file_session_factory)
+    monkeypatch.setattr(worker_module, "build_llm_client", lambda: MockLLMClient(latency=0.2))
+    running_id, queued_id = await _enqueue(file_session_factory, 2)
+    queue = DBJobQueue(file_session_factory)
+    worker = worker_module.Worker(queue, concurrency=1, poll_interval=0.05)
+    worker_task = asyncio.create_task(worker.run())
+    await asyncio.sleep(0.3)
+
+    async with file_session_factory() as s:
+        for pid in (queued_id, running_id):
+            assert await crud.cancel_project(s, pid)
+        assert await DBJobQueue.cancel(s, queued_id) == "queued"
+        assert await DBJobQueue.cancel(s, running_id) == "running"
+    while worker.processed < 1:
+        await asyncio.sleep(0.05)
+    worker.stop()
+    await worker_task
+
+    async with file_session_factory() as s:
+        jobs = {j.project_id: j for j in (await s.execute(select(PipelineJobRecord))).scalars().all()}
+        outputs = await crud.list_agent_outputs(s, running_id)
+        statuses = [(await crud.get_project(s, pid)).status for pid in (running_id, queued_id)]
+    assert jobs[running_id].status == JobStatus.CANCELLED and jobs[queued_id].status == JobStatus.CANCELLED
+    assert jobs[queued_id].attempts == 0  # never claimed
+    assert statuses == [ProjectStatus.CANCELLED] * 2
+    assert 0 < len(outputs) < len(PIPELINE_STAGES)
+
+
+@pytest.mark.asyncio
+async def test_worker_mode_api_queues_jobs_and_streams_from_the_database(monkeypatch, file_session_factory):
+    import json
+    import httpx
+    from main import app
+    from api import routes_agents, worker as worker_module
+
+    queue = DBJobQueue(file_session_factory)
+    monkeypatch.setattr(routes_agents._settings, "PIPELINE_EXECUTION_MODE", "worker")
+    monkeypatch.setattr(routes_agents._settings, "PIPELINE_EVENTS_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(routes_agents, "AsyncSessionLocal", file_session_factory)
+    monkeypatch.setattr(routes_agents, "_job_queue", queue)
+    monkeypatch.setattr(worker_module, "AsyncSessionLocal", file_session_factory)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/api/agents/run", json={"prompt": "Build a notes app"})
+        assert resp.status_code == 200 and resp.json()["queue_position"] == 0
+        project_id = resp.json()["project_id"]
+
+        worker = worker_module.Worker(queue, concurrency=1, poll_interval=0.05)
+        worker_task = asyncio.create_task(worker.run())
+        events = []
+        async with client.stream("GET", f"/api/agents/stream/{project_id}") as stream:
+            async for line in stream.aiter_lines():
+                if line.startswith("data:"):
+                    events.append(json.loads(line[len("data:"):]))
+        worker.stop()
+        await worker_task
+        status = (await client.get(f"/api/agents/status/{project_id}")).json()
+
+    assert events[-1]["event_type"] == "workflow_end"
+    assert sum(e["event_type"] == "agent_result" for e in events) >= 1
+    assert status["state"] == "finished" and worker.processed == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_claim_errors(monkeypatch, file_session_factory):
+    from sqlalchemy.exc import OperationalError
+    from api.ai.agents.llm_client import MockLLMClient
+    from api import worker as worker_module
+
+    class FlakyQueue(DBJobQueue):
+        """The database is locked for the first claims."""
+
+        failures = 2
+
+        async def claim(self, worker_id):
+            if self.failures:
+                self.failures -= 1
+                raise OperationalError("SELECT ...", {}, Exception("database is locked"))
+            return await super().claim(worker_id)
+
+    monkeypatch.setattr(worker_module, "AsyncSessionLocal", file_session_factory)
+    monkeypatch.setattr(worker_module, "build_llm_client", lambda: MockLLMClient(latency=0))
+    (project_id,) = await _enqueue(file_session_factory, 1)
+    queue = FlakyQueue(file_session_factory, lease_seconds=1)
+    worker = worker_module.Worker(queue, concurrency=1, poll_interval=0.05)
+    worker_task = asyncio.create_task(worker.run())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 10
+    while worker.processed < 1 and not worker_task.done() and loop.time() < deadline:
+        await asyncio.sleep(0.02)
+    worker.stop()
+    await worker_task
+
+    assert queue.failures == 0 and worker.processed == 1
+    async with file_session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.COMPLETED
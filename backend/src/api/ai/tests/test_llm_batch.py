@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+
+from api.ai.agents.llm_cache import CachedLLMClient, LRUCache, ResponseCache
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+from api.ai.core.deadlines import TimeBudgetExceeded
+
+
+class CountingLLM(LLMClient):
+    provider = "counting"
+    model_name = "counting"
+
+    def __init__(self, native_from: int = 0):
+        self.native_from = native_from
+        self.in_flight = 0
+        self.peak = 0
+        self.prompts = []
+        self.batches = []
+
+    async def generate(self, prompt: str, system=None, **kwargs) -> str:
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.01 if prompt != "slow" else 0.05)
+        finally:
+            self.in_flight -= 1
+        if prompt == "bad":
+            raise ValueError("HTTP 400 malformed")
+        if prompt == "late":
+            raise TimeBudgetExceeded("stage", 1.0)
+        return prompt.upper()
+
+    def batches_natively(self, count: int) -> bool:
+        return bool(self.native_from) and count >= self.native_from
+
+    async def generate_many(self, prompts, system=None, concurrency=None, **kwargs):
+        if self.batches_natively(len(prompts)):
+            self.batches.append(list(prompts))
+            return [p.upper() for p in prompts]
+        return await super().generate_many(prompts, system=system, concurrency=concurrency, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_results_in_order_with_per_item_errors_and_bounded_concurrency():
+    llm = CountingLLM()
+    results = await llm.generate_many(["slow", "b", "bad", "d", "e", "f"], concurrency=2)
+
+    assert results[:2] == ["SLOW", "B"] and results[3:] == ["D", "E", "F"]
+    assert isinstance(results[2], LLMProviderError) and not results[2].retryable and results[2].provider == "counting"
+    assert llm.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_running_out_of_time_fails_the_whole_call():
+    with pytest.raises(TimeBudgetExceeded):
+        await CountingLLM().generate_many(["a", "late", "c"])
+
+
+@pytest.mark.asyncio
+async def test_cache_answers_hits_and_sends_distinct_misses_as_one_batch():
+    inner = CountingLLM(native_from=2)
+    llm = CachedLLMClient(inner, ResponseCache(memory=LRUCache(100)))
+    await llm.generate("x")
+
+    assert llm.batches_natively(2)
+    assert await llm.generate_many(["x", "y", "z", "y"]) == ["X", "Y", "Z", "Y"]
+    assert inner.batches == [["y", "z"]]
+    assert await llm.generate_many(["y", "z"]) == ["Y", "Z"] and len(inner.batches) == 1  # all cached now
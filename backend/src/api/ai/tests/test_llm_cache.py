@@ -0,0 +1,68 @@
+import pytest
+
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.agents.llm_cache import CachedLLMClient, LRUCache, ResponseCache, SQLiteCacheStore
+
+
+class CountingLLM(MockLLMClient):
+    def __init__(self, reply=None):
+        super().__init__()
+        self.calls = 0
+        self.reply = reply
+
+    async def generate(self, prompt, system=None, **kwargs):
+        self.calls += 1
+        return self.reply or await super().generate(prompt, system=system, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_repeated_prompt_is_served_from_memory():
+    inner = CountingLLM()
+    llm = CachedLLMClient(inner, ResponseCache())
+    first = await llm.generate("idea", system="boss")
+    second = await llm.generate("idea", system="boss")
+    await llm.generate("idea", system="architect")
+    assert first == second
+    assert inner.calls == 2
+    stats = llm.cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_persistent_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    inner = CountingLLM()
+    await CachedLLMClient(inner, ResponseCache(store=SQLiteCacheStore(path))).generate("idea")
+
+    fresh = ResponseCache(store=SQLiteCacheStore(path))
+    await CachedLLMClient(inner, fresh).generate("idea")
+    assert inner.calls == 1
+    assert fresh.stats()["persistent_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bypass_and_errors_are_not_cached():
+    inner = CountingLLM(reply="[ERROR] Gemini API failed: boom")
+    llm = CachedLLMClient(inner, ResponseCache())
+    await llm.generate("idea")
+    await llm.generate("idea")
+    assert inner.calls == 2
+
+    inner.reply = "fine"
+    await llm.generate("idea")
+    await llm.generate("idea", cache_bypass=True)
+    assert inner.calls == 4
+    assert llm.cache.stats()["bypassed"] == 1
+
+
+def test_lru_evicts_by_entries_bytes_and_ttl():
+    lru = LRUCache(max_entries=2, max_bytes=10)
+    lru.set("a", "1", ttl=60)
+    lru.set("b", "2", ttl=60)
+    lru.get("a")
+    lru.set("c", "3", ttl=60)
+    assert lru.get("b") is None and lru.get("a") == "1"
+    lru.set("big", "x" * 9, ttl=60)
+    assert lru.get("c") is None and len(lru) == 2
+    lru.set("old", "v", ttl=-1)
+    assert lru.get("old") is None
@@ -0,0 +1,117 @@
+import pytest
+
+from api.ai.agents import llm_cascade, llm_ratelimit, llm_resilience
+from api.ai.agents.boss_agent import BossAgent
+from api.ai.agents.llm_cascade import AcceptanceCheck, CascadeLLMClient, required_sections
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+from api.ai.agents.llm_stack import build_llm_client
+from api.ai.core import stage_context
+from api.config.settings import get_settings
+
+GOOD_BRIEF = (
+    "## Goal\nShip a notes app people open every day.\n\n"
+    "## Success criteria\n- Notes sync in under a second\n- Works offline\n- Search finds any note\n\n"
+    "## Constraints\n- Two engineers, six weeks\n"
+)
+
+
+class ScriptedLLM(LLMClient):
+    provider = "scripted"
+
+    def __init__(self, model: str, answer: str = "", fail: bool = False):
+        self.model_name = model
+        self.answer = answer
+        self.fail = fail
+        self.calls = 0
+
+    async def generate(self, prompt: str, system=None, **kwargs) -> str:
+        self.calls += 1
+        if self.fail:
+            raise LLMProviderError("overloaded", provider=self.provider, status_code=503)
+        return self.answer or f"{self.model_name} answer"
+
+    async def stream(self, prompt: str, system=None, **kwargs):
+        text = await self.generate(prompt, system=system, **kwargs)
+        for i in range(0, len(text), 40):
+            yield text[i:i + 40]
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(llm_cascade, "_stats", {})
+
+
+async def _run_boss(llm: LLMClient, stage: str = "Boss") -> str:
+    deltas = []
+
+    async def sink(chunk: str) -> None:
+        deltas.append(chunk)
+
+    stage_token = stage_context.current_stage.set(stage)
+    sink_token = stage_context.delta_sink.set(sink)
+    try:
+        content = (await BossAgent(llm=llm).run("A notes app")).content
+    finally:
+        stage_context.delta_sink.reset(sink_token)
+        stage_context.current_stage.reset(stage_token)
+    assert "".join(deltas) == content  # rejected answers never reach the stream
+    return content
+
+
+def test_required_sections_come_from_the_agent_prompt():
+    prompt = "User idea:\n- not a section\n\nProduce:\n- 1-2 sentence goal\n- key success criteria (3 bullets)\n- primary constraints (if any)\n"
+    assert required_sections(prompt) == [["goal"], ["success", "criteria"]]
+    assert required_sections("Return a task breakdown (epics -> tasks).\n") == []
+
+    check = AcceptanceCheck(min_chars=50)
+    assert check(prompt, GOOD_BRIEF) == []
+    assert check(prompt, "[ERROR] Gemini API failed") == ["error_marker"]
+    assert check(prompt, "Goal: notes.") == ["too_short", "no_structure", "missing_sections"]
+    assert check(prompt, GOOD_BRIEF.replace("Success criteria", "Metrics").replace("Goal", "Aim")) == ["missing_sections"]
+
+
+@pytest.mark.asyncio
+async def test_cheap_answer_accepted_or_escalated():
+    cheap, strong = ScriptedLLM("cheap", GOOD_BRIEF), ScriptedLLM("strong", GOOD_BRIEF + "\n(strong)")
+    llm = CascadeLLMClient([cheap, strong], check=AcceptanceCheck(min_chars=50))
+
+    assert await _run_boss(llm) == GOOD_BRIEF
+    assert (cheap.calls, strong.calls) == (1, 0)
+
+    cheap.answer = "Sure! A notes app."
+    assert await _run_boss(llm) == GOOD_BRIEF + "\n(strong)"
+    cheap.fail = True
+    assert await _run_boss(llm) == GOOD_BRIEF + "\n(strong)"
+    assert (cheap.calls, strong.calls) == (3, 2)
+
+    stats = llm_cascade.cascade_stats()["Boss"]
+    assert stats["calls"] == 3 and stats["escalated"] == 2 and stats["escalation_rate"] == pytest.approx(0.6667)
+    assert stats["reasons"] == {"too_short": 1, "no_structure": 1, "missing_sections": 1, "error": 1}
+
+
+@pytest.mark.asyncio
+async def test_stages_outside_the_cascade_use_the_strong_model():
+    cheap, strong = ScriptedLLM("cheap", GOOD_BRIEF), ScriptedLLM("strong", GOOD_BRIEF)
+    llm = CascadeLLMClient([cheap, strong], check=AcceptanceCheck(min_chars=50), stages=["Boss", "Architect"])
+
+    await _run_boss(llm, stage="Engineer")
+    await _run_boss(llm, stage="Architect (Refined)")
+    assert (cheap.calls, strong.calls) == (1, 1)
+    assert set(llm_cascade.cascade_stats()) == {"Architect (Refined)"}
+
+
+def test_built_from_settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(llm_ratelimit, "_limiters", {})
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(settings, "LLM_CASCADE_MODEL", "gemini-2.5-flash-lite")
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", None)
+    assert build_llm_client().model_name == "mock"  # no key: dev runs on the mock, nothing to cascade
+
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", "key")
+    llm = build_llm_client()
+    while not isinstance(llm, CascadeLLMClient):
+        llm = llm.inner
+    assert [t.model_name for t in llm.tiers] == ["gemini-2.5-flash-lite", settings.GEMINI_MODEL]
+    assert llm.tiers[0].policy.max_attempts == 1
+    assert llm.stages == {"Boss", "Product Manager", "Architect", "Project Manager", "QA"}
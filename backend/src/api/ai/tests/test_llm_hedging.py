@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+
+from api.ai.agents.llm_client import LLMProviderError, MockLLMClient
+from api.ai.agents.llm_hedging import HedgedLLMClient, HedgePolicy
+
+
+class TrackingLLM(MockLLMClient):
+    """Mock that records started and cancelled calls."""
+
+    def __init__(self, latency):
+        super().__init__(latency=latency)
+        self.started = 0
+        self.cancelled = 0
+
+    async def generate(self, prompt, system=None, **kwargs):
+        self.started += 1
+        try:
+            return await super().generate(prompt, system=system, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    async def stream(self, prompt, system=None, **kwargs):
+        self.started += 1
+        try:
+            async for chunk in super().stream(prompt, system=system, **kwargs):
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_over_a_stalled_primary_and_cancels_it():
+    slow, fast = TrackingLLM(latency=5.0), TrackingLLM(latency=0.01)
+    llm = HedgedLLMClient(slow, secondary=fast, policy=HedgePolicy(initial_delay=0.02, max_hedge_rate=1.0))
+    text = await asyncio.wait_for(llm.generate("idea", system="boss"), timeout=1.0)
+    assert text == await MockLLMClient(latency=0).generate("idea", system="boss")
+    assert slow.cancelled == 1 and fast.started == 1
+    assert llm.policy.counters["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_never_hedged():
+    primary, secondary = TrackingLLM(latency=0.0), TrackingLLM(latency=0.0)
+    llm = HedgedLLMClient(primary, secondary=secondary, policy=HedgePolicy(initial_delay=0.5))
+    for _ in range(5):
+        await llm.generate("idea")
+    assert secondary.started == 0 and llm.policy.counters["hedges"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_rate_cap_suppresses_extra_requests():
+    primary, secondary = TrackingLLM(latency=0.03), TrackingLLM(latency=0.0)
+    llm = HedgedLLMClient(primary, secondary=secondary, policy=HedgePolicy(initial_delay=0.01, max_hedge_rate=0.25))
+    for _ in range(8):
+        await llm.generate("idea")
+    counters = llm.policy.counters
+    assert counters["hedges"] == 2 and counters["hedges_suppressed"] == 6
+    assert secondary.started == 2
+
+
+def test_hedge_delay_tracks_the_latency_quantile():
+    policy = HedgePolicy(quantile=0.9, initial_delay=3.0, min_samples=10)
+    assert policy.hedge_delay() == 3.0
+    for i in range(1, 11):
+        policy.record(i / 10, hedged=False)
+    assert policy.hedge_delay() == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_generate_and_stream_latencies_are_kept_apart_and_failures_left_out():
+    class FailingLLM(MockLLMClient):
+        async def generate(self, prompt, system=None, **kwargs):
+            raise LLMProviderError("boom", provider="mock")
+
+    policy = HedgePolicy(initial_delay=5.0, max_hedge_rate=0.0)
+    await HedgedLLMClient(MockLLMClient(latency=0.05), policy=policy).generate("idea")
+    chunks = [c async for c in HedgedLLMClient(MockLLMClient(latency=0), policy=policy).stream("idea")]
+    with pytest.raises(LLMProviderError):
+        await HedgedLLMClient(FailingLLM(latency=0), policy=policy).generate("idea")
+
+    assert chunks and len(policy._hedged) == 3
+    (generate,), (first_chunk,) = policy._latencies["generate"], policy._latencies["stream"]
+    assert generate >= 0.05 > first_chunk
+    assert set(policy.stats()["hedge_delay"]) == {"generate", "stream"}
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_the_winners_full_text():
+    slow, fast = TrackingLLM(latency=5.0), TrackingLLM(latency=0.02)
+    llm = HedgedLLMClient(slow, secondary=fast, policy=HedgePolicy(initial_delay=0.01, max_hedge_rate=1.0))
+    chunks = [c async for c in llm.stream("idea", system="pm")]
+    assert "".join(chunks) == await MockLLMClient(latency=0).generate("idea", system="pm")
+    assert slow.cancelled == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_cancels_the_call_it_is_waiting_on():
+    primary, secondary = TrackingLLM(latency=5.0), TrackingLLM(latency=0.0)
+    llm = HedgedLLMClient(primary, secondary=secondary, policy=HedgePolicy(initial_delay=1.0, max_hedge_rate=1.0))
+    for call in (lambda: llm.generate("idea"), lambda: llm.stream("idea").__anext__()):
+        caller = asyncio.ensure_future(call())
+        await asyncio.sleep(0.02)  # inside the hedge delay
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+    assert primary.started == 2 and primary.cancelled == 2 and secondary.started == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_consumer_stopping_early_closes_the_winner():
+    primary = TrackingLLM(latency=0.05)
+    stream = HedgedLLMClient(primary, policy=HedgePolicy(initial_delay=1.0)).stream("idea")
+    await stream.__anext__()
+    await stream.aclose()
+    assert primary.cancelled == 1
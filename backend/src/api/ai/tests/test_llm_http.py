@@ -0,0 +1,277 @@
+import asyncio
+import json
+import httpx
+import pytest
+import pytest_asyncio
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from api.ai.agents.llm_client import GeminiClient, LLMProviderError, get_llm_client
+from api.ai.agents.llm_http import GeminiHTTPClient, OpenAIHTTPClient
+from api.ai.agents.llm_resilience import ResilientLLMClient
+from api.config.settings import get_settings
+
+
+class StandInProvider:
+    """Local HTTP server speaking just enough of the Gemini and OpenAI APIs."""
+
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.failures = []  # (status, headers) answered to the next requests
+        self.delay = 0.0
+        self.jobs = {}  # batch job id -> {"prompts", "polls", "cancelled"}
+        self.polls_until_done = 1
+        self.app = Starlette(routes=[
+            Route("/v1beta/models/{call:path}", self.gemini, methods=["POST"]),
+            Route("/v1beta/batches/{job:path}", self.gemini_batch, methods=["GET", "POST"]),
+            Route("/v1/chat/completions", self.openai, methods=["POST"]),
+            Route("/v1/files", self.openai_upload, methods=["POST"]),
+            Route("/v1/files/{file}/content", self.openai_file, methods=["GET"]),
+            Route("/v1/batches", self.openai_create_batch, methods=["POST"]),
+            Route("/v1/batches/{job:path}", self.openai_batch, methods=["GET", "POST"]),
+        ])
+
+    async def _accept(self, request: Request):
+        body = await request.json()
+        self.requests.append({"path": request.url.path, "query": str(request.query_params), "headers": dict(request.headers), "body": body})
+        self.connections.add(request.client.port)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            status, headers = self.failures.pop(0)
+            return body, JSONResponse({"error": {"code": status, "message": "injected"}}, status_code=status, headers=headers)
+        return body, None
+
+    @staticmethod
+    def _sse(payloads):
+        async def events():
+            for payload in payloads:
+                yield f"data: {json.dumps(payload) if not isinstance(payload, str) else payload}\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def gemini(self, request: Request):
+        body, error = await self._accept(request)
+        if error:
+            return error
+        if request.path_params["call"].endswith(":batchGenerateContent"):
+            requests = body["batch"]["inputConfig"]["requests"]["requests"]
+            job = self._new_job([r["request"]["contents"][0]["parts"][0]["text"] for r in requests])
+            return JSONResponse({"name": f"batches/{job}", "done": False})
+        words = f"echo: {body['contents'][0]['parts'][0]['text']}".split(" ")
+        if request.path_params["call"].endswith(":streamGenerateContent"):
+            return self._sse([{"candidates": [{"content": {"role": "model", "parts": [{"text": w + " "}]}}]} for w in words])
+        return JSONResponse({"candidates": [{"content": {"role": "model", "parts": [{"text": " ".join(words) + " "}]}}]})
+
+    async def openai(self, request: Request):
+        body, error = await self._accept(request)
+        if error:
+            return error
+        words = f"echo: {body['messages'][-1]['content']}".split(" ")
+        if body.get("stream"):
+            return self._sse([{"choices": [{"delta": {"content": w + " "}}]} for w in words] + ["[DONE]"])
+        return JSONResponse({"choices": [{"message": {"role": "assistant", "content": " ".join(words) + " "}}]})
+
+    # Batch jobs: prompts containing "reject" fail for good, "flaky" ones transiently
+    def _new_job(self, prompts):
+        job = f"job{len(self.jobs) + 1}"
+        self.jobs[job] = {"prompts": prompts, "polls": 0, "cancelled": False}
+        return job
+
+    def _poll(self, request: Request, job: str):
+        self.requests.append({"path": request.url.path, "method": request.method})
+        state = self.jobs[job]
+        if request.method == "POST":
+            state["cancelled"] = True
+            return None
+        state["polls"] += 1
+        return state if state["polls"] > self.polls_until_done else None
+
+    async def gemini_batch(self, request: Request):
+        job = request.path_params["job"].split(":")[0]
+        state = self._poll(request, job)
+        if state is None:
+            return JSONResponse({"name": f"batches/{job}", "done": False, "metadata": {"state": "BATCH_STATE_RUNNING"}})
+        inlined = []
+        for i, prompt in reversed(list(enumerate(state["prompts"]))):  # order comes from the metadata keys
+            if "reject" in prompt or "flaky" in prompt:
+                item = {"error": {"code": 3 if "reject" in prompt else 8, "message": "injected"}}
+            else:
+                item = {"response": {"candidates": [{"content": {"parts": [{"text": f"echo: {prompt} "}]}}]}}
+            inlined.append({**item, "metadata": {"key": str(i)}})
+        return JSONResponse({"name": f"batches/{job}", "done": True, "response": {"inlinedResponses": {"inlinedResponses": inlined}}})
+
+    async def openai_upload(self, request: Request):
+        raw = (await request.body()).decode()
+        lines = [json.loads(line) for line in raw.splitlines() if line.startswith('{"custom_id"')]
+        self.requests.append({"path": request.url.path, "lines": lines})
+        self.jobs[f"file-{len(self.jobs) + 1}"] = {"lines": lines}
+        return JSONResponse({"id": f"file-{len(self.jobs)}"})
+
+    async def openai_create_batch(self, request: Request):
+        body = await request.json()
+        self.requests.append({"path": request.url.path, "body": body})
+        lines = self.jobs[body["input_file_id"]]["lines"]
+        job = self._new_job([line["body"]["messages"][-1]["content"] for line in lines])
+        return JSONResponse({"id": job, "status": "validating"})
+
+    async def openai_batch(self, request: Request):
+        job = request.path_params["job"].split("/")[0]
+        state = self._poll(request, job)
+        if state is None:
+            return JSONResponse({"id": job, "status": "cancelling" if request.method == "POST" else "in_progress"})
+        output, errors = [], []
+        for i, prompt in enumerate(state["prompts"]):
+            if "reject" in prompt or "flaky" in prompt:
+                status = 400 if "reject" in prompt else 429
+                errors.append({"custom_id": str(i), "response": {"status_code": status, "body": {"error": {"message": "injected"}}}})
+            else:
+                output.append({"custom_id": str(i), "response": {"status_code": 200, "body": {"choices": [{"message": {"content": f"echo: {prompt} "}}]}}})
+        state["files"] = {f"{job}-out": output, f"{job}-err": errors}
+        return JSONResponse({"id": job, "status": "completed", "output_file_id": f"{job}-out", "error_file_id": f"{job}-err"})
+
+    async def openai_file(self, request: Request):
+        file = request.path_params["file"]
+        lines = self.jobs[file.rsplit("-", 1)[0]]["files"][file]
+        return PlainTextResponse("\n".join(json.dumps(line) for line in lines))
+
+
+@pytest_asyncio.fixture()
+async def provider():
+    stand_in = StandInProvider()
+    server = uvicorn.Server(uvicorn.Config(stand_in.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    async with httpx.AsyncClient(timeout=5) as http:
+        yield stand_in, f"http://127.0.0.1:{port}", http
+    server.should_exit = True
+    await task
+
+
+@pytest.mark.asyncio
+async def test_gemini_generate_and_stream_reuse_one_connection(provider):
+    stand_in, url, http = provider
+    llm = GeminiHTTPClient(api_key="test-key", model="gemini-test", base_url=f"{url}/v1beta", http=http)
+
+    text = await llm.generate("hello world", system="be brief")
+    chunks = [c async for c in llm.stream("hello world", system="be brief")]
+    for _ in range(5):
+        await llm.generate("again")
+
+    assert text == "echo: hello world "
+    assert len(chunks) == 3 and "".join(chunks) == text
+    first, streamed = stand_in.requests[0], stand_in.requests[1]
+    assert first["path"] == "/v1beta/models/gemini-test:generateContent"
+    assert first["headers"]["x-goog-api-key"] == "test-key"
+    assert first["body"]["systemInstruction"] == {"parts": [{"text": "be brief"}]}
+    assert streamed["path"].endswith(":streamGenerateContent") and streamed["query"] == "alt=sse"
+    assert len(stand_in.connections) == 1  # keep-alive: 7 calls, one TCP connection
+
+
+@pytest.mark.asyncio
+async def test_openai_generate_and_stream(provider):
+    stand_in, url, http = provider
+    llm = OpenAIHTTPClient(api_key="sk-test", model="gpt-test", base_url=f"{url}/v1", http=http)
+
+    text = await llm.generate("hi there", system="sys")
+    chunks = [c async for c in llm.stream("hi there")]
+
+    assert text == "echo: hi there " and "".join(chunks) == text and len(chunks) == 3
+    request = stand_in.requests[0]
+    assert request["headers"]["authorization"] == "Bearer sk-test"
+    assert request["body"]["model"] == "gpt-test"
+    assert request["body"]["messages"] == [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi there"}]
+    assert stand_in.requests[1]["body"]["stream"] is True
+
+
+@pytest.mark.asyncio
+async def test_http_errors_and_timeouts_become_provider_errors(provider):
+    stand_in, url, http = provider
+    llm = GeminiHTTPClient(api_key="k", model="m", base_url=f"{url}/v1beta", http=http)
+
+    stand_in.failures = [(429, {"retry-after": "2"})]
+    with pytest.raises(LLMProviderError) as info:
+        await llm.generate("x")
+    assert info.value.retryable and info.value.status_code == 429 and info.value.retry_after == 2.0
+
+    stand_in.failures = [(400, {})]
+    with pytest.raises(LLMProviderError) as info:
+        async for _ in llm.stream("x"):
+            pass
+    assert not info.value.retryable and "injected" in str(info.value)
+
+    stand_in.delay = 0.5
+    async with httpx.AsyncClient(timeout=0.1) as impatient:
+        slow = GeminiHTTPClient(api_key="k", model="m", base_url=f"{url}/v1beta", http=impatient)
+        with pytest.raises(LLMProviderError) as info:
+            await slow.generate("x")
+    assert info.value.retryable and "Timeout" in str(info.value)
+
+
+def test_factory_prefers_native_clients(monkeypatch):
+    assert isinstance(get_llm_client("gemini", api_key="k"), GeminiHTTPClient)
+    assert isinstance(get_llm_client("openai", api_key="k"), OpenAIHTTPClient)
+    monkeypatch.setattr(get_settings(), "LLM_HTTP_CLIENT", "sdk")
+    assert isinstance(get_llm_client("gemini", api_key="k"), GeminiClient)
+
+
+@pytest.fixture()
+def native_batches(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "LLM_NATIVE_BATCH_MIN_PROMPTS", 3)
+    monkeypatch.setattr(settings, "LLM_BATCH_POLL_SECONDS", 0.01)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["gemini", "openai"])
+async def test_generate_many_submits_one_batch_job(provider, native_batches, kind):
+    stand_in, url, http = provider
+    if kind == "gemini":
+        llm = GeminiHTTPClient(api_key="k", model="m", base_url=f"{url}/v1beta", http=http)
+    else:
+        llm = OpenAIHTTPClient(api_key="k", model="m", base_url=f"{url}/v1", http=http)
+
+    results = await llm.generate_many(["one", "reject this", "three", "flaky"], system="sys")
+
+    assert results[0] == "echo: one " and results[2] == "echo: three "
+    assert isinstance(results[1], LLMProviderError) and not results[1].retryable
+    assert isinstance(results[3], LLMProviderError) and results[3].retryable
+    paths = [r["path"] for r in stand_in.requests]
+    assert not any(p.endswith(("generateContent", "chat/completions")) for p in paths)  # no per-prompt calls
+    if kind == "openai":
+        assert paths[:2] == ["/v1/files", "/v1/batches"] and stand_in.requests[0]["lines"][1]["url"] == "/v1/chat/completions"
+
+    stand_in.requests.clear()
+    assert await llm.generate_many(["a", "b"]) == ["echo: a ", "echo: b "]  # below the threshold: one call each
+    assert len(stand_in.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_transient_batch_items_are_retried_one_by_one(provider, native_batches):
+    stand_in, url, http = provider
+    llm = ResilientLLMClient([GeminiHTTPClient(api_key="k", model="m", base_url=f"{url}/v1beta", http=http)])
+
+    results = await llm.generate_many(["one", "flaky", "reject"])
+
+    assert results[:2] == ["echo: one ", "echo: flaky "] and not results[2].retryable
+    assert [r["path"] for r in stand_in.requests if r["path"].endswith(":generateContent")] == ["/v1beta/models/m:generateContent"]
+
+
+@pytest.mark.asyncio
+async def test_abandoned_batch_job_is_cancelled(provider, native_batches):
+    stand_in, url, http = provider
+    stand_in.polls_until_done = 1000
+    llm = OpenAIHTTPClient(api_key="k", model="m", base_url=f"{url}/v1", http=http)
+
+    task = asyncio.create_task(llm.generate_many(["a", "b", "c"]))
+    while not stand_in.jobs.get("job2", {}).get("polls"):
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert stand_in.jobs["job2"]["cancelled"] and stand_in.requests[-1]["path"] == "/v1/batches/job2/cancel"
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+
+from api.ai.agents.llm_client import LLMProviderError, MockLLMClient
+from api.ai.agents.llm_http import OpenAIHTTPClient
+from api.ai.agents.llm_ratelimit import RateLimitedLLMClient, RateLimiter, is_rate_limit_error, retry_after_seconds
+
+
+class QuotaLLM(MockLLMClient):
+    """Fails like the provider clients do when the provider returns 429."""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.calls = 0
+
+    async def generate(self, prompt, system=None, **kwargs):
+        self.calls += 1
+        raise LLMProviderError("gemini API failed: 429 Resource has been exhausted", provider="gemini", status_code=429, retry_after=2)
+
+
+@pytest.mark.asyncio
+async def test_requests_over_rpm_wait_instead_of_failing():
+    limiter = RateLimiter(rpm=600)  # 10 per second, burst of 600
+    limiter._requests.level = 2
+    start = time.monotonic()
+    await asyncio.gather(*(limiter.acquire(1) for _ in range(4)))
+    assert time.monotonic() - start >= 0.15
+    assert limiter.counters["acquired"] == 4 and limiter.counters["throttled"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_arrival_order():
+    limiter = RateLimiter(rpm=1200)
+    limiter._requests.level = 0
+    order = []
+
+    async def call(i):
+        await limiter.acquire(1)
+        order.append(i)
+
+    tasks = [asyncio.create_task(call(i)) for i in range(5)]
+    await asyncio.gather(*tasks)
+    assert order == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_reserved_then_settled_against_the_real_usage():
+    limiter = RateLimiter(tpm=100_000)
+    llm = RateLimitedLLMClient(MockLLMClient(latency=0), limiter, expected_output_tokens=5000)
+    await llm.generate("short prompt")
+    # The reservation was mostly refunded: the mock answer is far below 5000 tokens
+    assert limiter.stats()["tpm_utilization"] < 0.01
+
+
+@pytest.mark.asyncio
+async def test_provider_429_pauses_and_slows_the_limiter():
+    limiter = RateLimiter(rpm=60)
+    llm = RateLimitedLLMClient(QuotaLLM(), limiter)
+    with pytest.raises(LLMProviderError) as info:
+        await llm.generate("idea")
+    assert is_rate_limit_error(info.value)
+    stats = limiter.stats()
+    assert stats["rate_limited"] == 1 and stats["rate_scale"] == 0.5
+    assert 1.0 < stats["paused_for"] <= 2.0
+
+
+@pytest.mark.asyncio
+async def test_429_without_retry_after_pauses_for_the_tpm_refill_of_the_call():
+    limiter = RateLimiter(tpm=60_000)  # 1000 tokens per second, no rpm
+    limiter.on_rate_limited(None, tokens=1000)
+    # Halved rate: 2s to refill the failed call's tokens, not the minute of an unknown rpm
+    assert limiter.stats()["rate_scale"] == 0.5 and 1.5 < limiter.stats()["paused_for"] <= 2.0
+    RateLimiter().on_rate_limited(None)  # neither rate configured: a short default pause
+
+
+class FailingLLM(MockLLMClient):
+    """Fails (or hangs, until cancelled) after streaming a few words."""
+
+    def __init__(self, hang: bool = False):
+        super().__init__(latency=0)
+        self.hang = hang
+
+    async def _fail(self):
+        if self.hang:
+            await asyncio.Event().wait()
+        raise LLMProviderError("openai API failed: HTTP 500", provider="openai", status_code=500)
+
+    async def generate(self, prompt, system=None, **kwargs):
+        await self._fail()
+
+    async def stream(self, prompt, system=None, **kwargs):
+        yield "one "
+        yield "two "
+        await self._fail()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hang", [False, True])
+async def test_failed_and_cancelled_calls_settle_their_reservation(hang):
+    limiter = RateLimiter(tpm=100_000)
+    limiter._scale = 0.5
+    llm = RateLimitedLLMClient(FailingLLM(hang), limiter, expected_output_tokens=50_000)
+
+    async def consume():
+        return [chunk async for chunk in llm.stream("idea")]
+
+    for call in (lambda: llm.generate("idea"), consume):
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        if hang:
+            assert limiter.stats()["tpm_utilization"] > 0.4  # reserved up front
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError if hang else LLMProviderError):
+            await task
+        assert limiter.stats()["tpm_utilization"] < 0.01
+    assert limiter.stats()["rate_scale"] == 0.5  # no success to win the rate back with
+
+
+def test_retry_after_is_read_from_headers_and_messages():
+    class HTTPError(Exception):
+        headers = {"retry-after": "7"}
+
+    assert retry_after_seconds(HTTPError("429 Too Many Requests")) == 7.0
+    assert retry_after_seconds(Exception("quota exceeded, retry_delay { seconds: 12 }")) == 12.0
+    assert not is_rate_limit_error(ValueError("bad prompt"))
+
+
+def _openai_stub(responses):
+    """OpenAI client over a stub transport answering (status, headers) in turn."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status, headers = responses.pop(0)
+        if status >= 400:
+            return httpx.Response(status, headers=headers, json={"error": {"message": "injected"}})
+        if json.loads(request.content).get("stream"):
+            events = "".join(f"data: {json.dumps({'choices': [{'delta': {'content': w}}]})}\n\n" for w in ("one ", "two ", "three"))
+            return httpx.Response(200, headers={**headers, "content-type": "text/event-stream"}, text=events + "data: [DONE]\n\n")
+        return httpx.Response(200, headers=headers, json={"choices": [{"message": {"content": "answer"}}]})
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return OpenAIHTTPClient(api_key="sk-test", model="gpt-test", base_url="http://provider/v1", http=http)
+
+
+@pytest.mark.asyncio
+async def test_limiter_follows_the_providers_remaining_quota_headers():
+    limiter = RateLimiter(rpm=60, tpm=100_000)
+    llm = RateLimitedLLMClient(_openai_stub([
+        (200, {"x-ratelimit-remaining-requests": "3", "x-ratelimit-remaining-tokens": "50000"}),
+        (429, {"retry-after": "1", "x-ratelimit-remaining-requests": "0"}),
+    ]), limiter)
+
+    await llm.generate("idea")
+    stats = limiter.stats()
+    assert stats["rpm_utilization"] == pytest.approx(0.95, abs=0.01) and 0.45 < stats["tpm_utilization"] < 0.55
+
+    with pytest.raises(LLMProviderError) as info:
+        await llm.generate("idea")
+    assert info.value.headers["x-ratelimit-remaining-requests"] == "0"
+    assert limiter.stats()["rate_limited"] == 1 and limiter.stats()["paused_for"] > 0.5
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_early_still_settles_its_reservation():
+    limiter = RateLimiter(tpm=100_000)
+    llm = RateLimitedLLMClient(_openai_stub([(200, {})]), limiter, expected_output_tokens=50_000)
+    stream = llm.stream("idea")
+    assert await stream.__anext__() == "one "
+    assert limiter.stats()["tpm_utilization"] > 0.4  # reserved up front
+    await stream.aclose()
+    assert limiter.stats()["tpm_utilization"] < 0.01
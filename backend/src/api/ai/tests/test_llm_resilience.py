@@ -0,0 +1,142 @@
+import pytest
+
+from api.ai.agents.boss_agent import BossAgent
+from api.ai.agents.llm_client import LLMProviderError, MockLLMClient, classify_error
+from api.ai.agents.llm_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientLLMClient,
+    RetryBudget,
+    RetryPolicy,
+)
+
+
+class FlakyLLM(MockLLMClient):
+    """Fails the first `failures` calls with `error`, then answers."""
+
+    def __init__(self, failures=10 ** 6, error=None, provider="flaky"):
+        super().__init__(latency=0)
+        self.failures = failures
+        self.error = error or ConnectionError("503 Service Unavailable")
+        self.calls = 0
+        self.provider = provider
+
+    async def generate(self, prompt, system=None, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return await super().generate(prompt, system=system, **kwargs)
+
+
+def fast_policy(attempts=3):
+    return RetryPolicy(max_attempts=attempts, base_delay=0.001, max_delay=0.01)
+
+
+def test_errors_are_classified_as_retryable_or_fatal():
+    assert classify_error(ConnectionError("503 Service Unavailable")).retryable
+    assert classify_error(TimeoutError("timed out")).retryable
+    assert not classify_error(ValueError("400 Bad Request: invalid argument")).retryable
+
+    class InvalidArgument(Exception):
+        pass
+
+    assert not classify_error(InvalidArgument("prompt blocked")).retryable
+
+
+def test_transport_errors_stay_retryable_whatever_numbers_their_message_holds():
+    timeout = classify_error(TimeoutError("read timed out after 404 ms"))
+    assert timeout.retryable and timeout.status_code is None
+    reset = classify_error(ConnectionError("connection reset by api.example.com:443"))
+    assert reset.retryable and reset.status_code is None
+
+    class APIConnectionError(Exception):  # an SDK's transport error, recognised by name
+        pass
+
+    assert classify_error(APIConnectionError("Bad Request 400")).retryable
+    assert classify_error(RuntimeError("upstream said HTTP 404")).status_code == 404
+    assert classify_error(RuntimeError("took 404 seconds")).status_code is None
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_is_retried_with_backoff():
+    inner = FlakyLLM(failures=2)
+    llm = ResilientLLMClient([inner], policy=fast_policy())
+    assert (await llm.generate("idea")).startswith("[MOCK LLM RESPONSE]")
+    assert inner.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_fatal_error_is_not_retried():
+    inner = FlakyLLM(error=ValueError("401 Unauthorized"))
+    llm = ResilientLLMClient([inner], policy=fast_policy())
+    with pytest.raises(LLMProviderError) as err:
+        await llm.generate("idea")
+    assert not err.value.retryable and inner.calls == 1
+    assert llm.breakers[0].state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast_and_fails_over():
+    down, backup = FlakyLLM(provider="down"), MockLLMClient(latency=0)
+    breakers = [CircuitBreaker("down", failure_threshold=2, recovery_timeout=60), CircuitBreaker("backup")]
+    llm = ResilientLLMClient([down, backup], breakers=breakers, policy=fast_policy())
+
+    assert (await llm.generate("idea")).startswith("[MOCK LLM RESPONSE]")  # failed over on the first error
+    await llm.generate("idea")
+    assert breakers[0].state == CircuitBreaker.OPEN and down.calls == 2
+    await llm.generate("idea")
+    assert down.calls == 2  # skipped while open
+
+    alone = ResilientLLMClient([down], breakers=breakers[:1], policy=fast_policy())
+    with pytest.raises(CircuitOpenError) as err:
+        await alone.generate("idea")
+    assert err.value.retry_after > 0 and down.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_the_circuit():
+    inner = FlakyLLM(failures=1)
+    breaker = CircuitBreaker("flaky", failure_threshold=1, recovery_timeout=0.0)
+    llm = ResilientLLMClient([inner], breakers=[breaker], policy=fast_policy(attempts=1))
+    with pytest.raises(LLMProviderError):
+        await llm.generate("idea")
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    await llm.generate("idea")
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_stops_retry_storms():
+    inner = FlakyLLM()
+    budget = RetryBudget(ratio=0.0, min_per_second=0.0, max_balance=1.0)
+    llm = ResilientLLMClient([inner], breakers=[CircuitBreaker("flaky", failure_threshold=100)], policy=fast_policy(5), budget=budget)
+    with pytest.raises(LLMProviderError):
+        await llm.generate("idea")
+    assert inner.calls == 2 and budget.exhausted == 1
+
+
+@pytest.mark.asyncio
+async def test_agent_raises_provider_errors_instead_of_persisting_fallback_text():
+    agent = BossAgent(llm=ResilientLLMClient([FlakyLLM()], policy=fast_policy(attempts=1)))
+    with pytest.raises(LLMProviderError):
+        await agent.run("Build a notes app")
+
+
+@pytest.mark.asyncio
+async def test_run_endpoint_returns_503_while_every_circuit_is_open(monkeypatch):
+    import httpx
+    from main import app
+    from api import routes_agents
+
+    from api.ai.agents import llm_resilience, llm_stack
+
+    # Admission reads the process-wide breakers; it must not build provider clients
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    monkeypatch.setattr(llm_stack, "provider_chain", lambda: pytest.fail("admission built the provider chain"))
+    breaker = llm_resilience.get_circuit_breaker(*routes_agents.provider_specs()[0])
+    breaker.recovery_timeout = 12
+    breaker._open()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/api/agents/run", json={"prompt": "Build a notes app"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] in ("11", "12")
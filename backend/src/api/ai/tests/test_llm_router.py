@@ -0,0 +1,162 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from api.ai.agents import llm_ratelimit, llm_resilience, llm_router
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+from api.ai.agents.llm_ratelimit import RateLimitedLLMClient, RateLimiter
+from api.ai.agents.llm_router import Backend, BackendHealth, RoutedLLMClient
+from api.ai.agents.llm_stack import build_llm_client, provider_chain, provider_specs
+from api.ai.core import stage_context
+from api.config.settings import get_settings
+
+
+class FakeBackend(LLMClient):
+    provider = "fake"
+
+    def __init__(self, model: str, latency: float = 0.0, fail: int = 0, fatal: bool = False):
+        self.model_name = model
+        self.latency = latency
+        self.fail = fail  # the next `fail` calls raise a transient error
+        self.fatal = fatal
+        self.calls = 0
+
+    async def generate(self, prompt: str, system=None, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fatal:
+            raise LLMProviderError("bad request", provider=self.provider, retryable=False, status_code=400)
+        if self.fail:
+            self.fail -= 1
+            raise LLMProviderError("unavailable", provider=self.provider, status_code=503)
+        return f"{self.model_name}: {prompt}"
+
+
+def _backend(client, weight=1.0, limiter=None, **health):
+    return Backend(client=client, health=BackendHealth(client.model_name, **health), limiter=limiter, weight=weight)
+
+
+@pytest.mark.asyncio
+async def test_traffic_follows_latency_weight_and_headroom():
+    fast, slow = FakeBackend("fast"), FakeBackend("slow")
+    a, b = _backend(fast), _backend(slow)
+    a.health.latency["generate"], b.health.latency["generate"] = 0.1, 1.0
+    router = RoutedLLMClient([a, b])
+    picks = Counter(router.order("generate")[0].model_name for _ in range(2000))
+    assert picks["fast"] > 8 * picks["slow"] > 0  # ~10:1
+
+    b.weight = 10.0
+    picks = Counter(router.order("generate")[0].model_name for _ in range(2000))
+    assert 0.35 < picks["fast"] / 2000 < 0.65
+
+    # A key whose quota is used up gets (almost) nothing while another has room
+    a.weight, b.weight = 1.0, 1.0
+    a.health.latency["generate"] = b.health.latency["generate"]
+    exhausted = RateLimiter(rpm=10)
+    for _ in range(10):
+        await exhausted.acquire(1)
+    a.limiter = exhausted
+    picks = Counter(router.order("generate")[0].model_name for _ in range(1000))
+    assert picks["slow"] > 950
+
+
+@pytest.mark.asyncio
+async def test_throughput_scales_with_keys():
+    async def completed_in(backends, calls=8):
+        router = RoutedLLMClient(backends)
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(router.generate(f"p{i}") for i in range(calls)))
+        return asyncio.get_running_loop().time() - start
+
+    def keyed(n):
+        # Each key admits one request at once, then one per 0.05s
+        backends = []
+        for i in range(n):
+            limiter = RateLimiter(rpm=1200)
+            limiter._requests.level = 1
+            backends.append(_backend(RateLimitedLLMClient(FakeBackend(f"key{i}"), limiter), limiter=limiter))
+        return backends
+
+    one, four = await completed_in(keyed(1)), await completed_in(keyed(4))
+    assert four < one / 2
+
+
+@pytest.mark.asyncio
+async def test_stage_pinning():
+    cheap, strong = FakeBackend("cheap"), FakeBackend("strong")
+    router = RoutedLLMClient([_backend(cheap), _backend(strong)], stage_models={"Boss": ["cheap"], "Engineer": ["strong"]})
+
+    async def in_stage(stage):
+        token = stage_context.current_stage.set(stage)
+        try:
+            return await router.generate("x")
+        finally:
+            stage_context.current_stage.reset(token)
+
+    assert {await in_stage("Boss") for _ in range(10)} == {"cheap: x"}
+    assert {await in_stage("Engineer (Final)") for _ in range(10)} == {"strong: x"}
+    assert {await in_stage("QA") for _ in range(40)} == {"cheap: x", "strong: x"}
+
+
+@pytest.mark.asyncio
+async def test_failover_and_health_based_ejection(monkeypatch):
+    flaky, healthy = FakeBackend("flaky", fail=100), FakeBackend("healthy")
+    a, b = _backend(flaky, eject_failures=2, eject_seconds=60), _backend(healthy)
+    router = RoutedLLMClient([a, b])
+    monkeypatch.setattr(router, "order", lambda kind: [a, b] if not a.health.ejected() else [b])
+
+    # Transient failures fail over within the call
+    assert await router.generate("x") == "healthy: x"
+    assert await router.generate("x") == "healthy: x"
+    assert a.health.ejected() and flaky.calls == 2 and a.health.error_rate > 0
+    assert a.health.stats()["ejected"] == 1
+
+    # Ejected backends are no candidates until their cool-down ends
+    monkeypatch.undo()
+    assert router.candidates() == [b]
+    a.health.ejected_until = 0.0
+    assert [c.model_name for c in router.candidates()] == ["flaky", "healthy"]
+
+    # Rejected requests are not failed over and do not count against health
+    fatal = _backend(FakeBackend("fatal", fatal=True))
+    rejecting = RoutedLLMClient([fatal, b])
+    rejecting.order = lambda kind: [fatal, b]
+    calls = healthy.calls
+    with pytest.raises(LLMProviderError, match="bad request"):
+        await rejecting.generate("x")
+    assert healthy.calls == calls
+    assert fatal.health.error_rate == 0 and not fatal.health.ejected()
+
+
+def test_built_from_settings(monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(llm_router, "_health", {})
+    monkeypatch.setattr(llm_ratelimit, "_limiters", {})
+    monkeypatch.setattr(llm_resilience, "_breakers", {})
+    for name, value in {
+        "GEMINI_API_KEY": "key-1",
+        "GEMINI_API_KEYS": "key-2, key-1",
+        "GEMINI_MODELS": "gemini-2.5-flash,gemini-2.5-pro",
+        "LLM_ROUTER_WEIGHTS": "gemini-2.5-pro=0.5",
+        "LLM_STAGE_MODELS": "Boss=gemini-2.5-flash,Engineer=gemini-2.5-pro|gemini-2.5-flash",
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+    chain = provider_chain()
+    assert len(chain) == 1 and isinstance(chain[0], RoutedLLMClient)
+    routed = chain[0]
+    assert sorted((b.model_name, b.weight) for b in routed.backends) == [
+        ("gemini-2.5-flash", 1.0), ("gemini-2.5-flash", 1.0), ("gemini-2.5-pro", 0.5), ("gemini-2.5-pro", 0.5)
+    ]
+    assert len({id(b.limiter) for b in routed.backends}) == 4  # one rate limiter per key and model
+    assert routed.stage_models["Engineer"] == ["gemini-2.5-pro", "gemini-2.5-flash"]
+    assert len(llm_router.router_stats()) == 4
+    assert build_llm_client().provider == "gemini"
+    assert provider_specs() == [(c.provider, c.model_name) for c in chain]
+
+    monkeypatch.setattr(settings, "GEMINI_API_KEYS", "")
+    monkeypatch.setattr(settings, "GEMINI_MODELS", "")
+    assert not isinstance(provider_chain()[0], RoutedLLMClient)
+    monkeypatch.setattr(settings, "LLM_FALLBACK_PROVIDER", "mock")
+    assert provider_specs() == [(c.provider, c.model_name) for c in provider_chain()] == [("gemini", settings.GEMINI_MODEL), ("mock", "mock")]
@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+
+from api.ai.agents.llm_client import LLMClient, LLMProviderError
+from api.ai.agents.llm_singleflight import COALESCED, CoalescingLLMClient, SingleFlight
+
+
+class GatedLLM(LLMClient):
+    """Counts calls; every call blocks until the test opens the gate."""
+
+    provider = "gated"
+    model_name = "gated-1"
+
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.cancelled = 0
+        self.gate = asyncio.Event()
+        self.fail = fail
+
+    async def generate(self, prompt: str, system=None, **kwargs) -> str:
+        self.calls += 1
+        try:
+            await self.gate.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise LLMProviderError("provider down", provider=self.provider, retryable=True)
+        return f"answer to {prompt}"
+
+    async def stream(self, prompt: str, system=None, **kwargs):
+        self.calls += 1
+        for word in ("one", "two", "three"):
+            yield word + " "
+            await self.gate.wait()
+        if self.fail:
+            raise LLMProviderError("stream broke", provider=self.provider, retryable=True)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_share_one_request():
+    inner = GatedLLM()
+    group = SingleFlight()
+    llm = CoalescingLLMClient(inner, group)
+    coalesced = COALESCED.labels("gated", "generate")
+    before = coalesced.value
+
+    calls = [asyncio.create_task(llm.generate("Write a spec", system="be brief")) for _ in range(4)]
+    calls.append(asyncio.create_task(llm.generate("  Write a\nspec ", system="be  brief")))  # same, normalised
+    other = asyncio.create_task(llm.generate("Something else"))
+    await _settle()
+    assert inner.calls == 2 and group.in_flight == 2
+
+    inner.gate.set()
+    assert await asyncio.gather(*calls) == ["answer to Write a spec"] * 5
+    assert await other == "answer to Something else"
+    assert coalesced.value - before == 4
+    assert group.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 4, "coalesced_ratio": pytest.approx(4 / 6, abs=1e-4)}
+
+    # Finished requests are not remembered: the next call goes to the provider again
+    await llm.generate("Write a spec", system="be brief")
+    assert inner.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    inner = GatedLLM(fail=True)
+    llm = CoalescingLLMClient(inner, SingleFlight())
+
+    calls = [asyncio.create_task(llm.generate("x")) for _ in range(3)]
+    await _settle()
+    inner.gate.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert inner.calls == 1
+    assert all(isinstance(r, LLMProviderError) and "provider down" in str(r) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    inner = GatedLLM()
+    group = SingleFlight()
+    llm = CoalescingLLMClient(inner, group)
+
+    leader = asyncio.create_task(llm.generate("x"))
+    follower = asyncio.create_task(llm.generate("x"))
+    await _settle()
+    leader.cancel()  # the caller that started the request goes away
+    await _settle()
+    assert leader.cancelled() and inner.cancelled == 0
+
+    inner.gate.set()
+    assert await follower == "answer to x" and inner.calls == 1
+
+    # Once the last waiter is gone the request is cancelled too
+    inner.gate.clear()
+    lonely = asyncio.create_task(llm.generate("y"))
+    await _settle()
+    lonely.cancel()
+    await _settle()
+    assert inner.cancelled == 1 and group.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_streams_are_shared_and_replayed_to_late_joiners():
+    inner = GatedLLM()
+    llm = CoalescingLLMClient(inner, SingleFlight())
+
+    async def collect():
+        return [chunk async for chunk in llm.stream("x")]
+
+    first = asyncio.create_task(collect())
+    await _settle()  # "one " has been received
+    late = asyncio.create_task(collect())
+    await _settle()
+    inner.gate.set()
+    assert await first == await late == ["one ", "two ", "three "]
+    assert inner.calls == 1
+
+    inner.fail = True
+    streams = [asyncio.create_task(collect()) for _ in range(2)]
+    results = await asyncio.gather(*streams, return_exceptions=True)
+    assert inner.calls == 2
+    assert all(isinstance(r, LLMProviderError) for r in results)
@@ -0,0 +1,85 @@
+import re
+import pytest
+
+from api.ai.agents.llm_client import LLMProviderError, MockLLMClient
+from api.ai.agents.llm_resilience import ResilientLLMClient, RetryPolicy
+from api.ai.core import metrics
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator, PIPELINE_STAGES
+from api.db import crud
+
+
+def _sample(text: str, line_prefix: str) -> float:
+    match = re.search(rf"^{re.escape(line_prefix)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_exposition_format():
+    registry = metrics.Registry()
+    hist = registry.register(metrics.Histogram("t_seconds", "Test.", ("stage",), buckets=(0.1, 1.0)))
+    count = registry.register(metrics.Counter("t_total", "Test.", ("kind",)))
+    registry.register(metrics.Gauge("t_depth", "Test.", function=lambda: 3))
+
+    child = hist.labels('a "quoted" stage')
+    assert hist.labels('a "quoted" stage') is child  # bound once, reused
+    for value in (0.05, 0.5, 5):
+        child.observe(value)
+    count.labels("x").inc(2)
+
+    text = registry.render()
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{stage="a \\"quoted\\" stage",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a \\"quoted\\" stage",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="a \\"quoted\\" stage",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="a \\"quoted\\" stage"} 3' in text
+    assert 't_total{kind="x"} 2' in text
+    assert "t_depth 3" in text
+    with pytest.raises(ValueError):
+        count.labels("x", "y")
+
+
+@pytest.mark.asyncio
+async def test_pipeline_run_records_stage_phases_and_retries(session_factory):
+    before = metrics.render_latest()
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Metrics", "Build a notes app")
+
+    class FlakyOnce(MockLLMClient):
+        calls = 0
+
+        def _maybe_fail(self):
+            FlakyOnce.calls += 1
+            if FlakyOnce.calls == 1:
+                raise LLMProviderError("mock API failed: 503", provider="mock", status_code=503)
+
+    llm = ResilientLLMClient([FlakyOnce(latency=0)], policy=RetryPolicy(max_attempts=3, base_delay=0))
+    await Orchestrator(message_bus=MessageBus(), llm=llm).run(
+        prompt="Build a notes app", db_session_factory=session_factory, project_id=project_id, project_title="Metrics"
+    )
+    after = metrics.render_latest()
+
+    def delta(line_prefix: str) -> float:
+        return _sample(after, line_prefix) - _sample(before, line_prefix)
+
+    for phase in ("llm", "persist"):
+        assert delta(f'autoteam_stage_phase_seconds_count{{stage="Boss",phase="{phase}"}}') == 1
+    # agent_start and agent_result
+    assert delta('autoteam_stage_phase_seconds_count{stage="QA",phase="publish"}') == 2
+    persisted = sum(delta(f'autoteam_stage_phase_seconds_count{{stage="{s.name}",phase="persist"}}') for s in PIPELINE_STAGES)
+    assert persisted == len(PIPELINE_STAGES)
+    assert delta('autoteam_llm_retries_total{provider="mock",action="retry"}') == 1
+    assert delta('autoteam_llm_errors_total{provider="mock",retryable="true"}') == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_the_registry():
+    import httpx
+    from main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for name in ("autoteam_stage_phase_seconds", "autoteam_pipelines_active", "autoteam_sse_subscribers",
+                 "autoteam_message_bus_queued_messages", "autoteam_db_pool_checked_out", "autoteam_llm_cache_lookups_total"):
+        assert f"# TYPE {name} " in resp.text
@@ -30,4 +30,94 @@ async def test_orchestrator_runs(session: AsyncSession):
 
 
     results = await orch.run(prompt="Build an AI notes app", db=session, project_title="Test")
-    assert len(results) >= 7 # Boss, PM, Arch, PM(refined), Arch(refined), PMgr, Arch(final), PMgr(refined), Eng, QA, Eng(final)
\ No newline at end of file
+    assert len(results) >= 7 # Boss, PM, Arch, PM(refined), Arch(refined), PMgr, Arch(final), PMgr(refined), Eng, QA, Eng(final)
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_persists_every_stage_in_pipeline_order(session_factory):
+    from api.ai.core.orchestrator import PIPELINE_STAGES
+
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "DAG", "Build an AI notes app")
+
+    orch = Orchestrator(message_bus=MessageBus(), llm=MockLLMClient(), max_parallelism=2)
+    results = await orch.run(
+        prompt="Build an AI notes app",
+        db_session_factory=session_factory,
+        project_id=project_id,
+        project_title="DAG",
+    )
+
+    assert len(results) == len(PIPELINE_STAGES)
+    async with session_factory() as s:
+        rows = await crud.list_agent_outputs(s, project_id)
+    assert [r.agent_name for r in rows] == [stage.name for stage in PIPELINE_STAGES]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_streams_agent_deltas(session_factory):
+    import json
+
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Stream", "Build an AI notes app")
+
+    bus = MessageBus()
+    orch = Orchestrator(message_bus=bus, llm=MockLLMClient())
+    await orch.run(prompt="Build an AI notes app", db_session_factory=session_factory, project_id=project_id, project_title="Stream")
+
+    events = []
+    async for raw in bus.subscribe(project_id):
+        events.append(json.loads(raw))
+        if events[-1]["event_type"] == "workflow_end":
+            break
+
+    boss_deltas = "".join(e["content"] for e in events if e["event_type"] == "agent_delta" and e["agent_name"] == "Boss")
+    boss_result = next(e["content"] for e in events if e["event_type"] == "agent_result" and e["agent_name"] == "Boss")
+    assert boss_deltas == boss_result
+
+    async with session_factory() as s:
+        rows = await crud.list_agent_outputs(s, project_id)
+    assert rows[0].content == boss_result
+
+
+@pytest.mark.asyncio
+async def test_resume_runs_only_missing_stages(session_factory, monkeypatch):
+    from api.ai.core.orchestrator import PIPELINE_STAGES
+    from api.db.models import ProjectStatus
+
+    class CountingLLM(MockLLMClient):
+        calls = 0
+
+        async def stream(self, prompt, system=None, **kwargs):
+            CountingLLM.calls += 1
+            async for chunk in super().stream(prompt, system=system, **kwargs):
+                yield chunk
+
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Resume", "Build an AI notes app")
+
+    # First run dies at QA
+    first = Orchestrator(message_bus=MessageBus(), llm=MockLLMClient())
+
+    async def provider_down(input_text):
+        raise RuntimeError("provider down")
+
+    first.qa.run = provider_down
+    monkeypatch.setattr(first, "_run_agent_with_retries", lambda agent, text, name: agent.run(text))
+    await first.run(prompt="Build an AI notes app", db_session_factory=session_factory, project_id=project_id, project_title="Resume")
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.FAILED
+
+    # Resume re-runs QA and everything downstream of it, nothing else
+    second = Orchestrator(message_bus=MessageBus(), llm=CountingLLM())
+    results = await second.run(
+        prompt="Build an AI notes app",
+        db_session_factory=session_factory,
+        project_id=project_id,
+        project_title="Resume",
+        resume=True,
+    )
+    assert CountingLLM.calls == 2
+    assert len(results) == len(PIPELINE_STAGES)
+    async with session_factory() as s:
+        assert (await crud.get_project(s, project_id)).status == ProjectStatus.COMPLETED
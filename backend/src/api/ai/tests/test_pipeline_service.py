@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+
+from api.ai.core.pipeline_service import PipelineService, QueueFullError, ServiceUnavailableError
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_bounds_concurrency_and_records_queue_wait():
+    service = PipelineService(workers=2, max_queue_depth=10)
+    await service.start()
+    active = 0
+    peak = 0
+    done = asyncio.Event()
+    finished = 0
+
+    async def run():
+        nonlocal active, peak, finished
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        finished += 1
+        if finished == 5:
+            done.set()
+
+    for pid in range(5):
+        await service.submit(pid, run)
+    await asyncio.sleep(0.005)  # both workers busy, three jobs waiting
+    assert service.position(4) == 2
+    await asyncio.wait_for(done.wait(), timeout=2)
+    await asyncio.sleep(0)
+    await service.stop()
+
+    assert peak == 2
+    assert service.job(4).state == "finished"
+    assert service.job(4).queue_wait >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_admission_control_rejects_when_full_or_stopped():
+    service = PipelineService(workers=1, max_queue_depth=1)
+    with pytest.raises(ServiceUnavailableError):
+        await service.submit(1, lambda: asyncio.sleep(0))
+
+    await service.start()
+    gate = asyncio.Event()
+    await service.submit(1, gate.wait)
+    await asyncio.sleep(0.01)  # worker picks job 1
+    await service.submit(2, gate.wait)
+    with pytest.raises(QueueFullError) as exc:
+        await service.submit(3, gate.wait)
+    assert exc.value.depth == 1
+    with pytest.raises(ValueError):
+        await service.submit(2, gate.wait)
+    gate.set()
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_run_endpoint_returns_429_when_queue_is_full(monkeypatch):
+    import httpx
+    from main import app
+    from api import routes_agents
+
+    service = PipelineService(workers=1, max_queue_depth=0)
+    await service.start()
+    monkeypatch.setattr(routes_agents, "_pipeline_service", service)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/api/agents/run", json={"prompt": "Build a notes app"})
+    await service.stop()
+
+    assert resp.status_code == 429
+    assert "Retry-After" in resp.headers
+    assert resp.json()["detail"]["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_startup_resumes_only_projects_whose_owner_is_gone(monkeypatch, session_factory):
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from api import routes_agents
+    from api.db import crud
+    from api.db.models import Project
+
+    service = PipelineService(workers=1, max_queue_depth=10)
+    await service.start()
+    gate = asyncio.Event()
+    monkeypatch.setattr(routes_agents, "_pipeline_service", service)
+    monkeypatch.setattr(routes_agents, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(routes_agents, "_run_factory", lambda project_id, **kwargs: gate.wait)
+    monkeypatch.setattr(routes_agents, "_lease_owner", "api-b")
+
+    now = datetime.utcnow()
+    leases = {
+        "live": ("api-a", now + timedelta(seconds=30), now),  # running in another process
+        "expired": ("api-a", now - timedelta(seconds=1), now),  # that process crashed
+        "legacy": (None, None, now - timedelta(hours=1)),  # queued before projects had leases
+        "new": (None, None, now),  # its process leases it right after the insert
+    }
+    ids = {}
+    async with session_factory() as s:
+        for name, (owner, expires, created) in leases.items():
+            ids[name] = await crud.create_project(s, name, "Build a notes app")
+            await s.execute(
+                update(Project).where(Project.id == ids[name]).values(lease_owner=owner, lease_expires_at=expires, created_at=created)
+            )
+        await s.commit()
+
+    assert await routes_agents.resume_unfinished_pipelines() == 2
+    assert set(service.active_projects()) == {ids["expired"], ids["legacy"]}
+    assert await routes_agents.resume_unfinished_pipelines() == 0  # now leased by this process
+
+    # Another process takes over a lease that ran out: the run stops here, the project stays unfinished
+    async with session_factory() as s:
+        await s.execute(update(Project).where(Project.id == ids["legacy"]).values(lease_owner="api-c", lease_expires_at=now + timedelta(seconds=30)))
+        await s.commit()
+    await routes_agents._renew_leases()
+    await asyncio.sleep(0.05)
+    assert service.active_projects() == [ids["expired"]]
+
+    # A shutdown hands the rest over at once
+    await service.stop()
+    await routes_agents.release_pipeline_leases()
+    await service.start()
+    monkeypatch.setattr(routes_agents, "_lease_owner", "api-d")
+    assert await routes_agents.resume_unfinished_pipelines() == 1
+    async with session_factory() as s:
+        assert (await crud.get_project(s, ids["expired"])).lease_owner == "api-d"
+        assert (await crud.get_project(s, ids["live"])).lease_owner == "api-a"
+    gate.set()
+    await service.stop()
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+
+from api.ai.agents.base_agent import AgentResult
+from api.ai.core.scheduler import PROMPT, Stage, StageScheduler
+
+
+def _diamond():
+    return [
+        Stage("A", "a", inputs=(PROMPT,)),
+        Stage("B", "b", inputs=("A",)),
+        Stage("C", "c", inputs=("A",)),
+        Stage("D", "d", inputs=("B", "C")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_run_concurrently():
+    active = 0
+    peak = 0
+
+    async def runner(stage, outputs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        parts = ["idea" if n == PROMPT else outputs[n].content for n in stage.inputs]
+        return AgentResult(agent_name=stage.name, content="\n\n".join(parts) + f"|{stage.name}")
+
+    results = await StageScheduler(_diamond(), max_parallelism=4).run(runner)
+    assert peak == 2  # B and C overlap
+    assert results["D"].content == "idea|A|B\n\nidea|A|C|D"
+
+
+@pytest.mark.asyncio
+async def test_max_parallelism_is_respected():
+    stages = [Stage(f"S{i}", "s") for i in range(5)]
+    active = 0
+    peak = 0
+
+    async def runner(stage, outputs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return AgentResult(agent_name=stage.name, content="")
+
+    await StageScheduler(stages, max_parallelism=2).run(runner)
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_keeps_partial_results_and_cancels_siblings():
+    cancelled = []
+
+    async def runner(stage, outputs):
+        if stage.name == "B":
+            raise RuntimeError("boom")
+        if stage.name == "C":
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(stage.name)
+                raise
+        return AgentResult(agent_name=stage.name, content="ok")
+
+    results = {}
+    with pytest.raises(RuntimeError):
+        await StageScheduler(_diamond()).run(runner, results)
+    assert list(results) == ["A"]
+    assert cancelled == ["C"]
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        StageScheduler([Stage("A", "a", inputs=("B",)), Stage("B", "b", inputs=("A",))])
+    with pytest.raises(ValueError):
+        StageScheduler([Stage("A", "a", inputs=("Missing",))])
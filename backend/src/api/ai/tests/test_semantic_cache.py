@@ -0,0 +1,208 @@
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.agents.llm_resilience import ResilientLLMClient
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator
+from api.ai.core.semantic_cache import SemanticCache, VectorIndex
+from api.db import crud
+from api.db.models import AgentUsage
+
+IDEAS = [
+    "Build an AI-powered note taking app that summarizes meetings",
+    "A marketplace for renting camping gear between neighbours",
+    "Mobile game where players grow a virtual garden",
+]
+
+
+class BrokenLLM(MockLLMClient):
+    """Fails with an unexpected (non-provider) error, so agents answer with their fallback."""
+
+    async def generate(self, prompt, system=None, **kwargs):
+        raise RuntimeError("unexpected client bug")
+
+    async def stream(self, prompt, system=None, **kwargs):
+        raise RuntimeError("unexpected client bug")
+        yield
+
+
+def _filled(**kwargs) -> SemanticCache:
+    cache = SemanticCache(**kwargs)
+    for idea in IDEAS:
+        cache.add("mock/Boss", idea, f"brief: {idea}")
+    return cache
+
+
+def test_reworded_input_hits_and_different_ideas_miss():
+    cache = _filled()
+    hit = cache.lookup("mock/Boss", "build an AI powered note-taking app that summarizes meetings!")
+    assert hit is not None and hit.output == f"brief: {IDEAS[0]}" and hit.similarity >= 0.9
+    assert cache.lookup("mock/Boss", "Mobile game where players grow a virtual farm") is None
+    assert cache.lookup("mock/Boss", "Dashboard for tracking a fleet of delivery trucks") is None
+    assert cache.lookup("mock/Product Manager", IDEAS[0]) is None  # other stage
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+
+# Held out: none of these pairs is in bench.semantic_threshold, which sets the default threshold
+HELD_OUT_STORED = [
+    "A bank app using cloud storage",
+    "Podcast app that transcribes episodes",
+    "Recipe app with no ads",
+    "Expense tracker for freelancers with bank sync",
+    "Travel planner that books trains and hotels",
+    "Photo sharing app for families",
+    "test taking app",
+]
+HELD_OUT_PARAPHRASES = [
+    ("Podcast app that transcribes episodes", "podcast app which transcribes the episodes"),
+    ("Travel planner that books trains and hotels", "A travel planner booking hotels and trains"),
+]
+HELD_OUT_DIFFERENT = [
+    ("A bank app using cloud storage", "a bank app not using cloud storage"),
+    ("Recipe app with no ads", "Recipe app with ads"),
+    ("Expense tracker for freelancers with bank sync", "Expense tracker for freelancers without bank sync"),
+    ("Travel planner that books trains and hotels", "Travel planner that books flights and hotels"),
+    ("Photo sharing app for families", "Photo sharing app for families, no ads"),
+    ("Photo sharing app for families", "Photo editing app for families"),
+    ("test taking app", "test app"),
+]
+
+
+def test_held_out_paraphrases_hit_and_negations_miss():
+    cache = SemanticCache()
+    for idea in HELD_OUT_STORED:
+        cache.add("mock/Boss", idea, f"brief: {idea}")
+    for stored, reworded in HELD_OUT_PARAPHRASES:
+        hit = cache.lookup("mock/Boss", reworded)
+        assert hit is not None and hit.output == f"brief: {stored}", reworded
+    for _, different in HELD_OUT_DIFFERENT:
+        assert cache.lookup("mock/Boss", different) is None, different
+
+
+def test_least_recently_used_entries_are_evicted_and_expired_ones_dropped(monkeypatch):
+    cache = _filled(max_entries=3)
+    assert cache.lookup("mock/Boss", IDEAS[0]) is not None  # now most recently used
+    cache.add("mock/Boss", "Chat app for remote teams with video calls", "brief: chat")
+    assert cache.lookup("mock/Boss", IDEAS[1]) is None
+    assert cache.lookup("mock/Boss", IDEAS[0]) is not None
+    assert len(cache) == 3 and cache.stats()["evictions"] == 1
+
+    now = __import__("time").time()
+    monkeypatch.setattr("api.ai.core.semantic_cache.time.time", lambda: now + 8 * 24 * 3600)
+    assert cache.lookup("mock/Boss", IDEAS[0]) is None
+    assert len(cache) == 0  # each expired best match was dropped in turn
+
+
+def test_an_expired_best_match_falls_back_to_the_next_live_entry():
+    cache = SemanticCache()
+    expired = cache.embedder.features("podcast app which transcribes the episodes")
+    cache._insert("mock/Boss", cache.embedder.embed(expired), "brief: stale", __import__("time").time() - 8 * 24 * 3600)
+    cache.add("mock/Boss", "Podcast app that transcribes episodes", "brief: fresh")
+    hit = cache.lookup("mock/Boss", "podcast app which transcribes the episodes")
+    assert hit is not None and hit.output == "brief: fresh"
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / "semantic.npz")
+    cache = _filled(path=path)
+    await cache.save()
+
+    restored = SemanticCache(path=path)
+    assert restored.load() == len(IDEAS)
+    hit = restored.lookup("mock/Boss", IDEAS[2])
+    assert hit is not None and hit.output == f"brief: {IDEAS[2]}" and hit.similarity == pytest.approx(1.0, abs=1e-5)
+    assert SemanticCache(path=path, dim=128).load() == 0  # vectors of another dimension are not comparable
+
+
+def test_inverted_file_search_matches_brute_force():
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((20, 64))
+    vectors = (centers[rng.integers(20, size=600)] + 0.5 * rng.standard_normal((600, 64))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = VectorIndex(64, ivf_min=256)
+    for i, v in enumerate(vectors):
+        index.add(i, v)
+    assert index.centroids is not None and len(index.lists) > index.nprobe
+
+    for i in range(0, 600, 50):
+        index.remove(i)
+    kept = np.array([i for i in range(600) if i % 50])
+    queries = vectors[kept[::7]] + 0.01 * rng.standard_normal((len(kept[::7]), 64)).astype(np.float32)
+    for query in queries / np.linalg.norm(queries, axis=1, keepdims=True):
+        best_id, similarity = index.search(query)
+        assert best_id == kept[np.argmax(vectors[kept] @ query)]
+        assert similarity == pytest.approx(float(vectors[best_id] @ query), abs=1e-5)
+
+
+@pytest.mark.asyncio
+async def test_index_is_retrained_off_the_event_loop():
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((400, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = VectorIndex(64, ivf_min=256)
+    for i in range(256):
+        index.add(i, vectors[i])
+    # The k-means runs in a thread: the add returned untrained, and the index keeps changing meanwhile
+    assert index._training is not None and index.centroids is None
+    for i in range(256, 400):
+        index.add(i, vectors[i])
+    for i in range(0, 400, 40):
+        index.remove(i)
+    await index._training
+    assert index.centroids is not None and index._training is None
+    kept = [i for i in range(400) if i % 40]
+    assert len(index) == len(kept)
+    for i in kept:
+        assert index.search(vectors[i])[0] == i
+
+
+@pytest.mark.asyncio
+async def test_reworded_resubmission_reuses_boss_and_pm_outputs(session_factory):
+    cache = SemanticCache()
+    prompts = ["Build an AI-powered note taking app that summarizes meetings", "build an AI powered note-taking app that summarizes meetings!"]
+    project_ids = []
+    for prompt in prompts:
+        async with session_factory() as s:
+            project_ids.append(await crud.create_project(s, "Notes", prompt))
+        bus = MessageBus()
+        await Orchestrator(message_bus=bus, llm=ResilientLLMClient([MockLLMClient(latency=0)]), semantic_cache=cache).run(
+            prompt=prompt, db_session_factory=session_factory, project_id=project_ids[-1], project_title="Notes"
+        )
+
+    events = []
+    async for raw in bus.subscribe(project_ids[1]):
+        events.append(json.loads(raw))
+        if events[-1]["event_type"] == "workflow_end":
+            break
+    assert [e["agent_name"] for e in events if e["event_type"] == "stage_cached"] == ["Boss", "Product Manager"]
+
+    async with session_factory() as s:
+        rows = (await s.execute(select(AgentUsage))).scalars().all()
+        first, second = ({u.agent_name: u for u in rows if u.project_id == pid} for pid in project_ids)
+        outputs = {o.agent_name: o.content for o in await crud.list_agent_outputs(s, project_ids[1])}
+    assert first["Boss"].outcome == "ok" and first["Boss"].attempts == 1
+    assert second["Boss"].outcome == "cached" and second["Boss"].attempts == 0 and second["Boss"].completion_tokens > 0
+    assert second["Product Manager"].outcome == "cached" and second["Architect"].outcome == "ok"
+    assert prompts[0] in outputs["Boss"]  # the first run's brief
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_fallback_outputs_are_not_cached(session_factory):
+    cache = SemanticCache()
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Notes", IDEAS[0])
+    await Orchestrator(message_bus=MessageBus(), llm=BrokenLLM(latency=0), semantic_cache=cache).run(
+        prompt=IDEAS[0], db_session_factory=session_factory, project_id=project_id, project_title="Notes"
+    )
+
+    async with session_factory() as s:
+        rows = (await s.execute(select(AgentUsage).where(AgentUsage.project_id == project_id))).scalars().all()
+    assert rows and {u.outcome for u in rows} == {"fallback"}
+    assert len(cache) == 0
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from api.db.database import Base, ensure_schema
+from bench.importtime import DEFAULT_FORBIDDEN, forbidden_imports, measure
+
+
+def test_app_import_leaves_sdks_and_streaming_to_first_use():
+    entries = measure("main")
+    assert forbidden_imports(entries, DEFAULT_FORBIDDEN) == []
+    assert "api.routes_usage" in {e.name for e in entries}
+
+
+def test_worker_import_does_not_build_the_api():
+    names = {e.name for e in measure("api.worker")}
+    assert "fastapi" not in names and "api.routes_agents" not in names
+
+
+@pytest.mark.asyncio
+async def test_ensure_schema_only_creates_missing_tables():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    try:
+        assert set(await ensure_schema(engine)) == set(Base.metadata.tables)
+        assert await ensure_schema(engine) == []
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP TABLE agent_usage"))
+        assert await ensure_schema(engine) == ["agent_usage"]
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_ensure_schema_adds_columns_new_to_existing_tables():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    try:
+        async with engine.begin() as conn:
+            # projects and pipeline_jobs as created before status/batch_id and cancel_requested existed
+            await conn.execute(text(
+                "CREATE TABLE projects (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, user_prompt TEXT NOT NULL, created_at DATETIME NOT NULL)"
+            ))
+            await conn.execute(text(
+                "CREATE TABLE pipeline_jobs (id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL, payload TEXT NOT NULL,"
+                " status VARCHAR(16) NOT NULL, attempts INTEGER NOT NULL, lease_owner VARCHAR(128), lease_expires_at DATETIME,"
+                " heartbeat_at DATETIME, last_error TEXT, created_at DATETIME NOT NULL, finished_at DATETIME)"
+            ))
+            await conn.execute(text("INSERT INTO projects (title, user_prompt, created_at) VALUES ('Notes', 'idea', '2025-01-01')"))
+            await conn.execute(text(
+                "INSERT INTO pipeline_jobs (project_id, payload, status, attempts, created_at) VALUES (1, '{}', 'queued', 0, '2025-01-01')"
+            ))
+        created = await ensure_schema(engine)
+        assert {"projects.status", "projects.batch_id", "pipeline_jobs.cancel_requested", "pipeline_jobs.batch_id"} <= set(created)
+        assert "projects" not in created and "pipeline_jobs" not in created
+        assert await ensure_schema(engine) == []
+        async with engine.connect() as conn:
+            row = (await conn.execute(text("SELECT status, batch_id FROM projects"))).one()
+            assert (await conn.execute(text("SELECT cancel_requested FROM pipeline_jobs"))).scalar_one() in (0, False)
+            indexes = {i["name"] for i in await conn.run_sync(lambda c: inspect(c).get_indexes("projects"))}
+        assert row == ("pending", None)
+        assert {"ix_projects_status", "ix_projects_batch_id"} <= indexes
+    finally:
+        await engine.dispose()
@@ -0,0 +1,45 @@
+from api.ai.core.token_budget import ContextBudgeter, Section, context_limit, count_tokens, TRUNCATION_MARKER
+
+
+def _report_text(n):
+    return "\n\n".join(f"Paragraph {i}. It has detail sentences that go on. And on." for i in range(n))
+
+
+def test_under_budget_input_is_left_untouched():
+    text, report = ContextBudgeter("gemini-2.5-flash").fit([Section("a", "one"), Section("b", "two")], budget=100)
+    assert text == "one\n\ntwo"
+    assert not report.compacted
+
+
+def test_repeated_paragraphs_are_dropped_from_older_sections_first():
+    shared = "## Components\n- API\n- DB"
+    old = Section("Architect", shared + "\n\nOld rationale.", priority=1)
+    new = Section("Architect (Refined)", shared + "\n\nNew rationale.", priority=2)
+    budget = count_tokens(old.text) + count_tokens(new.text) - 1
+    text, report = ContextBudgeter().fit([new, old], budget=budget)
+    assert report.applied == ["dedupe"]
+    assert text.count("## Components") == 1
+    assert "Old rationale." in text and "New rationale." in text
+
+
+def test_progressive_compaction_always_fits_budget():
+    prompt = Section("prompt", "Build an AI notes app", priority=99)
+    old = Section("old", _report_text(200), priority=1)
+    new = Section("new", "# Plan\n" + _report_text(50), priority=2)
+    text, report = ContextBudgeter().fit([new, old, prompt], budget=300)
+    assert report.tokens_after <= 300
+    assert report.tokens_before > 300
+    assert "Build an AI notes app" in text
+
+
+def test_truncate_only_as_last_resort():
+    section = Section("only", "word " * 500)
+    text, report = ContextBudgeter(strategies=["truncate"]).fit([section], budget=50)
+    assert text.endswith(TRUNCATION_MARKER)
+    assert count_tokens(text) <= 50
+
+
+def test_context_limits_resolve_by_prefix():
+    assert context_limit("gemini-2.5-flash-preview-05-20") == 1_048_576
+    assert context_limit("gpt-4o-mini") == 128_000
+    assert ContextBudgeter("gpt-3.5-turbo", reserved_output_tokens=385).max_input_tokens == 16_000
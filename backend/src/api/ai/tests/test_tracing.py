@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+import pytest
+
+from api.ai.agents.llm_cache import CachedLLMClient, ResponseCache
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.agents.llm_resilience import ResilientLLMClient
+from api.ai.core import tracing
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator, PIPELINE_STAGES
+from api.db import crud
+
+
+@pytest.fixture()
+def tracer(monkeypatch):
+    tracer = tracing.Tracer(exporters=[tracing.InMemoryExporter(max_projects=2)])
+    monkeypatch.setattr(tracing, "_tracer", tracer)
+    return tracer
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_per_project_and_record_errors(tracer):
+    with tracing.span("orphan") as orphan:
+        orphan.set("ignored", True)  # no project, no parent: a no-op span
+
+    with tracing.span("root", project_id=1, prompt_chars=10):
+        with tracing.span("child") as child:
+            child.set("attempt", 1)
+            await asyncio.sleep(0.01)
+        with pytest.raises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError("boom")
+        tracing.record("queued", 1, 0.5)
+
+    spans = {s["name"]: s for s in tracer.spans(1)}
+    assert set(spans) == {"root", "child", "failing", "queued"}
+    assert all(s["trace_id"] == "project-1" for s in spans.values())
+    assert spans["root"]["parent_id"] is None
+    assert spans["child"]["parent_id"] == spans["root"]["span_id"]
+    assert spans["child"]["attributes"] == {"attempt": 1} and spans["child"]["duration"] >= 0.01
+    assert spans["failing"]["status"] == "error" and "boom" in spans["failing"]["error"]
+    assert spans["queued"]["duration"] == pytest.approx(0.5)
+
+    view = tracing.waterfall(tracer.spans(1))
+    assert [(r["name"], r["depth"]) for r in view["spans"]] == [("root", 0), ("queued", 1), ("child", 1), ("failing", 1)]
+    assert len(view["text"].splitlines()) == 4
+
+    # Least recently traced projects are dropped
+    for pid in (2, 3):
+        with tracing.span("root", project_id=pid):
+            pass
+    assert tracer.spans(1) == [] and tracer.spans(3)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_trace_covers_stages_llm_calls_and_db_writes(tracer, session_factory):
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Traced", "Build a notes app")
+
+    cache = ResponseCache()
+    llm = CachedLLMClient(ResilientLLMClient([MockLLMClient(latency=0)]), cache)
+    await Orchestrator(message_bus=MessageBus(), llm=llm).run(
+        prompt="Build a notes app", db_session_factory=session_factory, project_id=project_id, project_title="Traced"
+    )
+
+    spans = tracer.spans(project_id)
+    by_id = {s["span_id"]: s for s in spans}
+    root = next(s for s in spans if s["name"] == "run_pipeline")
+    assert root["parent_id"] is None and root["attributes"]["outcome"] == "completed"
+
+    stages = [s for s in spans if s["name"].startswith("stage:")]
+    assert len(stages) == len(PIPELINE_STAGES)
+    assert all(s["parent_id"] == root["span_id"] for s in stages)
+
+    def stage_of(span):
+        while not span["name"].startswith("stage:"):
+            span = by_id[span["parent_id"]]
+        return span["attributes"]["stage"]
+
+    llm_calls = [s for s in spans if s["name"] == "llm.stream"]
+    writes = [s for s in spans if s["name"] == "crud.add_agent_output"]
+    lookups = [s for s in spans if s["name"] == "llm.cache_lookup"]
+    ran = {s["attributes"]["stage"] for s in stages if not s["attributes"].get("skipped")}
+    assert {stage_of(s) for s in llm_calls} == ran
+    assert all(s["attributes"]["attempt"] == 1 and s["attributes"]["output_chars"] > 0 for s in llm_calls)
+    assert {stage_of(s) for s in writes} == {s.name for s in PIPELINE_STAGES}
+    assert lookups and all(s["attributes"]["hit"] is False for s in lookups)
+
+
+@pytest.mark.asyncio
+async def test_trace_endpoint_serves_a_waterfall(tracer, tmp_path):
+    import httpx
+    from main import app
+
+    exporter = tracing.JSONLExporter(str(tmp_path / "spans.jsonl"))
+    tracer.exporters.append(exporter)
+    with tracing.span("run_pipeline", project_id=7):
+        with tracing.span("stage:Boss"):
+            pass
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        data = (await client.get("/api/agents/trace/7")).json()
+        text = (await client.get("/api/agents/trace/7", params={"format": "text"})).text
+        missing = await client.get("/api/agents/trace/8")
+
+    assert data["trace_id"] == "project-7"
+    assert [r["name"] for r in data["spans"]] == ["run_pipeline", "stage:Boss"]
+    assert "  stage:Boss" in text
+    assert missing.status_code == 404
+
+    # The JSONL file holds the same spans, e.g. for workers in other processes
+    exporter.flush()
+    lines = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+    assert {line["name"] for line in lines} == {"run_pipeline", "stage:Boss"}
+    assert tracing.JSONLExporter(str(tmp_path / "spans.jsonl")).spans(7) == lines
+
+
+def test_jsonl_spans_are_written_off_the_calling_thread_and_partial_lines_skipped(tracer, tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    path.write_text('{"project_id": 5, "name": "written by a worker"}\n{"project_id": 5, "na\n')  # cut short by a crash
+    writers = []
+
+    def recording_open(*args, **kwargs):
+        writers.append(threading.current_thread().name)
+        return open(*args, **kwargs)
+
+    exporter = tracing.JSONLExporter(str(path))
+    monkeypatch.setattr(tracing, "open", recording_open, raising=False)
+    tracer.exporters.append(exporter)
+    with tracing.span("run_pipeline", project_id=5):
+        pass
+    exporter.flush()
+    assert writers == ["tracing-jsonl"]
+
+    assert [s["name"] for s in exporter.spans(5)] == ["written by a worker", "run_pipeline"]
+    exporter.close()
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from api.ai.agents.llm_client import MockLLMClient
+from api.ai.agents.llm_resilience import ResilientLLMClient
+from api.ai.core.message_bus import MessageBus
+from api.ai.core.orchestrator import Orchestrator, PIPELINE_STAGES
+from api.ai.core.usage import StageUsage, estimate_cost
+from api.db import crud
+from api.db.models import AgentOutput, AgentUsage
+
+
+def test_cost_estimates():
+    assert estimate_cost("gemini-2.5-flash", 1_000_000, 0) == pytest.approx(0.30)
+    assert estimate_cost("gemini-2.5-flash-lite-preview", 0, 1_000_000) == pytest.approx(0.40)  # longest prefix wins
+    assert estimate_cost("unknown-model", 10, 10) is None
+    assert StageUsage(model="gpt-4o", prompt_tokens=1000, completion_tokens=1000).cost_usd == 0.0  # cache hit: no request made
+
+
+@pytest.mark.asyncio
+async def test_pipeline_records_usage_per_stage(session_factory):
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Costed", "Build a notes app")
+
+    llm = ResilientLLMClient([MockLLMClient(latency=0)])
+    await Orchestrator(message_bus=MessageBus(), llm=llm, max_parallelism=1).run(
+        prompt="Build a notes app", db_session_factory=session_factory, project_id=project_id, project_title="Costed", queue_wait=1.5
+    )
+
+    async with session_factory() as s:
+        outputs = await crud.list_agent_outputs(s, project_id)
+        usage = await crud.project_usage(s, project_id)
+
+    assert len(outputs) == len(PIPELINE_STAGES)
+    by_stage = {row["agent_name"]: row for row in usage["stages"]}
+    assert set(by_stage) == {s.name for s in PIPELINE_STAGES}
+    ran = [row for row in by_stage.values() if row["attempts"]]
+    assert ran and all(row["prompt_tokens"] > 0 and row["completion_tokens"] > 0 for row in ran)
+    assert all(row["cost_usd"] == 0.0 for row in by_stage.values())  # the mock is free
+    # Boss waited for the run's worker; later stages only for a parallelism slot
+    assert by_stage["Boss"]["queue_wait_seconds"] == pytest.approx(1.5, abs=0.05)
+    assert usage["totals"]["stage_runs"] == len(PIPELINE_STAGES)
+    assert usage["totals"]["completion_tokens"] == sum(row["completion_tokens"] for row in by_stage.values())
+
+
+@pytest.mark.asyncio
+async def test_usage_row_details_and_percentiles_in_sql(session_factory):
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Stats", "x")
+        usage = StageUsage(provider="gemini", model="gemini-2.5-flash", attempts=2, prompt_tokens=1000, completion_tokens=500, llm_seconds=3.0)
+        output_id = await crud.add_agent_output(s, project_id, "Boss", "brief", usage=usage)
+        row = await s.get(AgentUsage, 1)
+        assert row.agent_output_id == output_id and row.model == "gemini-2.5-flash" and row.attempts == 2
+        assert row.cost_usd == pytest.approx((1000 * 0.30 + 500 * 2.50) / 1e6)
+
+        # 100 Engineer runs of 1..100 seconds, spread over two days
+        day = datetime.utcnow().replace(hour=12)
+        for i in range(1, 101):
+            rec = AgentOutput(project_id=project_id, agent_name="Engineer", content="code")
+            rec.usage = AgentUsage(
+                project_id=project_id, agent_name="Engineer", outcome="ok", attempts=1, llm_seconds=float(i),
+                created_at=day - timedelta(days=i % 2),
+            )
+            s.add(rec)
+        await s.commit()
+
+        agents = {a["agent_name"]: a for a in await crud.usage_by_agent(s)}
+        daily = await crud.usage_by_day(s, since=day - timedelta(days=5))
+
+    engineer = agents["Engineer"]
+    assert engineer["stage_runs"] == 100 and engineer["llm_seconds"] == pytest.approx(5050)
+    assert (engineer["llm_seconds_p50"], engineer["llm_seconds_p95"], engineer["llm_seconds_p99"]) == (50, 95, 99)
+    assert agents["Boss"]["llm_seconds_p50"] == 3.0 and agents["Boss"]["attempts"] == 2
+
+    assert [d["stage_runs"] for d in daily] == [50, 51]  # odd runs yesterday; even runs and Boss today
+    assert daily[0]["llm_seconds_p50"] == 49 and daily[1]["projects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_usage_endpoints(session_factory):
+    from main import app
+    from api import routes_usage
+
+    async with session_factory() as s:
+        project_id = await crud.create_project(s, "Api", "x")
+        await crud.add_agent_output(s, project_id, "Engineer", "code", usage=StageUsage(model="mock", attempts=1, llm_seconds=2.0))
+        await crud.add_agent_output(s, project_id, "Boss", "brief", usage=StageUsage(model="mock", attempts=1, llm_seconds=1.0))
+
+    async def session():
+        async with session_factory() as s:
+            yield s
+
+    app.dependency_overrides[routes_usage._get_session] = session
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            project = (await client.get(f"/api/usage/projects/{project_id}")).json()
+            agents = (await client.get("/api/usage/agents", params={"days": 1})).json()
+            daily = (await client.get("/api/usage/daily")).json()
+            missing = await client.get("/api/usage/projects/999")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [s["agent_name"] for s in project["stages"]] == ["Boss", "Engineer"]  # pipeline order
+    assert project["totals"]["llm_seconds"] == pytest.approx(3.0)
+    assert {a["agent_name"] for a in agents["agents"]} == {"Boss", "Engineer"}
+    assert daily["daily"][0]["stage_runs"] == 2
+    assert missing.status_code == 404
@@ -16,6 +16,64 @@ class Settings:
     # OpenAI / Provider config (agents.llm_client.OpenAIClient)
     GEMINI_API_KEY: Optional[str] = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+    OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL_NAME", "gpt-4o")
+    # Provider to fail over to when the primary's circuit is open: "" | "openai" | "mock"
+    LLM_FALLBACK_PROVIDER: str = os.getenv("LLM_FALLBACK_PROVIDER", "")
+    # "native": async HTTP clients over one pooled keep-alive connection pool (api.ai.agents.llm_http);
+    # "sdk": the vendor SDKs, whose blocking calls run in the default thread pool
+    LLM_HTTP_CLIENT: str = os.getenv("LLM_HTTP_CLIENT", "native")
+    GEMINI_BASE_URL: str = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    # Longest silence while waiting for (the next chunk of) a response; stage deadlines cut it shorter
+    LLM_HTTP_READ_TIMEOUT: float = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "120"))
+    # Used when the `h2` package is installed (pip install "httpx[http2]")
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+
+    # Many-prompt calls (LLMClient.generate_many): prompts in flight at once, and the batch size from
+    # which the native HTTP clients submit one provider batch job instead (0 = never). Batch jobs are
+    # cheaper and metered apart from interactive traffic but finish in minutes to hours: meant for
+    # evaluation runs, not pipeline stages. Job status is polled every POLL_SECONDS
+    LLM_BATCH_CONCURRENCY: int = int(os.getenv("LLM_BATCH_CONCURRENCY", "8"))
+    LLM_NATIVE_BATCH_MIN_PROMPTS: int = int(os.getenv("LLM_NATIVE_BATCH_MIN_PROMPTS", "0"))
+    LLM_BATCH_POLL_SECONDS: float = float(os.getenv("LLM_BATCH_POLL_SECONDS", "10"))
+
+
+    # Routing over several keys and models (api.ai.agents.llm_router), used once more than one
+    # backend is configured: every key (GEMINI_API_KEY plus the comma-separated GEMINI_API_KEYS)
+    # times every model of GEMINI_MODELS (default GEMINI_MODEL); OpenAI likewise when listed in
+    # LLM_ROUTER_PROVIDERS
+    LLM_ROUTER_PROVIDERS: str = os.getenv("LLM_ROUTER_PROVIDERS", "gemini")
+    GEMINI_API_KEYS: str = os.getenv("GEMINI_API_KEYS", "")
+    GEMINI_MODELS: str = os.getenv("GEMINI_MODELS", "")
+    OPENAI_API_KEYS: str = os.getenv("OPENAI_API_KEYS", "")
+    OPENAI_MODELS: str = os.getenv("OPENAI_MODELS", "")
+    # Relative share of traffic by model or provider, e.g. "gemini-2.5-pro=0.5,openai=2"
+    LLM_ROUTER_WEIGHTS: str = os.getenv("LLM_ROUTER_WEIGHTS", "")
+    # Models a stage may use (alternatives separated by "|"; "Engineer" also covers
+    # "Engineer (Final)"), e.g. "Boss=gemini-2.5-flash-lite,Engineer=gemini-2.5-pro"
+    LLM_STAGE_MODELS: str = os.getenv("LLM_STAGE_MODELS", "")
+    # Consecutive transient failures that eject a backend, and its first cool-down (doubles on repeat)
+    LLM_ROUTER_EJECT_FAILURES: int = int(os.getenv("LLM_ROUTER_EJECT_FAILURES", "3"))
+    LLM_ROUTER_EJECT_SECONDS: float = float(os.getenv("LLM_ROUTER_EJECT_SECONDS", "30"))
+
+
+    # Model cascade (api.ai.agents.llm_cascade): the listed stages ("Architect" also covers its
+    # refinements) first ask LLM_CASCADE_MODEL ("model" of the primary provider or "provider:model";
+    # empty disables) and escalate to the regular model when the answer fails a local check
+    LLM_CASCADE_MODEL: str = os.getenv("LLM_CASCADE_MODEL", "")
+    LLM_CASCADE_STAGES: str = os.getenv("LLM_CASCADE_STAGES", "Boss,Product Manager,Architect,Project Manager,QA")
+    # Shortest cheap-tier answer accepted (characters)
+    LLM_CASCADE_MIN_CHARS: int = int(os.getenv("LLM_CASCADE_MIN_CHARS", "200"))
+
+
+    # Per-stage usage accounting (api.ai.core.usage): USD per million input/output tokens, overriding or
+    # adding to the built-in price list, e.g. "gemini-2.5-flash=0.30/2.50,my-model=1/4"
+    LLM_PRICES: str = os.getenv("LLM_PRICES", "")
 
 
     # App
@@ -23,6 +81,114 @@ class Settings:
     ENV: str = os.getenv("ENV", "development")
 
 
+    # Pipeline
+    # Max number of independent stages executed concurrently per project run
+    PIPELINE_MAX_PARALLELISM: int = int(os.getenv("PIPELINE_MAX_PARALLELISM", "4"))
+    # Token budget for the upstream context fed into each stage, and how to compact it when over
+    PIPELINE_STAGE_INPUT_TOKENS: int = int(os.getenv("PIPELINE_STAGE_INPUT_TOKENS", "8000"))
+    PROMPT_COMPACTION_STRATEGIES: str = os.getenv("PROMPT_COMPACTION_STRATEGIES", "dedupe,structured,summarize,truncate")
+    # Early exit for refinement loops: "diff" | "embedding" | "off", and the similarity that counts as converged
+    CONVERGENCE_METHOD: str = os.getenv("CONVERGENCE_METHOD", "diff")
+    CONVERGENCE_THRESHOLD: float = float(os.getenv("CONVERGENCE_THRESHOLD", "0.95"))
+    # Time budgets (0 disables): wall-clock deadline of a run from its start, the cap on any single
+    # stage's share of it, and the limit on one pipeline database call (separate, so a stage that
+    # used up its budget can still save its degraded result)
+    PIPELINE_DEADLINE_SECONDS: float = float(os.getenv("PIPELINE_DEADLINE_SECONDS", "900"))
+    PIPELINE_STAGE_TIMEOUT_SECONDS: float = float(os.getenv("PIPELINE_STAGE_TIMEOUT_SECONDS", "180"))
+    PIPELINE_DB_TIMEOUT_SECONDS: float = float(os.getenv("PIPELINE_DB_TIMEOUT_SECONDS", "15"))
+    # Bounded worker pool executing pipelines, and how many runs may wait for it
+    PIPELINE_WORKERS: int = int(os.getenv("PIPELINE_WORKERS", "4"))
+    PIPELINE_QUEUE_DEPTH: int = int(os.getenv("PIPELINE_QUEUE_DEPTH", "100"))
+    # Batch submissions: runs of one batch executing at once (default), the share of workers
+    # batches may use (0 = all but one, never more; a single worker alternates between batch
+    # and interactive runs), and the size limits of a batch and of all queued batch runs
+    PIPELINE_BATCH_CONCURRENCY: int = int(os.getenv("PIPELINE_BATCH_CONCURRENCY", "2"))
+    PIPELINE_BATCH_WORKERS: int = int(os.getenv("PIPELINE_BATCH_WORKERS", "0"))
+    PIPELINE_BATCH_MAX_PROMPTS: int = int(os.getenv("PIPELINE_BATCH_MAX_PROMPTS", "500"))
+    PIPELINE_BATCH_QUEUE_DEPTH: int = int(os.getenv("PIPELINE_BATCH_QUEUE_DEPTH", "5000"))
+    # "inline": pipelines run on this API process's worker pool; "worker": /run only writes a
+    # job row and separate `python -m api.worker` processes claim and execute it
+    PIPELINE_EXECUTION_MODE: str = os.getenv("PIPELINE_EXECUTION_MODE", "inline")
+    # Worker mode: lease length (renewed by heartbeats every third of it; inline mode leases
+    # projects for as long), claims before a job is failed as poison, per-process
+    # concurrency, idle poll interval, drain time on shutdown
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+    WORKER_SHUTDOWN_GRACE_SECONDS: float = float(os.getenv("WORKER_SHUTDOWN_GRACE_SECONDS", "30"))
+    # Cancel a run once its last SSE subscriber disconnected and nobody reconnected within the
+    # grace period (default for GET /stream; `?cancel_on_disconnect=` overrides it per stream)
+    PIPELINE_CANCEL_ON_DISCONNECT: bool = os.getenv("PIPELINE_CANCEL_ON_DISCONNECT", "false").lower() == "true"
+    PIPELINE_DISCONNECT_GRACE_SECONDS: float = float(os.getenv("PIPELINE_DISCONNECT_GRACE_SECONDS", "30"))
+    # How often SSE streams poll the database for progress made by workers
+    PIPELINE_EVENTS_POLL_INTERVAL: float = float(os.getenv("PIPELINE_EVENTS_POLL_INTERVAL", "0.5"))
+    # Resume projects that never reached workflow_end when the backend starts, and, while it
+    # runs, those whose lease expired because the process running them is gone (inline mode)
+    PIPELINE_RESUME_ON_STARTUP: bool = os.getenv("PIPELINE_RESUME_ON_STARTUP", "true").lower() == "true"
+
+
+    # LLM response cache (memory LRU + optional SQLite file; empty path disables the file tier)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "./.cache/llm_cache.sqlite3")
+    LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+    LLM_CACHE_MAX_MEMORY_BYTES: int = int(os.getenv("LLM_CACHE_MAX_MEMORY_BYTES", str(64 * 1024 * 1024)))
+    LLM_CACHE_MAX_DISK_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "100000"))
+
+
+    # Semantic stage cache (api.ai.core.semantic_cache): the listed stages reuse the output of an
+    # earlier run whose stage input is at least THRESHOLD similar (hashed content-word tf-idf cosine),
+    # so reworded resubmissions skip the LLM call. The similarity is lexical: swapping one content
+    # word of a longer idea still scores ~0.8, hence 0.85 (calibrated with bench.semantic_threshold).
+    # Saved to PATH (.npz; empty keeps it in memory only)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_STAGES: str = os.getenv("SEMANTIC_CACHE_STAGES", "Boss,Product Manager")
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+    SEMANTIC_CACHE_TTL_SECONDS: float = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    SEMANTIC_CACHE_DIM: int = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+    SEMANTIC_CACHE_PATH: str = os.getenv("SEMANTIC_CACHE_PATH", "./.cache/semantic_cache.npz")
+
+
+    # Provider rate limits shared by all pipelines of this process (0 disables a dimension);
+    # OUTPUT_TOKENS is the completion size reserved up front and settled after each call
+    LLM_RATE_LIMIT_ENABLED: bool = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() == "true"
+    LLM_RATE_LIMIT_RPM: int = int(os.getenv("LLM_RATE_LIMIT_RPM", "60"))
+    LLM_RATE_LIMIT_TPM: int = int(os.getenv("LLM_RATE_LIMIT_TPM", "1000000"))
+    LLM_RATE_LIMIT_OUTPUT_TOKENS: int = int(os.getenv("LLM_RATE_LIMIT_OUTPUT_TOKENS", "1024"))
+
+
+    # Retries of transient provider errors (jittered backoff, capped to a share of traffic)
+    # and the circuit breaker that fails fast once a provider keeps failing
+    LLM_RETRY_MAX_ATTEMPTS: int = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+    LLM_RETRY_BUDGET_RATIO: float = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RECOVERY_SECONDS: float = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+
+
+    # Hedged LLM requests: duplicate a call still running past the given latency quantile,
+    # using INITIAL_DELAY until enough latencies are known; MAX_RATE caps the share of hedged calls
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_QUANTILE: float = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+    LLM_HEDGE_INITIAL_DELAY: float = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "2.0"))
+    LLM_HEDGE_MAX_RATE: float = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+
+
+    # Identical LLM requests (same provider, model, system, prompt and parameters, ignoring
+    # whitespace) made while one is already in flight wait for its result instead of calling again
+    LLM_COALESCE_ENABLED: bool = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+
+
+    # Tracing spans per project, kept in memory for the last MAX_PROJECTS projects
+    # (GET /api/agents/trace/{id}); JSONL_PATH also appends every span to a file
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACING_MAX_PROJECTS: int = int(os.getenv("TRACING_MAX_PROJECTS", "200"))
+    TRACING_JSONL_PATH: str = os.getenv("TRACING_JSONL_PATH", "")
+
+
     # Prompt templates folder
     PROMPTS_DIR: str = os.getenv("PROMPTS_DIR", "config/prompts")
 
@@ -2,10 +2,13 @@
 
 ## `db/crud.py`
 
-from typing import List, Optional
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, case, distinct, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from .models import Project, AgentOutput
+from api.ai.core import tracing
+from api.ai.core.usage import StageUsage
+from .models import Batch, Project, AgentOutput, AgentUsage, ProjectStatus
 
 async def create_project(db: AsyncSession, title: str, user_prompt: str) -> int:
     proj = Project(title=title, user_prompt=user_prompt)
@@ -14,19 +17,211 @@ async def create_project(db: AsyncSession, title: str, user_prompt: str) -> int:
     await db.refresh(proj)
     return proj.id
 
-async def add_agent_output(db: AsyncSession, project_id: int, agent_name: str, content: str) -> int:
-    rec = AgentOutput(project_id=project_id, agent_name=agent_name, content=content)
-    db.add(rec)
-    await db.commit()
-    await db.refresh(rec)
-    return rec.id
+async def add_agent_output(db: AsyncSession, project_id: int, agent_name: str, content: str, usage: Optional[StageUsage] = None) -> int:
+    with tracing.span("crud.add_agent_output", project_id=project_id, agent_name=agent_name, content_chars=len(content)):
+        rec = AgentOutput(project_id=project_id, agent_name=agent_name, content=content)
+        if usage is not None:
+            # Same transaction: an output is never saved without its usage row
+            rec.usage = AgentUsage(
+                project_id=project_id,
+                agent_name=agent_name,
+                provider=usage.provider,
+                model=usage.model,
+                outcome=usage.outcome,
+                attempts=usage.attempts,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                llm_seconds=usage.llm_seconds,
+                queue_wait_seconds=usage.queue_wait_seconds,
+                cost_usd=usage.cost_usd,
+            )
+        db.add(rec)
+        await db.flush()
+        output_id = rec.id
+        await db.commit()
+        return output_id
 
 async def get_project(db: AsyncSession, project_id: int) -> Optional[Project]:
     res = await db.execute(select(Project).where(Project.id == project_id))
     return res.scalar_one_or_none()
 
+async def set_project_status(db: AsyncSession, project_id: int, status: str, unless: Optional[str] = None) -> bool:
+    """Set the status, leaving the row alone if it currently is `unless`; returns whether it changed."""
+    query = update(Project).where(Project.id == project_id)
+    if unless is not None:
+        query = query.where(Project.status != unless)
+    res = await db.execute(query.values(status=status))
+    await db.commit()
+    return res.rowcount == 1
+
+async def cancel_project(db: AsyncSession, project_id: int) -> bool:
+    """Mark an unfinished project cancelled; False if it already finished."""
+    res = await db.execute(
+        update(Project)
+        .where(Project.id == project_id, Project.status.in_(ProjectStatus.UNFINISHED))
+        .values(status=ProjectStatus.CANCELLED)
+    )
+    await db.commit()
+    return res.rowcount == 1
+
+async def list_projects_by_status(db: AsyncSession, statuses: Sequence[str]) -> List[Project]:
+    res = await db.execute(select(Project).where(Project.status.in_(statuses)).order_by(Project.created_at))
+    return list(res.scalars().all())
+
+async def list_orphaned_projects(db: AsyncSession, lease_seconds: float) -> List[Project]:
+    """Unfinished projects whose lease expired; never leased ones only once they are a lease old."""
+    now = datetime.utcnow()
+    res = await db.execute(
+        select(Project)
+        .where(
+            Project.status.in_(ProjectStatus.UNFINISHED),
+            or_(
+                Project.lease_expires_at < now,
+                # Just created: the submitting process takes the lease right after the insert
+                and_(Project.lease_expires_at.is_(None), Project.created_at < now - timedelta(seconds=lease_seconds)),
+            ),
+        )
+        .order_by(Project.created_at)
+    )
+    return list(res.scalars().all())
+
+async def lease_projects(db: AsyncSession, project_ids: Sequence[int], owner: str, lease_seconds: float) -> List[int]:
+    """Take or renew the lease of each project unless another owner's is still live; returns the ids `owner` holds."""
+    if not project_ids:
+        return []
+    now = datetime.utcnow()
+    await db.execute(
+        update(Project)
+        .where(
+            Project.id.in_(project_ids),
+            or_(Project.lease_owner.is_(None), Project.lease_owner == owner, Project.lease_expires_at < now),
+        )
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    )
+    await db.commit()
+    res = await db.execute(select(Project.id).where(Project.id.in_(project_ids), Project.lease_owner == owner))
+    return list(res.scalars().all())
+
+async def expire_project_leases(db: AsyncSession, owner: str) -> int:
+    """Let other processes resume `owner`'s unfinished projects right away (shutdown)."""
+    res = await db.execute(
+        update(Project)
+        .where(Project.lease_owner == owner, Project.status.in_(ProjectStatus.UNFINISHED))
+        .values(lease_expires_at=datetime.utcnow())
+    )
+    await db.commit()
+    return res.rowcount
+
 async def list_agent_outputs(db: AsyncSession, project_id: int) -> List[AgentOutput]:
-    res = await db.execute(select(AgentOutput).where(AgentOutput.project_id == project_id).order_by(AgentOutput.created_at))
+    res = await db.execute(select(AgentOutput).where(AgentOutput.project_id == project_id).order_by(AgentOutput.created_at, AgentOutput.id))
+    return list(res.scalars().all())
+
+async def list_agent_outputs_after(db: AsyncSession, project_id: int, after_id: int) -> List[AgentOutput]:
+    """Outputs persisted since `after_id`, in insertion order (for polling)."""
+    res = await db.execute(
+        select(AgentOutput).where(AgentOutput.project_id == project_id, AgentOutput.id > after_id).order_by(AgentOutput.id)
+    )
+    return list(res.scalars().all())
+
+async def create_batch(db: AsyncSession, title: str, prompts: Sequence[str], concurrency: int) -> Tuple[int, List[int]]:
+    """Create a batch and one project per prompt in a single transaction."""
+    batch = Batch(title=title, concurrency=concurrency)
+    db.add(batch)
+    await db.flush()
+    projects = [
+        Project(title=f"{title} #{i + 1}", user_prompt=prompt, batch_id=batch.id) for i, prompt in enumerate(prompts)
+    ]
+    db.add_all(projects)
+    await db.flush()
+    ids = [p.id for p in projects]
+    await db.commit()
+    return batch.id, ids
+
+async def get_batch(db: AsyncSession, batch_id: int) -> Optional[Batch]:
+    res = await db.execute(select(Batch).where(Batch.id == batch_id))
+    return res.scalar_one_or_none()
+
+async def list_batch_projects(db: AsyncSession, batch_id: int) -> List[Project]:
+    res = await db.execute(select(Project).where(Project.batch_id == batch_id).order_by(Project.id))
     return list(res.scalars().all())
 
+async def batch_status_counts(db: AsyncSession, batch_id: int) -> Dict[str, int]:
+    res = await db.execute(
+        select(Project.status, func.count(Project.id)).where(Project.batch_id == batch_id).group_by(Project.status)
+    )
+    return {status: count for status, count in res.all()}
+
+# --------------------- Usage aggregation (computed in SQL) ---------------------
+USAGE_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _usage_totals(table) -> List[Any]:
+    return [
+        func.count().label("stage_runs"),
+        func.coalesce(func.sum(table.c.attempts), 0).label("attempts"),
+        func.coalesce(func.sum(table.c.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(table.c.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(table.c.cost_usd), 0.0).label("cost_usd"),
+        func.coalesce(func.sum(table.c.llm_seconds), 0.0).label("llm_seconds"),
+        func.coalesce(func.sum(table.c.queue_wait_seconds), 0.0).label("queue_wait_seconds"),
+    ]
+
+
+def _ranked_usage(group_by: Sequence[Any], where: Sequence[Any]):
+    """AgentUsage rows with each row's rank of llm_seconds within its group (for percentiles)."""
+    return (
+        select(
+            *group_by,
+            AgentUsage.project_id,
+            AgentUsage.attempts,
+            AgentUsage.prompt_tokens,
+            AgentUsage.completion_tokens,
+            AgentUsage.cost_usd,
+            AgentUsage.llm_seconds,
+            AgentUsage.queue_wait_seconds,
+            func.row_number().over(partition_by=list(group_by), order_by=AgentUsage.llm_seconds).label("rank"),
+            func.count().over(partition_by=list(group_by)).label("group_size"),
+        )
+        .where(*where)
+        .subquery()
+    )
+
+
+def _percentiles(ranked) -> List[Any]:
+    # Nearest-rank percentile: the smallest value whose rank reaches q * n (portable: no percentile_cont in SQLite)
+    return [
+        func.min(case((ranked.c.rank >= q * ranked.c.group_size, ranked.c.llm_seconds))).label(f"llm_seconds_p{round(q * 100)}")
+        for q in USAGE_QUANTILES
+    ]
+
+
+async def _usage_groups(db: AsyncSession, group_by: Sequence[Any], where: Sequence[Any], extra=()) -> List[Dict[str, Any]]:
+    ranked = _ranked_usage(group_by, where)
+    keys = [ranked.c[col.name] for col in group_by]
+    res = await db.execute(
+        select(*keys, *_usage_totals(ranked), *_percentiles(ranked), *[e(ranked) for e in extra])
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    return [dict(row._mapping) for row in res.all()]
+
+
+async def project_usage(db: AsyncSession, project_id: int) -> Dict[str, Any]:
+    """Per-stage and total usage of a project."""
+    where = [AgentUsage.project_id == project_id]
+    stages = await _usage_groups(db, [AgentUsage.agent_name], where)
+    totals = select(*_usage_totals(AgentUsage.__table__)).where(*where)
+    return {"stages": stages, "totals": dict((await db.execute(totals)).one()._mapping)}
+
+
+async def usage_by_agent(db: AsyncSession, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Usage and llm_seconds percentiles per agent (stage name) across projects."""
+    where = [AgentUsage.created_at >= since] if since is not None else []
+    return await _usage_groups(db, [AgentUsage.agent_name], where)
+
 
+async def usage_by_day(db: AsyncSession, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Usage and llm_seconds percentiles per calendar day (UTC)."""
+    where = [AgentUsage.created_at >= since] if since is not None else []
+    day = func.date(AgentUsage.created_at).label("day")
+    return await _usage_groups(db, [day], where, extra=[lambda r: func.count(distinct(r.c.project_id)).label("projects")])
@@ -1,9 +1,41 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from .database import Base
 
 
+class ProjectStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    # Pipelines in these states never reached workflow_end
+    UNFINISHED = (PENDING, RUNNING)
+
+
+class JobStatus:
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Batch(Base):
+    __tablename__ = "batches"
+
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(255), nullable=False)
+    concurrency = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+    projects = relationship("Project", back_populates="batch")
+
+
 class Project(Base):
     __tablename__ = "projects"
 
@@ -11,10 +43,17 @@ class Project(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
     user_prompt = Column(Text, nullable=False)
+    status = Column(String(32), nullable=False, default=ProjectStatus.PENDING, server_default=ProjectStatus.PENDING, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Inline mode: the API process that queued or runs the project, renewed while it does;
+    # only projects whose lease expired are resumed by another process
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
     outputs = relationship("AgentOutput", back_populates="project", cascade="all, delete-orphan")
+    batch = relationship("Batch", back_populates="projects")
 
 
 class AgentOutput(Base):
@@ -28,4 +67,57 @@ class AgentOutput(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
-    project = relationship("Project", back_populates="outputs")
\ No newline at end of file
+    project = relationship("Project", back_populates="outputs")
+    usage = relationship("AgentUsage", back_populates="output", uselist=False, cascade="all, delete-orphan")
+
+
+class AgentUsage(Base):
+    """LLM usage of the stage run that produced an AgentOutput (tokens are estimates)."""
+    __tablename__ = "agent_usage"
+
+
+    id = Column(Integer, primary_key=True, index=True)
+    agent_output_id = Column(Integer, ForeignKey("agent_outputs.id", ondelete="CASCADE"), nullable=False, unique=True)
+    # Copied from the output so aggregations need no join
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    agent_name = Column(String(128), nullable=False, index=True)
+    provider = Column(String(64), nullable=True)
+    model = Column(String(128), nullable=True)
+    # ok | error | timeout | skipped | cached | fallback (see api.ai.core.usage.StageOutcome)
+    outcome = Column(String(16), nullable=False)
+    # Provider requests made; 0 when answered from the response cache
+    attempts = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    llm_seconds = Column(Float, nullable=False, default=0.0)
+    # Ready to started: waiting for a parallelism slot, plus the run's admission queue for first stages
+    queue_wait_seconds = Column(Float, nullable=False, default=0.0)
+    # NULL when the model has no known price
+    cost_usd = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+    output = relationship("AgentOutput", back_populates="usage")
+
+
+class PipelineJobRecord(Base):
+    """Durable pipeline run request, claimed by out-of-process workers (api.worker)."""
+    __tablename__ = "pipeline_jobs"
+
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id", ondelete="SET NULL"), nullable=True, index=True)
+    # JSON-encoded Orchestrator.run keyword arguments
+    payload = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default=JobStatus.QUEUED, server_default=JobStatus.QUEUED, index=True)
+    # Incremented on every claim; also fences heartbeats/completions of a stale lease holder
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    # Set by POST /cancel while the job is leased; the owning worker stops the run
+    cancel_requested = Column(Boolean, nullable=False, default=False, server_default="0")
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
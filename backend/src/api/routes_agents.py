@@ -1,14 +1,32 @@
+from collections import defaultdict
+from typing import AsyncGenerator, Dict, List, Optional
 import asyncio
-from typing import AsyncGenerator, List
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from sse_starlette.sse import EventSourceResponse
+import json
+import os
+import socket
+import uuid
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import PlainTextResponse
 from api.ai.core.message_bus import MessageBus
-from api.ai.core.orchestrator import Orchestrator
-from api.ai.agents.llm_client import MockLLMClient, GeminiClient
+from api.ai.core.metrics import gauge
+from api.ai.core import tracing
+from api.ai.core.orchestrator import Orchestrator, STAGE_ERROR_PREFIX
+from api.ai.core.pipeline_service import QueueFullError, ServiceUnavailableError, get_pipeline_service
+from api.ai.core.job_queue import get_job_queue
+from api.ai.agents.llm_cache import get_response_cache
+from api.ai.agents.llm_ratelimit import rate_limiter_stats
+from api.ai.agents.llm_resilience import CircuitOpenError, circuit_stats, open_circuit_retry_after
+from api.ai.agents.llm_hedging import hedge_stats_by_model
+from api.ai.agents.llm_router import router_stats
+from api.ai.agents.llm_cascade import cascade_stats
+from api.ai.agents.llm_stack import build_llm_client, provider_specs
 from api.config.settings import get_settings
 from api.db.database import AsyncSessionLocal
 from api.db import crud 
+from api.db.models import JobStatus, ProjectStatus
+from api.ai.core.utils import get_logger
 from api.ai.schemas.project_request import ProjectCreate
+from api.ai.schemas.batch_request import BatchCreate, BatchProgress
 router = APIRouter()
 
 
@@ -29,12 +47,38 @@ router = APIRouter()
 # # Shared singletons
 _settings = get_settings()
 _message_bus = MessageBus()
+# Batch-level events, keyed by batch id
+_batch_bus = MessageBus()
+_pipeline_service = get_pipeline_service()
+# Worker mode: runs are durable jobs executed by `python -m api.worker` processes
+_job_queue = get_job_queue()
+# Inline mode: owner of this process's project leases; unique per start, so a restarted
+# container does not take the leases of its previous run for its own
+_lease_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Open SSE streams per project, and the pending auto-cancels of projects that have none
+_subscribers: Dict[int, int] = defaultdict(int)
+_disconnect_timers: Dict[int, asyncio.Task] = {}
+logger = get_logger("routes_agents")
+
+# --------------------- Metrics (read at scrape time) ---------------------
+gauge("autoteam_pipelines_active", "Pipeline runs executing in this API process.", function=lambda: _pipeline_service.stats()["running"])
+gauge(
+    "autoteam_pipeline_queue_depth",
+    "Runs admitted but not started, per lane.",
+    ("lane",),
+    function=lambda: {("interactive",): _pipeline_service.stats()["queued"], ("batch",): _pipeline_service.stats()["batch_queued"]},
+)
+gauge(
+    "autoteam_message_bus_queued_messages",
+    "Events published but not yet read by a stream.",
+    ("bus",),
+    function=lambda: {("project",): _message_bus.queued(), ("batch",): _batch_bus.queued()},
+)
+gauge("autoteam_sse_subscribers", "Open project SSE streams.", function=lambda: sum(_subscribers.values()))
+
+
 def _get_llm_client():
-# Choose real provider if key present; fall back to Mock
-    if _settings.GEMINI_API_KEY:
-        return GeminiClient(api_key=_settings.GEMINI_API_KEY,
-model=_settings.GEMINI_MODEL)
-    return MockLLMClient()
+    return build_llm_client()
 
 
 async def _get_session():
@@ -42,47 +86,588 @@ async def _get_session():
         yield session
 
 
+def _event_source(events):
+    # sse_starlette pulls in uvicorn: loaded by the first stream, not at startup
+    from sse_starlette.sse import EventSourceResponse
+
+    return EventSourceResponse(events)
+
+
+def _admission_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(max(1, int(exc.retry_after or 1)))})
+    if isinstance(exc, QueueFullError):
+        return HTTPException(
+            status_code=429,
+            detail={"message": str(exc), "queue_depth": exc.depth, "eta_seconds": exc.eta_seconds},
+            headers={"Retry-After": str(max(1, int(exc.eta_seconds)))},
+        )
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+
+
+def _check_circuits() -> None:
+    # From settings and the process-wide breakers: admission builds no client
+    chain = provider_specs()
+    retry_after = open_circuit_retry_after(chain)
+    if retry_after is not None:
+        raise CircuitOpenError([f"{provider}/{model}" for provider, model in chain], retry_after)
+
+
+def _run_factory(project_id: int, **run_kwargs):
+    async def run():
+        job = _pipeline_service.job(project_id)
+        queue_wait = job.queue_wait if job is not None else 0.0
+        if job is not None:
+            tracing.record("queue_wait", project_id, queue_wait, batch_id=job.batch_id)
+        # Built when a worker picks the job, so queued runs hold no client
+        orch = Orchestrator(message_bus=_message_bus, llm=_get_llm_client())
+        # Pass the SessionLocal factory, NOT a request session, to the worker.
+        await orch.run(project_id=project_id, db_session_factory=AsyncSessionLocal, queue_wait=queue_wait, **run_kwargs)
+    return run
+
+
+def _worker_mode() -> bool:
+    return _settings.PIPELINE_EXECUTION_MODE == "worker"
+
+
+async def _check_admission(size: int = 1, batch: bool = False) -> None:
+    if not _worker_mode():
+        if batch:
+            _pipeline_service.check_batch_admission(size)
+        else:
+            _pipeline_service.check_admission()
+        return
+    limit = _settings.PIPELINE_BATCH_QUEUE_DEPTH if batch else _settings.PIPELINE_QUEUE_DEPTH
+    async with AsyncSessionLocal() as session:
+        queued = await _job_queue.queued_count(session)
+    if queued + size > limit:
+        raise QueueFullError(queued, 0.0)
+
+
+async def _is_active(project_id: int) -> bool:
+    if not _worker_mode():
+        return _pipeline_service.is_active(project_id)
+    async with AsyncSessionLocal() as session:
+        return await _job_queue.active_job(session, project_id) is not None
+
+
+async def _lease(project_ids: List[int]) -> List[int]:
+    """Inline mode: take or renew this process's lease of the projects; returns those it holds."""
+    async with AsyncSessionLocal() as session:
+        return await crud.lease_projects(session, project_ids, _lease_owner, _settings.JOB_LEASE_SECONDS)
+
+
+async def _enqueue(project_id: int, **run_kwargs) -> None:
+    with tracing.span("api.enqueue", project_id=project_id, mode=_settings.PIPELINE_EXECUTION_MODE, resume=run_kwargs.get("resume", False)):
+        if not _worker_mode():
+            if not await _lease([project_id]):
+                raise ValueError(f"Project {project_id} is queued or running in another process")
+            await _pipeline_service.submit(project_id, _run_factory(project_id, **run_kwargs))
+            return
+        async with AsyncSessionLocal() as session:
+            if await _job_queue.active_job(session, project_id) is not None:
+                raise ValueError(f"Project {project_id} is already queued or running")
+            await _job_queue.enqueue(session, project_id, run_kwargs)
+
+
+async def _batch_progress(session, batch_id: int) -> BatchProgress:
+    counts = await crud.batch_status_counts(session, batch_id)
+    total = sum(counts.values())
+    completed = counts.get(ProjectStatus.COMPLETED, 0)
+    failed = counts.get(ProjectStatus.FAILED, 0)
+    cancelled = counts.get(ProjectStatus.CANCELLED, 0)
+    return BatchProgress(
+        batch_id=batch_id,
+        total=total,
+        pending=counts.get(ProjectStatus.PENDING, 0),
+        running=counts.get(ProjectStatus.RUNNING, 0),
+        completed=completed,
+        failed=failed,
+        cancelled=cancelled,
+        done=completed + failed + cancelled == total,
+    )
+
+
+async def _publish_batch_progress(batch_id: int, project_id: int) -> None:
+    async with AsyncSessionLocal() as session:
+        progress = await _batch_progress(session, batch_id)
+        project = await crud.get_project(session, project_id)
+    message = {
+        "event_type": "batch_progress",
+        "batch_id": batch_id,
+        "project_id": project_id,
+        "project_status": project.status if project else None,
+        "progress": progress.model_dump(),
+    }
+    await _batch_bus.publish(batch_id, "batch", json.dumps(message))
+    if progress.done:
+        await _batch_bus.publish(batch_id, "batch", json.dumps({**message, "event_type": "batch_end"}))
+
+
+async def _enqueue_batch(batch_id: int, projects: List[tuple], concurrency: int, **run_kwargs) -> None:
+    """`projects`: (project_id, prompt, title) tuples of one batch."""
+    if _worker_mode():
+        # Workers claim jobs FIFO; the per-batch concurrency cap applies to inline mode only
+        async with AsyncSessionLocal() as session:
+            for pid, prompt, title in projects:
+                await _job_queue.enqueue(session, pid, {"prompt": prompt, "project_title": title, **run_kwargs}, batch_id=batch_id)
+        return
+
+    def job(project_id: int, prompt: str, title: str):
+        run = _run_factory(project_id, prompt=prompt, project_title=title, **run_kwargs)
+
+        async def run_and_report():
+            await run()
+            await _publish_batch_progress(batch_id, project_id)
+        return run_and_report
+
+    await _lease([pid for pid, _, _ in projects])
+    await _pipeline_service.submit_batch(
+        batch_id, [(pid, job(pid, prompt, title)) for pid, prompt, title in projects], concurrency
+    )
+
+
+async def _queue_info(project_id: int) -> dict:
+    if _worker_mode():
+        async with AsyncSessionLocal() as session:
+            job = await _job_queue.active_job(session, project_id)
+            queued = job is not None and job.status == JobStatus.QUEUED
+            position = await _job_queue.queued_count(session, before_id=job.id) if queued else None
+        return {"queue_position": position, "eta_seconds": None}
+    position = _pipeline_service.position(project_id)
+    return {
+        "queue_position": position,
+        "eta_seconds": _pipeline_service.eta(position) if position is not None else 0.0,
+    }
+
+
 # ---------- Run full pipeline and return final results ---------
-@router.post("/run", summary="Starts the multi-agent workflow and returns a project ID for streaming.")
+@router.post("/run", summary="Queues the multi-agent workflow and returns a project ID for streaming.")
 async def run_pipeline(
     body: ProjectCreate,
-    background_tasks: BackgroundTasks,
     session = Depends(_get_session)
 ):
     if not body.prompt or len(body.prompt) < 3:
         raise HTTPException(status_code=422, detail="Prompt must be at least 3 characters")
 
+    # 1. Reject early when the pipeline queue is saturated or every provider's circuit is open
+    try:
+        _check_circuits()
+        await _check_admission()
+    except (QueueFullError, ServiceUnavailableError, CircuitOpenError) as exc:
+        raise _admission_error(exc)
+
     project_title = body.title or "AutoTeamAI Project"
     # `crud.create_project` returns the ID directly, so we assign it to `project_id`.
     project_id = await crud.create_project(
         session, title=project_title, user_prompt=body.prompt
     )
 
-    # 2. Add the orchestrator run to background tasks
-    llm = _get_llm_client()
-    orch = Orchestrator(message_bus=_message_bus, llm=llm)
-    
-    # Pass the SessionLocal factory, NOT the active session, to the background task.
-    background_tasks.add_task(
-        orch.run, 
-        prompt=body.prompt, 
-        db_session_factory=AsyncSessionLocal, # Pass the factory
-        project_id=project_id, 
-        project_title=project_title
-    )
+    # 2. Hand the orchestrator run to the bounded worker pool
+    try:
+        await _enqueue(
+            project_id,
+            prompt=body.prompt,
+            project_title=project_title,
+            max_parallelism=body.max_parallelism,
+            cache_bypass=body.cache_bypass,
+            deadline_seconds=body.deadline_seconds,
+        )
+    except (QueueFullError, ServiceUnavailableError) as exc:
+        await crud.set_project_status(session, project_id, ProjectStatus.FAILED)
+        raise _admission_error(exc)
 
     # 3. Return immediately with the project ID
     return {
-        "message": "Workflow started in the background.",
+        "message": "Workflow queued for execution.",
         "project_id": project_id,
-        "project_title": project_title
+        "project_title": project_title,
+        **(await _queue_info(project_id)),
     }
 
+# ---------- Resume an interrupted pipeline ---------
+@router.post("/resume/{project_id}", summary="Re-runs only the stages of a project that have no persisted output.")
+async def resume_pipeline(project_id: int, session = Depends(_get_session)):
+    project = await crud.get_project(session, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if await _is_active(project_id):
+        raise HTTPException(status_code=409, detail="Project pipeline is already queued or running")
+    if project.status == ProjectStatus.CANCELLED:
+        # Resuming is an explicit request to carry on; the orchestrator refuses cancelled projects
+        await crud.set_project_status(session, project_id, ProjectStatus.PENDING)
+
+    try:
+        await _enqueue(project_id, prompt=project.user_prompt, project_title=project.title, resume=True)
+    except (QueueFullError, ServiceUnavailableError) as exc:
+        raise _admission_error(exc)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {
+        "message": "Workflow resume queued.",
+        "project_id": project_id,
+        "project_title": project.title,
+        **(await _queue_info(project_id)),
+    }
+
+
+async def resume_unfinished_pipelines() -> int:
+    """
+    Called on startup and by `keep_pipeline_leases`: resume the projects that never
+    reached workflow_end (status pending/running) and whose owning process is gone,
+    i.e. their lease expired. Another live process's runs are left alone, so a
+    rolling deploy does not run them twice. Returns the number of pipelines queued.
+    """
+    async with AsyncSessionLocal() as session:
+        orphans = await crud.list_orphaned_projects(session, _settings.JOB_LEASE_SECONDS)
+        orphans = [p for p in orphans if not _pipeline_service.is_active(p.id)]
+        # Taken atomically: of several processes sweeping at once, one resumes each project
+        held = set(await crud.lease_projects(session, [p.id for p in orphans], _lease_owner, _settings.JOB_LEASE_SECONDS))
+        projects = [p for p in orphans if p.id in held]
+        batches: Dict[int, List[tuple]] = defaultdict(list)
+        for project in projects:
+            if project.batch_id is not None and not _pipeline_service.is_active(project.id):
+                batches[project.batch_id].append((project.id, project.user_prompt, project.title))
+        concurrency = {bid: (await crud.get_batch(session, bid)).concurrency for bid in batches}
+
+    queued = 0
+    for project in projects:
+        if project.batch_id is not None or _pipeline_service.is_active(project.id):
+            continue
+        try:
+            await _enqueue(project.id, prompt=project.user_prompt, project_title=project.title, resume=True)
+        except QueueFullError:
+            # Left as pending; the lease runs out and a later sweep picks them up
+            logger.warning("Pipeline queue full; %d unfinished projects not resumed", len(projects) - queued)
+            break
+        queued += 1
+    for batch_id, batch_projects in batches.items():
+        try:
+            await _enqueue_batch(batch_id, batch_projects, concurrency[batch_id], resume=True)
+        except QueueFullError:
+            logger.warning("Batch queue full; batch %s not resumed", batch_id)
+            continue
+        queued += len(batch_projects)
+    if queued:
+        logger.info("Resuming %d unfinished pipelines", queued)
+    return queued
+
+
+async def _renew_leases() -> None:
+    """Renew the leases of this process's runs; a run whose lease another process took is stopped here."""
+    active = _pipeline_service.active_projects()
+    lost = set(active) - set(await _lease(active))
+    for project_id in lost:
+        # Not a POST /cancel: the project keeps its status and the new owner carries on
+        logger.warning("Lease of project_id %s taken over by another process; stopping its run here", project_id)
+        _pipeline_service.cancel(project_id)
+
+
+async def keep_pipeline_leases(resume: bool = True) -> None:
+    """
+    Inline mode, every third of JOB_LEASE_SECONDS: renew this process's leases and, with
+    `resume`, resume the projects of processes that crashed or shut down (started by `main.lifespan`).
+    """
+    while True:
+        await asyncio.sleep(_settings.JOB_LEASE_SECONDS / 3)
+        try:
+            await _renew_leases()
+            if resume:
+                await resume_unfinished_pipelines()
+        except Exception as e:
+            logger.warning("Could not renew pipeline leases: %s", e)
+
+
+async def release_pipeline_leases() -> None:
+    """On shutdown, after the pipeline service stopped: hand unfinished runs to other processes now."""
+    async with AsyncSessionLocal() as session:
+        released = await crud.expire_project_leases(session, _lease_owner)
+    if released:
+        logger.info("Released %d pipeline leases", released)
+
+
+# ---------- Cancellation ---------
+async def _cancel_project(project_id: int) -> Optional[str]:
+    """
+    Persist 'cancelled' and stop the run wherever it is. Returns the state it was
+    in ("queued" / "running" / "pending"), None if the project had already finished.
+    """
+    async with AsyncSessionLocal() as session:
+        # Persisted first: the orchestrator reads it to tell a cancel from a shutdown
+        if not await crud.cancel_project(session, project_id):
+            return None
+        if _worker_mode():
+            state = await _job_queue.cancel(session, project_id)
+        else:
+            state = _pipeline_service.cancel(project_id)
+        project = await crud.get_project(session, project_id)
+    logger.info("Cancelled project_id %s (%s)", project_id, state or "not queued")
+
+    if not _worker_mode():  # worker-mode streams read the cancelled status from the database
+        if state != "running":
+            # No orchestrator will publish the terminal events of a run that never started
+            for event_type in ("workflow_cancelled", "workflow_end"):
+                message = {"event_type": event_type, "project_id": project_id, "agent_name": "Orchestrator", "content": "Workflow was cancelled."}
+                await _message_bus.publish(project_id, "Orchestrator", json.dumps(message))
+        if project.batch_id is not None:
+            await _publish_batch_progress(project.batch_id, project_id)
+    return state or "pending"
+
+
+@router.post("/cancel/{project_id}", summary="Stops a queued or running pipeline and marks the project cancelled.")
+async def cancel_pipeline(project_id: int, session = Depends(_get_session)):
+    project = await crud.get_project(session, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    state = await _cancel_project(project_id)
+    if state is None:
+        raise HTTPException(status_code=409, detail=f"Project pipeline already finished ({project.status})")
+    return {"message": "Workflow cancelled.", "project_id": project_id, "status": ProjectStatus.CANCELLED, "was": state}
+
+
+def _subscribe(project_id: int) -> None:
+    _subscribers[project_id] += 1
+    timer = _disconnect_timers.pop(project_id, None)
+    if timer is not None:
+        timer.cancel()
+
+
+def _unsubscribe(project_id: int, cancel_on_disconnect: bool) -> None:
+    _subscribers[project_id] -= 1
+    if _subscribers[project_id] > 0:
+        return
+    del _subscribers[project_id]
+    if cancel_on_disconnect and project_id not in _disconnect_timers:
+        _disconnect_timers[project_id] = asyncio.create_task(_cancel_after_grace(project_id))
+
+
+async def _cancel_after_grace(project_id: int) -> None:
+    try:
+        await asyncio.sleep(_settings.PIPELINE_DISCONNECT_GRACE_SECONDS)
+        if _subscribers.get(project_id):
+            return
+        if await _cancel_project(project_id):
+            logger.info("Auto-cancelled project_id %s: no stream subscriber for %.0fs", project_id, _settings.PIPELINE_DISCONNECT_GRACE_SECONDS)
+    except Exception as e:
+        logger.error(f"Auto-cancel of project_id {project_id} failed: {e}", exc_info=True)
+    finally:
+        if _disconnect_timers.get(project_id) is asyncio.current_task():
+            del _disconnect_timers[project_id]
+
+
+# ---------- Batch submission ---------
+@router.post("/batch", summary="Queues one pipeline per prompt as a batch and returns its id for progress tracking.")
+async def run_batch(body: BatchCreate, session = Depends(_get_session)):
+    if len(body.prompts) > _settings.PIPELINE_BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=422, detail=f"A batch may hold at most {_settings.PIPELINE_BATCH_MAX_PROMPTS} prompts")
+    if any(len(p.strip()) < 3 for p in body.prompts):
+        raise HTTPException(status_code=422, detail="Every prompt must be at least 3 characters")
+
+    try:
+        _check_circuits()
+        await _check_admission(len(body.prompts), batch=True)
+    except (QueueFullError, ServiceUnavailableError, CircuitOpenError) as exc:
+        raise _admission_error(exc)
+
+    title = body.title or "AutoTeamAI Batch"
+    concurrency = body.concurrency or _settings.PIPELINE_BATCH_CONCURRENCY
+    batch_id, project_ids = await crud.create_batch(session, title=title, prompts=body.prompts, concurrency=concurrency)
+    projects = [(pid, prompt, f"{title} #{i + 1}") for i, (pid, prompt) in enumerate(zip(project_ids, body.prompts))]
+
+    try:
+        await _enqueue_batch(
+            batch_id, projects, concurrency,
+            max_parallelism=body.max_parallelism, cache_bypass=body.cache_bypass, deadline_seconds=body.deadline_seconds,
+        )
+    except (QueueFullError, ServiceUnavailableError) as exc:
+        for pid in project_ids:
+            await crud.set_project_status(session, pid, ProjectStatus.FAILED)
+        raise _admission_error(exc)
+
+    return {
+        "message": "Batch queued for execution.",
+        "batch_id": batch_id,
+        "project_ids": project_ids,
+        "concurrency": concurrency,
+        "progress": (await _batch_progress(session, batch_id)).model_dump(),
+    }
+
+
+@router.get("/batch/{batch_id}", summary="Aggregate progress of a batch")
+async def batch_status(batch_id: int, session = Depends(_get_session)):
+    batch = await crud.get_batch(session, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {
+        "batch_id": batch_id,
+        "title": batch.title,
+        "progress": (await _batch_progress(session, batch_id)).model_dump(),
+        "queue": _pipeline_service.batch_stats(batch_id),
+    }
+
+
+@router.get("/batch/{batch_id}/stream", summary="SSE stream of batch-level completion events")
+async def stream_batch(batch_id: int):
+    async with AsyncSessionLocal() as session:
+        if not await crud.get_batch(session, batch_id):
+            raise HTTPException(status_code=404, detail="Batch not found")
+        snapshot = await _batch_progress(session, batch_id)
+
+    async def event_generator() -> AsyncGenerator[dict, None]:
+        yield {"event": "batch_update", "data": json.dumps({"event_type": "batch_progress", "batch_id": batch_id, "progress": snapshot.model_dump()})}
+        if snapshot.done:
+            return
+        messages = _poll_batch_events(batch_id, snapshot) if _worker_mode() else _batch_bus.subscribe(batch_id)
+        async for msg in messages:
+            yield {"event": "batch_update", "data": msg}
+            if json.loads(msg)["event_type"] == "batch_end":
+                return
+    return _event_source(event_generator())
+
+
+# ---------- Queue position / wait time of a project ---------
+@router.get("/status/{project_id}", summary="Queue state, position, ETA and queue-wait time of a project run")
+async def pipeline_status(project_id: int):
+    if _worker_mode():
+        async with AsyncSessionLocal() as session:
+            record = await _job_queue.latest_job(session, project_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="No pipeline run known for this project")
+        states = {JobStatus.QUEUED: "queued", JobStatus.LEASED: "running"}
+        return {
+            "project_id": project_id,
+            "state": states.get(record.status, "finished"),
+            "attempts": record.attempts,
+            "worker": record.lease_owner,
+            **(await _queue_info(project_id)),
+        }
+    job = _pipeline_service.job(project_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No pipeline run known for this project")
+    return {
+        "project_id": project_id,
+        "state": job.state,
+        "queue_wait_seconds": round(job.queue_wait, 3),
+        **(await _queue_info(project_id)),
+    }
+
+
+@router.get("/queue/stats", summary="Worker pool and queue utilisation")
+async def queue_stats():
+    if _worker_mode():
+        async with AsyncSessionLocal() as session:
+            return {"mode": "worker", "jobs": await _job_queue.stats(session)}
+    return _pipeline_service.stats()
+
+
+# ---------- Worker mode: progress is read back from the database ---------
+async def _poll_project_events(project_id: int) -> AsyncGenerator[str, None]:
+    """Agent results persisted by workers, then workflow_end once the project settles (no deltas)."""
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            # Status first: outputs are committed before the final status, so none can be missed
+            project = await crud.get_project(session, project_id)
+            rows = await crud.list_agent_outputs_after(session, project_id, last_id)
+        for row in rows:
+            last_id = row.id
+            event_type = "error" if row.content.startswith(STAGE_ERROR_PREFIX) else "agent_result"
+            yield json.dumps({"event_type": event_type, "project_id": project_id, "agent_name": row.agent_name, "content": row.content})
+        if project is None or project.status not in ProjectStatus.UNFINISHED:
+            cancelled = project is not None and project.status == ProjectStatus.CANCELLED
+            if cancelled:
+                yield json.dumps({"event_type": "workflow_cancelled", "project_id": project_id, "agent_name": "Orchestrator", "content": "Workflow was cancelled."})
+            content = "Workflow was cancelled." if cancelled else "Workflow has completed."
+            yield json.dumps({"event_type": "workflow_end", "project_id": project_id, "agent_name": "Orchestrator", "content": content})
+            return
+        await asyncio.sleep(_settings.PIPELINE_EVENTS_POLL_INTERVAL)
+
+
+async def _poll_batch_events(batch_id: int, last: BatchProgress) -> AsyncGenerator[str, None]:
+    while True:
+        await asyncio.sleep(_settings.PIPELINE_EVENTS_POLL_INTERVAL)
+        async with AsyncSessionLocal() as session:
+            progress = await _batch_progress(session, batch_id)
+        if progress == last:
+            continue
+        last = progress
+        message = {"event_type": "batch_end" if progress.done else "batch_progress", "batch_id": batch_id, "progress": progress.model_dump()}
+        yield json.dumps(message)
+        if progress.done:
+            return
+
+
 # ---------- Live SSE stream of a project’s agent outputs ---------
 @router.get("/stream/{project_id}", summary="SSE stream for live agent outputs")
-async def stream_results(project_id: int):
+async def stream_results(project_id: int, cancel_on_disconnect: Optional[bool] = None):
+    if cancel_on_disconnect is None:
+        cancel_on_disconnect = _settings.PIPELINE_CANCEL_ON_DISCONNECT
+
     async def event_generator()-> AsyncGenerator[str, None]:
-        async for msg in _message_bus.subscribe(project_id):
-            # The 'msg' is already a JSON string from the orchestrator
-            yield {"event": "agent_update", "data": msg}
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+        _subscribe(project_id)
+        try:
+            messages = _poll_project_events(project_id) if _worker_mode() else _message_bus.subscribe(project_id)
+            async for msg in messages:
+                # The 'msg' is already a JSON string from the orchestrator
+                yield {"event": "agent_update", "data": msg}
+                if json.loads(msg)["event_type"] == "workflow_end":
+                    return
+        finally:
+            # Client went away (or the stream ended); maybe nobody is watching the run any more
+            _unsubscribe(project_id, cancel_on_disconnect)
+    return _event_source(event_generator())
+
+
+# ---------- LLM response cache counters ---------
+@router.get("/cache/stats", summary="Hit/miss counters of the LLM response cache")
+async def cache_stats():
+    if not _settings.LLM_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_response_cache().stats()}
+
+
+@router.get("/hedge/stats", summary="Hedged-request counters and current hedge delay")
+async def hedge_stats():
+    if not _settings.LLM_HEDGE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "models": hedge_stats_by_model()}
+
+
+@router.get("/ratelimit/stats", summary="Utilization of the shared provider rate limiters")
+async def ratelimit_stats():
+    return {"enabled": _settings.LLM_RATE_LIMIT_ENABLED, "limiters": rate_limiter_stats()}
+
+
+@router.get("/router/stats", summary="Latency, error rate and ejection state of each routed backend")
+async def llm_router_stats():
+    return {"backends": router_stats()}
+
+
+@router.get("/cascade/stats", summary="Per-stage escalation rates of the model cascade")
+async def llm_cascade_stats():
+    return {"enabled": bool(_settings.LLM_CASCADE_MODEL), "stages": cascade_stats()}
+
+
+@router.get("/semantic-cache/stats", summary="Hit/miss counters and size of the semantic stage cache")
+async def semantic_cache_stats():
+    if not _settings.SEMANTIC_CACHE_ENABLED:
+        return {"enabled": False}
+    from api.ai.core.semantic_cache import get_semantic_cache  # numpy, only when enabled
+
+    return {"enabled": True, **get_semantic_cache().stats()}
+
+
+@router.get("/trace/{project_id}", summary="Waterfall of a project's tracing spans (format=json|text)")
+async def project_trace(project_id: int, format: str = "json"):
+    spans = await asyncio.to_thread(tracing.get_tracer().spans, project_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="No trace recorded for this project")
+    view = tracing.waterfall(spans)
+    if format == "text":
+        return PlainTextResponse(view["text"] + "\n")
+    return {"project_id": project_id, "trace_id": tracing.trace_id_for(project_id), **view}
+
+
+@router.get("/circuits/stats", summary="Circuit breaker states and the shared retry budget")
+async def circuits_stats():
+    return circuit_stats()
@@ -33,6 +33,7 @@ async def get_project(project_id: int, session = Depends(_get_session)) -> Optio
         "id": proj.id,
         "title": proj.title,
         "prompt": proj.user_prompt,
+        "status": proj.status,
     }
 
 
@@ -41,6 +42,6 @@ async def list_projects(limit: int = 20, session = Depends(_get_session)):
     res = await session.execute(select(Project).order_by(Project.created_at.desc()).limit(limit))
     items = list(res.scalars().all())
     return [
-        {"id": p.id, "title": p.title, "prompt": p.user_prompt, "created_at": p.created_at.isoformat()}
+        {"id": p.id, "title": p.title, "prompt": p.user_prompt, "status": p.status, "created_at": p.created_at.isoformat()}
         for p in items
     ]
\ No newline at end of file
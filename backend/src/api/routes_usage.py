@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+
+from api.db.database import AsyncSessionLocal
+from api.db import crud as crud_async
+from api.ai.core.orchestrator import PIPELINE_STAGES
+
+
+router = APIRouter()
+
+_STAGE_ORDER = {s.name: i for i, s in enumerate(PIPELINE_STAGES)}
+
+
+async def _get_session():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+def _since(days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+
+@router.get("/projects/{project_id}", summary="Tokens, LLM time, queue wait and estimated cost of a project, per stage")
+async def project_usage(project_id: int, session = Depends(_get_session)):
+    usage = await crud_async.project_usage(session, project_id)
+    if not usage["stages"]:
+        raise HTTPException(status_code=404, detail="No usage recorded for this project")
+    usage["stages"].sort(key=lambda s: _STAGE_ORDER.get(s["agent_name"], len(_STAGE_ORDER)))
+    return {"project_id": project_id, **usage}
+
+
+@router.get("/agents", summary="Usage and LLM time percentiles per agent over the last `days` days")
+async def usage_by_agent(days: int = Query(7, ge=1, le=366), session = Depends(_get_session)):
+    return {"days": days, "agents": await crud_async.usage_by_agent(session, since=_since(days))}
+
+
+@router.get("/daily", summary="Usage and LLM time percentiles per day over the last `days` days")
+async def usage_by_day(days: int = Query(30, ge=1, le=366), session = Depends(_get_session)):
+    return {"days": days, "daily": await crud_async.usage_by_day(session, since=_since(days))}
@@ -0,0 +1,190 @@
+"""
+Out-of-process pipeline worker.
+
+    PIPELINE_EXECUTION_MODE=worker python -m api.worker [--concurrency N] [--worker-id ID]
+
+Claims jobs written by the API (api.ai.core.job_queue), runs the orchestrator
+for each and keeps its lease alive with heartbeats. Runs every orchestrator with
+`resume=True`, so a job reclaimed after a crash continues from the persisted
+stage outputs. SIGTERM/SIGINT stop claiming, let running jobs drain for
+WORKER_SHUTDOWN_GRACE_SECONDS and hand the rest back to the queue. A job
+flagged by POST /cancel is stopped within one poll interval.
+"""
+
+from typing import Optional, Set
+import argparse
+import asyncio
+import os
+import signal
+import socket
+
+from api.ai.core.job_queue import ClaimedJob, DBJobQueue, get_job_queue
+from api.ai.core.message_bus import NullMessageBus
+from api.ai.core.orchestrator import Orchestrator
+from api.ai.core.utils import get_logger
+from api.ai.agents.llm_stack import build_llm_client
+from api.config.settings import get_settings
+from api.db import crud
+from api.db.database import AsyncSessionLocal, engine, ensure_schema
+from api.db.models import JobStatus, ProjectStatus
+
+logger = get_logger("worker")
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: DBJobQueue,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        shutdown_grace: float = 30.0,
+        worker_id: Optional[str] = None,
+    ):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.shutdown_grace = shutdown_grace
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.bus = NullMessageBus()
+        self._stopping = asyncio.Event()
+        self._jobs: Set[asyncio.Task] = set()
+        self.processed = 0
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        logger.info("Worker %s started (concurrency=%d)", self.worker_id, self.concurrency)
+        slots = asyncio.Semaphore(self.concurrency)
+        while not self._stopping.is_set():
+            await slots.acquire()
+            job = await self._claim() if not self._stopping.is_set() else None
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._execute(job))
+            self._jobs.add(task)
+            task.add_done_callback(lambda t: (self._jobs.discard(t), slots.release()))
+        await self._drain()
+        logger.info("Worker %s stopped after %d jobs", self.worker_id, self.processed)
+
+    async def _claim(self) -> Optional[ClaimedJob]:
+        try:
+            return await self.queue.claim(self.worker_id)
+        except Exception as e:
+            # e.g. the database restarting or locked: keep the running jobs, retry after a poll interval
+            logger.warning("Worker %s could not claim a job: %s", self.worker_id, e)
+            return None
+
+    async def _drain(self) -> None:
+        if not self._jobs:
+            return
+        logger.info("Draining %d running jobs (grace %.0fs)", len(self._jobs), self.shutdown_grace)
+        _, pending = await asyncio.wait(set(self._jobs), timeout=self.shutdown_grace)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # --------------------- One job ---------------------
+    async def _execute(self, job: ClaimedJob) -> None:
+        logger.info("Worker %s running job %s (project %s, attempt %d)", self.worker_id, job.id, job.project_id, job.attempts)
+        run = asyncio.create_task(self._run_pipeline(job))
+        watch = asyncio.create_task(self._watch(job, run))
+        try:
+            await run
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # Shutdown; release is fenced, so only a still-owned lease is handed back
+                if await self.queue.release(job):
+                    logger.info("Job %s handed back to the queue", job.id)
+                raise
+            # Stopped by the watcher (cancel request or lost lease); settled below
+        except Exception as e:
+            logger.error("Job %s crashed: %s", job.id, e, exc_info=True)
+            await self._complete(job, JobStatus.FAILED, error=str(e))
+            return
+        finally:
+            watch.cancel()
+            # Its database session is closed before the job is settled below
+            await asyncio.gather(watch, return_exceptions=True)
+
+        async with AsyncSessionLocal() as db:
+            project = await crud.get_project(db, job.project_id)
+        outcomes = {ProjectStatus.COMPLETED: JobStatus.DONE, ProjectStatus.CANCELLED: JobStatus.CANCELLED}
+        if await self._complete(job, outcomes.get(project.status if project else None, JobStatus.FAILED)):
+            self.processed += 1
+
+    async def _complete(self, job: ClaimedJob, status: str, error: Optional[str] = None) -> bool:
+        """Settle the job; when that fails, its lease runs out and another claim retries it."""
+        try:
+            if await self.queue.complete(job, status, error=error):
+                return True
+            logger.warning("Job %s finished after its lease was lost", job.id)
+        except Exception as e:
+            logger.warning("Worker %s could not complete job %s: %s", self.worker_id, job.id, e)
+        return False
+
+    async def _run_pipeline(self, job: ClaimedJob) -> None:
+        orch = Orchestrator(message_bus=self.bus, llm=build_llm_client())
+        kwargs = {**job.payload, "resume": True, "queue_wait": job.queue_wait}
+        await orch.run(project_id=job.project_id, db_session_factory=AsyncSessionLocal, **kwargs)
+
+    async def _watch(self, job: ClaimedJob, run: asyncio.Task) -> None:
+        """Renew the lease every third of it and check for cancel requests every poll interval."""
+        loop = asyncio.get_running_loop()
+        next_heartbeat = loop.time() + self.queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(min(self.poll_interval, max(next_heartbeat - loop.time(), 0.0)))
+            if await self.queue.cancel_requested(job):
+                logger.info("Job %s (project %s) cancelled; stopping run", job.id, job.project_id)
+                run.cancel()
+                return
+            if loop.time() < next_heartbeat:
+                continue
+            next_heartbeat = loop.time() + self.queue.lease_seconds / 3
+            if not await self.queue.heartbeat(job):
+                # Another worker owns the job now; stop duplicating its work
+                logger.warning("Lease on job %s lost; cancelling local run", job.id)
+                run.cancel()
+                return
+
+
+async def main(concurrency: Optional[int] = None, worker_id: Optional[str] = None) -> None:
+    settings = get_settings()
+    await ensure_schema()
+    worker = Worker(
+        get_job_queue(),
+        concurrency=concurrency or settings.WORKER_CONCURRENCY,
+        poll_interval=settings.WORKER_POLL_INTERVAL,
+        shutdown_grace=settings.WORKER_SHUTDOWN_GRACE_SECONDS,
+        worker_id=worker_id,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await worker.run()
+    finally:
+        from api.ai.agents.llm_http import close_http_client  # loaded by the first native client anyway
+
+        await close_http_client()
+        if settings.SEMANTIC_CACHE_ENABLED:
+            from api.ai.core.semantic_cache import save_semantic_cache
+
+            await save_semantic_cache()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AutoTeamAI pipeline worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="jobs run at once (default WORKER_CONCURRENCY)")
+    parser.add_argument("--worker-id", default=None, help="lease owner name (default host:pid)")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.worker_id))
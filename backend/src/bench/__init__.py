@@ -0,0 +1 @@
+"""Local benchmarks (run from backend/src, e.g. `python -m bench.hedging` or `python -m bench.load`)."""
@@ -0,0 +1,40 @@
+"""Helpers shared by the benchmarks: latency/size distributions and percentile summaries."""
+
+from typing import Callable, Dict, List, Sequence
+import random
+
+
+def long_tail(rng: random.Random, base: float, tail: float, tail_prob: float) -> Callable[[], float]:
+    """Mostly lognormal around `base`, with `tail_prob` of calls stalled around `tail`."""
+    def sample() -> float:
+        if rng.random() < tail_prob:
+            return tail * rng.uniform(0.5, 1.5)
+        return rng.lognormvariate(0.0, 0.25) * base
+    return sample
+
+
+def lognormal(rng: random.Random, median: float, sigma: float = 0.5) -> Callable[[], float]:
+    def sample() -> float:
+        return rng.lognormvariate(0.0, sigma) * median
+    return sample
+
+
+def fixed(value: float) -> Callable[[], float]:
+    return lambda: value
+
+
+def percentiles(samples: Sequence[float], scale: float = 1000.0, suffix: str = "_ms") -> Dict[str, float]:
+    """p50/p95/p99/max of `samples` (seconds by default, reported in ms)."""
+    if not samples:
+        return {}
+    ordered: List[float] = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 2)
+
+    return {
+        f"p50{suffix}": pick(0.50),
+        f"p95{suffix}": pick(0.95),
+        f"p99{suffix}": pick(0.99),
+        f"max{suffix}": round(ordered[-1] * scale, 2),
+    }
@@ -0,0 +1,68 @@
+"""
+Tail-latency benchmark for hedged LLM requests.
+
+Runs MockLLMClient with a long-tail latency distribution (most calls fast, a few
+percent stalled) with and without HedgedLLMClient and prints p50/p95/p99 and the
+hedge rate as JSON.
+
+    python -m bench.hedging --requests 2000 --concurrency 32
+"""
+
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from api.ai.agents.llm_client import LLMClient, MockLLMClient
+from api.ai.agents.llm_hedging import HedgedLLMClient, HedgePolicy
+from bench.common import long_tail, percentiles
+
+
+async def measure(llm: LLMClient, requests: int, concurrency: int) -> List[float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        async with sem:
+            start = time.perf_counter()
+            await llm.generate(f"request {i}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+async def main(args: argparse.Namespace) -> Dict[str, object]:
+    def mock(seed: int) -> MockLLMClient:
+        return MockLLMClient(latency=long_tail(random.Random(seed), args.base, args.tail, args.tail_prob))
+
+    baseline = await measure(mock(args.seed), args.requests, args.concurrency)
+
+    policy = HedgePolicy(quantile=args.quantile, initial_delay=args.base * 4, max_hedge_rate=args.max_hedge_rate)
+    hedged_llm = HedgedLLMClient(mock(args.seed), secondary=mock(args.seed + 1), policy=policy)
+    hedged = await measure(hedged_llm, args.requests, args.concurrency)
+
+    return {
+        "config": vars(args),
+        "baseline": percentiles(baseline),
+        "hedged": {**percentiles(hedged), "hedge_rate": round(policy.counters["hedges"] / args.requests, 4), **policy.stats()},
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--base", type=float, default=0.02, help="typical latency (s)")
+    parser.add_argument("--tail", type=float, default=0.5, help="stalled-call latency (s)")
+    parser.add_argument("--tail-prob", type=float, default=0.03)
+    parser.add_argument("--quantile", type=float, default=0.95)
+    parser.add_argument("--max-hedge-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main(parse_args())), indent=2))
@@ -0,0 +1,115 @@
+"""
+Cold-start import benchmark.
+
+Imports `--module` (default: main, the API app) in fresh interpreters under
+`python -X importtime` and prints as JSON:
+- the import time over `--runs` runs (min/median/max), net of interpreter startup
+- the packages and app modules that cost the most
+- any `--forbid` module that got imported (by default: vendor SDKs, httpx,
+  uvicorn and sse_starlette, which only first use should load)
+
+With `--budget-ms` it exits 1 when the median is over budget or a forbidden
+module was imported. This is the guard against startup regressions:
+
+    python -m bench.importtime --runs 7 --budget-ms 1500
+    python -m bench.importtime --module api.worker --forbid fastapi
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Set
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FORBIDDEN = ("google.generativeai", "openai", "httpx", "uvicorn", "sse_starlette")
+OWN_PACKAGES = ("api", "main")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+@dataclass
+class Entry:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def _importtime(code: str) -> List[Entry]:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")  # api.db.database builds its engine at import time
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=SRC, env=env, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append(Entry(name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def measure(module: str) -> List[Entry]:
+    """Import entries of `module` in a fresh interpreter, without what interpreter startup imports."""
+    startup = {e.name for e in _importtime("pass")}
+    return [e for e in _importtime(f"import {module}") if e.name not in startup]
+
+
+def total_ms(entries: Sequence[Entry]) -> float:
+    return sum(e.cumulative_us for e in entries if e.depth == 0) / 1000
+
+
+def forbidden_imports(entries: Sequence[Entry], forbidden: Sequence[str]) -> List[str]:
+    names: Set[str] = {e.name for e in entries}
+    return sorted(f for f in forbidden if any(n == f or n.startswith(f + ".") for n in names))
+
+
+def _summary(entries: Sequence[Entry], top: int) -> Dict[str, object]:
+    by_package: Dict[str, int] = defaultdict(int)
+    for e in entries:
+        by_package[e.name.split(".")[0]] += e.self_us
+    own = [e for e in entries if e.name.split(".")[0] in OWN_PACKAGES]
+    return {
+        "modules_imported": len(entries),
+        "slowest_packages_ms": {p: round(us / 1000, 1) for p, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]},
+        "slowest_app_modules_ms": {e.name: round(e.self_us / 1000, 1) for e in sorted(own, key=lambda e: -e.self_us)[:top]},
+    }
+
+
+def main(args: argparse.Namespace) -> Dict[str, object]:
+    runs = [measure(args.module) for _ in range(args.runs)]
+    totals = [total_ms(r) for r in runs]
+    median = statistics.median(totals)
+    forbidden = forbidden_imports(runs[0], args.forbid)
+    result: Dict[str, object] = {
+        "config": vars(args),
+        "import_ms": {"min": round(min(totals), 1), "median": round(median, 1), "max": round(max(totals), 1)},
+        "forbidden_imported": forbidden,
+        **_summary(runs[totals.index(min(totals))], args.top),
+    }
+    if args.budget_ms:
+        result["within_budget"] = median <= args.budget_ms and not forbidden
+    return result
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=0.0, help="fail above this median import time (0: report only)")
+    parser.add_argument("--forbid", nargs="*", default=list(DEFAULT_FORBIDDEN), help="modules the import must not load")
+    parser.add_argument("--top", type=int, default=10)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    report = main(parse_args())
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report.get("within_budget", True) else 1)
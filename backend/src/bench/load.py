@@ -0,0 +1,381 @@
+"""
+End-to-end load benchmark for the run -> SSE pipeline.
+
+Starts the real FastAPI app in-process (lifespan included) on a throwaway SQLite
+database, swaps the LLM provider for a MockLLMClient with a configurable latency
+distribution, output size and error rate (the rate limiter, retries, breaker and
+cache still wrap it), then drives `--projects` runs with at most `--concurrency`
+in flight. Each client POSTs /api/agents/run and consumes /api/agents/stream
+until workflow_end.
+
+Reports throughput, p50/p95/p99 admission, time-to-first-event, end-to-end and
+per-stage latency, database time and event-loop lag as JSON, tagged with the git
+commit so runs can be compared:
+
+    python -m bench.load --projects 200 --concurrency 50 --workers 8 --output before.json
+    python -m bench.load --compare before.json after.json
+"""
+
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+from bench.common import fixed, lognormal, long_tail, percentiles
+
+
+# --------------------- Streaming in-process transport ---------------------
+class _BodyStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: asyncio.Queue, disconnected: asyncio.Event, app_task: asyncio.Task):
+        self._chunks = chunks
+        self._disconnected = disconnected
+        self._app_task = app_task
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def aclose(self) -> None:
+        # Closing the response is the client going away
+        self._disconnected.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._app_task), timeout=5)
+        except Exception:
+            self._app_task.cancel()
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    Like httpx.ASGITransport, but hands the body over while the app is still
+    sending it. httpx's transport buffers the whole response until the app
+    returns, which would hide every SSE timing this benchmark measures.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = b"".join([chunk async for chunk in request.stream])
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(k.lower(), v) for k, v in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port or 80),
+            "client": ("127.0.0.1", 50000),
+            "root_path": "",
+        }
+        started: asyncio.Future = asyncio.get_running_loop().create_future()
+        chunks: asyncio.Queue = asyncio.Queue()
+        disconnected = asyncio.Event()
+        request_sent = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                started.set_result((message["status"], message.get("headers", [])))
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    chunks.put_nowait(message["body"])
+                if not message.get("more_body", False):
+                    chunks.put_nowait(None)
+
+        async def run_app() -> None:
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if not started.done():
+                    started.set_exception(e)
+            finally:
+                if not started.done():
+                    started.set_exception(RuntimeError("ASGI app returned without a response"))
+                chunks.put_nowait(None)
+
+        app_task = asyncio.create_task(run_app())
+        status, headers = await started
+        return httpx.Response(status, headers=headers, stream=_BodyStream(chunks, disconnected, app_task))
+
+
+# --------------------- Probes ---------------------
+class LoopLagMonitor:
+    """Samples how late a short sleep wakes up: a proxy for event-loop blocking."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - start - self.interval, 0.0))
+
+
+class DBTimer:
+    """Times every statement on the engine (await included, so pool/thread hops count)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.samples: List[float] = []
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before)
+        event.listen(sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.samples.append(time.perf_counter() - conn.info["bench_started"].pop())
+
+
+# --------------------- Load generation ---------------------
+def _latency_model(args: argparse.Namespace, rng: random.Random):
+    if args.latency_dist == "fixed":
+        return fixed(args.base)
+    if args.latency_dist == "lognormal":
+        return lognormal(rng, args.base, args.sigma)
+    return long_tail(rng, args.base, args.tail, args.tail_prob)
+
+
+class Stats:
+    def __init__(self):
+        self.outcomes: Dict[str, int] = defaultdict(int)
+        self.admission: List[float] = []
+        self.first_event: List[float] = []
+        self.end_to_end: List[float] = []
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.events = 0
+
+
+async def _one_run(client: httpx.AsyncClient, i: int, stats: Stats) -> None:
+    start = time.perf_counter()
+    resp = await client.post("/api/agents/run", json={"prompt": f"Build a todo app with reminders #{i}", "title": f"load-{i}"})
+    stats.admission.append(time.perf_counter() - start)
+    if resp.status_code != 200:
+        stats.outcomes["rejected" if resp.status_code == 429 else f"http_{resp.status_code}"] += 1
+        return
+
+    project_id = resp.json()["project_id"]
+    stage_started: Dict[str, float] = {}
+    first_event: Optional[float] = None
+    outcome = "incomplete"
+    async with client.stream("GET", f"/api/agents/stream/{project_id}") as stream:
+        async for line in stream.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            now = time.perf_counter()
+            stats.events += 1
+            if first_event is None:
+                first_event = now - start
+            event = json.loads(line[len("data:"):])
+            event_type, name = event["event_type"], event.get("agent_name")
+            if event_type == "agent_start":
+                stage_started[name] = now
+            elif event_type == "agent_result" and name in stage_started:
+                stats.stages[name].append(now - stage_started.pop(name))
+            elif event_type == "error":
+                outcome = "failed"
+            elif event_type == "workflow_cancelled":
+                outcome = "cancelled"
+            elif event_type == "workflow_end":
+                if outcome == "incomplete":
+                    outcome = "completed"
+                break
+
+    stats.outcomes[outcome] += 1
+    if first_event is not None:
+        stats.first_event.append(first_event)
+    if outcome == "completed":
+        stats.end_to_end.append(time.perf_counter() - start)
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    # Deferred: settings and the engine are built from the environment main() prepares
+    from main import app
+    from api import routes_agents
+    from api.ai.agents import llm_stack
+    from api.ai.agents.llm_client import MockLLMClient
+    from api.db.database import engine
+
+    rng = random.Random(args.seed)
+    latency = _latency_model(args, rng)
+    output_chars = (lambda: max(1, int(rng.lognormvariate(0.0, 0.3) * args.output_chars))) if args.output_chars else None
+
+    def mock_chain():
+        return [MockLLMClient(latency=latency, output_chars=output_chars, error_rate=args.error_rate, rng=rng)]
+
+    llm_stack.provider_chain = mock_chain
+    routes_agents.provider_chain = mock_chain
+
+    stats = Stats()
+    lag = LoopLagMonitor()
+    db_timer = DBTimer(engine)
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(i: int) -> None:
+        async with sem:
+            try:
+                await asyncio.wait_for(_one_run(client, i, stats), timeout=args.run_timeout)
+            except asyncio.TimeoutError:
+                stats.outcomes["timed_out"] += 1
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=StreamingASGITransport(app), base_url="http://bench", timeout=None) as client:
+            lag.start()
+            db_timer.samples.clear()  # schema creation is not part of the load
+            start = time.perf_counter()
+            await asyncio.gather(*(bounded(i) for i in range(args.projects)))
+            wall = time.perf_counter() - start
+            await lag.stop()
+
+    completed = stats.outcomes.get("completed", 0)
+    stage_runs = sum(len(v) for v in stats.stages.values())
+    return {
+        "benchmark": "load",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "results": {
+            "wall_s": round(wall, 3),
+            "outcomes": dict(stats.outcomes),
+            "throughput": {
+                "projects_per_s": round(completed / wall, 3),
+                "stages_per_s": round(stage_runs / wall, 3),
+                "events_per_s": round(stats.events / wall, 1),
+            },
+            "admission": percentiles(stats.admission),
+            "first_event": percentiles(stats.first_event),
+            "end_to_end": percentiles(stats.end_to_end),
+            "stages": {name: {"count": len(samples), **percentiles(samples)} for name, samples in sorted(stats.stages.items())},
+            "db": {
+                "statements": len(db_timer.samples),
+                "total_s": round(sum(db_timer.samples), 3),
+                **percentiles(db_timer.samples),
+            },
+            "event_loop_lag": {"samples": len(lag.samples), **percentiles(lag.samples)},
+        },
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+# --------------------- Comparison ---------------------
+def _flatten(tree: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> str:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before, after = _flatten(old["results"]), _flatten(new["results"])
+    rows = [f"{'metric':<48} {old.get('commit') or 'old':>12} {new.get('commit') or 'new':>12} {'change':>9}"]
+    for key in sorted(before.keys() | after.keys()):
+        a, b = before.get(key), after.get(key)
+        if a is None or b is None:
+            change = "n/a"
+        elif a == 0:
+            change = "=" if b == 0 else "new"
+        else:
+            change = f"{(b - a) / a * 100:+.1f}%"
+        rows.append(f"{key:<48} {'-' if a is None else a:>12} {'-' if b is None else b:>12} {change:>9}")
+    return "\n".join(rows)
+
+
+# --------------------- Entry point ---------------------
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="print the deltas between two result files and exit")
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20, help="runs (POST + stream) in flight at once")
+    parser.add_argument("--workers", type=int, default=4, help="PIPELINE_WORKERS")
+    parser.add_argument("--queue-depth", type=int, default=None, help="PIPELINE_QUEUE_DEPTH (default: --projects, no 429s)")
+    parser.add_argument("--latency-dist", choices=("fixed", "lognormal", "long_tail"), default="lognormal")
+    parser.add_argument("--base", type=float, default=0.05, help="typical LLM call latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal spread")
+    parser.add_argument("--tail", type=float, default=1.0, help="stalled-call latency for long_tail (s)")
+    parser.add_argument("--tail-prob", type=float, default=0.02)
+    parser.add_argument("--output-chars", type=int, default=2000, help="typical response size (0 = tiny mock text)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of LLM calls failing with a retryable 503")
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache on")
+    parser.add_argument("--run-timeout", type=float, default=600.0)
+    parser.add_argument("--database-url", default=None, help="default: a temporary SQLite file")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the JSON result here")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as tmp:
+        os.environ.update({
+            "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{tmp}/bench.sqlite3",
+            "PIPELINE_EXECUTION_MODE": "inline",
+            "PIPELINE_WORKERS": str(args.workers),
+            "PIPELINE_QUEUE_DEPTH": str(args.queue_depth or args.projects),
+            "PIPELINE_RESUME_ON_STARTUP": "false",
+            "LLM_CACHE_ENABLED": "true" if args.cache else "false",
+            "LLM_CACHE_PATH": f"{tmp}/llm_cache.sqlite3",
+        })
+        result = asyncio.run(run_load(args))
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Lookup-latency benchmark for the semantic stage cache.
+
+Fills one namespace with `--entries` clustered unit vectors (topics with
+paraphrase-like noise around them), then prints as JSON:
+- index search latency (p50/p95/p99, microseconds) for near-duplicate queries
+- full `SemanticCache.lookup` latency, including embedding a stage-sized input
+- recall of the inverted-file index against exact brute-force search
+
+    python -m bench.semantic_cache --entries 100000 --queries 2000
+"""
+
+from typing import Dict, List
+import argparse
+import json
+import time
+
+import numpy as np
+
+from api.ai.core.semantic_cache import SemanticCache
+from bench.common import percentiles
+
+NAMESPACE = "bench/Boss"
+IDEA = "Build an AI-powered note taking app that summarizes meetings, syncs across devices and works offline. "
+
+
+def clustered(rng: np.random.Generator, n: int, dim: int, topics: int, noise: float) -> np.ndarray:
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(topics, size=n)] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main(args: argparse.Namespace) -> Dict[str, object]:
+    rng = np.random.default_rng(args.seed)
+    cache = SemanticCache(max_entries=args.entries, dim=args.dim)
+    vectors = clustered(rng, args.entries, args.dim, args.topics, args.noise)
+    started = time.perf_counter()
+    for vector in vectors:
+        cache._insert(NAMESPACE, vector, "cached output", time.time())
+    build_s = time.perf_counter() - started
+    index = cache.indexes[NAMESPACE]
+
+    # Near duplicates of stored entries, as a reworded resubmission would be
+    targets = rng.integers(args.entries, size=args.queries)
+    queries = vectors[targets] + args.query_noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    search: List[float] = []
+    found = []
+    for query in queries:
+        t = time.perf_counter()
+        found.append(index.search(query)[0])
+        search.append(time.perf_counter() - t)
+    exact = np.argmax(queries @ vectors.T, axis=1)  # entry ids are insertion order
+
+    lookup: List[float] = []
+    for i in range(args.queries):
+        text = IDEA * args.repeat + f"variant {i}"
+        t = time.perf_counter()
+        cache.lookup(NAMESPACE, text)
+        lookup.append(time.perf_counter() - t)
+
+    return {
+        "config": vars(args),
+        "build_s": round(build_s, 2),
+        "lists": len(index.lists),
+        "search": percentiles(search, scale=1e6, suffix="_us"),
+        "lookup": percentiles(lookup, scale=1e6, suffix="_us"),
+        "recall_at_1": round(float(np.mean(np.asarray(found) == exact)), 4),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=2000, help="clusters of similar stored inputs")
+    parser.add_argument("--noise", type=float, default=0.6, help="spread of entries around their topic")
+    parser.add_argument("--query-noise", type=float, default=0.02, help="how far a query is from its stored duplicate")
+    parser.add_argument("--repeat", type=int, default=3, help="copies of the sample idea in each lookup text")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(parse_args()), indent=2))
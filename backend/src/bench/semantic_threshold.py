@@ -0,0 +1,100 @@
+"""
+Threshold calibration for the semantic stage cache.
+
+Embeds labelled (stored, resubmitted) idea pairs with the cache's embedder,
+its idf learned from the stored side, and prints as JSON:
+- the similarity of every pair, paraphrases and different ideas apart
+- per threshold: paraphrases that would hit, different ideas that would hit
+
+A different idea above the threshold reuses the wrong stage output, while a
+paraphrase below it only costs the LLM call; pick the lowest threshold with
+no false hits.
+
+    python -m bench.semantic_threshold --thresholds 0.75 0.8 0.85 0.9
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import json
+
+from api.ai.core.semantic_cache import HashedTfidfEmbedder
+
+# Same idea, reworded
+PARAPHRASES: List[Tuple[str, str]] = [
+    ("AI-powered note taking app", "notes app with AI"),
+    ("notes app with AI", "AI-powered note taking app"),
+    ("AI-powered note-taking app", "ai powered note taking apps!"),
+    ("Build an AI-powered note taking app that summarizes meetings", "An AI note taking app that summarises meetings"),
+    ("Build an AI-powered note taking app that summarizes meetings", "App that takes meeting notes and summarizes them with AI"),
+    ("A marketplace for renting camping gear between neighbours", "Marketplace where neighbours rent camping gear to each other"),
+    ("A marketplace for renting camping gear between neighbours", "Peer-to-peer camping gear rental marketplace for neighbors"),
+    ("Mobile game where players grow a virtual garden", "A mobile game in which players grow virtual gardens"),
+    ("Mobile game where players grow a virtual garden", "Virtual garden growing game for mobile"),
+    ("Fitness tracker app that suggests workouts", "An app that tracks fitness and recommends workouts"),
+    ("Recipe recommendation app based on ingredients in your fridge", "App recommending recipes from the ingredients in my fridge"),
+    ("Language learning app with spaced repetition flashcards", "Spaced repetition flashcard app for learning languages"),
+    ("Budgeting app for students", "A budget planner app for students"),
+    ("Platform connecting freelance designers with small businesses", "Platform that connects small businesses to freelance designers"),
+    ("Chat app for remote teams with video calls", "Remote team chat app with video calling"),
+    ("Dog walking service booking app", "App to book dog walkers"),
+    ("Online marketplace for second-hand textbooks", "Marketplace for used textbooks online"),
+    ("Smart home energy usage monitor", "Monitor energy usage in a smart home"),
+    ("Meditation app with guided sessions and sleep stories", "Guided meditation and sleep stories app"),
+]
+
+# A different idea, mostly the same words
+DIFFERENT: List[Tuple[str, str]] = [
+    ("AI-powered note taking app", "notes app without AI"),
+    ("notes app with AI", "notes app without AI"),
+    ("AI-powered note taking app", "AI-powered recipe app"),
+    ("notes app with AI", "todo app with AI"),
+    ("Mobile game where players grow a virtual garden", "Mobile game where players grow a virtual farm"),
+    ("Mobile game where players grow a virtual garden", "Mobile game where players build a virtual city"),
+    ("A marketplace for renting camping gear between neighbours", "A marketplace for renting power tools between neighbours"),
+    ("Build an AI-powered note taking app that summarizes meetings", "Build an AI-powered app that summarizes podcasts"),
+    ("Fitness tracker app that suggests workouts", "Fitness tracker app that suggests recipes"),
+    ("Budgeting app for students", "Budgeting app for retirees"),
+    ("Language learning app with spaced repetition flashcards", "Language learning app with live tutors"),
+    ("Chat app for remote teams with video calls", "Chat app for remote teams without video calls"),
+    ("Dog walking service booking app", "Cat sitting service booking app"),
+    ("Online marketplace for second-hand textbooks", "Online marketplace for second-hand furniture"),
+    ("Smart home energy usage monitor", "Smart home security camera monitor"),
+    ("Meditation app with guided sessions and sleep stories", "Meditation app for kids"),
+    ("Platform connecting freelance designers with small businesses", "Platform connecting freelance developers with startups"),
+    ("Remote team chat app with video calling", "Video calling app for doctors and patients"),
+]
+
+
+def similarities(embedder: HashedTfidfEmbedder, pairs: List[Tuple[str, str]]) -> List[float]:
+    return [
+        round(float(embedder.embed(embedder.features(stored)) @ embedder.embed(embedder.features(submitted))), 3)
+        for stored, submitted in pairs
+    ]
+
+
+def main(args: argparse.Namespace) -> Dict[str, object]:
+    embedder = HashedTfidfEmbedder(args.dim)
+    for stored in dict.fromkeys(stored for stored, _ in PARAPHRASES + DIFFERENT):
+        embedder.learn(embedder.features(stored))
+    hits = similarities(embedder, PARAPHRASES)
+    false_hits = similarities(embedder, DIFFERENT)
+    return {
+        "config": vars(args),
+        "paraphrases": sorted(zip(hits, (submitted for _, submitted in PARAPHRASES))),
+        "different": sorted(zip(false_hits, (submitted for _, submitted in DIFFERENT)), reverse=True),
+        "thresholds": {
+            str(t): {"hits": f"{sum(s >= t for s in hits)}/{len(hits)}", "false_hits": f"{sum(s >= t for s in false_hits)}/{len(false_hits)}"}
+            for t in args.thresholds
+        },
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.75, 0.8, 0.85, 0.9, 0.95])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(parse_args()), indent=2))
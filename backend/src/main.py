@@ -1,19 +1,24 @@
 import os
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.routes_agents import router as agents_router
+from api.routes_agents import router as agents_router, keep_pipeline_leases, release_pipeline_leases, resume_unfinished_pipelines
 from api.routes_results import router as results_router
 from api.routes_projects import router as projects_router
-from api.db.database import engine, Base
+from api.routes_usage import router as usage_router
+from api.db.database import engine, ensure_schema
+from api.config.settings import get_settings
+from api.ai.core.pipeline_service import get_pipeline_service
+from api.ai.core import metrics
 
 
 # --- Initialize Database ---
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    created = await ensure_schema()
+    if created:
+        print(f"🗄️  Created tables/columns: {', '.join(created)}")
 
 
 # --- Lifespan Context ---
@@ -21,7 +26,32 @@ async def init_db():
 async def lifespan(app: FastAPI):
     print("🚀 Starting AutoTeamAI Backend...")
     await init_db()
+    pipeline_service = get_pipeline_service()
+    await pipeline_service.start()
+    # In worker mode the jobs table is durable and workers pick interrupted runs up themselves
+    settings = get_settings()
+    lease_keeper = None
+    if settings.PIPELINE_EXECUTION_MODE != "worker":
+        if settings.PIPELINE_RESUME_ON_STARTUP:
+            await resume_unfinished_pipelines()
+        # Keeps this process's project leases alive (and resumes those of processes that are gone)
+        lease_keeper = asyncio.create_task(keep_pipeline_leases(resume=settings.PIPELINE_RESUME_ON_STARTUP))
     yield
+    print("🧹 Stopping pipeline workers...")
+    if lease_keeper is not None:
+        lease_keeper.cancel()
+    await pipeline_service.stop()
+    if lease_keeper is not None:
+        await release_pipeline_leases()
+    print("🧹 Closing LLM HTTP connections...")
+    from api.ai.agents.llm_http import close_http_client  # loaded by the first native client anyway
+
+    await close_http_client()
+    if settings.SEMANTIC_CACHE_ENABLED:
+        print("🧹 Saving the semantic stage cache...")
+        from api.ai.core.semantic_cache import save_semantic_cache
+
+        await save_semantic_cache()
     print("🧹 Cleaning up database connections...")
     await engine.dispose()
 
@@ -55,6 +85,7 @@ app.add_middleware(
 app.include_router(projects_router, prefix="/api/projects", tags=["Projects"])
 app.include_router(agents_router, prefix="/api/agents", tags=["Agents"])
 app.include_router(results_router, prefix="/api/results", tags=["Results"])
+app.include_router(usage_router, prefix="/api/usage", tags=["Usage"])
 
 
 # --- Environment Variables ---
@@ -73,6 +104,12 @@ async def health():
     return {"status": "ok"}
 
 
+# --- Prometheus Metrics ---
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+
 # --- Lifecycle Events (optional logging) ---
 @app.on_event("startup")
 async def startup_event():
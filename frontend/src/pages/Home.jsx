@@ -84,7 +84,10 @@ export default function Home() {
 
     eventSource.addEventListener("agent_update", (event) => {
       const newMessage = JSON.parse(event.data);
-      setMessages((prev) => [...prev, newMessage]);
+      // Token deltas only feed the live output card, not the status log
+      if (newMessage.event_type !== "agent_delta") {
+        setMessages((prev) => [...prev, newMessage]);
+      }
 
       const raw = newMessage.agent_name;
       const baseAgent = normalizeAgentName(raw);
@@ -97,7 +100,16 @@ export default function Home() {
 
           if (newMessage.event_type === "agent_start") {
             // Keep previous content visible while starting; mark as in progress
-            next[baseAgent] = { ...prevEntry, inProgress: true, updatedAt: Date.now() };
+            next[baseAgent] = { ...prevEntry, inProgress: true, streaming: false, updatedAt: Date.now() };
+          } else if (newMessage.event_type === "agent_delta") {
+            // First chunk of a run replaces the previous content, later chunks append
+            const base = prevEntry.streaming ? prevEntry.content : "";
+            next[baseAgent] = {
+              content: base + (newMessage.content || ""),
+              inProgress: true,
+              streaming: true,
+              updatedAt: Date.now(),
+            };
           } else if (newMessage.event_type === "agent_result") {
             // Refined (or fresh) result REPLACES previous content
             next[baseAgent] = {